@@ -0,0 +1,125 @@
+"""
+Leitor do catálogo binário PRXC baixado do backend (/product/all.bin).
+
+O arquivo é mapeado em memória (mmap): a busca por código de barras é uma busca
+binária no índice ordenado, O(log n), sem carregar o catálogo em objetos Python.
+O formato é gerado por backend/catalog_binary.py (mantenha os dois em sincronia).
+"""
+
+import mmap
+import os
+import struct
+
+MAGIC = b'PRXC'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIqIIII')
+HEADER_SIZE = 40
+RECORD = struct.Struct('<IHBxi')
+
+FLAG_PROMO = 0x01
+FLAG_HAS_PRICE = 0x02
+
+
+class CatalogFormatError(ValueError):
+    pass
+
+
+class CatalogReader:
+    """Acesso somente leitura a um arquivo PRXC.
+
+    Uso:
+        with CatalogReader(path) as cat:
+            produto = cat.lookup('7891234567890')
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, 'rb')
+        try:
+            size = os.fstat(self._fh.fileno()).st_size
+            if size < HEADER_SIZE:
+                raise CatalogFormatError('Arquivo de catálogo truncado')
+            self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._fh.close()
+            raise
+        try:
+            self._parse_header(size)
+        except Exception:
+            self.close()
+            raise
+
+    def _parse_header(self, size):
+        (magic, version, self.key_width, self.count, revision,
+         self._index_off, self._records_off, self._heap_off, heap_len) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise CatalogFormatError('Arquivo não é um catálogo PRECIX (PRXC)')
+        if version != VERSION:
+            raise CatalogFormatError(f'Versão de catálogo não suportada: {version}')
+        self.revision = None if revision < 0 else revision
+        if (self._records_off != self._index_off + self.count * self.key_width
+                or self._heap_off != self._records_off + self.count * RECORD.size
+                or self._heap_off + heap_len > size):
+            raise CatalogFormatError('Seções do catálogo inconsistentes')
+
+    # --- ciclo de vida ---
+    def close(self):
+        mm, self._mm = getattr(self, '_mm', None), None
+        if mm is not None:
+            mm.close()
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    # --- busca ---
+    def _key_at(self, i):
+        off = self._index_off + i * self.key_width
+        return self._mm[off:off + self.key_width]
+
+    def _find(self, barcode):
+        key = str(barcode).strip().encode('utf-8')
+        if not key or len(key) > self.key_width:
+            return -1
+        key = key.ljust(self.key_width, b'\0')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._key_at(lo) == key:
+            return lo
+        return -1
+
+    def _product_at(self, i):
+        name_off, name_len, flags, cents = RECORD.unpack_from(self._mm, self._records_off + i * RECORD.size)
+        start = self._heap_off + name_off
+        return {
+            'barcode': self._key_at(i).rstrip(b'\0').decode('utf-8'),
+            'name': self._mm[start:start + name_len].decode('utf-8', errors='replace'),
+            'price': cents / 100.0 if flags & FLAG_HAS_PRICE else None,
+            'promo': bool(flags & FLAG_PROMO),
+        }
+
+    def lookup(self, barcode):
+        """Produto (dict) do código de barras ou None."""
+        i = self._find(barcode)
+        return self._product_at(i) if i >= 0 else None
+
+    def __contains__(self, barcode):
+        return self._find(barcode) >= 0
+
+    def iter_products(self):
+        """Percorre o catálogo em ordem de código, um produto por vez."""
+        for i in range(self.count):
+            yield self._product_at(i)
@@ -24,6 +24,8 @@ import sys
 from wsgiref.simple_server import make_server
 from urllib.parse import parse_qs, urlparse
 from logging.handlers import RotatingFileHandler
+import threading
+from catalog_reader import CatalogReader, CatalogFormatError
 
 # Configuração inicial (unificar diretório entre EXE e Serviço)
 def _is_windows_service_context() -> bool:
@@ -260,14 +262,192 @@ def cadastrar_equipamento(ip, porta, descricao):
     logging.info(f"Equipamento cadastrado: {ip}:{porta} - {descricao}")
 
 
+# Cópia local do catálogo PRECIX para sync incremental (/product/changes)
+CATALOG_CACHE_PATH = os.path.join(APP_HOME, 'catalog_cache.json')
+
+
+def _catalog_endpoint_url(api_url, endpoint):
+    """URL de outro endpoint do catálogo quando api_url aponta para o backend PRECIX."""
+    try:
+        u = urlparse(api_url)
+        path = u.path.rstrip('/')
+        for suffix in ('/product/all', '/api/produtos'):
+            if path.endswith(suffix):
+                return f"{u.scheme}://{u.netloc}{path[:-len(suffix)]}{endpoint}"
+    except Exception:
+        pass
+    return None
+
+
+def _catalog_changes_url(api_url):
+    """URL de /product/changes quando api_url aponta para o catálogo do backend PRECIX."""
+    return _catalog_endpoint_url(api_url, '/product/changes')
+
+
+def _carregar_cache_catalogo(api_url):
+    try:
+        with open(CATALOG_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        # Cache de outra origem não serve
+        if cache.get('api_url') == api_url and isinstance(cache.get('products'), dict):
+            return cache
+    except Exception:
+        pass
+    return None
+
+
+def _salvar_cache_catalogo(cache):
+    tmp = CATALOG_CACHE_PATH + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp, CATALOG_CACHE_PATH)
+    except Exception as e:
+        logging.warning(f"[API] Falha ao salvar cache do catálogo: {e}")
+
+
+def _sync_catalogo_delta(changes_url, cache):
+    """Aplica no cache as mudanças desde cache['revision']. Retorna False se precisar de sync completo."""
+    since = cache.get('revision')
+    if since is None:
+        return False
+    produtos = cache['products']
+    total_mudancas = 0
+    while True:
+        response = requests.get(changes_url, params={'since': since, 'limit': 5000}, timeout=20)
+        if response.status_code != 200:
+            return False
+        delta = response.json()
+        if delta.get('resync'):
+            logging.info('[API] Revisão local antiga demais; refazendo sync completo')
+            return False
+        for p in delta.get('upserts') or []:
+            if isinstance(p, dict) and p.get('barcode'):
+                produtos[str(p['barcode'])] = p
+        for bc in delta.get('deletes') or []:
+            produtos.pop(str(bc), None)
+        total_mudancas += len(delta.get('upserts') or []) + len(delta.get('deletes') or [])
+        since = delta.get('next_since', since)
+        if not delta.get('has_more'):
+            break
+    cache['revision'] = since
+    logging.info(f"[API] Sync incremental: {total_mudancas} mudanças aplicadas (revisão {since}, {len(produtos)} produtos)")
+    return True
+
+
+# Catálogo binário (PRXC) para consultas locais por código de barras via mmap
+CATALOG_BIN_PATH = os.path.join(APP_HOME, 'catalog.bin')
+_catalog_bin_lock = threading.Lock()
+_catalog_bin_reader = None
+
+
+def _fechar_catalogo_binario():
+    global _catalog_bin_reader
+    if _catalog_bin_reader is not None:
+        try:
+            _catalog_bin_reader.close()
+        except Exception:
+            pass
+        _catalog_bin_reader = None
+
+
+def baixar_catalogo_binario(api_url):
+    """Baixa /product/all.bin para CATALOG_BIN_PATH (If-None-Match). Retorna True se o arquivo está atualizado."""
+    bin_url = _catalog_endpoint_url(api_url, '/product/all.bin')
+    if not bin_url:
+        return False
+    etag_path = CATALOG_BIN_PATH + '.etag'
+    headers = {}
+    try:
+        if os.path.exists(CATALOG_BIN_PATH) and os.path.exists(etag_path):
+            with open(etag_path, 'r', encoding='utf-8') as f:
+                headers['If-None-Match'] = f.read().strip()
+    except Exception:
+        pass
+    tmp = CATALOG_BIN_PATH + '.tmp'
+    try:
+        with requests.get(bin_url, headers=headers, timeout=30, stream=True) as response:
+            if response.status_code == 304:
+                return True
+            response.raise_for_status()
+            with open(tmp, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    f.write(chunk)
+            etag = response.headers.get('ETag')
+        # Valida antes de substituir o arquivo em uso
+        CatalogReader(tmp).close()
+        with _catalog_bin_lock:
+            # No Windows o arquivo mapeado não pode ser substituído: fecha o leitor antes
+            _fechar_catalogo_binario()
+            os.replace(tmp, CATALOG_BIN_PATH)
+        if etag:
+            with open(etag_path, 'w', encoding='utf-8') as f:
+                f.write(etag)
+        logging.info(f"[API] Catálogo binário atualizado ({os.path.getsize(CATALOG_BIN_PATH)} bytes)")
+        return True
+    except Exception as e:
+        logging.warning(f"[API] Falha ao baixar catálogo binário: {e}")
+        try:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        except Exception:
+            pass
+        return False
+
+
+def consultar_catalogo_binario(barcode):
+    """Produto do catálogo binário local (O(log n), sem carregar o arquivo) ou None."""
+    global _catalog_bin_reader
+    with _catalog_bin_lock:
+        if _catalog_bin_reader is None:
+            if not os.path.exists(CATALOG_BIN_PATH):
+                return None
+            try:
+                _catalog_bin_reader = CatalogReader(CATALOG_BIN_PATH)
+            except (OSError, CatalogFormatError) as e:
+                logging.warning(f"[API] Catálogo binário local inválido: {e}")
+                return None
+        return _catalog_bin_reader.lookup(barcode)
+
+
 def buscar_dados_precix(api_url):
     try:
+        changes_url = _catalog_changes_url(api_url)
+        if changes_url:
+            # Mantém também o catálogo binário local para consultas por código (/catalog/lookup)
+            baixar_catalogo_binario(api_url)
+        cache = _carregar_cache_catalogo(api_url) if changes_url else None
+        if cache:
+            try:
+                if _sync_catalogo_delta(changes_url, cache):
+                    _salvar_cache_catalogo(cache)
+                    return list(cache['products'].values())
+            except Exception as e:
+                logging.warning(f"[API] Sync incremental falhou ({e}); usando sync completo")
         logging.info(f"[API] Buscando dados de preços em: {api_url}")
-        response = requests.get(api_url, timeout=20)
+        headers = {}
+        if cache and cache.get('etag'):
+            headers['If-None-Match'] = cache['etag']
+        response = requests.get(api_url, timeout=20, headers=headers)
+        if response.status_code == 304 and cache:
+            logging.info('[API] Catálogo sem alterações (304)')
+            return list(cache['products'].values())
         response.raise_for_status()
         logging.info(f"[API] Conteúdo bruto retornado (preview): {response.text[:1000]}")
         dados = response.json()
         logging.info(f"[API] Dados recebidos: {type(dados)} - {str(dados)[:500]}")
+        # Guarda a revisão para as próximas chamadas serem incrementais
+        rev = response.headers.get('X-Catalog-Revision')
+        if changes_url and isinstance(dados, list) and rev is not None:
+            try:
+                _salvar_cache_catalogo({
+                    'api_url': api_url,
+                    'revision': int(rev),
+                    'etag': response.headers.get('ETag'),
+                    'products': {str(p['barcode']): p for p in dados if isinstance(p, dict) and p.get('barcode')},
+                })
+            except Exception as e:
+                logging.warning(f"[API] Falha ao montar cache do catálogo: {e}")
         return dados
     except Exception as e:
         logging.error(f"Erro ao buscar dados PRECIX: {e}")
@@ -1056,6 +1236,17 @@ def _wsgi_app(environ, start_response):
                 start_response('500 Internal Server Error', [('Content-Type', 'application/json')])
                 return [json.dumps({'status': 'error'}).encode('utf-8')]
 
+        # consulta de preço no catálogo binário local
+        if path == '/catalog/lookup' and method == 'GET':
+            barcode = (query.get('barcode', [''])[0] or '').strip()
+            produto = consultar_catalogo_binario(barcode) if barcode else None
+            if produto is None:
+                start_response('404 Not Found', [('Content-Type', 'application/json')])
+                return [json.dumps({'error': 'not_found'}).encode('utf-8')]
+            payload = json.dumps(produto, ensure_ascii=False).encode('utf-8')
+            start_response('200 OK', [('Content-Type', 'application/json; charset=utf-8')])
+            return [payload]
+
         # read persisted ACKs
         if path == '/acks' and method == 'GET':
             try:
@@ -0,0 +1,205 @@
+"""
+Módulo: admin_router.py
+-----------------------
+Rotas operacionais: health/status, audit_log, estatísticas internas (pool, jobs, event loop,
+consultas lentas, heartbeats, eventos da IA, inicialização) e /metrics.
+"""
+
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from .database import get_system_status, get_device_counts, get_pool_stats, query_audit_logs
+    from .ai_agent_integration import ask_ai_agent, ai_events
+    from .audit_writer import audit_writer
+    from .db_async import run_db, db_executor, loop_monitor
+    from .health import health_monitor
+    from .heartbeats import heartbeat_stats
+    from .jobs import scheduler
+    from .keyset import InvalidCursor
+    from .lifecycle import startup
+    from .metrics import registry as metrics_registry
+    from .request_timing import slow_queries
+except ImportError:
+    from database import get_system_status, get_device_counts, get_pool_stats, query_audit_logs
+    from ai_agent_integration import ask_ai_agent, ai_events
+    from audit_writer import audit_writer
+    from db_async import run_db, db_executor, loop_monitor
+    from health import health_monitor
+    from heartbeats import heartbeat_stats
+    from jobs import scheduler
+    from keyset import InvalidCursor
+    from lifecycle import startup
+    from metrics import registry as metrics_registry
+    from request_timing import slow_queries
+
+FRONTEND_PUBLIC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'public'))
+
+router = APIRouter()
+
+
+@router.get('/favicon.ico')
+def favicon():
+    file_path = os.path.join(FRONTEND_PUBLIC_DIR, 'favicon.ico')
+    if os.path.exists(file_path):
+        return FileResponse(file_path)
+    raise HTTPException(status_code=404, detail='favicon not found')
+
+
+@router.get('/health')
+def health():
+    # Resultado em cache dos health probes (job health_probes); 503 só se um probe crítico (banco) falhar
+    snap = health_monitor.snapshot()
+    return JSONResponse(content=snap, status_code=503 if snap['status'] == 'fail' else 200)
+
+
+@router.get('/metrics')
+def metrics():
+    return Response(metrics_registry.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@router.get("/status")
+async def system_status():
+    return JSONResponse(content=await run_db(get_system_status))
+
+
+@router.post("/notify-ai-agent/")
+async def notify_agent(request: Request):
+    data = await request.json()
+    try:
+        # Quem chama espera a resposta do agente: envio síncrono (falha na hora com o circuito aberto),
+        # no threadpool e não no executor do banco, que ficaria preso até PRECIX_IA_TIMEOUT s
+        response = await run_in_threadpool(ask_ai_agent, data)
+    except Exception as e:
+        response = {"success": False, "error": str(e)}
+    return JSONResponse(content=response)
+
+
+@router.get('/admin/status')
+def admin_status():
+    import datetime
+    status = get_system_status()
+    # Determina status online: se existe pelo menos 1 device online (contagem no banco)
+    online = get_device_counts()['online'] > 0
+    # Busca último backup
+    try:
+        from backup_restore import get_last_backup
+        backup = get_last_backup()
+        last_backup = backup['timestamp'] if backup and 'timestamp' in backup else None
+    except Exception:
+        last_backup = None
+    status['online'] = online
+    status['last_backup'] = last_backup
+    
+    # Serializa datetime para string recursivamente
+    def serialize_datetime(obj):
+        if isinstance(obj, datetime.datetime):
+            return obj.isoformat()
+        elif isinstance(obj, dict):
+            return {k: serialize_datetime(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [serialize_datetime(item) for item in obj]
+        return obj
+    
+    serialized_status = serialize_datetime(status)
+    return JSONResponse(content=serialized_status)
+
+
+# Estatísticas do pool de conexões PostgreSQL (em uso, ociosas, esperas, tempo de espera)
+@router.get('/admin/db/pool-stats')
+def admin_db_pool_stats():
+    return get_pool_stats()
+
+
+@router.get('/admin/audit/stats')
+def admin_audit_stats():
+    return audit_writer.stats()
+
+
+# Fila de eventos para o agente de IA: enviados/descartados/falhos e estado do circuit breaker
+@router.get('/admin/ai-events/stats')
+def admin_ai_events_stats():
+    return ai_events.stats()
+
+
+@router.get('/admin/db/slow-queries')
+def admin_slow_queries(limit: int = Query(50, ge=1, le=500)):
+    return {'stats': slow_queries.stats(), 'queries': slow_queries.recent(limit)}
+
+
+@router.get('/admin/heartbeats/stats')
+def admin_heartbeat_stats():
+    return heartbeat_stats()
+
+
+@router.get('/admin/jobs')
+def admin_jobs():
+    return scheduler.stats()
+
+
+@router.post('/admin/jobs/{name}/run')
+def admin_run_job(name: str):
+    if not scheduler.run_now(name):
+        raise HTTPException(status_code=404, detail=f'Job {name} não encontrado')
+    return {"success": True}
+
+
+@router.get('/admin/loop/stats')
+def admin_loop_stats():
+    # Atraso do event loop e fila do executor de banco (db_async.py)
+    return {'loop': loop_monitor.stats(), 'db_executor': db_executor.stats()}
+
+
+# Tempo de import/criação do app, duração de cada fase do startup e memória residente (lifecycle.py)
+@router.get('/admin/startup')
+def admin_startup_stats():
+    return startup.stats()
+
+
+def _audit_logs_page(response: Response, **filters):
+    try:
+        rows, next_cursor = query_audit_logs(**filters)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Corpo continua sendo a lista (compatível com o painel); a próxima página vem no cabeçalho
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return rows
+
+
+@router.get('/admin/audit-logs')
+def api_get_audit_logs(
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    action: Optional[List[str]] = Query(None),
+    device_id: Optional[int] = None,
+    store_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """Audit log paginado por cursor: repita a chamada com ?cursor=<X-Next-Cursor> até o cabeçalho sumir."""
+    return _audit_logs_page(
+        response, limit=limit, cursor=cursor, action=action, device_id=device_id,
+        store_id=store_id, since=since, until=until
+    )
+
+
+@router.get('/admin/devices/{device_id}/audit-logs')
+def api_get_device_audit_logs(
+    device_id: int,
+    response: Response,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    action: Optional[List[str]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    return _audit_logs_page(
+        response, limit=limit, cursor=cursor, action=action, device_id=device_id, since=since, until=until
+    )
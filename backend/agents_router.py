@@ -0,0 +1,257 @@
+"""
+Módulo: agents_router.py
+------------------------
+Rotas dos agentes locais (/admin/agents...): status do agente, lista/resumo para o painel e
+equipamentos legados (balanças, PCs) reportados por cada agente.
+"""
+
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Body, HTTPException, Query, Request
+
+try:
+    from .database import (
+        upsert_agent_status, delete_agent_status, update_agent_status, bulk_upsert_agent_devices,
+        get_agent_devices, delete_agent_device, replace_agent_stores, get_latest_agent_by_ip,
+        get_agents_tree, get_agents_summary, FAKE_AGENT_IDS, reconcile_agent_identity, normalize_agent_id
+    )
+    from .db_async import run_db
+    from .heartbeats import agent_device_heartbeats
+except ImportError:
+    from database import (
+        upsert_agent_status, delete_agent_status, update_agent_status, bulk_upsert_agent_devices,
+        get_agent_devices, delete_agent_device, replace_agent_stores, get_latest_agent_by_ip,
+        get_agents_tree, get_agents_summary, FAKE_AGENT_IDS, reconcile_agent_identity, normalize_agent_id
+    )
+    from db_async import run_db
+    from heartbeats import agent_device_heartbeats
+
+router = APIRouter()
+
+
+@router.get('/admin/agents')
+def listar_agentes(include_fakes: bool = Query(False)):
+    # Árvore agente/lojas/dispositivos em uma única consulta; a reatribuição de dispositivos
+    # órfãos roda no caminho de escrita (heartbeat/devices), não na leitura
+    rows = get_agents_tree()
+    out = []
+    seen = set()
+    from datetime import datetime, timezone
+    now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    for r in rows:
+        rec = dict(r)
+        rec['id'] = (rec.get('agent_id') or rec.get('id') or '').strip().lower()
+        if not rec['id'] or rec['id'] in seen:
+            continue
+        seen.add(rec['id'])
+        last = rec.get('last_update') or rec.get('ultima_atualizacao')
+        status_calc = None
+        normalized_last = None
+        try:
+            if last:
+                try:
+                    dt = datetime.strptime(str(last), '%Y-%m-%d %H:%M:%S')
+                    dt = dt.replace(tzinfo=timezone.utc)
+                except Exception:
+                    try:
+                        dt = datetime.strptime(str(last), '%d/%m/%Y, %H:%M:%S')
+                        dt = dt.replace(tzinfo=timezone.utc)
+                    except Exception:
+                        dt = datetime.fromisoformat(str(last))
+                        if dt.tzinfo is None:
+                            dt = dt.replace(tzinfo=timezone.utc)
+                diff = (now - dt).total_seconds()
+                status_calc = 'online' if diff <= 120 else 'offline'
+                normalized_last = dt.isoformat(timespec='seconds')
+        except Exception:
+            status_calc = None
+            normalized_last = None
+        if normalized_last:
+            rec['last_update'] = normalized_last
+            rec['ultima_atualizacao'] = dt.strftime('%d/%m/%Y, %H:%M:%S')
+        rec['status'] = status_calc or rec.get('status') or 'offline'
+        if not rec.get('loja_nome') and rec.get('lojas'):
+            rec['loja_nome'] = rec['lojas'][0].get('loja_nome')
+            rec['loja_codigo'] = rec.get('loja_codigo') or rec['lojas'][0].get('loja_codigo')
+        if not include_fakes and rec['id'] in FAKE_AGENT_IDS:
+            continue
+        out.append(rec)
+    return out
+
+
+# IP -> agente canônico (get_latest_agent_by_ip), para não consultar o banco a cada heartbeat de dispositivo
+_AGENT_BY_IP_TTL_S = 30.0
+_agent_by_ip_cache: Dict[str, tuple] = {}
+
+
+def _canonical_agent_for_ip(ip: Optional[str]) -> Optional[str]:
+    if not ip:
+        return None
+    cached = _agent_by_ip_cache.get(ip)
+    if cached is not None and time.monotonic() - cached[1] < _AGENT_BY_IP_TTL_S:
+        return cached[0]
+    canon = get_latest_agent_by_ip(ip)
+    _agent_by_ip_cache[ip] = (canon, time.monotonic())
+    return canon
+
+
+def _client_ip(req: Request):
+    try:
+        if not req:
+            return None
+        xf = req.headers.get('x-forwarded-for') or req.headers.get('X-Forwarded-For')
+        if xf:
+            parts = [p.strip() for p in xf.split(',') if p.strip()]
+            if parts:
+                return parts[0]
+        xr = req.headers.get('x-real-ip') or req.headers.get('X-Real-IP')
+        if xr:
+            return xr.strip()
+        return req.client.host if req.client else None
+    except Exception:
+        return req.client.host if req and req.client else None
+
+
+@router.post('/admin/agents/status')
+async def upsert_agent_status_handler(request: Request):
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail='Invalid JSON payload')
+    agent_id = (data.get('agent_id') or '').strip().lower()
+    if not agent_id:
+        raise HTTPException(status_code=400, detail='agent_id é obrigatório')
+    req_ip = _client_ip(request)
+    # Heartbeat + dedupe/reatribuição são bloqueantes: rodam no executor do banco
+    return await run_db(_persist_agent_status, agent_id, data, req_ip or data.get('ip'))
+
+
+def _persist_agent_status(agent_id: str, data: dict, ip):
+    loja_codigo = data.get('loja_codigo')
+    loja_nome = data.get('loja_nome') or data.get('store_name')
+    status = data.get('status') or 'online'
+    last_update = data.get('last_update') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        same_ip_id = get_latest_agent_by_ip(ip)
+        if same_ip_id:
+            agent_id = same_ip_id
+    except Exception:
+        pass
+    try:
+        upsert_agent_status(agent_id, loja_codigo=loja_codigo, loja_nome=loja_nome, status=status, last_update=last_update, ip=ip)
+        try:
+            # Apenas este agent_id/IP; a varredura completa é o job agent_identity_sweep
+            reconcile_agent_identity(agent_id, ip)
+        except Exception as e:
+            logging.warning(f"[AGENTS] Falha na reconciliação de {agent_id}: {e}")
+        lojas = data.get('lojas')
+        if isinstance(lojas, list):
+            replace_agent_stores(agent_id, lojas)
+        return {"success": True}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get('/admin/agents/summary')
+def agents_summary():
+    # Contagem direto no banco, sem montar a árvore de lojas/dispositivos
+    return get_agents_summary()
+
+
+@router.delete('/admin/agents/{agent_id}')
+def delete_agent(agent_id: str):
+    try:
+        delete_agent_status(agent_id)
+        return {"success": True}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.put('/admin/agents/{agent_id}')
+def edit_agent(agent_id: str, data: dict = Body(...)):
+    try:
+        loja_codigo = data.get('loja_codigo')
+        loja_nome = data.get('loja_nome')
+        status = data.get('status')
+        ip = data.get('ip')
+        last_update = data.get('last_update')
+        update_agent_status(agent_id, loja_codigo=loja_codigo, loja_nome=loja_nome, status=status, ip=ip, last_update=last_update)
+        return {"success": True}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post('/admin/agents/{agent_id}/devices')
+def upsert_agent_devices(agent_id: str, payload: dict = Body(...), request: Request = None):
+    try:
+        try:
+            req_ip = _client_ip(request)
+            canon = get_latest_agent_by_ip(req_ip)
+            if canon:
+                agent_id = canon
+        except Exception:
+            pass
+        devices = payload.get('devices') or []
+        devices = [d for d in devices if str(d.get('identifier') or '').strip()]
+        bulk_upsert_agent_devices(agent_id, devices)
+        try:
+            reconcile_agent_identity(agent_id, req_ip)
+        except Exception:
+            pass
+        return {"success": True, "count": len(devices)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post('/admin/agents/{agent_id}/devices/heartbeat')
+def agent_device_heartbeat(agent_id: str, data: dict = Body(...), request: Request = None):
+    try:
+        ip = (data.get('ip') or '').strip()
+        port = str(data.get('port') or '21').strip()
+        identifier = (data.get('identifier') or '').strip()
+        if not identifier:
+            if not ip:
+                raise HTTPException(status_code=400, detail='identifier ou ip são obrigatórios')
+            identifier = f'PC-{ip}:{port}'
+        name = data.get('name') or 'PC'
+        status = data.get('status') or 'online'
+        from datetime import datetime as _dt
+        # Horário local, como o restante de agent_devices.last_update
+        ts = _dt.now()
+        try:
+            canon = _canonical_agent_for_ip(_client_ip(request))
+            if canon:
+                agent_id = canon
+        except Exception:
+            pass
+        # Write-behind: o heartbeat vai para o buffer e é gravado em lote (heartbeats.py);
+        # a reconciliação de identidade do agente roda no heartbeat do próprio agente e no job
+        agent_device_heartbeats.record(
+            (normalize_agent_id(agent_id), identifier), ts=ts,
+            name=name, tipo='LEGACY', status=status, ip=ip
+        )
+        return {"success": True, "identifier": identifier, "last_update": ts.isoformat()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get('/admin/agents/{agent_id}/devices')
+def list_agent_devices(agent_id: str):
+    try:
+        return get_agent_devices(agent_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete('/admin/agents/{agent_id}/devices/{identifier}')
+def remove_agent_device(agent_id: str, identifier: str):
+    try:
+        delete_agent_device(agent_id, identifier)
+        return {"success": True}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,25 +1,164 @@
-import requests
+"""
+Módulo: ai_agent_integration.py
+-------------------------------
+Envio de eventos para o agente de IA real (Agno, Ollama, etc).
+
+- notify_ai_agent só enfileira o evento (fire-and-forget); uma thread envia em lotes de até
+  PRECIX_IA_BATCH_SIZE eventos por ciclo, reaproveitando a conexão HTTP (keep-alive)
+- Fila limitada (PRECIX_IA_QUEUE_MAX): cheia, o evento mais antigo é descartado
+- Circuit breaker: após PRECIX_IA_BREAKER_FAILURES falhas seguidas de conexão/timeout/5xx os envios
+  param por PRECIX_IA_BACKOFF_S segundos, dobrando a cada nova falha até PRECIX_IA_BACKOFF_MAX_S;
+  os eventos esperam na fila (sujeitos ao limite) e o primeiro envio após a pausa testa o endpoint
+- ask_ai_agent envia na hora e devolve a resposta (chat, ping); com o circuito aberto falha
+  imediatamente em vez de esperar o timeout
+- O prompt (prompt_supermercado.txt) é relido só quando o mtime do arquivo muda
+- Contadores enviados/descartados/falhos em GET /admin/ai-events/stats e /metrics
+- Sem start() (scripts) notify_ai_agent continua enviando direto, na thread de quem chamou
+"""
+
+import logging
 import os
+import threading
+import time
+from collections import deque
+from typing import Optional
 
 # Configurações para IA real (Agno/Ollama)
 IA_ENDPOINT = os.getenv('PRECIX_IA_ENDPOINT', os.environ.get('AI_AGENT_URL', 'http://localhost:8080/event'))
 IA_TOKEN = os.getenv('PRECIX_IA_TOKEN', None)
 IA_TIMEOUT = int(os.getenv('PRECIX_IA_TIMEOUT', '10'))
+IA_QUEUE_MAX = int(os.getenv('PRECIX_IA_QUEUE_MAX', '1000'))
+IA_BATCH_SIZE = int(os.getenv('PRECIX_IA_BATCH_SIZE', '20'))
+IA_BREAKER_FAILURES = int(os.getenv('PRECIX_IA_BREAKER_FAILURES', '3'))
+IA_BACKOFF_S = float(os.getenv('PRECIX_IA_BACKOFF_S', '5'))
+IA_BACKOFF_MAX_S = float(os.getenv('PRECIX_IA_BACKOFF_MAX_S', '300'))
 
 PROMPT_PATH = os.path.join(os.path.dirname(__file__), 'prompt_supermercado.txt')
+
+
+class PromptCache:
+    """Conteúdo de um arquivo de texto, relido apenas quando o mtime muda."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._text = None
+
+    def get(self) -> Optional[str]:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._text = f.read()
+                except Exception:
+                    return None
+                self._mtime = mtime
+            return self._text
+
+
+_prompt_cache = PromptCache(PROMPT_PATH)
+
+
 def get_ia_prompt():
+    return _prompt_cache.get()
+
+
+class CircuitOpen(Exception):
+    """Circuito aberto: o endpoint da IA falhou seguidamente e está em pausa."""
+
+
+class CircuitBreaker:
+    """Fechado -> aberto após failure_threshold falhas seguidas; reabre com backoff exponencial."""
+
+    def __init__(self, failure_threshold: int = IA_BREAKER_FAILURES, backoff_s: float = IA_BACKOFF_S,
+                 max_backoff_s: float = IA_BACKOFF_MAX_S):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.backoff_s = max(0.0, float(backoff_s))
+        self.max_backoff_s = max(self.backoff_s, float(max_backoff_s))
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opens = 0
+        self._open_until = 0.0
+        self._stats = {'opened': 0, 'rejected': 0}
+
+    def retry_in(self) -> float:
+        """Segundos até o próximo envio permitido (0 = pode enviar)."""
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.retry_in() > 0:
+            with self._lock:
+                self._stats['rejected'] += 1
+            return False
+        return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opens = 0
+            self._open_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            # Falha no envio de teste após a pausa reabre direto, com o dobro da espera
+            if self._failures >= self.failure_threshold or self._opens:
+                backoff = min(self.max_backoff_s, self.backoff_s * (2 ** self._opens))
+                self._open_until = time.monotonic() + backoff
+                self._opens += 1
+                self._failures = 0
+                self._stats['opened'] += 1
+                logging.warning(f"[AI_AGENT] Circuito aberto: novos envios em {backoff:.0f}s")
+
+    def stats(self) -> dict:
+        retry_in = self.retry_in()
+        with self._lock:
+            out = dict(self._stats)
+            out['state'] = 'open' if retry_in > 0 else ('half_open' if self._opens else 'closed')
+            out['consecutive_failures'] = self._failures
+        out['retry_in_s'] = round(retry_in, 3)
+        return out
+
+
+breaker = CircuitBreaker()
+_session_local = threading.local()
+
+
+def _session():
+    # requests é carregado no primeiro envio, não no import do backend; uma sessão por thread
+    session = getattr(_session_local, 'session', None)
+    if session is None:
+        import requests
+        session = requests.Session()
+        _session_local.session = session
+    return session
+
+
+def _log_event(event_type, details, response):
+    # Importa log_ia_event apenas dentro da função para evitar import circular
     try:
-        with open(PROMPT_PATH, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception:
-        return None
+        try:
+            from .ia_event_log import log_ia_event
+        except ImportError:
+            from ia_event_log import log_ia_event
+        log_ia_event(event_type, details, response)
+    except Exception as logerr:
+        print(f"[AI_AGENT] Falha ao logar evento IA: {logerr}")
 
-def notify_ai_agent(event_type, details=None):
-    """
-    Envia um evento para o agente de IA real (Agno, Ollama, etc).
-    event_type: str - tipo do evento (ex: 'sync_start', 'sync_success', 'sync_failure', 'import', 'export', 'error', etc)
-    details: dict - informações adicionais do evento
+
+def send_ai_event(event_type, details=None):
+    """Envia um evento na hora e devolve o JSON da resposta.
+
+    Levanta CircuitOpen se o circuito estiver aberto e a exceção do envio em caso de falha.
     """
+    if not breaker.allow():
+        raise CircuitOpen(f'endpoint da IA em pausa por {breaker.retry_in():.0f}s')
     payload = {
         'event_type': event_type,
         'details': details or {}
@@ -32,24 +171,174 @@ def notify_ai_agent(event_type, details=None):
     if IA_TOKEN:
         headers['Authorization'] = f'Bearer {IA_TOKEN}'
     try:
-        response = requests.post(IA_ENDPOINT, json=payload, headers=headers, timeout=IA_TIMEOUT)
-        response.raise_for_status()
-        resp_json = response.json()
-        # Importa log_ia_event apenas dentro da função para evitar import circular
-        try:
-            from ia_event_log import log_ia_event
-            log_ia_event(event_type, details, resp_json)
-        except Exception as logerr:
-            print(f"[AI_AGENT] Falha ao logar evento IA: {logerr}")
-        return resp_json
+        response = _session().post(IA_ENDPOINT, json=payload, headers=headers, timeout=IA_TIMEOUT)
+    except Exception:
+        breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        # Endpoint respondeu: erro 4xx é do evento, não do agente
+        breaker.record_success()
+    response.raise_for_status()
+    return response.json()
+
+
+def ask_ai_agent(event_type, details=None):
+    """Envio síncrono com resposta (chat, ping, /notify-ai-agent/); None em caso de falha."""
+    try:
+        resp_json = send_ai_event(event_type, details)
     except Exception as e:
         print(f"[AI_AGENT] Falha ao notificar agente IA: {e}")
-        try:
-            from ia_event_log import log_ia_event
-            log_ia_event(event_type, details, {'error': str(e)})
-        except Exception as logerr:
-            print(f"[AI_AGENT] Falha ao logar erro IA: {logerr}")
+        _log_event(event_type, details, {'error': str(e)})
         return None
+    _log_event(event_type, details, resp_json)
+    return resp_json
+
+
+class AIEventBus:
+    """Fila limitada + thread de envio para os eventos da IA.
+
+    send_fn(event_type, details) envia um evento (levanta CircuitOpen com o circuito aberto);
+    log_fn(event_type, details, resposta) registra o resultado (logs/ia_events.log).
+    """
+
+    def __init__(self, max_queue: int = IA_QUEUE_MAX, batch_size: int = IA_BATCH_SIZE,
+                 send_fn=send_ai_event, log_fn=_log_event, circuit: CircuitBreaker = breaker):
+        self.max_queue = max(1, int(max_queue))
+        self.batch_size = max(1, int(batch_size))
+        self._send = send_fn
+        self._log = log_fn
+        self.circuit = circuit
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            'queued': 0,
+            'sent': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'max_depth': 0,
+            'last_sent_at': None,
+            'last_error': None,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def publish(self, event_type, details=None) -> bool:
+        """Enfileira um evento; False se outro precisou ser descartado para abrir espaço."""
+        with self._cond:
+            dropped = len(self._queue) >= self.max_queue
+            if dropped:
+                self._queue.popleft()
+                self._stats['dropped'] += 1
+            self._queue.append((event_type, details))
+            self._stats['queued'] += 1
+            depth = len(self._queue)
+            if depth > self._stats['max_depth']:
+                self._stats['max_depth'] = depth
+            self._cond.notify()
+        return not dropped
+
+    def send_batch(self) -> int:
+        """Envia até batch_size eventos da fila. Retorna os enviados com sucesso."""
+        with self._cond:
+            n = min(self.batch_size, len(self._queue))
+            batch = [self._queue.popleft() for _ in range(n)]
+        sent = 0
+        for i, (event_type, details) in enumerate(batch):
+            try:
+                resp_json = self._send(event_type, details)
+            except CircuitOpen:
+                # Devolve o restante do lote à frente da fila, respeitando o limite
+                with self._cond:
+                    rest = batch[i:]
+                    room = self.max_queue - len(self._queue)
+                    keep = rest[:max(0, room)]
+                    self._queue.extendleft(reversed(keep))
+                    self._stats['dropped'] += len(rest) - len(keep)
+                break
+            except Exception as e:
+                with self._cond:
+                    self._stats['failed'] += 1
+                    self._stats['last_error'] = f'{type(e).__name__}: {e}'
+                logging.warning(f"[AI_AGENT] Falha ao notificar agente IA ({event_type}): {e}")
+                self._log(event_type, details, {'error': str(e)})
+                continue
+            sent += 1
+            with self._cond:
+                self._stats['sent'] += 1
+                self._stats['last_sent_at'] = time.time()
+            self._log(event_type, details, resp_json)
+        if batch:
+            with self._cond:
+                self._stats['batches'] += 1
+        return sent
+
+    # --- ciclo de vida ---
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='precix-ai-events', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout_s: float = 5.0):
+        # Não espera a fila esvaziar: com o agente fora do ar isso seria timeout por evento
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout_s)
+            self._thread = None
+        with self._cond:
+            pending = len(self._queue)
+            self._queue.clear()
+            self._stats['dropped'] += pending
+        if pending:
+            logging.info(f"[AI_AGENT] {pending} eventos pendentes descartados no encerramento")
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                if not self._queue:
+                    self._cond.wait(1.0)
+                    continue
+            # Circuito aberto: espera a pausa terminar (ou o encerramento)
+            retry_in = self.circuit.retry_in()
+            if retry_in > 0:
+                self._stop.wait(retry_in)
+                continue
+            self.send_batch()
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out['depth'] = len(self._queue)
+        out['running'] = self.running
+        out['max_queue'] = self.max_queue
+        out['batch_size'] = self.batch_size
+        out['breaker'] = self.circuit.stats()
+        return out
+
+
+ai_events = AIEventBus()
+
+
+def notify_ai_agent(event_type, details=None):
+    """
+    Envia um evento para o agente de IA real (Agno, Ollama, etc), sem esperar a resposta.
+    event_type: str - tipo do evento (ex: 'sync_start', 'sync_success', 'sync_failure', 'import', 'export', 'error', etc)
+    details: dict - informações adicionais do evento
+    Retorna False se a fila estava cheia (um evento antigo foi descartado).
+    """
+    if not ai_events.running:
+        return ask_ai_agent(event_type, details) is not None
+    return ai_events.publish(event_type, details)
 
 # Exemplo de uso:
 if __name__ == '__main__':
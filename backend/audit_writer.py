@@ -0,0 +1,236 @@
+"""
+Módulo: audit_writer.py
+-----------------------
+Gravação assíncrona em lote do audit_log (add_audit_log em database.py).
+
+- add_audit_log só enfileira a linha (timestamp capturado na chamada); uma thread grava em lote
+  com um único INSERT multi-linha quando a fila atinge PRECIX_AUDIT_BATCH_SIZE ou a cada
+  PRECIX_AUDIT_FLUSH_S segundos
+- Fila limitada (PRECIX_AUDIT_QUEUE_MAX) com política de estouro (PRECIX_AUDIT_OVERFLOW):
+    drop_oldest  descarta a entrada mais antiga (padrão: o log recente é o mais útil)
+    drop_new     descarta a entrada nova
+    block        espera até PRECIX_AUDIT_BLOCK_TIMEOUT_S por espaço; depois descarta a nova
+    sync         grava a entrada na hora, na thread de quem chamou
+- Falha de conexão/operacional devolve o lote à frente da fila (sujeito ao limite); linha recusada
+  pelo banco (IntegrityError/DataError, ex.: device_id de um dispositivo já removido) faz o lote ser
+  regravado linha a linha e só as linhas recusadas são descartadas (contadas em 'rejected')
+- No shutdown a fila é gravada por completo
+- Sem start() (scripts, testes) add_audit_log continua gravando direto no banco
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+try:
+    from psycopg2 import DataError, IntegrityError
+    # Erros da linha (não do banco): repetir o lote não adianta
+    ROW_ERRORS = (IntegrityError, DataError)
+except ImportError:
+    ROW_ERRORS = ()
+
+AUDIT_QUEUE_MAX = int(os.environ.get('PRECIX_AUDIT_QUEUE_MAX', '10000'))
+AUDIT_BATCH_SIZE = int(os.environ.get('PRECIX_AUDIT_BATCH_SIZE', '500'))
+AUDIT_FLUSH_S = float(os.environ.get('PRECIX_AUDIT_FLUSH_S', '1'))
+AUDIT_OVERFLOW = os.environ.get('PRECIX_AUDIT_OVERFLOW', 'drop_oldest').strip().lower()
+AUDIT_BLOCK_TIMEOUT_S = float(os.environ.get('PRECIX_AUDIT_BLOCK_TIMEOUT_S', '0.5'))
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_new', 'block', 'sync')
+
+
+class AuditWriter:
+    """Fila limitada + thread escritora; flush_fn(lista de linhas) grava um lote.
+
+    row_errors: exceções de flush_fn que indicam linha inválida (isoladas linha a linha e descartadas).
+    """
+
+    def __init__(self, max_queue: int = AUDIT_QUEUE_MAX, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval_s: float = AUDIT_FLUSH_S, overflow: str = AUDIT_OVERFLOW,
+                 block_timeout_s: float = AUDIT_BLOCK_TIMEOUT_S, row_errors: tuple = ROW_ERRORS):
+        if overflow not in OVERFLOW_POLICIES:
+            logging.warning(f"[AUDIT] Política de estouro desconhecida '{overflow}', usando drop_oldest")
+            overflow = 'drop_oldest'
+        self.max_queue = max(1, int(max_queue))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval_s = max(0.05, float(flush_interval_s))
+        self.overflow = overflow
+        self.block_timeout_s = max(0.0, float(block_timeout_s))
+        self.row_errors = tuple(row_errors)
+        self._flush_fn: Optional[Callable[[List[tuple]], None]] = None
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            'queued': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'rejected': 0,
+            'sync_writes': 0,
+            'batches': 0,
+            'flush_errors': 0,
+            'max_depth': 0,
+            'last_flush_ms': 0.0,
+            'last_error': None,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    # --- produtor ---
+    def enqueue(self, row: tuple) -> bool:
+        """Enfileira uma linha; False se foi descartada pela política de estouro."""
+        write_now = False
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.overflow == 'drop_oldest':
+                    self._queue.popleft()
+                    self._stats['dropped'] += 1
+                elif self.overflow == 'block':
+                    deadline = time.monotonic() + self.block_timeout_s
+                    while len(self._queue) >= self.max_queue:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats['dropped'] += 1
+                            return False
+                        self._cond.notify_all()
+                        self._cond.wait(remaining)
+                elif self.overflow == 'sync':
+                    write_now = True
+                else:
+                    self._stats['dropped'] += 1
+                    return False
+            if not write_now:
+                self._queue.append(row)
+                self._stats['queued'] += 1
+                depth = len(self._queue)
+                if depth > self._stats['max_depth']:
+                    self._stats['max_depth'] = depth
+                if depth >= self.batch_size:
+                    self._cond.notify_all()
+                return True
+        # sync: fila cheia, grava esta linha na hora (na thread de quem chamou)
+        try:
+            self._flush_fn([row])
+        except Exception as e:
+            with self._cond:
+                self._stats['dropped'] += 1
+                self._stats['flush_errors'] += 1
+                self._stats['last_error'] = str(e)
+            return False
+        with self._cond:
+            self._stats['sync_writes'] += 1
+            self._stats['flushed'] += 1
+        return True
+
+    # --- consumidor ---
+    def flush(self) -> int:
+        """Grava a fila em lotes de batch_size. Retorna linhas gravadas."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    if not self._queue:
+                        return written
+                    n = min(self.batch_size, len(self._queue))
+                    batch = [self._queue.popleft() for _ in range(n)]
+                    # Libera produtores esperando (política block)
+                    self._cond.notify_all()
+                t0 = time.perf_counter()
+                try:
+                    self._flush_fn(batch)
+                    ok, pending, error = len(batch), [], None
+                except self.row_errors as e:
+                    logging.warning(f"[AUDIT] Lote do audit_log recusado ({e}); gravando linha a linha")
+                    ok, pending, error = self._flush_rows(batch)
+                except Exception as e:
+                    ok, pending, error = 0, batch, e
+                with self._cond:
+                    if ok:
+                        self._stats['batches'] += 1
+                        self._stats['flushed'] += ok
+                        self._stats['last_flush_ms'] = round((time.perf_counter() - t0) * 1000.0, 3)
+                written += ok
+                if pending:
+                    self._requeue(pending, error)
+                    logging.warning(f"[AUDIT] Falha ao gravar {len(pending)} entradas do audit_log: {error}")
+                    return written
+
+    def _flush_rows(self, rows: List[tuple]):
+        """Grava uma linha por vez, descartando as recusadas.
+
+        Retorna (gravadas, não tentadas, erro): um erro de outro tipo (conexão) interrompe e
+        as linhas restantes voltam para a fila.
+        """
+        ok = 0
+        for i, row in enumerate(rows):
+            try:
+                self._flush_fn([row])
+            except self.row_errors as e:
+                with self._cond:
+                    self._stats['rejected'] += 1
+                    self._stats['dropped'] += 1
+                    self._stats['last_error'] = str(e)
+                logging.warning(f"[AUDIT] Entrada do audit_log descartada: {e}")
+                continue
+            except Exception as e:
+                return ok, rows[i:], e
+            ok += 1
+        return ok, [], None
+
+    def _requeue(self, rows: List[tuple], error: Exception):
+        with self._cond:
+            # Devolve à frente da fila, respeitando o limite
+            room = self.max_queue - len(self._queue)
+            keep = rows[:max(0, room)]
+            self._queue.extendleft(reversed(keep))
+            self._stats['dropped'] += len(rows) - len(keep)
+            self._stats['flush_errors'] += 1
+            self._stats['last_error'] = str(error)
+
+    # --- ciclo de vida ---
+    def start(self, flush_fn: Callable[[List[tuple]], None]):
+        self._flush_fn = flush_fn
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='precix-audit-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout_s: float = 10.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout_s)
+            self._thread = None
+        if self._flush_fn is not None:
+            self.flush()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                if len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval_s)
+            if self._stop.is_set():
+                return
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out['depth'] = len(self._queue)
+        out['running'] = self.running
+        out['max_queue'] = self.max_queue
+        out['batch_size'] = self.batch_size
+        out['flush_interval_s'] = self.flush_interval_s
+        out['overflow'] = self.overflow
+        return out
+
+
+audit_writer = AuditWriter()
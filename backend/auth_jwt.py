@@ -1,24 +1,94 @@
+import json
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+try:
+    from .database import get_db_connection
+except ImportError:
+    from database import get_db_connection
 
 # Chave secreta forte (em produção, use variável de ambiente)
 SECRET_KEY = "precix_super_secret_key_2025"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+security = HTTPBearer()
+
+# python-jose (e suas dependências de criptografia) só é importado no primeiro uso de token,
+# fora do tempo de import do backend
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    from jose import jwt
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> dict:
+    from jose import jwt
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
 def verify_access_token(token: str):
+    from jose import JWTError
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             return None
         return username
     except JWTError:
         return None
+
+
+# Dependências FastAPI compartilhadas pelos routers
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    username = verify_access_token(token)
+    if not username:
+        raise HTTPException(status_code=401, detail="Token inválido ou expirado")
+    return username
+
+
+def require_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    try:
+        payload = decode_access_token(token)
+        if payload.get('role') != 'admin':
+            raise HTTPException(status_code=403, detail='Acesso restrito a administradores')
+    except Exception:
+        raise HTTPException(status_code=401, detail='Token inválido ou expirado')
+
+
+def require_admin_or_perm(perm: str):
+    def _inner(credentials: HTTPAuthorizationCredentials = Depends(security)):
+        token = credentials.credentials
+        try:
+            payload = decode_access_token(token)
+            username = payload.get('sub')
+            role = payload.get('role')
+            if role == 'admin':
+                return username
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute('SELECT permissoes FROM admin_users WHERE username = %s', (username,))
+            row = cur.fetchone()
+            conn.close()
+            perms = []
+            if row:
+                p = row[0] if not isinstance(row, dict) else row.get('permissoes')
+                if p:
+                    try:
+                        perms = json.loads(p) if isinstance(p, str) else p
+                    except Exception:
+                        perms = []
+            if perm in perms:
+                return username
+            raise HTTPException(status_code=403, detail='Acesso restrito: falta permissão')
+        except HTTPException:
+            raise
+        except Exception:
+            raise HTTPException(status_code=401, detail='Token inválido ou expirado')
+    return _inner
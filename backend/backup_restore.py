@@ -4,7 +4,6 @@ from fastapi.responses import FileResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 import os
 import shutil
-from jose import jwt
 from datetime import datetime
 import json
 
@@ -17,6 +16,7 @@ router = APIRouter()
 security = HTTPBearer()
 
 def require_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    from jose import jwt
     token = credentials.credentials
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -0,0 +1,121 @@
+"""
+Módulo: banners_router.py
+-------------------------
+Banners exibidos nos equipamentos (/admin/banners): listagem por loja, upload e remoção.
+"""
+
+import json
+import logging
+import os
+import shutil
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+
+try:
+    from .auth_jwt import get_current_user
+    from .db_async import run_db
+except ImportError:
+    from auth_jwt import get_current_user
+    from db_async import run_db
+
+BANNERS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'banners'))
+os.makedirs(BANNERS_DIR, exist_ok=True)
+
+router = APIRouter()
+
+
+@router.get('/admin/banners')
+def list_banners(store_id: str = Query(None)):
+    files = [f for f in os.listdir(BANNERS_DIR) if f.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".webp"))]
+    meta_path = os.path.join(BANNERS_DIR, 'banners_meta.json')
+    meta = {}
+    if os.path.exists(meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except Exception:
+            meta = {}
+    filtered = []
+    logging.info(f"[BANNERS] list_banners chamado com store_id={store_id}")
+    for f in files:
+        m = meta.get(f, {})
+        meta_store_id = str(m.get('store_id')).strip() if m.get('store_id') is not None else None
+        req_store_id = str(store_id).strip() if store_id is not None else None
+        all_stores_flag = bool(m.get('all_stores'))
+        logging.info(f"[BANNERS][DEBUG] Banner: {f} | meta_store_id: '{meta_store_id}' | req_store_id: '{req_store_id}' | all_stores: {all_stores_flag}")
+        if all_stores_flag:
+            filtered.append({"filename": f, "url": f"/admin/banners/{f}"})
+        elif req_store_id and meta_store_id and meta_store_id == req_store_id:
+            filtered.append({"filename": f, "url": f"/admin/banners/{f}"})
+    logging.info(f"[BANNERS] Retornando {len(filtered)} banners para store_id={store_id}")
+    return filtered
+
+
+@router.get('/admin/banners/{filename}')
+def get_banner(filename: str):
+    file_path = os.path.join(BANNERS_DIR, filename)
+    if not os.path.exists(file_path):
+        return {"success": False, "message": "Arquivo não encontrado."}
+    return FileResponse(file_path)
+
+
+@router.delete('/admin/banners/{filename}')
+def delete_banner(filename: str):
+    file_path = os.path.join(BANNERS_DIR, filename)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+        return {"success": True}
+    return {"success": False, "message": "Arquivo não encontrado."}
+
+
+@router.post('/admin/banners/upload')
+async def upload_banner(request: Request, username: str = Depends(get_current_user)):
+    form = await request.form()
+    file = form.get('file')
+    store_id = form.get('store_id')
+    all_stores = form.get('all_stores')
+    logging.info(f"[UPLOAD] username={username} file={getattr(file, 'filename', None)} store_id={store_id} all_stores={all_stores}")
+    if not file or not hasattr(file, 'filename'):
+        raise HTTPException(status_code=400, detail="Arquivo de imagem obrigatório.")
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
+        raise HTTPException(status_code=400, detail="Formato de arquivo não suportado.")
+    if not store_id and not all_stores:
+        raise HTTPException(status_code=400, detail="É obrigatório informar a loja ou marcar 'todas as lojas'.")
+    # Cópia do arquivo e metadados em disco fora do event loop
+    return await run_db(_save_banner, file, store_id, all_stores, username)
+
+
+def _save_banner(file, store_id, all_stores, username):
+    file_path = os.path.join(BANNERS_DIR, file.filename)
+    try:
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+    except Exception as e:
+        logging.error(f"[UPLOAD] Erro ao salvar arquivo: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao salvar arquivo.")
+    meta_path = os.path.join(BANNERS_DIR, 'banners_meta.json')
+    try:
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        else:
+            meta = {}
+    except Exception as e:
+        logging.error(f"[UPLOAD] Erro ao ler banners_meta.json: {e}")
+        meta = {}
+    store_id_clean = str(store_id).strip() if store_id else None
+    all_stores_flag = str(all_stores).lower() in ['1', 'true', 'on', 'yes'] if all_stores is not None else False
+    meta[file.filename] = {
+        'store_id': store_id_clean,
+        'all_stores': all_stores_flag,
+        'uploaded_by': username
+    }
+    try:
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logging.error(f"[UPLOAD] Erro ao salvar banners_meta.json: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao salvar metadados.")
+    return {"success": True, "filename": file.filename}
@@ -0,0 +1,97 @@
+"""
+Módulo: catalog_binary.py
+-------------------------
+Catálogo binário compacto (PRXC) para o agente local e equipamentos: GET /product/all.bin
+
+Formato (little-endian), pensado para mmap e busca binária sem carregar o arquivo:
+
+- Cabeçalho (HEADER, 40 bytes): magic b'PRXC', versão, largura da chave, quantidade,
+  revisão do catálogo (-1 se desconhecida) e offsets/tamanhos das seções
+- Índice: `count` códigos de barras ASCII/UTF-8 com largura fixa (preenchidos com NUL),
+  ordenados byte a byte
+- Tabela de registros (RECORD, 12 bytes, mesma ordem do índice): offset e tamanho do
+  nome no heap, flags (promo, preço presente) e preço em centavos
+- Heap de strings: nomes UTF-8 concatenados
+
+O leitor correspondente fica em agente_local/catalog_reader.py (mantenha os dois em sincronia).
+"""
+
+import logging
+import struct
+from typing import Iterable, Optional, Tuple
+
+try:
+    from .catalog_format import normalize_product_row
+except ImportError:
+    from catalog_format import normalize_product_row
+
+MAGIC = b'PRXC'
+VERSION = 1
+# magic, versão, largura da chave, quantidade, revisão, off índice, off registros, off heap, tamanho heap
+HEADER = struct.Struct('<4sHHIqIIII')
+HEADER_SIZE = 40
+# offset do nome, tamanho do nome, flags, reservado, preço em centavos
+RECORD = struct.Struct('<IHBxi')
+
+FLAG_PROMO = 0x01
+FLAG_HAS_PRICE = 0x02
+
+MAX_KEY_WIDTH = 64
+MAX_NAME_BYTES = 0xFFFF
+MEDIA_TYPE = 'application/vnd.precix.catalog'
+
+
+def _price_cents(price) -> Optional[int]:
+    try:
+        if price is None:
+            return None
+        cents = int(round(float(price) * 100))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if not -0x80000000 <= cents <= 0x7FFFFFFF:
+        return None
+    return cents
+
+
+def build_catalog_binary(rows: Iterable, revision: Optional[int] = None) -> Tuple[bytes, int]:
+    """Serializa linhas (barcode, name, price, promo) no formato PRXC. Retorna (corpo, quantidade).
+
+    Preços passam pela mesma normalização do /product/all. Códigos repetidos mantêm a
+    última ocorrência; códigos vazios ou maiores que MAX_KEY_WIDTH bytes são ignorados.
+    """
+    by_key = {}
+    skipped = 0
+    for row in rows:
+        p = normalize_product_row(row)
+        key = str(p['barcode'] or '').strip().encode('utf-8')
+        if not key or len(key) > MAX_KEY_WIDTH:
+            skipped += 1
+            continue
+        by_key[key] = p
+    if skipped:
+        logging.warning(f"[CATALOG] {skipped} produtos sem código válido fora do catálogo binário")
+    keys = sorted(by_key)
+    count = len(keys)
+    key_width = max((len(k) for k in keys), default=1)
+
+    index = bytearray(count * key_width)
+    records = bytearray(count * RECORD.size)
+    heap = bytearray()
+    for i, key in enumerate(keys):
+        p = by_key[key]
+        index[i * key_width:i * key_width + len(key)] = key
+        name = str(p['name'] or '').encode('utf-8')[:MAX_NAME_BYTES]
+        cents = _price_cents(p['price'])
+        flags = (FLAG_PROMO if p['promo'] else 0) | (FLAG_HAS_PRICE if cents is not None else 0)
+        RECORD.pack_into(records, i * RECORD.size, len(heap), len(name), flags, cents or 0)
+        heap += name
+
+    index_off = HEADER_SIZE
+    records_off = index_off + len(index)
+    heap_off = records_off + len(records)
+    header = HEADER.pack(
+        MAGIC, VERSION, key_width, count,
+        -1 if revision is None else int(revision),
+        index_off, records_off, heap_off, len(heap),
+    ).ljust(HEADER_SIZE, b'\0')
+    return b''.join((header, bytes(index), bytes(records), bytes(heap))), count
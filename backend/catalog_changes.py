@@ -0,0 +1,101 @@
+"""
+Módulo: catalog_changes.py
+--------------------------
+Sync incremental do catálogo: mudanças (upserts e exclusões) desde uma revisão.
+
+- Cada produto carrega products.rev (trigger da migração 2); exclusões viram tombstones
+- GET /product/changes?since=<rev>&limit=<n> devolve apenas o que mudou, paginado por revisão
+- resync=True quando o cliente está abaixo do piso (tombstones já podados/TRUNCATE) ou
+  à frente do servidor (banco restaurado): o cliente deve baixar /product/all de novo
+"""
+
+import logging
+import os
+from typing import Optional
+
+try:
+    from .database import db_transaction
+    from .catalog_format import normalize_product_row
+except ImportError:
+    from database import db_transaction
+    from catalog_format import normalize_product_row
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('PRECIX_TOMBSTONE_RETENTION_DAYS', '30'))
+
+
+def get_catalog_changes(since: Optional[int], limit: int = DEFAULT_LIMIT) -> dict:
+    """Retorna as mudanças com revisão maior que `since`, em ordem de revisão.
+
+    Resposta: revision (atual), since, upserts, deletes (barcodes), next_since,
+    has_more e resync. O cliente repete a chamada com since=next_since enquanto has_more.
+    """
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        # Snapshot único: revisão atual e mudanças lidas do mesmo estado do banco
+        cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        cur.execute('SELECT revision, delta_floor FROM catalog_state WHERE id = 1')
+        row = cur.fetchone()
+        revision, floor = (int(row[0]), int(row[1])) if row else (0, 0)
+        out = {
+            'revision': revision,
+            'since': since,
+            'upserts': [],
+            'deletes': [],
+            'next_since': revision,
+            'has_more': False,
+            'resync': False,
+        }
+        if since is None or since < floor or since > revision:
+            out['resync'] = True
+            return out
+        # Busca limit+1 de cada lado para saber se há mais páginas
+        cur.execute(
+            'SELECT barcode, name, price, promo, rev FROM products WHERE rev > %s ORDER BY rev LIMIT %s',
+            (since, limit + 1)
+        )
+        ups = cur.fetchall()
+        cur.execute(
+            'SELECT barcode, rev FROM product_tombstones WHERE rev > %s ORDER BY rev LIMIT %s',
+            (since, limit + 1)
+        )
+        dels = cur.fetchall()
+        cur.close()
+    # Intercala por revisão e corta na página
+    merged = sorted(
+        [(r[4], 'u', r) for r in ups] + [(r[1], 'd', r) for r in dels],
+        key=lambda x: x[0]
+    )
+    page = merged[:limit]
+    for rev, kind, r in page:
+        if kind == 'u':
+            out['upserts'].append(normalize_product_row(r))
+        else:
+            out['deletes'].append(r[0])
+    if len(merged) > limit:
+        out['has_more'] = True
+        out['next_since'] = page[-1][0]
+    # Sem mais páginas: next_since = revisão atual (inclui revisões sem mudança visível)
+    return out
+
+
+def prune_tombstones(retention_days: int = TOMBSTONE_RETENTION_DAYS) -> int:
+    """Remove tombstones antigos e sobe o piso de delta para a maior revisão removida."""
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "DELETE FROM product_tombstones WHERE deleted_at < now() - (%s * interval '1 day') RETURNING rev",
+            (int(retention_days),)
+        )
+        revs = [r[0] for r in cur.fetchall()]
+        if revs:
+            cur.execute(
+                'UPDATE catalog_state SET delta_floor = GREATEST(delta_floor, %s) WHERE id = 1',
+                (max(revs),)
+            )
+        cur.close()
+    if revs:
+        logging.info(f"[CATALOG] {len(revs)} tombstones removidos; piso de delta = {max(revs)}")
+    return len(revs)
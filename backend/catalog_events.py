@@ -0,0 +1,231 @@
+"""
+Módulo: catalog_events.py
+-------------------------
+Canal Server-Sent Events (GET /product/events) com as mudanças do catálogo.
+
+- Um único poller por processo acompanha a revisão do catálogo (catalog_state) e, quando ela
+  muda, busca o delta (get_catalog_changes) e publica um evento para todos os clientes
+- Escritas locais (upsert_products, importador) acordam o poller na hora via
+  add_product_write_listener; escritas de outros workers chegam no próximo ciclo
+  (PRECIX_SSE_POLL_S)
+- Eventos (o id é a revisão do catálogo):
+    changes   {revision, since, upserts, deletes}  delta pequeno (até PRECIX_SSE_MAX_CHANGES itens)
+    revision  {revision, has_more: true}           delta grande: o cliente usa /product/changes
+    resync    {revision}                           cliente fora da janela de deltas: baixar /product/all
+- Last-Event-ID (cabeçalho ou ?last_event_id=) retoma a partir da revisão informada: pelo
+  backlog em memória ou, se ela já saiu dele, pelo banco
+- Comentário ": ping" a cada PRECIX_SSE_HEARTBEAT_S mantém a conexão viva em proxies
+- Clientes ociosos custam uma corrotina: não há fila por cliente, todos leem o mesmo backlog
+  e esperam o mesmo asyncio.Event
+- store_id: eventos publicados com loja só chegam a clientes dessa loja (ou sem filtro);
+  o catálogo de preços é único, então os eventos de catálogo vão para todas as lojas
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import AsyncIterator, Callable, Optional
+
+SSE_POLL_S = float(os.environ.get('PRECIX_SSE_POLL_S', '2'))
+SSE_HEARTBEAT_S = float(os.environ.get('PRECIX_SSE_HEARTBEAT_S', '15'))
+SSE_BACKLOG = int(os.environ.get('PRECIX_SSE_BACKLOG', '256'))
+SSE_MAX_CHANGES = int(os.environ.get('PRECIX_SSE_MAX_CHANGES', '500'))
+SSE_RETRY_MS = int(os.environ.get('PRECIX_SSE_RETRY_MS', '5000'))
+
+
+def format_sse(event: str, data: dict, event_id: Optional[int] = None) -> bytes:
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+    lines.extend(f'data: {part}' for part in payload.split('\n'))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class CatalogEventBroker:
+    """Poller da revisão + backlog compartilhado de eventos SSE.
+
+    fetch_revision(force) -> revisão atual (ou None); fetch_changes(since, limit) -> dict de
+    get_catalog_changes. Ambas são bloqueantes e rodam via run_blocking (executor do banco).
+    """
+
+    def __init__(self, fetch_revision: Callable, fetch_changes: Callable, run_blocking: Callable,
+                 poll_s: float = SSE_POLL_S, heartbeat_s: float = SSE_HEARTBEAT_S,
+                 backlog: int = SSE_BACKLOG, max_changes: int = SSE_MAX_CHANGES):
+        self._fetch_revision = fetch_revision
+        self._fetch_changes = fetch_changes
+        self._run_blocking = run_blocking
+        self.poll_s = max(0.1, float(poll_s))
+        self.heartbeat_s = max(1.0, float(heartbeat_s))
+        self.max_changes = max(1, int(max_changes))
+        # (seq, revision, since, store_id, frame)
+        self._backlog: deque = deque(maxlen=max(1, int(backlog)))
+        self._seq = 0
+        self._revision: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._new_event: Optional[asyncio.Event] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._force = False
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {'clients': 0, 'max_clients': 0, 'connections': 0, 'published': 0,
+                       'replays_memory': 0, 'replays_db': 0, 'resyncs': 0, 'poll_errors': 0}
+
+    # --- ciclo de vida (chamar no event loop) ---
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._new_event = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._poll_loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._new_event is not None:
+            # Libera os clientes conectados para encerrarem
+            self._new_event.set()
+
+    def notify_write(self, barcodes=None):
+        """Listener de escrita em products (qualquer thread): antecipa a próxima verificação."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        self._force = True
+        try:
+            loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError:
+            pass
+
+    # --- publicação ---
+    def publish(self, event: str, data: dict, revision: Optional[int] = None,
+                since: Optional[int] = None, store_id: Optional[int] = None):
+        self._seq += 1
+        self._backlog.append((self._seq, revision, since, store_id, format_sse(event, data, revision)))
+        self._stats['published'] += 1
+        # Acorda todos os clientes de uma vez e arma o próximo Event
+        waiter, self._new_event = self._new_event, asyncio.Event()
+        waiter.set()
+
+    def _changes_frame(self, changes: dict, since: int):
+        """(evento, dados) para um resultado de get_catalog_changes a partir de `since`."""
+        if changes.get('resync'):
+            return 'resync', {'revision': changes['revision']}
+        if changes.get('has_more'):
+            return 'revision', {'revision': changes['revision'], 'has_more': True}
+        return 'changes', {
+            'revision': changes['revision'],
+            'since': since,
+            'upserts': changes.get('upserts') or [],
+            'deletes': changes.get('deletes') or [],
+        }
+
+    async def _poll_once(self):
+        force, self._force = self._force, False
+        revision = await self._run_blocking(self._fetch_revision, force)
+        if revision is None or revision == self._revision:
+            return
+        previous, self._revision = self._revision, revision
+        if previous is None:
+            # Primeira leitura: só a linha de base
+            return
+        changes = await self._run_blocking(self._fetch_changes, previous, self.max_changes)
+        event, data = self._changes_frame(changes, previous)
+        # O delta pode ter avançado além da revisão lida (escritas concorrentes)
+        self._revision = max(revision, int(changes.get('revision') or revision))
+        self.publish(event, data, revision=self._revision, since=None if event == 'resync' else previous)
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            # Sem clientes não há para quem publicar; a linha de base é mantida
+            if self._stats['clients'] == 0 and self._revision is not None and not self._force:
+                continue
+            try:
+                await self._poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats['poll_errors'] += 1
+                logging.warning(f"[SSE] Falha ao verificar revisão do catálogo: {e}")
+
+    # --- clientes ---
+    async def _replay(self, last_id: int, store_id: Optional[int]):
+        """Frames para um cliente que retoma de last_id (Last-Event-ID) e a última revisão enviada."""
+        covered = any(since is not None and since <= last_id for _, _, since, _, _ in self._backlog)
+        if covered or (self._revision is not None and last_id >= self._revision):
+            self._stats['replays_memory'] += 1
+            frames, sent = [], last_id
+            for _, revision, _, sid, frame in self._backlog:
+                if revision is not None and revision > last_id and (sid is None or store_id is None or sid == store_id):
+                    frames.append(frame)
+                    sent = max(sent, revision)
+            return frames, sent
+        self._stats['replays_db'] += 1
+        changes = await self._run_blocking(self._fetch_changes, last_id, self.max_changes)
+        event, data = self._changes_frame(changes, last_id)
+        if event == 'resync':
+            self._stats['resyncs'] += 1
+        return [format_sse(event, data, changes.get('revision'))], changes.get('revision')
+
+    async def stream(self, last_event_id: Optional[str] = None, store_id: Optional[int] = None,
+                     is_disconnected: Callable = None) -> AsyncIterator[bytes]:
+        self._stats['clients'] += 1
+        self._stats['connections'] += 1
+        self._stats['max_clients'] = max(self._stats['max_clients'], self._stats['clients'])
+        try:
+            yield f'retry: {SSE_RETRY_MS}\n\n'.encode('ascii')
+            cursor = self._seq
+            try:
+                last_id = int(last_event_id) if last_event_id not in (None, '') else None
+            except ValueError:
+                last_id = None
+            sent = None
+            if last_id is not None:
+                frames, sent = await self._replay(last_id, store_id)
+                for frame in frames:
+                    yield frame
+            elif self._revision is not None:
+                sent = self._revision
+                yield format_sse('revision', {'revision': self._revision}, self._revision)
+            while self._task is not None:
+                waiter = self._new_event
+                # Evento publicado enquanto este gerador estava parado num yield: o Event daquele
+                # publish já foi trocado, então não espera (senão só sairia no próximo publish)
+                if self._seq <= cursor:
+                    try:
+                        await asyncio.wait_for(waiter.wait(), timeout=self.heartbeat_s)
+                    except asyncio.TimeoutError:
+                        if is_disconnected is not None and await is_disconnected():
+                            return
+                        yield b': ping\n\n'
+                        continue
+                for seq, revision, _, sid, frame in list(self._backlog):
+                    if seq <= cursor or (sid is not None and store_id is not None and sid != store_id):
+                        continue
+                    # Já enviado no replay (evento publicado enquanto o banco era consultado)
+                    if revision is not None and sent is not None and revision <= sent:
+                        continue
+                    yield frame
+                    if revision is not None:
+                        sent = revision
+                cursor = self._seq
+        finally:
+            self._stats['clients'] -= 1
+
+    def stats(self) -> dict:
+        out = dict(self._stats)
+        out['revision'] = self._revision
+        out['backlog'] = len(self._backlog)
+        out['running'] = self._task is not None
+        out['poll_s'] = self.poll_s
+        out['heartbeat_s'] = self.heartbeat_s
+        return out
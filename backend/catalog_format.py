@@ -0,0 +1,68 @@
+"""
+Módulo: catalog_format.py
+-------------------------
+Formatação do catálogo de produtos entregue aos clientes (sem dependência de banco).
+
+- normalize_product_row: linha (barcode, name, price, promo) -> dict de produto
+- dumps_products: corpo JSON completo (mesmo formato do JSONResponse do FastAPI)
+- iter_ndjson / iter_json_array: serialização incremental em blocos para streaming
+"""
+
+import json
+import math
+from typing import Iterable, Iterator
+
+
+def normalize_product_row(row) -> dict:
+    """Converte uma linha (barcode, name, price, promo) no formato entregue aos clientes.
+
+    Mantém a heurística histórica: preço menor que 1 (e diferente de zero)
+    provavelmente está em centavos e é convertido para reais.
+    """
+    produto = {'barcode': row[0], 'name': row[1], 'price': row[2], 'promo': row[3]}
+    preco = produto['price']
+    if preco is not None and isinstance(preco, float) and not math.isfinite(preco):
+        produto['price'] = None
+    elif preco and preco < 1:
+        produto['price'] = round(preco * 100, 2)
+    return produto
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+
+
+def dumps_products(produtos) -> bytes:
+    """Serializa como o JSONResponse do FastAPI (UTF-8, sem espaços)."""
+    return _dumps(produtos).encode('utf-8')
+
+
+def iter_ndjson(rows: Iterable, chunk_rows: int = 1000) -> Iterator[bytes]:
+    """Um produto JSON por linha, agrupando chunk_rows linhas por bloco emitido."""
+    buf = []
+    for row in rows:
+        buf.append(_dumps(normalize_product_row(row)))
+        if len(buf) >= chunk_rows:
+            yield ('\n'.join(buf) + '\n').encode('utf-8')
+            buf = []
+    if buf:
+        yield ('\n'.join(buf) + '\n').encode('utf-8')
+
+
+def iter_json_array(rows: Iterable, chunk_rows: int = 1000) -> Iterator[bytes]:
+    """Array JSON escrito incrementalmente (mesmo conteúdo de dumps_products)."""
+    first = True
+    buf = ['[']
+    n = 0
+    for row in rows:
+        if not first:
+            buf.append(',')
+        first = False
+        buf.append(_dumps(normalize_product_row(row)))
+        n += 1
+        if n >= chunk_rows:
+            yield ''.join(buf).encode('utf-8')
+            buf = []
+            n = 0
+    buf.append(']')
+    yield ''.join(buf).encode('utf-8')
@@ -0,0 +1,180 @@
+"""
+Módulo: catalog_router.py
+-------------------------
+Rotas do catálogo de produtos: consulta por código de barras, catálogo completo (JSON, streaming
+e binário), sync incremental e SSE, carga em lote, exportação TXT e cache de produtos.
+"""
+
+import json
+import logging
+from typing import Dict, List, Optional, Union
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+
+try:
+    from .database import (
+        get_product_by_barcode, export_products_to_txt, add_audit_log, upsert_products,
+        invalidate_product_cache, get_product_cache_stats, add_product_write_listener
+    )
+    from .ai_agent_integration import notify_ai_agent
+    from .auth_jwt import get_current_user
+    from .catalog_snapshot import catalog_response, catalog_binary_response, catalog_store, catalog_bin_store
+    from .catalog_stream import catalog_stream_response
+    from .catalog_changes import get_catalog_changes
+    from .catalog_events import CatalogEventBroker
+    from .db_async import run_db
+except ImportError:
+    from database import (
+        get_product_by_barcode, export_products_to_txt, add_audit_log, upsert_products,
+        invalidate_product_cache, get_product_cache_stats, add_product_write_listener
+    )
+    from ai_agent_integration import notify_ai_agent
+    from auth_jwt import get_current_user
+    from catalog_snapshot import catalog_response, catalog_binary_response, catalog_store, catalog_bin_store
+    from catalog_stream import catalog_stream_response
+    from catalog_changes import get_catalog_changes
+    from catalog_events import CatalogEventBroker
+    from db_async import run_db
+
+router = APIRouter()
+
+
+@router.post('/admin/products/bulk')
+def admin_products_bulk(payload: Union[List[Dict], Dict, str] = Body(...), username: str = Depends(get_current_user)):
+    try:
+        data_list: List[Dict] = []
+        if isinstance(payload, list):
+            data_list = [p for p in payload if isinstance(p, dict)]
+        elif isinstance(payload, dict):
+            if isinstance(payload.get('produtos'), list):
+                data_list = [p for p in payload.get('produtos') if isinstance(p, dict)]
+            elif isinstance(payload.get('products'), list):
+                data_list = [p for p in payload.get('products') if isinstance(p, dict)]
+            else:
+                data_list = [payload]
+        elif isinstance(payload, str):
+            try:
+                parsed = json.loads(payload)
+                if isinstance(parsed, list):
+                    data_list = [p for p in parsed if isinstance(p, dict)]
+                elif isinstance(parsed, dict):
+                    if isinstance(parsed.get('produtos'), list):
+                        data_list = [p for p in parsed.get('produtos') if isinstance(p, dict)]
+                    elif isinstance(parsed.get('products'), list):
+                        data_list = [p for p in parsed.get('products') if isinstance(p, dict)]
+                    else:
+                        data_list = [parsed]
+            except Exception:
+                raise HTTPException(status_code=400, detail='Payload inválido (string não é JSON válido)')
+        if not data_list:
+            raise HTTPException(status_code=400, detail='Nenhum produto válido no payload')
+        result = upsert_products(data_list)
+        try:
+            add_audit_log(None, None, 'PRODUCTS_BULK_UPSERT', json.dumps({'user': username, 'result': result}, ensure_ascii=False))
+        except Exception:
+            pass
+        return JSONResponse(content={'success': True, 'result': result})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.exception('Erro no endpoint admin/products/bulk')
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get('/product/all')
+def get_all_products(request: Request, stream: Optional[str] = Query(None)):
+    # stream=ndjson|json: cursor server-side em streaming, memória limitada; ver catalog_stream.py
+    if stream:
+        return catalog_stream_response(stream)
+    # Corpo pré-serializado por revisão do catálogo (ETag/304 e gzip); ver catalog_snapshot.py
+    return catalog_response(request)
+
+
+@router.get('/api/produtos')
+def alias_api_produtos(request: Request, stream: Optional[str] = Query(None)):
+    return get_all_products(request, stream)
+
+
+@router.get('/product/all.bin')
+def get_all_products_binary(request: Request):
+    # Catálogo binário (índice ordenado + heap) para o agente local fazer mmap; ver catalog_binary.py
+    return catalog_binary_response(request)
+
+
+def _notify_catalog_rebuild(snap):
+    notify_ai_agent('sync_success', {'source': 'backend', 'info': 'Produtos sincronizados', 'revision': snap.revision, 'total': snap.count})
+
+
+# A IA é notificada apenas quando o catálogo muda (nova revisão), fora da requisição
+catalog_store.on_rebuild = _notify_catalog_rebuild
+
+
+@router.get('/admin/catalog/stats')
+def admin_catalog_stats():
+    out = catalog_store.stats()
+    out['binary'] = catalog_bin_store.stats()
+    return out
+
+
+# Sync incremental: apenas produtos alterados/excluídos desde a revisão informada
+@router.get('/product/changes')
+def product_changes(since: Optional[int] = Query(None), limit: int = Query(1000, ge=1, le=10000)):
+    try:
+        return get_catalog_changes(since, limit)
+    except Exception:
+        logging.exception('Erro no endpoint product/changes')
+        raise HTTPException(status_code=503, detail='Sync incremental indisponível; use /product/all')
+
+
+# Push das mudanças do catálogo por Server-Sent Events (catalog_events.py)
+catalog_events = CatalogEventBroker(catalog_store.current_revision, get_catalog_changes, run_db)
+add_product_write_listener(catalog_events.notify_write)
+
+
+@router.get('/product/events')
+async def product_events(request: Request, last_event_id: Optional[str] = Query(None), store_id: Optional[int] = Query(None)):
+    # EventSource reenvia o último id no cabeçalho ao reconectar; ?last_event_id= para o primeiro acesso
+    resume = request.headers.get('last-event-id') or last_event_id
+    return StreamingResponse(
+        catalog_events.stream(resume, store_id, request.is_disconnected),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@router.get('/admin/events/stats')
+def admin_events_stats():
+    return catalog_events.stats()
+
+
+@router.get('/admin/export-txt')
+def export_txt():
+    txt_path = export_products_to_txt()
+    try:
+        notify_ai_agent('export', {'file': txt_path})
+    except Exception:
+        pass
+    return FileResponse(txt_path, media_type='text/plain', filename='produtos.txt')
+
+
+# Estatísticas do cache de produtos por código de barras (hits, misses, evicções)
+@router.get('/admin/cache/stats')
+def admin_cache_stats():
+    return get_product_cache_stats()
+
+
+# Limpa o cache de produtos (ex.: após alteração manual direto no banco)
+@router.post('/admin/cache/clear')
+def admin_cache_clear():
+    invalidate_product_cache()
+    return {'success': True}
+
+
+# Rota dinâmica por último: /product/all, /product/changes e /product/events têm precedência
+@router.get('/product/{barcode}')
+def get_product(barcode: str):
+    product = get_product_by_barcode(barcode)
+    if not product:
+        raise HTTPException(status_code=404, detail='Produto não encontrado')
+    return product
@@ -0,0 +1,275 @@
+"""
+Módulo: catalog_snapshot.py
+---------------------------
+Snapshot versionado do catálogo completo servido em /product/all, /api/produtos e
+/product/all.bin (formato binário PRXC, ver catalog_binary.py).
+
+- A revisão do catálogo vem de catalog_state (incrementada por trigger em products)
+- Para cada revisão o corpo JSON é serializado e comprimido (gzip) uma única vez
+- ETag fraco W/"catalog-<revisão>": clientes com If-None-Match recebem 304 sem corpo
+- A revisão é consultada no banco no máximo a cada PRECIX_CATALOG_REV_CHECK_S segundos
+- Sem a migração aplicada (catalog_state ausente) usa um contador local + TTL de reconstrução
+"""
+
+import gzip
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+try:
+    from .database import db_connection, add_product_write_listener
+    from .catalog_format import normalize_product_row, dumps_products
+    from .catalog_binary import build_catalog_binary, MEDIA_TYPE as BINARY_MEDIA_TYPE
+except ImportError:
+    from database import db_connection, add_product_write_listener
+    from catalog_format import normalize_product_row, dumps_products
+    from catalog_binary import build_catalog_binary, MEDIA_TYPE as BINARY_MEDIA_TYPE
+
+REV_CHECK_S = float(os.environ.get('PRECIX_CATALOG_REV_CHECK_S', '1.0'))
+# Sem catalog_state: idade máxima do snapshot antes de reconstruir
+FALLBACK_TTL_S = float(os.environ.get('PRECIX_CATALOG_FALLBACK_TTL_S', '30'))
+GZIP_LEVEL = int(os.environ.get('PRECIX_CATALOG_GZIP_LEVEL', '6'))
+
+
+class CatalogSnapshot:
+    """Corpo pronto de uma revisão do catálogo (identity e gzip)."""
+
+    __slots__ = ('revision', 'etag', 'body', 'gzip_body', 'count', 'built_at', 'build_ms', 'local_gen')
+
+    def __init__(self, revision, etag, body, gzip_body, count, build_ms, local_gen):
+        self.revision = revision
+        self.etag = etag
+        self.body = body
+        self.gzip_body = gzip_body
+        self.count = count
+        self.built_at = time.time()
+        self.build_ms = build_ms
+        self.local_gen = local_gen
+
+
+def _serialize_json(rows, revision):
+    produtos = [normalize_product_row(r) for r in rows]
+    return dumps_products(produtos), len(produtos)
+
+
+class CatalogSnapshotStore:
+    """Snapshots por revisão de um formato do catálogo.
+
+    name: prefixo do ETag e dos logs; serialize(rows, revision) -> (corpo, quantidade).
+    """
+
+    def __init__(self, name: str = 'catalog', serialize=_serialize_json):
+        self.name = name
+        self._serialize = serialize
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._build_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._rev_checked_at = 0.0
+        self._db_revision = None
+        self._revision_supported = True
+        # Incrementado por invalidate(): força reconstrução mesmo sem catalog_state
+        self._local_gen = 0
+        self._stats = {
+            'builds': 0,
+            'build_errors': 0,
+            'served_200': 0,
+            'served_304': 0,
+            'served_gzip': 0,
+            'revision_checks': 0,
+            'last_build_ms': 0.0,
+        }
+        # Chamado (em thread separada) após cada reconstrução; ex.: notificar a IA
+        self.on_rebuild = None
+
+    # --- revisão ---
+    def _read_revision(self, cur) -> Optional[int]:
+        if not self._revision_supported:
+            return None
+        try:
+            cur.execute('SELECT revision FROM catalog_state WHERE id = 1')
+            row = cur.fetchone()
+            return int(row[0]) if row else None
+        except Exception as e:
+            # Tabela ausente (migração não aplicada): passa a usar o modo fallback
+            logging.warning(f"[CATALOG] catalog_state indisponível, usando revisão local: {e}")
+            self._revision_supported = False
+            return None
+
+    def current_revision(self, force: bool = False) -> Optional[int]:
+        """Revisão do banco, consultada no máximo a cada REV_CHECK_S segundos."""
+        if not self._revision_supported:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._rev_checked_at < REV_CHECK_S:
+                return self._db_revision
+        with db_connection() as conn:
+            cur = conn.cursor()
+            rev = self._read_revision(cur)
+            cur.close()
+        with self._lock:
+            self._db_revision = rev
+            self._rev_checked_at = time.monotonic()
+            self._stats['revision_checks'] += 1
+        return rev
+
+    def invalidate(self):
+        """Chamado após escritas locais: próxima requisição revalida a revisão."""
+        with self._lock:
+            self._local_gen += 1
+            self._rev_checked_at = 0.0
+
+    # --- snapshot ---
+    def _is_current(self, snap: Optional[CatalogSnapshot], rev: Optional[int]) -> bool:
+        if snap is None or snap.local_gen != self._local_gen:
+            return False
+        if rev is not None:
+            return snap.revision == rev
+        return (time.time() - snap.built_at) < FALLBACK_TTL_S
+
+    def get(self) -> CatalogSnapshot:
+        rev = self.current_revision()
+        snap = self._snapshot
+        if self._is_current(snap, rev):
+            return snap
+        # Single-flight: apenas uma thread reconstrói; as demais aguardam e reutilizam
+        with self._build_lock:
+            snap = self._snapshot
+            rev = self.current_revision()
+            if self._is_current(snap, rev):
+                return snap
+            snap = self._build()
+            self._snapshot = snap
+        if self.on_rebuild:
+            threading.Thread(target=self._notify_rebuild, args=(snap,), daemon=True).start()
+        return snap
+
+    def _build(self) -> CatalogSnapshot:
+        t0 = time.perf_counter()
+        local_gen = self._local_gen
+        try:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                # Revisão lida ANTES das linhas: uma escrita concorrente gera no máximo
+                # uma reconstrução extra, nunca um snapshot novo rotulado com revisão antiga
+                rev = self._read_revision(cur)
+                cur.execute('SELECT barcode, name, price, promo FROM products')
+                rows = cur.fetchall()
+                cur.close()
+        except Exception:
+            with self._lock:
+                self._stats['build_errors'] += 1
+            raise
+        body, count = self._serialize(rows, rev)
+        del rows
+        gz = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        if rev is not None:
+            etag = f'W/"{self.name}-{rev}"'
+        else:
+            etag = f'W/"{self.name}-local-{local_gen}-{int(time.time())}"'
+        build_ms = (time.perf_counter() - t0) * 1000.0
+        with self._lock:
+            self._db_revision = rev
+            self._rev_checked_at = time.monotonic()
+            self._stats['builds'] += 1
+            self._stats['last_build_ms'] = round(build_ms, 3)
+        logging.info(f"[CATALOG] Snapshot {self.name} rev={rev} com {count} produtos ({len(body)} bytes, gzip {len(gz)}) em {build_ms:.1f}ms")
+        return CatalogSnapshot(rev, etag, body, gz, count, build_ms, local_gen)
+
+    def _notify_rebuild(self, snap: CatalogSnapshot):
+        try:
+            self.on_rebuild(snap)
+        except Exception as e:
+            logging.warning(f"[CATALOG] Falha no callback de reconstrução: {e}")
+
+    def count_served(self, status: int, gzipped: bool = False):
+        with self._lock:
+            if status == 304:
+                self._stats['served_304'] += 1
+            else:
+                self._stats['served_200'] += 1
+                if gzipped:
+                    self._stats['served_gzip'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            snap = self._snapshot
+            out['revision_supported'] = self._revision_supported
+        if snap is not None:
+            out['revision'] = snap.revision
+            out['etag'] = snap.etag
+            out['products'] = snap.count
+            out['bytes'] = len(snap.body)
+            out['gzip_bytes'] = len(snap.gzip_body)
+            out['built_at'] = snap.built_at
+        return out
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparação fraca de ETag (RFC 7232) contra o cabeçalho If-None-Match."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+
+    def _opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith('W/') else tag
+
+    target = _opaque(etag)
+    return any(_opaque(t) == target for t in if_none_match.split(','))
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    if not accept_encoding:
+        return False
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        if token.strip().lower() in ('gzip', '*'):
+            q = params.strip()
+            if q.startswith('q='):
+                try:
+                    return float(q[2:]) > 0
+                except ValueError:
+                    return True
+            return True
+    return False
+
+
+catalog_store = CatalogSnapshotStore()
+# Construído apenas quando alguém baixa /product/all.bin
+catalog_bin_store = CatalogSnapshotStore('catalog-bin', build_catalog_binary)
+# Escritas feitas por este processo revalidam a revisão imediatamente
+add_product_write_listener(lambda barcodes: catalog_store.invalidate())
+add_product_write_listener(lambda barcodes: catalog_bin_store.invalidate())
+
+
+def catalog_response(request, store: CatalogSnapshotStore = None, media_type: str = 'application/json'):
+    """Resposta HTTP do catálogo completo (200 com corpo pré-serializado ou 304)."""
+    from fastapi.responses import Response
+    store = store or catalog_store
+    snap = store.get()
+    headers = {
+        'ETag': snap.etag,
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+    if snap.revision is not None:
+        headers['X-Catalog-Revision'] = str(snap.revision)
+    if etag_matches(request.headers.get('if-none-match'), snap.etag):
+        store.count_served(304)
+        return Response(status_code=304, headers=headers)
+    if accepts_gzip(request.headers.get('accept-encoding')):
+        headers['Content-Encoding'] = 'gzip'
+        store.count_served(200, gzipped=True)
+        return Response(content=snap.gzip_body, media_type=media_type, headers=headers)
+    store.count_served(200)
+    return Response(content=snap.body, media_type=media_type, headers=headers)
+
+
+def catalog_binary_response(request):
+    """Catálogo binário PRXC (mesmas regras de ETag/304/gzip do JSON)."""
+    return catalog_response(request, catalog_bin_store, BINARY_MEDIA_TYPE)
@@ -0,0 +1,99 @@
+"""
+Módulo: catalog_stream.py
+-------------------------
+Exportação do catálogo completo em streaming (GET /product/all?stream=ndjson|json).
+
+- Cursor nomeado (server-side) do psycopg2: as linhas vêm do banco em lotes de itersize,
+  sem fetchall() nem lista de dicts em memória
+- NDJSON (um produto por linha) ou array JSON escrito incrementalmente
+- Pico de memória limitado por itersize/chunk, independente do tamanho do catálogo
+- Revisão e linhas lidas do mesmo snapshot (REPEATABLE READ)
+"""
+
+import logging
+import os
+import time
+from typing import Iterator, Optional, Tuple
+
+try:
+    from .database import get_pool
+    from .catalog_format import iter_ndjson, iter_json_array
+except ImportError:
+    from database import get_pool
+    from catalog_format import iter_ndjson, iter_json_array
+
+STREAM_ITERSIZE = int(os.environ.get('PRECIX_CATALOG_STREAM_ITERSIZE', '2000'))
+# Linhas serializadas por bloco enviado ao cliente
+STREAM_CHUNK_ROWS = int(os.environ.get('PRECIX_CATALOG_STREAM_CHUNK_ROWS', '1000'))
+
+STREAM_FORMATS = {
+    'ndjson': ('application/x-ndjson', iter_ndjson),
+    'json': ('application/json', iter_json_array),
+}
+
+
+def _read_revision(cur) -> Optional[int]:
+    cur.execute('SAVEPOINT catalog_rev')
+    try:
+        cur.execute('SELECT revision FROM catalog_state WHERE id = 1')
+        row = cur.fetchone()
+        cur.execute('RELEASE SAVEPOINT catalog_rev')
+        return int(row[0]) if row else None
+    except Exception:
+        # Sem a migração (catalog_state ausente): segue sem revisão
+        cur.execute('ROLLBACK TO SAVEPOINT catalog_rev')
+        return None
+
+
+def open_catalog_stream(fmt: str = 'ndjson') -> Tuple[Optional[int], str, Iterator[bytes]]:
+    """Abre o cursor do catálogo e retorna (revisão, media type, gerador de blocos).
+
+    A conexão é emprestada diretamente do pool (não via db_connection, que é por thread):
+    o StreamingResponse consome o gerador em outras threads. O gerador fecha o cursor e
+    devolve a conexão ao terminar, em erro ou quando o cliente desconecta.
+    """
+    media_type, serializer = STREAM_FORMATS[fmt]
+    conn = get_pool().connection()
+    try:
+        conn.autocommit = False
+        cur = conn.cursor()
+        cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        revision = _read_revision(cur)
+        cur.close()
+        named = conn.cursor(name='precix_catalog_stream')
+        named.itersize = STREAM_ITERSIZE
+        named.execute('SELECT barcode, name, price, promo FROM products')
+    except Exception:
+        conn.close()
+        raise
+
+    def _generate():
+        t0 = time.perf_counter()
+        sent = 0
+        try:
+            for chunk in serializer(named, chunk_rows=STREAM_CHUNK_ROWS):
+                sent += len(chunk)
+                yield chunk
+            logging.info(f"[CATALOG] Stream {fmt} rev={revision} concluído ({sent} bytes) em {(time.perf_counter() - t0) * 1000.0:.1f}ms")
+        finally:
+            try:
+                named.close()
+            except Exception:
+                pass
+            # O reset do pool faz o rollback da transação somente leitura
+            conn.close()
+
+    return revision, media_type, _generate()
+
+
+def catalog_stream_response(fmt: str):
+    """StreamingResponse do catálogo completo no formato pedido (ndjson ou json)."""
+    from fastapi import HTTPException
+    from fastapi.responses import StreamingResponse
+    if fmt not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail="stream deve ser 'ndjson' ou 'json'")
+    revision, media_type, body = open_catalog_stream(fmt)
+    headers = {'Cache-Control': 'no-cache'}
+    if revision is not None:
+        headers['X-Catalog-Revision'] = str(revision)
+    return StreamingResponse(body, media_type=media_type, headers=headers)
@@ -1,12 +1,32 @@
 import psycopg2
 import psycopg2.extras
 import os
+import io
+import math
+import time
 from typing import Optional, Dict
 import logging
 import bcrypt  # Adicionado para hash de senha
 import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+
+try:
+    from .db_pool import ConnectionPool
+    from .product_cache import product_cache
+    from .audit_writer import audit_writer
+    from .keyset import encode_cursor, decode_cursor
+    from .price_query_stats import summarize as summarize_price_queries
+    from .db_instrument import InstrumentedConnection
+except ImportError:
+    from db_pool import ConnectionPool
+    from product_cache import product_cache
+    from audit_writer import audit_writer
+    from keyset import encode_cursor, decode_cursor
+    from price_query_stats import summarize as summarize_price_queries
+    from db_instrument import InstrumentedConnection
 
 logging.basicConfig(level=logging.INFO)
 
@@ -42,27 +62,47 @@ def _ensure_dummy_passfile():
         logging.warning(f"[DB] Falha ao criar dummy passfile: {e}")
     return _DUMMY_PASSFILE_PATH
 
-def get_db_connection():
-    """Abre conexão PostgreSQL com diagnóstico detalhado de encoding.
-
-    Se ocorrer UnicodeDecodeError, loga os parâmetros em forma hex para inspeção.
-    """
-    # Garante passfile dummy seguro (evita .pgpass legado possivelmente Latin-1)
-    passfile = _ensure_dummy_passfile()
-    if passfile:
-        os.environ['PGPASSFILE'] = passfile
-    # Isola o libpq de arquivos/serviços externos com encoding duvidoso
-    try:
-        import tempfile as _tf
-        os.environ.setdefault('PGSYSCONFDIR', _tf.gettempdir())
-    except Exception:
-        pass
-    for _var in ('PGSERVICE', 'PGSERVICEFILE'):
-        try:
-            if _var in os.environ:
-                os.environ.pop(_var, None)
-        except Exception:
-            pass
+# Pool de conexões (parâmetros via ambiente)
+PG_POOL_MIN = int(os.environ.get('PRECIX_PG_POOL_MIN', '1'))
+PG_POOL_MAX = int(os.environ.get('PRECIX_PG_POOL_MAX', '20'))
+PG_POOL_TIMEOUT = float(os.environ.get('PRECIX_PG_POOL_TIMEOUT', '10'))
+PG_POOL_HEALTHCHECK_S = float(os.environ.get('PRECIX_PG_POOL_HEALTHCHECK_S', '30'))
+PG_POOL_MAX_IDLE_S = float(os.environ.get('PRECIX_PG_POOL_MAX_IDLE_S', '600'))
+
+_ENV_READY = False
+_ENV_LOCK = threading.Lock()
+_CONNECT_LOCK = threading.Lock()
+_CONN_PARAMS = None
+_POOL = None
+_POOL_LOCK = threading.Lock()
+_local = threading.local()
+
+def _prepare_libpq_env():
+    """Prepara uma única vez o ambiente do libpq (passfile dummy, isolamento de serviços)."""
+    global _ENV_READY
+    if _ENV_READY:
+        return
+    with _ENV_LOCK:
+        if _ENV_READY:
+            return
+        # Garante passfile dummy seguro (evita .pgpass legado possivelmente Latin-1)
+        passfile = _ensure_dummy_passfile()
+        if passfile:
+            os.environ['PGPASSFILE'] = passfile
+        # Isola o libpq de arquivos/serviços externos com encoding duvidoso
+        os.environ.setdefault('PGSYSCONFDIR', tempfile.gettempdir())
+        # Remove PG* herdados que o libpq leria (serviços, hosts alternativos etc.)
+        for k in list(os.environ.keys()):
+            ku = k.upper()
+            if ku.startswith('PG') and ku not in ('PGCLIENTENCODING', 'PGPASSFILE', 'PGSYSCONFDIR'):
+                os.environ.pop(k, None)
+        _ENV_READY = True
+
+def _connection_params() -> dict:
+    """Parâmetros de conexão sanitizados (calculados uma única vez)."""
+    global _CONN_PARAMS
+    if _CONN_PARAMS is not None:
+        return _CONN_PARAMS
     params = {
         'host': PG_HOST,
         'port': PG_PORT,
@@ -79,94 +119,197 @@ def get_db_connection():
         cleaned = ''.join(ch for ch in s if ord(ch) < 128)
         return cleaned
     sanitized = {}
-    changed = False
     for k, v in params.items():
         sv = _sanitize(v)
         sanitized[k] = sv
         if sv != v:
-            changed = True
             logging.warning(f"[DB][sanitize] Removidos caracteres não-ASCII em '{k}': original={repr(v)} -> usado={repr(sv)}")
-    if changed:
-        params = sanitized
-    # Validação: todos devem ser str ASCII/UTF-8 codificáveis
-    for k, v in params.items():
-        try:
-            if v is None:
-                continue
-            _ = str(v).encode('utf-8')
-        except Exception as e:
-            logging.error(f"[DB][param-encoding] Falha ao codificar {k}={repr(v)} -> {e}")
-    # Temporarily scrub PG* env vars and force neutral locale to avoid libpq decoding surprises
-    _backup_env = {}
-    try:
-        # Backup and remove PG* except the ones we just set/need
-        for k in list(os.environ.keys()):
-            ku = k.upper()
-            if ku.startswith('PG') and ku not in ('PGCLIENTENCODING', 'PGPASSFILE', 'PGSYSCONFDIR'):
-                _backup_env[k] = os.environ.pop(k)
-        # Force neutral C locale for the connect call
-        for loc in ('LC_ALL', 'LANG'):
-            if loc in os.environ:
-                _backup_env[loc] = os.environ[loc]
+    _CONN_PARAMS = sanitized
+    return _CONN_PARAMS
+
+def _open_raw_connection():
+    """Abre uma conexão física PostgreSQL com diagnóstico detalhado de encoding.
+
+    Usada apenas pelo pool quando precisa crescer. Se ocorrer UnicodeDecodeError,
+    loga os parâmetros em forma hex para inspeção e tenta o fallback LATIN1.
+    """
+    _prepare_libpq_env()
+    params = _connection_params()
+    # O locale neutro só vale durante o connect; serializado pois altera os.environ
+    with _CONNECT_LOCK:
+        _backup_env = {loc: os.environ.get(loc) for loc in ('LC_ALL', 'LANG')}
         os.environ['LC_ALL'] = 'C'
         os.environ['LANG'] = 'C'
-    except Exception:
-        pass
-    try:
-        logging.info('[DB][connect] Tentando conexão primária UTF8...')
-        conn = psycopg2.connect(**params)
-        conn.autocommit = True
-        return conn
-    except UnicodeDecodeError as ue:
-        # Debug aprofundado
-        debug_lines = ["[DB][connect][UnicodeDecodeError] Falha na tentativa UTF8. Parâmetros (hex):"]
-        for k, v in params.items():
-            sv = str(v)
-            hex_repr = ' '.join(f"{ord(c):02x}" for c in sv)
-            debug_lines.append(f"  {k}='{sv}' (hex: {hex_repr})")
-        logging.error('\n'.join(debug_lines))
-        logging.warning('[DB][connect] Fallback: tentando conexão com PGCLIENTENCODING=LATIN1 e depois forçando UTF8...')
         try:
-            os.environ['PGCLIENTENCODING'] = 'LATIN1'
-            # Isola configs externas
-            os.environ.setdefault('PGSYSCONFDIR', tempfile.gettempdir())
-            alt_params = dict(params)
-            # Remove options para evitar forçar UTF8 antes de conectar
-            alt_params.pop('options', None)
-            conn = psycopg2.connect(**alt_params)
-            conn.set_client_encoding('UTF8')
+            logging.info('[DB][connect] Abrindo nova conexão física UTF8...')
+            conn = psycopg2.connect(connection_factory=InstrumentedConnection, **params)
             conn.autocommit = True
-            logging.info('[DB][connect] Conectado via fallback LATIN1->UTF8.')
             return conn
-        except Exception as inner:
-            logging.error(f'[DB][connect][fallback] Falha também no fallback: {inner}')
-            print("[DB][connect][RAW EXCEPTION]", repr(inner))
-            raise ue
-    except Exception as e:
-        logging.error(f"[DB][connect] Erro genérico na conexão: {e}")
-        raise
-    finally:
-        # Restore environment
-        try:
+        except UnicodeDecodeError as ue:
+            # Debug aprofundado
+            debug_lines = ["[DB][connect][UnicodeDecodeError] Falha na tentativa UTF8. Parâmetros (hex):"]
+            for k, v in params.items():
+                sv = str(v)
+                hex_repr = ' '.join(f"{ord(c):02x}" for c in sv)
+                debug_lines.append(f"  {k}='{sv}' (hex: {hex_repr})")
+            logging.error('\n'.join(debug_lines))
+            logging.warning('[DB][connect] Fallback: tentando conexão com PGCLIENTENCODING=LATIN1 e depois forçando UTF8...')
+            prev_enc = os.environ.get('PGCLIENTENCODING')
+            try:
+                os.environ['PGCLIENTENCODING'] = 'LATIN1'
+                alt_params = dict(params)
+                # Remove options para evitar forçar UTF8 antes de conectar
+                alt_params.pop('options', None)
+                conn = psycopg2.connect(connection_factory=InstrumentedConnection, **alt_params)
+                conn.set_client_encoding('UTF8')
+                conn.autocommit = True
+                logging.info('[DB][connect] Conectado via fallback LATIN1->UTF8.')
+                return conn
+            except Exception as inner:
+                logging.error(f'[DB][connect][fallback] Falha também no fallback: {inner}')
+                raise ue
+            finally:
+                if prev_enc is None:
+                    os.environ.pop('PGCLIENTENCODING', None)
+                else:
+                    os.environ['PGCLIENTENCODING'] = prev_enc
+        except Exception as e:
+            logging.error(f"[DB][connect] Erro genérico na conexão: {e}")
+            raise
+        finally:
             for k, v in _backup_env.items():
                 if v is None:
                     os.environ.pop(k, None)
                 else:
                     os.environ[k] = v
+
+def get_pool() -> ConnectionPool:
+    """Retorna o pool global (criado sob demanda)."""
+    global _POOL
+    if _POOL is not None:
+        return _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ConnectionPool(
+                _open_raw_connection,
+                minconn=PG_POOL_MIN,
+                maxconn=PG_POOL_MAX,
+                acquire_timeout=PG_POOL_TIMEOUT,
+                health_check_after=PG_POOL_HEALTHCHECK_S,
+                max_idle=PG_POOL_MAX_IDLE_S,
+            )
+            _POOL.on_acquire = _on_pool_acquire
+    return _POOL
+
+# Observadores do tempo de aquisição de conexão (ex.: métricas em /metrics)
+_pool_acquire_observers = []
+
+def add_pool_acquire_observer(fn):
+    """Registra fn(segundos) chamada a cada conexão emprestada do pool."""
+    _pool_acquire_observers.append(fn)
+
+def _on_pool_acquire(seconds: float):
+    for fn in _pool_acquire_observers:
+        fn(seconds)
+
+def get_db_connection():
+    """Empresta uma conexão do pool.
+
+    Compatível com o uso legado (``conn = get_db_connection(); ...; conn.close()``):
+    ``close()`` devolve a conexão ao pool em vez de fechá-la.
+    Prefira ``with db_connection() as conn:`` em código novo.
+    """
+    return get_pool().connection()
+
+@contextmanager
+def db_connection():
+    """Context manager de empréstimo/devolução de conexão do pool.
+
+    Reentrante por thread: chamadas aninhadas (helper chamando helper) reutilizam
+    a mesma conexão, evitando segurar várias conexões do pool por requisição.
+    """
+    current = getattr(_local, 'conn', None)
+    if current is not None:
+        yield current
+        return
+    with get_pool().borrow() as conn:
+        _local.conn = conn
+        try:
+            yield conn
+        finally:
+            _local.conn = None
+
+@contextmanager
+def db_transaction():
+    """Empresta uma conexão em modo transacional (commit ao sair, rollback em erro)."""
+    with db_connection() as conn:
+        if not conn.autocommit:
+            # Já dentro de uma transação desta thread: participa dela
+            yield conn
+            return
+        conn.autocommit = False
+        try:
+            yield conn
+            conn.commit()
         except Exception:
-            pass
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+
+def get_pool_stats() -> dict:
+    """Estatísticas do pool de conexões (para o painel admin)."""
+    return get_pool().stats()
+
+def ping_db() -> float:
+    """SELECT 1 por uma conexão do pool; retorna a latência em ms (health probe)."""
+    t0 = time.perf_counter()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.fetchone()
+        cur.close()
+    return (time.perf_counter() - t0) * 1000.0
+
+def explain_query(sql: str, timeout_ms: int = 30000) -> str:
+    """EXPLAIN (ANALYZE, BUFFERS) de um SELECT já com os valores (log de consultas lentas).
+
+    Roda numa transação READ ONLY desfeita ao final, com statement_timeout próprio. A conexão
+    é fechada em vez de devolvida ao pool: nenhum estado de sessão deixado pela consulta
+    (ex.: lock consultivo) chega a outra requisição.
+    """
+    conn = get_pool().connection()
+    try:
+        conn.autocommit = False
+        cur = conn.cursor()
+        cur.execute('SET TRANSACTION READ ONLY')
+        cur.execute('SET LOCAL statement_timeout = %s', (int(timeout_ms),))
+        cur.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql)
+        return '\n'.join(r[0] for r in cur.fetchall())
+    finally:
+        try:
+            conn.rollback()
+        finally:
+            conn.discard()
+
+def close_pool():
+    """Fecha todas as conexões ociosas do pool (shutdown)."""
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.closeall()
 
 # Função para obter status do sistema (quantidade de produtos e última sincronização)
 def get_system_status():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT COUNT(*) FROM products')
-    total_products = cur.fetchone()[0]
-    # Última sincronização: pega o maior last_sync dos devices
-    cur.execute('SELECT MAX(last_sync) FROM devices WHERE last_sync IS NOT NULL')
-    last_sync = cur.fetchone()[0]
-    cur.close()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT COUNT(*) FROM products')
+        total_products = cur.fetchone()[0]
+        # Última sincronização: pega o maior last_sync dos devices
+        cur.execute('SELECT MAX(last_sync) FROM devices WHERE last_sync IS NOT NULL')
+        last_sync = cur.fetchone()[0]
+        cur.close()
     return {
         'total_products': total_products,
         'last_sync': last_sync
@@ -181,108 +324,264 @@ def normalize_agent_id(agent_id: str) -> str:
     except Exception:
         return ''
 
+def _fetch_product_by_barcode(barcode: str) -> Optional[Dict]:
+    """Consulta direta no banco (sem cache). Erros de query são propagados."""
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        try:
+            cur.execute('SELECT barcode, name, price, promo FROM products WHERE barcode = %s', (barcode,))
+            row = cur.fetchone()
+            if row:
+                try:
+                    return dict(row)
+                except Exception as e:
+                    logging.error(f"[DB][get_product_by_barcode] Erro ao decodificar linha: {row} - {e}")
+                    return None
+            return None
+        finally:
+            cur.close()
+
 def get_product_by_barcode(barcode: str) -> Optional[Dict]:
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    """Busca produto pelo código de barras, passando pelo cache LRU+TTL (product_cache)."""
     try:
-        cur.execute('SELECT barcode, name, price, promo FROM products WHERE barcode = %s', (barcode,))
-        row = cur.fetchone()
-        if row:
-            try:
-                return dict(row)
-            except Exception as e:
-                logging.error(f"[DB][get_product_by_barcode] Erro ao decodificar linha: {row} - {e}")
-                return None
-        return None
+        return product_cache.get_or_load(barcode, _fetch_product_by_barcode)
     except Exception as e:
+        # Erro de banco não entra no cache negativo
         logging.error(f"[DB][get_product_by_barcode] Erro na query: {e}")
         return None
-    finally:
+
+# Funções chamadas após escritas em products (ex.: snapshot do catálogo)
+_product_write_listeners = []
+
+def add_product_write_listener(fn):
+    """Registra fn(barcodes) chamada a cada invalidação (barcodes=None: tudo)."""
+    _product_write_listeners.append(fn)
+
+def invalidate_product_cache(barcodes=None):
+    """Invalida o cache de produtos: barcodes específicos ou tudo (barcodes=None)."""
+    if barcodes is None:
+        product_cache.clear()
+    else:
+        barcodes = list(barcodes)
+        product_cache.invalidate_many(barcodes)
+    for fn in _product_write_listeners:
+        try:
+            fn(barcodes)
+        except Exception as e:
+            logging.warning(f"[DB][invalidate_product_cache] Listener falhou: {e}")
+
+def get_product_cache_stats() -> dict:
+    return product_cache.stats()
+
+
+# Tipos escalares aceitos como valor de coluna (os demais o psycopg2 não adapta para texto)
+_SCALAR_TYPES = (str, int, float)
+
+
+def _normalize_product(p):
+    """Normaliza um produto do payload para (barcode, name, price, promo).
+
+    Retorna None quando o item deve ser contado como ignorado (mesmas regras do
+    caminho linha-a-linha: não-dict, barcode vazio ou valores não gravaveis).
+    """
+    if not isinstance(p, dict):
+        return None
+    barcode = str(p.get('barcode') or p.get('codigo') or '').strip()
+    if not barcode:
+        return None
+    name = p.get('name') or p.get('nome') or ''
+    try:
+        price = float(p.get('price') if p.get('price') is not None else 0)
+    except Exception:
+        price = 0.0
+    promo = p.get('promo') or p.get('promocao') or None
+    out = [barcode]
+    for v in (name, promo):
+        if v is None:
+            out.append(None)
+            continue
+        if isinstance(v, bool):
+            v = 'true' if v else 'false'
+        elif not isinstance(v, _SCALAR_TYPES):
+            return None
+        v = str(v)
+        if '\x00' in v:
+            return None
+        out.append(v)
+    if '\x00' in barcode:
+        return None
+    return (barcode, out[1], price, out[2])
+
+
+def _copy_text(v) -> str:
+    """Formata um valor para o formato texto do COPY."""
+    if v is None:
+        return '\\N'
+    if isinstance(v, float):
+        if math.isnan(v):
+            return 'NaN'
+        if math.isinf(v):
+            return 'Infinity' if v > 0 else '-Infinity'
+        return repr(v)
+    s = str(v)
+    return (s.replace('\\', '\\\\').replace('\t', '\\t')
+             .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _upsert_products_rowwise(rows: list):
+    """Caminho legado: um INSERT ... ON CONFLICT por produto.
+
+    Usado como fallback quando o merge em lote falha (ex.: valor rejeitado pelo banco),
+    preservando a contagem por linha de ignorados.
+    """
+    inserted = 0
+    updated = 0
+    ignored = 0
+    with db_connection() as conn:
+        cur = conn.cursor()
+        for barcode, name, price, promo in rows:
+            try:
+                cur.execute(
+                    'INSERT INTO products (barcode, name, price, promo) VALUES (%s, %s, %s, %s) '
+                    'ON CONFLICT (barcode) DO UPDATE SET name = EXCLUDED.name, price = EXCLUDED.price, promo = EXCLUDED.promo '
+                    'RETURNING (xmax = 0)',
+                    (barcode, name, price, promo)
+                )
+                if cur.fetchone()[0]:
+                    inserted += 1
+                else:
+                    updated += 1
+            except Exception:
+                ignored += 1
+                continue
         cur.close()
-        conn.close()
+    return inserted, updated, ignored
 
 
 def upsert_products(products: list):
     """Insere ou atualiza produtos em lote.
 
     products: lista de dicionários com, pelo menos, 'barcode' e 'price'.
-    Retorna um dicionário com contadores: inserted, updated, ignored.
+    Retorna um dicionário com contadores: inserted, updated, ignored e timings_ms por fase.
+
+    Os produtos válidos são enviados via COPY para uma tabela temporária e mesclados
+    com um único INSERT ... ON CONFLICT DO UPDATE (barcode repetido no lote: vale o último).
     """
     if not products:
-        return {'inserted': 0, 'updated': 0, 'ignored': 0}
-    conn = get_db_connection()
-    cur = conn.cursor()
-    inserted = 0
-    updated = 0
+        return {'inserted': 0, 'updated': 0, 'ignored': 0, 'timings_ms': {}}
+    t0 = time.perf_counter()
+    timings = {}
+    rows = []
     ignored = 0
     for p in products:
-        try:
-            if not isinstance(p, dict):
-                ignored += 1
-                continue
-            barcode = str(p.get('barcode') or p.get('codigo') or '').strip()
-            if not barcode:
-                ignored += 1
-                continue
-            name = p.get('name') or p.get('nome') or ''
-            try:
-                price = float(p.get('price') if p.get('price') is not None else 0)
-            except Exception:
-                price = 0.0
-            promo = p.get('promo') or p.get('promocao') or None
-            # detecta presença
-            cur.execute('SELECT 1 FROM products WHERE barcode = %s', (barcode,))
-            if cur.fetchone():
-                cur.execute('UPDATE products SET name = %s, price = %s, promo = %s WHERE barcode = %s', (name, price, promo, barcode))
-                updated += 1
-            else:
-                cur.execute('INSERT INTO products (barcode, name, price, promo) VALUES (%s, %s, %s, %s)', (barcode, name, price, promo))
-                inserted += 1
-        except Exception:
+        row = _normalize_product(p)
+        if row is None:
             ignored += 1
-            continue
-    conn.commit()
-    conn.close()
-    return {'inserted': inserted, 'updated': updated, 'ignored': ignored}
+        else:
+            rows.append(row)
+    timings['normalize'] = (time.perf_counter() - t0) * 1000.0
+    inserted = 0
+    updated = 0
+    if rows:
+        try:
+            with db_transaction() as conn:
+                cur = conn.cursor()
+                t = time.perf_counter()
+                cur.execute(
+                    'CREATE TEMP TABLE _stg_products ('
+                    ' seq INTEGER, barcode VARCHAR, name VARCHAR, price DOUBLE PRECISION, promo VARCHAR'
+                    ') ON COMMIT DROP'
+                )
+                buf = io.StringIO()
+                for seq, (barcode, name, price, promo) in enumerate(rows):
+                    buf.write(f"{seq}\t{_copy_text(barcode)}\t{_copy_text(name)}\t{_copy_text(price)}\t{_copy_text(promo)}\n")
+                buf.seek(0)
+                cur.copy_expert('COPY _stg_products (seq, barcode, name, price, promo) FROM STDIN', buf)
+                timings['stage'] = (time.perf_counter() - t) * 1000.0
+                t = time.perf_counter()
+                # xmax = 0 identifica linhas recém-inseridas (as atualizadas recebem xmax da transação)
+                cur.execute('''
+                    WITH merged AS (
+                        INSERT INTO products (barcode, name, price, promo)
+                        SELECT DISTINCT ON (barcode) barcode, name, price, promo
+                          FROM _stg_products
+                         ORDER BY barcode, seq DESC
+                        ON CONFLICT (barcode) DO UPDATE SET
+                            name = EXCLUDED.name,
+                            price = EXCLUDED.price,
+                            promo = EXCLUDED.promo
+                        RETURNING (xmax = 0) AS is_insert
+                    )
+                    SELECT COUNT(*) FILTER (WHERE is_insert) FROM merged
+                ''')
+                inserted = cur.fetchone()[0]
+                # Repetições do mesmo barcode no lote contam como atualização (como no caminho linha-a-linha)
+                updated = len(rows) - inserted
+                timings['merge'] = (time.perf_counter() - t) * 1000.0
+                cur.close()
+                t_commit = time.perf_counter()
+            timings['commit'] = (time.perf_counter() - t_commit) * 1000.0
+        except Exception as e:
+            logging.warning(f"[DB][upsert_products] Merge em lote falhou ({e}); aplicando linha a linha")
+            t = time.perf_counter()
+            inserted, updated, failed = _upsert_products_rowwise(rows)
+            ignored += failed
+            timings['rowwise'] = (time.perf_counter() - t) * 1000.0
+        if inserted or updated:
+            invalidate_product_cache(row[0] for row in rows)
+    timings['total'] = (time.perf_counter() - t0) * 1000.0
+    logging.info(f"[DB][upsert_products] {len(products)} itens: inserted={inserted} updated={updated} ignored={ignored} em {timings['total']:.1f}ms")
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'ignored': ignored,
+        'timings_ms': {k: round(v, 3) for k, v in timings.items()},
+    }
 
 
 # Função para inicializar o banco (criação das tabelas)
 def init_db():
     # No PostgreSQL, o schema deve ser criado e migrado via scripts SQL externos.
-    # Esta função pode ser usada apenas para logar a conexão.
-    conn = get_db_connection()
-    logging.info(f"[DB] Conectado ao banco PostgreSQL: {PG_DB} em {PG_HOST}:{PG_PORT}")
-    conn.close()
+    # Esta função valida a conexão e pré-aquece o pool.
+    get_pool().warmup()
+    with db_connection():
+        logging.info(f"[DB] Conectado ao banco PostgreSQL: {PG_DB} em {PG_HOST}:{PG_PORT}")
+    # Migrações incrementais (revisão do catálogo etc.); import tardio evita ciclo
+    try:
+        from .migrations import apply_migrations
+    except ImportError:
+        from migrations import apply_migrations
+    apply_migrations()
 
 # Função para popular o banco com dados de exemplo
 def populate_example_data():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Loga antes de inserir admin
-    cur.execute('SELECT * FROM admin_users')
-    logging.info(f"[DB] Usuários admin antes de popular: {cur.fetchall()}")
-    example_products = [
-        ('7891234567890', 'Arroz Sonda 5kg', 22.99, 'Leve 2 pague 1'),
-        ('7899876543210', 'Feijão Preto 1kg', 8.49, None),
-        ('7891112223334', 'Óleo de Soja 900ml', 6.99, 'Desconto 10%'),
-        ('7895556667778', 'Açúcar Refinado 1kg', 4.59, None),
-        ('7894443332221', 'Café Tradicional 500g', 13.99, 'Brinde Caneca'),
-    ]
-    for prod in example_products:
+    with db_connection() as conn:
+        cur = conn.cursor()
+        # Loga antes de inserir admin
+        cur.execute('SELECT * FROM admin_users')
+        logging.info(f"[DB] Usuários admin antes de popular: {cur.fetchall()}")
+        example_products = [
+            ('7891234567890', 'Arroz Sonda 5kg', 22.99, 'Leve 2 pague 1'),
+            ('7899876543210', 'Feijão Preto 1kg', 8.49, None),
+            ('7891112223334', 'Óleo de Soja 900ml', 6.99, 'Desconto 10%'),
+            ('7895556667778', 'Açúcar Refinado 1kg', 4.59, None),
+            ('7894443332221', 'Café Tradicional 500g', 13.99, 'Brinde Caneca'),
+        ]
+        for prod in example_products:
+            try:
+                cur.execute('INSERT INTO products (barcode, name, price, promo) VALUES (%s, %s, %s, %s) ON CONFLICT (barcode) DO NOTHING', prod)
+            except Exception:
+                pass
+        # Usuário admin padrão: admin / admin123
         try:
-            cur.execute('INSERT INTO products (barcode, name, price, promo) VALUES (%s, %s, %s, %s) ON CONFLICT (barcode) DO NOTHING', prod)
+            cur.execute('INSERT INTO admin_users (username, password) VALUES (%s, %s) ON CONFLICT (username) DO NOTHING', ('admin', 'admin123'))
         except Exception:
             pass
-    # Usuário admin padrão: admin / admin123
-    try:
-        cur.execute('INSERT INTO admin_users (username, password) VALUES (%s, %s) ON CONFLICT (username) DO NOTHING', ('admin', 'admin123'))
-    except Exception:
-        pass
-    # Loga depois de inserir admin
-    cur.execute('SELECT * FROM admin_users')
-    logging.info(f"[DB] Usuários admin após popular: {cur.fetchall()}")
-    conn.commit()
-    conn.close()
+        # Loga depois de inserir admin
+        cur.execute('SELECT * FROM admin_users')
+        logging.info(f"[DB] Usuários admin após popular: {cur.fetchall()}")
+        conn.commit()
+    invalidate_product_cache(prod[0] for prod in example_products)
 
 # Função utilitária para gerar hash de senha
 # Documentação: https://pypi.org/project/bcrypt/
@@ -298,11 +597,10 @@ def verify_password(password: str, hashed: str) -> bool:
 # Função para autenticar usuário admin
 # Compatível com senhas antigas (texto puro) e novas (hash)
 def authenticate_admin(username: str, password: str) -> bool:
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT * FROM admin_users WHERE username = %s', (username,))
-    user = cur.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT * FROM admin_users WHERE username = %s', (username,))
+        user = cur.fetchone()
     if not user:
         return False
     stored = user['password']
@@ -314,270 +612,582 @@ def authenticate_admin(username: str, password: str) -> bool:
 
 
 # Funções de auditoria/log (definidas primeiro para evitar erros de import)
+def insert_audit_logs(rows: list):
+    """Grava um lote de linhas (timestamp, device_id, device_name, action, details) num único INSERT."""
+    if not rows:
+        return
+    with db_connection() as conn:
+        cur = conn.cursor()
+        psycopg2.extras.execute_values(
+            cur,
+            'INSERT INTO audit_log (timestamp, device_id, device_name, action, details) VALUES %s',
+            rows, page_size=1000
+        )
+        conn.commit()
+
 def add_audit_log(device_id: int = None, device_name: str = None, action: str = '', details: str = ''):
     from datetime import datetime
-    conn = get_db_connection()
-    cur = conn.cursor()
     timestamp = datetime.utcnow().isoformat()
-    cur.execute('INSERT INTO audit_log (timestamp, device_id, device_name, action, details) VALUES (%s, %s, %s, %s, %s)', 
-                (timestamp, device_id, device_name, action, details))
-    conn.commit()
-    conn.close()
+    row = (timestamp, device_id, device_name, action, details)
+    # Com o writer ativo (app em execução) a linha vai para a fila e é gravada em lote (audit_writer.py)
+    if audit_writer.running:
+        audit_writer.enqueue(row)
+        return
+    insert_audit_logs([row])
+
+# Retenção do audit_log (tabela particionada por período, migração 5)
+AUDIT_RETENTION_DAYS = int(os.environ.get('PRECIX_AUDIT_RETENTION_DAYS', '30'))
+# 'month' ou 'day' (volume alto de consultas de preço)
+AUDIT_PARTITION_INTERVAL = 'day' if os.environ.get('PRECIX_AUDIT_PARTITION_INTERVAL', 'month').strip().lower() == 'day' else 'month'
+AUDIT_PARTITIONS_AHEAD = int(os.environ.get('PRECIX_AUDIT_PARTITIONS_AHEAD', '2'))
+
+
+def _audit_partition_bounds(name: str):
+    """(início, fim) do período de uma partição audit_log_YYYYMM / audit_log_YYYYMMDD."""
+    from datetime import timedelta
+    suffix = name.rsplit('_', 1)[-1]
+    if len(suffix) == 8:
+        start = datetime.strptime(suffix, '%Y%m%d')
+        return start, start + timedelta(days=1)
+    start = datetime.strptime(suffix, '%Y%m')
+    end = datetime(start.year + (start.month == 12), start.month % 12 + 1, 1)
+    return start, end
+
+
+def maintain_audit_partitions(retention_days: int = None) -> dict:
+    """Cria as partições dos próximos períodos e remove (DROP) as que saíram da retenção.
+
+    Se o audit_log não estiver particionado (migração não aplicada), cai no DELETE por timestamp.
+    """
+    from datetime import timedelta
+    retention_days = AUDIT_RETENTION_DAYS if retention_days is None else retention_days
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=retention_days)
+    result = {'created': [], 'dropped': [], 'deleted_rows': 0, 'cutoff': cutoff.isoformat()}
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('audit_log')")
+        row = cur.fetchone()
+        if not row or row[0] != 'p':
+            cur.execute('DELETE FROM audit_log WHERE timestamp < %s', (cutoff,))
+            result['deleted_rows'] = cur.rowcount
+            return result
+        cur.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass('audit_log') AND c.relname ~ '^audit_log_[0-9]{6}([0-9]{2})?$'"
+        )
+        existing = {name: _audit_partition_bounds(name) for (name,) in cur.fetchall()}
+        fmt = '%Y%m%d' if AUDIT_PARTITION_INTERVAL == 'day' else '%Y%m'
+        period = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        if AUDIT_PARTITION_INTERVAL == 'month':
+            period = period.replace(day=1)
+        for _ in range(AUDIT_PARTITIONS_AHEAD + 1):
+            # Período já coberto (ex.: partição mensal antes de mudar o intervalo para 'day')
+            if not any(start <= period < end for start, end in existing.values()):
+                cur.execute('SELECT precix_audit_log_ensure_partition(%s, %s)', (period.date(), AUDIT_PARTITION_INTERVAL))
+                created = cur.fetchone()[0]
+                if created:
+                    result['created'].append(created)
+            period = _audit_partition_bounds(period.strftime(fmt))[1]
+        for name, (_, end) in existing.items():
+            if end <= cutoff:
+                cur.execute(f'DROP TABLE IF EXISTS "{name}"')
+                result['dropped'].append(name)
+        # Linhas que caíram na default (partição ausente na época) seguem a retenção por DELETE
+        cur.execute('DELETE FROM audit_log_default WHERE timestamp < %s', (cutoff,))
+        result['deleted_rows'] = cur.rowcount
+    if result['created'] or result['dropped']:
+        logging.info(f"[DB][audit] Partições criadas: {result['created']} removidas: {result['dropped']}")
+    return result
+
+AUDIT_PAGE_MAX = 1000
+
+
+def query_audit_logs(limit: int = 50, cursor: str = None, action=None, device_id: int = None,
+                     store_id: int = None, since: datetime = None, until: datetime = None):
+    """Página do audit_log (mais recentes primeiro) com filtros e paginação keyset em (timestamp, id).
+
+    Retorna (linhas, next_cursor); next_cursor é None na última página.
+    `action` aceita um valor ou lista; `store_id` filtra pelos dispositivos da loja.
+    Cursor inválido levanta keyset.InvalidCursor.
+    """
+    limit = max(1, min(int(limit), AUDIT_PAGE_MAX))
+    # timestamp é gravado em UTC sem fuso
+    since, until = (
+        dt.astimezone(timezone.utc).replace(tzinfo=None) if dt is not None and dt.tzinfo else dt
+        for dt in (since, until)
+    )
+    where, params = [], []
+    if cursor:
+        ts, row_id = decode_cursor(cursor)
+        where.append('(timestamp, id) < (%s, %s)')
+        params.extend([ts, row_id])
+    if action:
+        actions = [action] if isinstance(action, str) else list(action)
+        where.append('action = ANY(%s)')
+        params.append(actions)
+    if device_id is not None:
+        where.append('device_id = %s')
+        params.append(device_id)
+    if store_id is not None:
+        where.append('device_id IN (SELECT id FROM devices WHERE store_id = %s)')
+        params.append(store_id)
+    if since is not None:
+        where.append('timestamp >= %s')
+        params.append(since)
+    if until is not None:
+        where.append('timestamp < %s')
+        params.append(until)
+    sql = 'SELECT * FROM audit_log'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    # Uma linha a mais indica se há próxima página
+    sql += ' ORDER BY timestamp DESC, id DESC LIMIT %s'
+    params.append(limit + 1)
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute(sql, params)
+        rows = [dict(r) for r in cur.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last['timestamp'], last['id'])
+    return rows, next_cursor
 
 def get_audit_logs(limit: int = 50):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT * FROM audit_log ORDER BY timestamp DESC LIMIT %s', (limit,))
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return query_audit_logs(limit)[0]
 
 def get_device_audit_logs(device_id: int, limit: int = 20):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT * FROM audit_log WHERE device_id = %s ORDER BY timestamp DESC LIMIT %s', (device_id, limit))
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return query_audit_logs(limit, device_id=device_id)[0]
+
+
+# Rollups das consultas de preço (migração 7, price_query_stats.py)
+PRICE_QUERY_DIMENSIONS = ('barcode', 'device', 'store')
+PRICE_QUERY_MAX_HOURS = 24 * 90
+
+
+def flush_price_query_stats(rows: list):
+    """Soma um lote de contadores (bucket, dimension, key, queries, hits, misses, latency_count,
+    latency_sum_ms, latency_hist) às linhas existentes, num único upsert."""
+    if not rows:
+        return
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        psycopg2.extras.execute_values(
+            cur,
+            '''
+            INSERT INTO price_query_stats AS t
+                (bucket, dimension, key, queries, hits, misses, latency_count, latency_sum_ms, latency_hist)
+            VALUES %s
+            ON CONFLICT (bucket, dimension, key) DO UPDATE SET
+                queries = t.queries + EXCLUDED.queries,
+                hits = t.hits + EXCLUDED.hits,
+                misses = t.misses + EXCLUDED.misses,
+                latency_count = t.latency_count + EXCLUDED.latency_count,
+                latency_sum_ms = t.latency_sum_ms + EXCLUDED.latency_sum_ms,
+                latency_hist = ARRAY(
+                    SELECT COALESCE(a, 0) + COALESCE(b, 0)
+                    FROM unnest(t.latency_hist, EXCLUDED.latency_hist) AS u(a, b)
+                )
+            ''',
+            rows, template='(%s, %s, %s, %s, %s, %s, %s, %s, %s::bigint[])', page_size=1000
+        )
+
+
+def _price_query_window(hours: int):
+    from datetime import timedelta
+    hours = max(1, min(int(hours), PRICE_QUERY_MAX_HOURS))
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    return now - timedelta(hours=hours - 1)
+
+
+def _sum_histograms(hists) -> list:
+    total = []
+    for hist in hists:
+        for i, n in enumerate(hist or []):
+            if i < len(total):
+                total[i] += n
+            else:
+                total.append(n)
+    return total
+
+
+def get_price_query_top(dimension: str = 'barcode', hours: int = 24, limit: int = 20, order: str = 'queries') -> list:
+    """Chaves mais consultadas (order='queries') ou com mais falhas (order='misses' / 'failure_rate')
+    nas últimas `hours` horas, a partir dos rollups."""
+    if dimension not in PRICE_QUERY_DIMENSIONS:
+        raise ValueError(f'Dimensão inválida: {dimension}')
+    order_sql = {
+        'queries': 'queries DESC',
+        'misses': 'misses DESC, queries DESC',
+        'failure_rate': 'misses::float / NULLIF(queries, 0) DESC NULLS LAST, queries DESC',
+    }.get(order)
+    if order_sql is None:
+        raise ValueError(f'Ordenação inválida: {order}')
+    limit = max(1, min(int(limit), 500))
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute(
+            f'''
+            SELECT key, SUM(queries)::bigint AS queries, SUM(hits)::bigint AS hits, SUM(misses)::bigint AS misses,
+                   SUM(latency_count)::bigint AS latency_count, SUM(latency_sum_ms) AS latency_sum_ms,
+                   array_agg(latency_hist) AS hists
+            FROM price_query_stats
+            WHERE dimension = %s AND bucket >= %s
+            GROUP BY key
+            ORDER BY {order_sql}
+            LIMIT %s
+            ''',
+            (dimension, _price_query_window(hours), limit)
+        )
+        rows = [dict(r) for r in cur.fetchall()]
+    for r in rows:
+        r['latency_hist'] = _sum_histograms(r.pop('hists'))
+        summarize_price_queries(r)
+    return rows
+
+
+def get_price_query_series(hours: int = 24, dimension: str = None, key: str = None) -> list:
+    """Série horária (consultas, acertos, falhas, latência) do total ou de uma chave específica."""
+    # O total usa a dimensão device: cada consulta conta uma vez por dispositivo
+    if dimension is None or key is None:
+        dimension, key = 'device', None
+    elif dimension not in PRICE_QUERY_DIMENSIONS:
+        raise ValueError(f'Dimensão inválida: {dimension}')
+    where, params = ['dimension = %s', 'bucket >= %s'], [dimension, _price_query_window(hours)]
+    if key is not None:
+        where.append('key = %s')
+        params.append(str(key))
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute(
+            f'''
+            SELECT bucket, SUM(queries)::bigint AS queries, SUM(hits)::bigint AS hits, SUM(misses)::bigint AS misses,
+                   SUM(latency_count)::bigint AS latency_count, SUM(latency_sum_ms) AS latency_sum_ms,
+                   array_agg(latency_hist) AS hists
+            FROM price_query_stats
+            WHERE {' AND '.join(where)}
+            GROUP BY bucket
+            ORDER BY bucket
+            ''',
+            params
+        )
+        rows = [dict(r) for r in cur.fetchall()]
+    for r in rows:
+        r['latency_hist'] = _sum_histograms(r.pop('hists'))
+        r['bucket'] = r['bucket'].isoformat()
+        summarize_price_queries(r)
+    return rows
 
 
 # CRUD de lojas
 def get_all_stores():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT * FROM stores ORDER BY codigo')
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT * FROM stores ORDER BY codigo')
+        rows = cur.fetchall()
     return [dict(row) for row in rows]
 
 def add_store(name: str, status: str = 'ativo'):
-    conn = get_db_connection()
-    cur = conn.cursor()
     # Novo: exige código
     raise Exception('Use add_store_with_code(codigo, name, status)')
 
 def add_store_with_code(codigo: str, name: str, status: str = 'ativo'):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO stores (codigo, name, status) VALUES (%s, %s, %s)', (codigo, name, status))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO stores (codigo, name, status) VALUES (%s, %s, %s)', (codigo, name, status))
+        conn.commit()
 
 def update_store(store_id: int, name: str, status: str):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('UPDATE stores SET name = %s, status = %s WHERE id = %s', (name, status, store_id))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('UPDATE stores SET name = %s, status = %s WHERE id = %s', (name, status, store_id))
+        conn.commit()
 
 def update_store_code(store_id: int, codigo: str, name: str, status: str):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('UPDATE stores SET codigo = %s, name = %s, status = %s WHERE id = %s', (codigo, name, status, store_id))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('UPDATE stores SET codigo = %s, name = %s, status = %s WHERE id = %s', (codigo, name, status, store_id))
+        conn.commit()
 def get_store_by_code(codigo: str):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT * FROM stores WHERE codigo = %s', (codigo,))
-    row = cur.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT * FROM stores WHERE codigo = %s', (codigo,))
+        row = cur.fetchone()
     return dict(row) if row else None
-    conn.commit()
-    conn.close()
 
 def delete_store(store_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    logging.info(f"[DB] Deletando loja id={store_id}")
-    cur.execute('DELETE FROM stores WHERE id = %s', (store_id,))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        logging.info(f"[DB] Deletando loja id={store_id}")
+        cur.execute('DELETE FROM stores WHERE id = %s', (store_id,))
+        conn.commit()
 
 # CRUD de equipamentos
-def get_all_devices():
-    from datetime import datetime, timedelta
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT * FROM devices')
-    rows = cur.fetchall()
-    conn.close()
+# Presença de dispositivos: online se o último heartbeat (last_sync, UTC) está dentro da janela
+DEVICE_ONLINE_WINDOW_S = int(os.environ.get('PRECIX_DEVICE_ONLINE_WINDOW_S', '120'))
+# last_sync é TIMESTAMP sem fuso gravado em UTC; comparação indexável (idx_devices_store_last_sync)
+_DEVICE_ONLINE_SQL = "(last_sync IS NOT NULL AND last_sync >= (now() AT TIME ZONE 'UTC') - %s * interval '1 second')"
+
+
+# Heartbeats ainda no buffer write-behind (heartbeats.py): fn(window_s) -> {identifier: {'ts': ...}}
+_device_presence_source = None
+
+
+def set_device_presence_source(fn):
+    global _device_presence_source
+    _device_presence_source = fn
+
+
+def _buffered_device_heartbeats() -> dict:
+    if _device_presence_source is None:
+        return {}
+    try:
+        return _device_presence_source(DEVICE_ONLINE_WINDOW_S)
+    except Exception as e:
+        logging.warning(f"[DB][HEARTBEAT] Falha ao consultar buffer de heartbeats: {e}")
+        return {}
+
+
+def _device_online_clause(fresh: dict):
+    """Expressão de presença: last_sync na janela OU heartbeat recente ainda não gravado."""
+    if not fresh:
+        return _DEVICE_ONLINE_SQL, [DEVICE_ONLINE_WINDOW_S]
+    return f'({_DEVICE_ONLINE_SQL} OR identifier = ANY(%s))', [DEVICE_ONLINE_WINDOW_S, list(fresh)]
+
+
+def _device_filters(store_id=None, online=None, identifiers=None, fresh=None):
+    where, params = [], []
+    if store_id is not None:
+        where.append('store_id = %s')
+        params.append(store_id)
+    if identifiers is not None:
+        where.append('identifier = ANY(%s)')
+        params.append(list(identifiers))
+    if online is not None:
+        clause, clause_params = _device_online_clause(fresh)
+        where.append(clause if online else f'NOT {clause}')
+        params.extend(clause_params)
+    return (' WHERE ' + ' AND '.join(where)) if where else '', params
+
+
+def get_all_devices(store_id: int = None, online: bool = None, identifiers=None):
+    """Lista dispositivos com `online` (0/1) calculado no banco; filtros opcionais por loja/presença."""
+    fresh = _buffered_device_heartbeats()
+    where, params = _device_filters(store_id, online, identifiers, fresh)
+    online_sql, online_params = _device_online_clause(fresh)
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute(
+            f'SELECT *, {online_sql}::int AS online_now FROM devices{where} ORDER BY id',
+            online_params + params
+        )
+        rows = cur.fetchall()
     devices = []
-    from datetime import timezone
-    now = datetime.now(timezone.utc).replace(microsecond=0)
     for row in rows:
         device = dict(row)
-        last_sync = device.get('last_sync')
-        dt = None
-        if last_sync:
-            try:
-                # Aceita datetime, string ISO, string sem microsegundos, string com timezone, etc
-                if isinstance(last_sync, str):
-                    try:
-                        dt = datetime.fromisoformat(last_sync)
-                    except Exception:
-                        # Tenta remover microsegundos se houver
-                        if '.' in last_sync:
-                            base, rest = last_sync.split('.', 1)
-                            rest = rest.split('+')[0].split('Z')[0].split('-')[0]
-                            last_sync_clean = base
-                            if '+' in last_sync:
-                                last_sync_clean += '+' + last_sync.split('+')[1]
-                            elif 'Z' in last_sync:
-                                last_sync_clean += 'Z'
-                            dt = datetime.fromisoformat(last_sync_clean)
-                        else:
-                            raise
-                elif hasattr(last_sync, 'isoformat'):
-                    dt = last_sync
-                if dt:
-                    if dt.tzinfo is None:
-                        dt = dt.replace(tzinfo=timezone.utc)
-                    dt = dt.astimezone(timezone.utc).replace(microsecond=0)
-                    diff = (now - dt).total_seconds()
-                    device['online'] = int(diff < 120)  # Padronizado para 120s como agentes
-                    logging.debug(f"[ONLINE-CHECK] Device {device.get('identifier')} diff={diff}s now={now.isoformat()} last_sync={dt.isoformat()} online={device['online']}")
-                else:
-                    device['online'] = 0
-            except Exception as e:
-                logging.warning(f"[ONLINE-CHECK] Erro ao calcular online para {device.get('identifier')}: {e} | last_sync={last_sync}")
-                device['online'] = 0
-        else:
-            device['online'] = 0
-        # Garante que online seja sempre 0 ou 1
-        device['online'] = int(bool(device.get('online', 0)))
+        device['online'] = device.pop('online_now')
+        buffered = fresh.get(device.get('identifier'))
+        if buffered is not None:
+            current = device.get('last_sync')
+            # Outro worker pode ter gravado um heartbeat mais novo
+            if not isinstance(current, datetime) or current < buffered['ts']:
+                device['last_sync'] = buffered['ts']
         devices.append(device)
     return devices
 
+
+def get_device_counts(store_id: int = None) -> dict:
+    """Totais de dispositivos (total/online/offline) numa única agregação."""
+    where, params = _device_filters(store_id)
+    online_sql, online_params = _device_online_clause(_buffered_device_heartbeats())
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f'SELECT COUNT(*), COUNT(*) FILTER (WHERE {online_sql}) FROM devices{where}',
+            online_params + params
+        )
+        total, online = cur.fetchone()
+        cur.close()
+    return {'total': total, 'online': online, 'offline': total - online}
+
+
+def get_device_store_map() -> Dict[str, int]:
+    """Mapa identifier -> store_id de todos os dispositivos (cache em device_events.DeviceStoreMap)."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT identifier, store_id FROM devices WHERE identifier IS NOT NULL')
+        rows = cur.fetchall()
+        cur.close()
+    return {r[0]: r[1] for r in rows}
+
+
+def get_device_identifier(device_id: int) -> Optional[str]:
+    """Identifier atual de um dispositivo (None se não existir ou não tiver)."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT identifier FROM devices WHERE id = %s', (device_id,))
+        row = cur.fetchone()
+        cur.close()
+    return row[0] if row else None
+
+
+def get_device_identifiers(store_id: int) -> set:
+    """Identificadores dos dispositivos de uma loja."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT identifier FROM devices WHERE store_id = %s AND identifier IS NOT NULL', (store_id,))
+        rows = cur.fetchall()
+        cur.close()
+    return {r[0] for r in rows}
+
 def add_device(store_id: int, name: str, status: str = 'ativo', last_sync: str = None, online: int = 0, identifier: str = None):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Usa o identifier fornecido ou gera um novo se não vier
-    if not identifier:
-        import uuid
-        identifier = str(uuid.uuid4())
-    cur.execute('INSERT INTO devices (store_id, name, status, last_sync, online, identifier) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id', (store_id, name, status, last_sync, online, identifier))
-    device_id = cur.fetchone()[0]
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        # Usa o identifier fornecido ou gera um novo se não vier
+        if not identifier:
+            import uuid
+            identifier = str(uuid.uuid4())
+        cur.execute('INSERT INTO devices (store_id, name, status, last_sync, online, identifier) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id', (store_id, name, status, last_sync, online, identifier))
+        device_id = cur.fetchone()[0]
+        conn.commit()
     # Log de auditoria
     add_audit_log(device_id, name, 'DEVICE_CREATED', f'Dispositivo criado na loja ID {store_id}')
     return device_id
 
 def update_device(device_id: int, name: str = None, status: str = None, last_sync: str = None, online: int = None, store_id: int = None, identifier: str = None):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    # Busca valores atuais
-    cur.execute('SELECT name, status, store_id, identifier FROM devices WHERE id = %s', (device_id,))
-    row = cur.fetchone()
-    current_name = row['name'] if row else ''
-    current_status = row['status'] if row else ''
-    current_store_id = row['store_id'] if row else None
-    current_identifier = row['identifier'] if row else None
-    # Permite atualizar identifier para vazio ou null explicitamente
-    if identifier == "null":
-        identifier = None
-    # Se for para atualizar o identifier, verifica unicidade (não pode duplicar)
-    if identifier not in (None, '', current_identifier):
-        conn_check = get_db_connection()
-        cur_check = conn_check.cursor()
-        cur_check.execute('SELECT id FROM devices WHERE identifier = %s', (identifier,))
-        found = cur_check.fetchone()
-        conn_check.close()
-        if found and (found[0] if not isinstance(found, dict) else found['id']) != device_id:
-            raise Exception(f"Já existe outro equipamento com o identificador {identifier}.")
-    # Nunca remove ou sobrescreve identifier de outro device
-    name = name if name not in (None, '') else current_name
-    status = status if status not in (None, '') else current_status
-    store_id = store_id if store_id not in (None, '') else current_store_id
-    if identifier is None:
-        identifier = current_identifier
-    elif identifier == '':
-        identifier = ''
-    else:
-        identifier = identifier
-    if online is not None:
-        cur.execute('UPDATE devices SET name = %s, status = %s, last_sync = %s, online = %s, store_id = %s, identifier = %s WHERE id = %s', (name, status, last_sync, online, store_id, identifier, device_id))
-    else:
-        cur.execute('UPDATE devices SET name = %s, status = %s, last_sync = %s, store_id = %s, identifier = %s WHERE id = %s', (name, status, last_sync, store_id, identifier, device_id))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        # Busca valores atuais
+        cur.execute('SELECT name, status, store_id, identifier FROM devices WHERE id = %s', (device_id,))
+        row = cur.fetchone()
+        current_name = row['name'] if row else ''
+        current_status = row['status'] if row else ''
+        current_store_id = row['store_id'] if row else None
+        current_identifier = row['identifier'] if row else None
+        # Permite atualizar identifier para vazio ou null explicitamente
+        if identifier == "null":
+            identifier = None
+        # Se for para atualizar o identifier, verifica unicidade (não pode duplicar)
+        if identifier not in (None, '', current_identifier):
+            cur.execute('SELECT id FROM devices WHERE identifier = %s', (identifier,))
+            found = cur.fetchone()
+            if found and found['id'] != device_id:
+                raise Exception(f"Já existe outro equipamento com o identificador {identifier}.")
+        # Nunca remove ou sobrescreve identifier de outro device
+        name = name if name not in (None, '') else current_name
+        status = status if status not in (None, '') else current_status
+        store_id = store_id if store_id not in (None, '') else current_store_id
+        if identifier is None:
+            identifier = current_identifier
+        elif identifier == '':
+            identifier = ''
+        else:
+            identifier = identifier
+        if online is not None:
+            cur.execute('UPDATE devices SET name = %s, status = %s, last_sync = %s, online = %s, store_id = %s, identifier = %s WHERE id = %s', (name, status, last_sync, online, store_id, identifier, device_id))
+        else:
+            cur.execute('UPDATE devices SET name = %s, status = %s, last_sync = %s, store_id = %s, identifier = %s WHERE id = %s', (name, status, last_sync, store_id, identifier, device_id))
+        conn.commit()
 # Novo endpoint: atualizar status online (heartbeat)
 def set_device_online(identifier: str):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT id FROM devices WHERE identifier = %s', (identifier,))
-    row = cur.fetchone()
-    from datetime import datetime
-    now = datetime.utcnow().isoformat()
-    if row:
-        device_id = row['id']
-        # Atualiza apenas last_sync e online, preservando nome/status e identifier
-        update_device(device_id, last_sync=now, online=1)
-        logging.info(f"[HEARTBEAT] Device online: id={device_id}, identifier={identifier}")
-    else:
-        # Não existe device com esse identifier, cria novo
-        logging.warning(f"[HEARTBEAT] Device NOT FOUND for identifier={identifier}. Criando novo device.")
-        default_name = f"Novo Equipamento {identifier[:8]}"
-        cur.execute('SELECT id FROM stores ORDER BY id LIMIT 1')
-        store_row = cur.fetchone()
-        default_store_id = (store_row['id'] if store_row else None)
-        add_device(default_store_id, default_name, identifier=identifier, last_sync=now, online=1)
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT id FROM devices WHERE identifier = %s', (identifier,))
+        row = cur.fetchone()
+        from datetime import datetime
+        now = datetime.utcnow().isoformat()
+        if row:
+            device_id = row['id']
+            # Atualiza apenas last_sync e online, preservando nome/status e identifier
+            update_device(device_id, last_sync=now, online=1)
+            logging.info(f"[HEARTBEAT] Device online: id={device_id}, identifier={identifier}")
+        else:
+            # Não existe device com esse identifier, cria novo
+            logging.warning(f"[HEARTBEAT] Device NOT FOUND for identifier={identifier}. Criando novo device.")
+            default_name = f"Novo Equipamento {identifier[:8]}"
+            cur.execute('SELECT id FROM stores ORDER BY id LIMIT 1')
+            store_row = cur.fetchone()
+            default_store_id = (store_row['id'] if store_row else None)
+            add_device(default_store_id, default_name, identifier=identifier, last_sync=now, online=1)
+
+def flush_device_heartbeats(batch: dict) -> dict:
+    """Grava heartbeats acumulados ({identifier: {'ts': datetime UTC}}) em lote.
+
+    Um UPDATE ... FROM (VALUES ...). Todo identifier do buffer teve a existência confirmada em
+    POST /device/heartbeat; os que não existem mais (dispositivo removido ou identifier alterado
+    desde então) não são recriados e voltam em 'missing'.
+    """
+    if not batch:
+        return {'updated': 0, 'missing': []}
+    rows = [(identifier, value['ts']) for identifier, value in batch.items()]
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        updated = psycopg2.extras.execute_values(
+            cur,
+            'UPDATE devices AS d SET last_sync = GREATEST(d.last_sync, v.ts), online = 1 '
+            'FROM (VALUES %s) AS v(identifier, ts) WHERE d.identifier = v.identifier RETURNING d.identifier',
+            rows, template='(%s, %s::timestamp)', page_size=1000, fetch=True
+        )
+        found = {r[0] for r in updated}
+        cur.close()
+    missing = [identifier for identifier, _ in rows if identifier not in found]
+    for identifier in missing:
+        logging.warning(f"[HEARTBEAT] Heartbeat descartado: device {identifier} não existe mais")
+    return {'updated': len(found), 'missing': missing}
 
 def set_device_offline(device_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT name FROM devices WHERE id = %s', (device_id,))
-    result = cur.fetchone()
-    device_name = result['name'] if result else f'Device {device_id}'
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT name FROM devices WHERE id = %s', (device_id,))
+        result = cur.fetchone()
+        device_name = result['name'] if result else f'Device {device_id}'
     update_device(device_id, name='', status='', last_sync=None, online=0)
     add_audit_log(device_id, device_name, 'DEVICE_OFFLINE', 'Dispositivo ficou offline')
 
 def delete_device(device_id: int):
+    # Entradas do device ainda na fila do audit_writer são gravadas antes do DELETE abaixo,
+    # que as remove; gravadas depois violariam a FK audit_log.device_id
+    if audit_writer.running:
+        audit_writer.flush()
     # Busca nome do device antes de deletar
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
-    try:
-        cur.execute('SELECT name FROM devices WHERE id = %s', (device_id,))
-        result = cur.fetchone()
-        device_name = result['name'] if result else f'Device {device_id}'
-        logging.info(f"[DB] Deletando device id={device_id} nome={device_name}")
+        try:
+            cur.execute('SELECT name FROM devices WHERE id = %s', (device_id,))
+            result = cur.fetchone()
+            device_name = result['name'] if result else f'Device {device_id}'
+            logging.info(f"[DB] Deletando device id={device_id} nome={device_name}")
         
-        # Primeiro adiciona o log de auditoria antes de deletar o device
-        cur.execute('INSERT INTO audit_log (timestamp, device_id, device_name, action, details) VALUES (%s, %s, %s, %s, %s)', 
-                   (datetime.utcnow(), device_id, device_name, 'DEVICE_DELETED', 'Dispositivo removido do sistema'))
+            # Primeiro adiciona o log de auditoria antes de deletar o device
+            cur.execute('INSERT INTO audit_log (timestamp, device_id, device_name, action, details) VALUES (%s, %s, %s, %s, %s)', 
+                       (datetime.utcnow(), device_id, device_name, 'DEVICE_DELETED', 'Dispositivo removido do sistema'))
         
-        # Depois deleta todos os logs de auditoria relacionados ao device
-        cur.execute('DELETE FROM audit_log WHERE device_id = %s', (device_id,))
+            # Depois deleta todos os logs de auditoria relacionados ao device
+            cur.execute('DELETE FROM audit_log WHERE device_id = %s', (device_id,))
         
-        # Finalmente deleta o device
-        cur.execute('DELETE FROM devices WHERE id = %s', (device_id,))
+            # Finalmente deleta o device
+            cur.execute('DELETE FROM devices WHERE id = %s', (device_id,))
         
-        conn.commit()
-        logging.info(f"[DB] Device {device_id} ({device_name}) deletado com sucesso")
+            conn.commit()
+            logging.info(f"[DB] Device {device_id} ({device_name}) deletado com sucesso")
         
-    except Exception as e:
-        conn.rollback()
-        logging.error(f"[DB] Erro ao deletar device {device_id}: {e}")
-        raise e
-    finally:
-        conn.close()
+        except Exception as e:
+            conn.rollback()
+            logging.error(f"[DB] Erro ao deletar device {device_id}: {e}")
+            raise e
 
 
 # Helpers de devices
 def get_device_by_identifier(identifier: str) -> Optional[Dict]:
     """Retorna um device pelo identifier ou None."""
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    try:
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cur.execute('SELECT * FROM devices WHERE identifier = %s', (identifier,))
         row = cur.fetchone()
         return dict(row) if row else None
-    finally:
-        conn.close()
 
 def update_device_catalog_sync(identifier: str, total_products: int = 0, timestamp: Optional[str] = None):
     """Atualiza métricas de catálogo de um device PWA.
@@ -592,8 +1202,7 @@ def update_device_catalog_sync(identifier: str, total_products: int = 0, timesta
     except Exception:
         pass
     # Atualiza métricas opcionais
-    try:
-        conn = get_db_connection()
+    with db_connection() as conn:
         cur = conn.cursor()
         # Primeiro tenta com last_catalog_sync/catalog_count
         try:
@@ -609,20 +1218,14 @@ def update_device_catalog_sync(identifier: str, total_products: int = 0, timesta
                 conn.commit()
             except Exception:
                 pass
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 
 # Exportador de produtos para .txt
 def export_products_to_txt(txt_path: str = 'produtos.txt'):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT barcode, name, price, promo FROM products')
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT barcode, name, price, promo FROM products')
+        rows = cur.fetchall()
     with open(txt_path, 'w', encoding='utf-8') as f:
         for row in rows:
             barcode = row['barcode']
@@ -633,11 +1236,10 @@ def export_products_to_txt(txt_path: str = 'produtos.txt'):
     return txt_path
 
 def debug_list_device_identifiers():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT id, identifier, name FROM devices')
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT id, identifier, name FROM devices')
+        rows = cur.fetchall()
     for row in rows:
         logging.info(f"[DEBUG] Device: id={row['id']}, identifier={row['identifier']}, name={row['name']}")
 
@@ -662,30 +1264,29 @@ def upsert_agent_status(agent_id: str, loja_codigo: str = None, loja_nome: str =
                     last_update = dt.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
             except Exception:
                 pass
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('''
-            INSERT INTO agents_status (agent_id, loja_codigo, loja_nome, status, last_update, ip)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (agent_id) DO UPDATE SET
-                loja_codigo=EXCLUDED.loja_codigo,
-                loja_nome=EXCLUDED.loja_nome,
-                status=EXCLUDED.status,
-                last_update=EXCLUDED.last_update,
-                ip=EXCLUDED.ip
-        ''', (agent_id, loja_codigo, loja_nome, status, last_update, ip))
-        conn.commit()
-        # Diagnóstico: verifica múltiplos registros por IP/agent_id
-        cur.execute('SELECT COUNT(*) FROM agents_status WHERE agent_id = %s', (agent_id,))
-        count_id = cur.fetchone()[0]
-        if count_id > 1:
-            logging.warning(f"[DB][upsert_agent_status] Múltiplos registros para agent_id={agent_id}")
-        if ip:
-            cur.execute('SELECT COUNT(*) FROM agents_status WHERE ip = %s', (ip,))
-            count_ip = cur.fetchone()[0]
-            if count_ip > 1:
-                logging.warning(f"[DB][upsert_agent_status] Múltiplos registros para ip={ip}")
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                INSERT INTO agents_status (agent_id, loja_codigo, loja_nome, status, last_update, ip)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (agent_id) DO UPDATE SET
+                    loja_codigo=EXCLUDED.loja_codigo,
+                    loja_nome=EXCLUDED.loja_nome,
+                    status=EXCLUDED.status,
+                    last_update=EXCLUDED.last_update,
+                    ip=EXCLUDED.ip
+            ''', (agent_id, loja_codigo, loja_nome, status, last_update, ip))
+            conn.commit()
+            # Diagnóstico: verifica múltiplos registros por IP/agent_id
+            cur.execute('SELECT COUNT(*) FROM agents_status WHERE agent_id = %s', (agent_id,))
+            count_id = cur.fetchone()[0]
+            if count_id > 1:
+                logging.warning(f"[DB][upsert_agent_status] Múltiplos registros para agent_id={agent_id}")
+            if ip:
+                cur.execute('SELECT COUNT(*) FROM agents_status WHERE ip = %s', (ip,))
+                count_ip = cur.fetchone()[0]
+                if count_ip > 1:
+                    logging.warning(f"[DB][upsert_agent_status] Múltiplos registros para ip={ip}")
     except Exception as e:
         logging.error(f"[DB][upsert_agent_status] Erro ao inserir/atualizar agente: {e}")
         raise
@@ -694,43 +1295,40 @@ def replace_agent_stores(agent_id: str, lojas: list):
     """Substitui a lista de lojas vinculadas a um agente."""
     try:
         agent_id = normalize_agent_id(agent_id)
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('DELETE FROM agent_stores WHERE agent_id = %s', (agent_id,))
-        for lj in lojas or []:
-            if not isinstance(lj, dict):
-                continue
-            codigo = (lj.get('codigo') or '').strip()
-            nome = (lj.get('nome') or lj.get('name') or '').strip()
-            if not codigo and not nome:
-                continue
-            cur.execute(
-                'INSERT INTO agent_stores (agent_id, loja_codigo, loja_nome) VALUES (%s, %s, %s) '
-                'ON CONFLICT (agent_id, loja_codigo) DO UPDATE SET loja_nome = EXCLUDED.loja_nome',
-                (agent_id, codigo or None, nome or None)
-            )
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute('DELETE FROM agent_stores WHERE agent_id = %s', (agent_id,))
+            for lj in lojas or []:
+                if not isinstance(lj, dict):
+                    continue
+                codigo = (lj.get('codigo') or '').strip()
+                nome = (lj.get('nome') or lj.get('name') or '').strip()
+                if not codigo and not nome:
+                    continue
+                cur.execute(
+                    'INSERT INTO agent_stores (agent_id, loja_codigo, loja_nome) VALUES (%s, %s, %s) '
+                    'ON CONFLICT (agent_id, loja_codigo) DO UPDATE SET loja_nome = EXCLUDED.loja_nome',
+                    (agent_id, codigo or None, nome or None)
+                )
+            conn.commit()
     except Exception as e:
         logging.error(f"[DB][replace_agent_stores] {e}")
         raise
 
 def get_agent_stores(agent_id: str):
     agent_id = normalize_agent_id(agent_id)
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT loja_codigo, loja_nome FROM agent_stores WHERE agent_id = %s ORDER BY loja_codigo', (agent_id,))
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT loja_codigo, loja_nome FROM agent_stores WHERE agent_id = %s ORDER BY loja_codigo', (agent_id,))
+        rows = cur.fetchall()
     return [dict(row) for row in rows]
 
 def get_all_agents_status():
     from datetime import datetime, timezone
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT * FROM agents_status')
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT * FROM agents_status')
+        rows = cur.fetchall()
     # Normaliza agent_id no retorno para consumo unificado
     out = []
     now_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
@@ -759,37 +1357,34 @@ def get_all_agents_status():
 
 def delete_agent_status(agent_id: str):
     agent_id = normalize_agent_id(agent_id)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM agents_status WHERE agent_id = %s', (agent_id,))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM agents_status WHERE agent_id = %s', (agent_id,))
+        conn.commit()
 
 def update_agent_status(agent_id: str, loja_codigo: str = None, loja_nome: str = None, status: str = None, ip: str = None, last_update: str = None):
     agent_id = normalize_agent_id(agent_id)
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    # Busca valores atuais
-    cur.execute('SELECT loja_codigo, loja_nome, status, last_update, ip FROM agents_status WHERE agent_id = %s', (agent_id,))
-    row = cur.fetchone()
-    if not row:
-        # Se não existir, cria com os dados fornecidos
-        conn.close()
-        upsert_agent_status(agent_id, loja_codigo=loja_codigo, loja_nome=loja_nome, status=status, last_update=last_update, ip=ip)
-        return
-    current = dict(row)
-    new_loja_codigo = loja_codigo if loja_codigo is not None else current.get('loja_codigo')
-    new_loja_nome = loja_nome if loja_nome is not None else current.get('loja_nome')
-    new_status = status if status is not None else current.get('status')
-    new_last_update = last_update if last_update is not None else current.get('last_update')
-    new_ip = ip if ip is not None else current.get('ip')
-    cur.execute('''
-            UPDATE agents_status
-                 SET loja_codigo = %s, loja_nome = %s, status = %s, last_update = %s, ip = %s
-             WHERE agent_id = %s
-    ''', (new_loja_codigo, new_loja_nome, new_status, new_last_update, new_ip, agent_id))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        # Busca valores atuais
+        cur.execute('SELECT loja_codigo, loja_nome, status, last_update, ip FROM agents_status WHERE agent_id = %s', (agent_id,))
+        row = cur.fetchone()
+        if not row:
+            # Se não existir, cria com os dados fornecidos
+            upsert_agent_status(agent_id, loja_codigo=loja_codigo, loja_nome=loja_nome, status=status, last_update=last_update, ip=ip)
+            return
+        current = dict(row)
+        new_loja_codigo = loja_codigo if loja_codigo is not None else current.get('loja_codigo')
+        new_loja_nome = loja_nome if loja_nome is not None else current.get('loja_nome')
+        new_status = status if status is not None else current.get('status')
+        new_last_update = last_update if last_update is not None else current.get('last_update')
+        new_ip = ip if ip is not None else current.get('ip')
+        cur.execute('''
+                UPDATE agents_status
+                     SET loja_codigo = %s, loja_nome = %s, status = %s, last_update = %s, ip = %s
+                 WHERE agent_id = %s
+        ''', (new_loja_codigo, new_loja_nome, new_status, new_last_update, new_ip, agent_id))
+        conn.commit()
 
 def _parse_dt(dt_str: str):
     from datetime import datetime as _dt
@@ -813,47 +1408,46 @@ def dedupe_agents():
     - Migra agent_stores e agent_devices para o agent_id canônico
     """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute('SELECT agent_id, loja_codigo, loja_nome, status, last_update, ip FROM agents_status')
-        rows = cur.fetchall()
-        # Agrupa por id normalizado
-        groups = {}
-        for row in rows:
-            raw_id = row['agent_id']
-            norm = normalize_agent_id(raw_id)
-            groups.setdefault(norm, []).append(dict(row))
-        for norm_id, lst in groups.items():
-            if norm_id == '':
-                # limpa entradas inválidas
-                cur.execute("DELETE FROM agents_status WHERE agent_id IS NULL OR TRIM(agent_id) = ''")
-                continue
-            # Seleciona registro vencedor pelo last_update mais recente
-            best = None
-            best_dt = None
-            for rec in lst:
-                dt = _parse_dt(rec.get('last_update'))
-                if dt and (best_dt is None or dt > best_dt):
-                    best_dt = dt
-                    best = rec
-                elif best is None:
-                    best = rec
-            # Garante registro canônico
-            if best:
-                upsert_agent_status(norm_id, best.get('loja_codigo'), best.get('loja_nome'), best.get('status'), best.get('last_update'), best.get('ip'))
-            # Migra children e remove duplicados com ids divergentes
-            raw_values = set([r.get('agent_id') for r in lst if r.get('agent_id')])
-            for raw in list(raw_values):
-                if not raw or normalize_agent_id(raw) == norm_id:
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            cur.execute('SELECT agent_id, loja_codigo, loja_nome, status, last_update, ip FROM agents_status')
+            rows = cur.fetchall()
+            # Agrupa por id normalizado
+            groups = {}
+            for row in rows:
+                raw_id = row['agent_id']
+                norm = normalize_agent_id(raw_id)
+                groups.setdefault(norm, []).append(dict(row))
+            for norm_id, lst in groups.items():
+                if norm_id == '':
+                    # limpa entradas inválidas
+                    cur.execute("DELETE FROM agents_status WHERE agent_id IS NULL OR TRIM(agent_id) = ''")
                     continue
-                # Atualiza agent_stores
-                cur.execute('UPDATE agent_stores SET agent_id = %s WHERE agent_id = %s', (norm_id, raw))
-                # Atualiza agent_devices
-                cur.execute('UPDATE agent_devices SET agent_id = %s WHERE agent_id = %s', (norm_id, raw))
-                # Remove antigo em agents_status
-                cur.execute('DELETE FROM agents_status WHERE agent_id = %s', (raw,))
-        conn.commit()
-        conn.close()
+                # Seleciona registro vencedor pelo last_update mais recente
+                best = None
+                best_dt = None
+                for rec in lst:
+                    dt = _parse_dt(rec.get('last_update'))
+                    if dt and (best_dt is None or dt > best_dt):
+                        best_dt = dt
+                        best = rec
+                    elif best is None:
+                        best = rec
+                # Garante registro canônico
+                if best:
+                    upsert_agent_status(norm_id, best.get('loja_codigo'), best.get('loja_nome'), best.get('status'), best.get('last_update'), best.get('ip'))
+                # Migra children e remove duplicados com ids divergentes
+                raw_values = set([r.get('agent_id') for r in lst if r.get('agent_id')])
+                for raw in list(raw_values):
+                    if not raw or normalize_agent_id(raw) == norm_id:
+                        continue
+                    # Atualiza agent_stores
+                    cur.execute('UPDATE agent_stores SET agent_id = %s WHERE agent_id = %s', (norm_id, raw))
+                    # Atualiza agent_devices
+                    cur.execute('UPDATE agent_devices SET agent_id = %s WHERE agent_id = %s', (norm_id, raw))
+                    # Remove antigo em agents_status
+                    cur.execute('DELETE FROM agents_status WHERE agent_id = %s', (raw,))
+            conn.commit()
     except Exception as e:
         logging.error(f"[DB][dedupe_agents] {e}")
         # não propaga para não derrubar startup
@@ -863,11 +1457,10 @@ def _latest_agent_id_for_ip(ip: str):
     try:
         if not ip:
             return None, None
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute('SELECT agent_id, last_update FROM agents_status WHERE ip = %s', (ip,))
-        rows = cur.fetchall()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+            cur.execute('SELECT agent_id, last_update FROM agents_status WHERE ip = %s', (ip,))
+            rows = cur.fetchall()
         if not rows:
             return None, None
         best_id = None
@@ -888,88 +1481,87 @@ def dedupe_agents_by_ip():
     migrando agent_stores e agent_devices e removendo duplicados em agents_status.
     """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute(
-            "SELECT ip, COUNT(*) as c FROM agents_status "
-            "WHERE ip IS NOT NULL AND TRIM(ip) <> '' "
-            "GROUP BY ip HAVING COUNT(*) > 1"
-        )
-        groups = cur.fetchall()
-        for g in groups:
-            ip = g['ip'] if isinstance(g, dict) else g[0]
-            # Determina id canônico
-            cur.execute('SELECT agent_id, last_update FROM agents_status WHERE ip = %s', (ip,))
-            rows = cur.fetchall()
-            canonical_id = None
-            best_dt = None
-            for r in rows:
-                dt = _parse_dt(r['last_update'] if isinstance(r, dict) else r[1])
-                aid = normalize_agent_id(r['agent_id'] if isinstance(r, dict) else r[0])
-                if dt and (best_dt is None or dt > best_dt):
-                    best_dt = dt
-                    canonical_id = aid
-                elif canonical_id is None:
-                    canonical_id = aid
-            if not canonical_id:
-                continue
-            # Garante registro canônico atualizado
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
             cur.execute(
-                'SELECT loja_codigo, loja_nome, status, last_update, ip FROM agents_status WHERE agent_id = %s',
-                (canonical_id,)
+                "SELECT ip, COUNT(*) as c FROM agents_status "
+                "WHERE ip IS NOT NULL AND TRIM(ip) <> '' "
+                "GROUP BY ip HAVING COUNT(*) > 1"
             )
-            best = cur.fetchone()
-            if best:
-                upsert_agent_status(
-                    canonical_id,
-                    (best['loja_codigo'] if isinstance(best, dict) else best[0]),
-                    (best['loja_nome'] if isinstance(best, dict) else best[1]),
-                    (best['status'] if isinstance(best, dict) else best[2]),
-                    (best['last_update'] if isinstance(best, dict) else best[3]),
-                    (best['ip'] if isinstance(best, dict) else best[4])
-                )
-            # Migra filhos e remove duplicados com segurança (evita UNIQUE conflicts)
-            cur.execute('SELECT agent_id FROM agents_status WHERE ip = %s', (ip,))
-            others = cur.fetchall()
-            for r in others:
-                raw = r['agent_id'] if isinstance(r, dict) else r[0]
-                if not raw:
-                    continue
-                if normalize_agent_id(raw) == canonical_id:
+            groups = cur.fetchall()
+            for g in groups:
+                ip = g['ip'] if isinstance(g, dict) else g[0]
+                # Determina id canônico
+                cur.execute('SELECT agent_id, last_update FROM agents_status WHERE ip = %s', (ip,))
+                rows = cur.fetchall()
+                canonical_id = None
+                best_dt = None
+                for r in rows:
+                    dt = _parse_dt(r['last_update'] if isinstance(r, dict) else r[1])
+                    aid = normalize_agent_id(r['agent_id'] if isinstance(r, dict) else r[0])
+                    if dt and (best_dt is None or dt > best_dt):
+                        best_dt = dt
+                        canonical_id = aid
+                    elif canonical_id is None:
+                        canonical_id = aid
+                if not canonical_id:
                     continue
-                # Copia lojas da origem para o canônico (upsert por (agent_id, loja_codigo))
-                cur.execute('SELECT loja_codigo, loja_nome FROM agent_stores WHERE agent_id = %s', (raw,))
-                stores_rows = cur.fetchall()
-                for s in stores_rows or []:
-                    sc = s if isinstance(s, dict) else {'loja_codigo': s[0], 'loja_nome': s[1]}
-                    cur.execute(
-                        'INSERT INTO agent_stores (agent_id, loja_codigo, loja_nome) VALUES (%s, %s, %s) '
-                        'ON CONFLICT (agent_id, loja_codigo) DO UPDATE SET loja_nome = EXCLUDED.loja_nome',
-                        (canonical_id, sc['loja_codigo'], sc['loja_nome'])
-                    )
-                # Copia devices da origem para o canônico (upsert por (agent_id, identifier))
-                cur.execute('SELECT identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name FROM agent_devices WHERE agent_id = %s', (raw,))
-                dev_rows = cur.fetchall()
-                for d in dev_rows or []:
-                    dd = d if isinstance(d, dict) else {
-                        'identifier': d[0], 'name': d[1], 'tipo': d[2], 'status': d[3], 'last_update': d[4], 'ip': d[5],
-                        'last_catalog_sync': d[6], 'catalog_count': d[7], 'store_code': d[8], 'store_name': d[9]
-                    }
-                    cur.execute(
-                        'INSERT INTO agent_devices (agent_id, identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name) '
-                        'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) '
-                        'ON CONFLICT (agent_id, identifier) DO UPDATE SET '
-                        'name=EXCLUDED.name, tipo=EXCLUDED.tipo, status=EXCLUDED.status, last_update=EXCLUDED.last_update, '
-                        'ip=EXCLUDED.ip, last_catalog_sync=EXCLUDED.last_catalog_sync, catalog_count=EXCLUDED.catalog_count, '
-                        'store_code=EXCLUDED.store_code, store_name=EXCLUDED.store_name',
-                        (canonical_id, dd['identifier'], dd['name'], dd['tipo'], dd['status'], dd['last_update'], dd['ip'], dd['last_catalog_sync'], dd['catalog_count'], dd['store_code'], dd['store_name'])
+                # Garante registro canônico atualizado
+                cur.execute(
+                    'SELECT loja_codigo, loja_nome, status, last_update, ip FROM agents_status WHERE agent_id = %s',
+                    (canonical_id,)
+                )
+                best = cur.fetchone()
+                if best:
+                    upsert_agent_status(
+                        canonical_id,
+                        (best['loja_codigo'] if isinstance(best, dict) else best[0]),
+                        (best['loja_nome'] if isinstance(best, dict) else best[1]),
+                        (best['status'] if isinstance(best, dict) else best[2]),
+                        (best['last_update'] if isinstance(best, dict) else best[3]),
+                        (best['ip'] if isinstance(best, dict) else best[4])
                     )
-                # Remove origem após copiar
-                cur.execute('DELETE FROM agent_stores WHERE agent_id = %s', (raw,))
-                cur.execute('DELETE FROM agent_devices WHERE agent_id = %s', (raw,))
-                cur.execute('DELETE FROM agents_status WHERE agent_id = %s', (raw,))
-        conn.commit()
-        conn.close()
+                # Migra filhos e remove duplicados com segurança (evita UNIQUE conflicts)
+                cur.execute('SELECT agent_id FROM agents_status WHERE ip = %s', (ip,))
+                others = cur.fetchall()
+                for r in others:
+                    raw = r['agent_id'] if isinstance(r, dict) else r[0]
+                    if not raw:
+                        continue
+                    if normalize_agent_id(raw) == canonical_id:
+                        continue
+                    # Copia lojas da origem para o canônico (upsert por (agent_id, loja_codigo))
+                    cur.execute('SELECT loja_codigo, loja_nome FROM agent_stores WHERE agent_id = %s', (raw,))
+                    stores_rows = cur.fetchall()
+                    for s in stores_rows or []:
+                        sc = s if isinstance(s, dict) else {'loja_codigo': s[0], 'loja_nome': s[1]}
+                        cur.execute(
+                            'INSERT INTO agent_stores (agent_id, loja_codigo, loja_nome) VALUES (%s, %s, %s) '
+                            'ON CONFLICT (agent_id, loja_codigo) DO UPDATE SET loja_nome = EXCLUDED.loja_nome',
+                            (canonical_id, sc['loja_codigo'], sc['loja_nome'])
+                        )
+                    # Copia devices da origem para o canônico (upsert por (agent_id, identifier))
+                    cur.execute('SELECT identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name FROM agent_devices WHERE agent_id = %s', (raw,))
+                    dev_rows = cur.fetchall()
+                    for d in dev_rows or []:
+                        dd = d if isinstance(d, dict) else {
+                            'identifier': d[0], 'name': d[1], 'tipo': d[2], 'status': d[3], 'last_update': d[4], 'ip': d[5],
+                            'last_catalog_sync': d[6], 'catalog_count': d[7], 'store_code': d[8], 'store_name': d[9]
+                        }
+                        cur.execute(
+                            'INSERT INTO agent_devices (agent_id, identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name) '
+                            'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) '
+                            'ON CONFLICT (agent_id, identifier) DO UPDATE SET '
+                            'name=EXCLUDED.name, tipo=EXCLUDED.tipo, status=EXCLUDED.status, last_update=EXCLUDED.last_update, '
+                            'ip=EXCLUDED.ip, last_catalog_sync=EXCLUDED.last_catalog_sync, catalog_count=EXCLUDED.catalog_count, '
+                            'store_code=EXCLUDED.store_code, store_name=EXCLUDED.store_name',
+                            (canonical_id, dd['identifier'], dd['name'], dd['tipo'], dd['status'], dd['last_update'], dd['ip'], dd['last_catalog_sync'], dd['catalog_count'], dd['store_code'], dd['store_name'])
+                        )
+                    # Remove origem após copiar
+                    cur.execute('DELETE FROM agent_stores WHERE agent_id = %s', (raw,))
+                    cur.execute('DELETE FROM agent_devices WHERE agent_id = %s', (raw,))
+                    cur.execute('DELETE FROM agents_status WHERE agent_id = %s', (raw,))
+            conn.commit()
     except Exception as e:
         logging.error(f"[DB][dedupe_agents_by_ip] {e}")
 
@@ -985,11 +1577,10 @@ def get_recent_agent_by_ip(ip: str, window_seconds: int = 300) -> Optional[str]:
     try:
         if not ip:
             return None
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cur.execute('SELECT agent_id, last_update FROM agents_status WHERE ip = %s', (ip,))
-        rows = cur.fetchall()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.execute('SELECT agent_id, last_update FROM agents_status WHERE ip = %s', (ip,))
+            rows = cur.fetchall()
         if not rows:
             return None
         from datetime import datetime, timedelta
@@ -1010,11 +1601,10 @@ def get_recent_agent_by_ip(ip: str, window_seconds: int = 300) -> Optional[str]:
         return None
 
 def get_all_users():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT * FROM admin_users')
-    rows = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT * FROM admin_users')
+        rows = cur.fetchall()
     return [dict(row) for row in rows]
 
 # --- Reatribuição de devices órfãos para o agente canônico por IP ---
@@ -1026,174 +1616,412 @@ def reassign_orphan_agent_devices_by_ip():
     e depois remove o registro antigo, evitando falhas de UNIQUE.
     """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        # Seleciona devices cujo agent_id não está presente em agents_status
-        cur.execute(
-            'SELECT d.agent_id, d.identifier, d.name, d.tipo, d.status, d.last_update, d.ip, '
-            '       d.last_catalog_sync, d.catalog_count, d.store_code, d.store_name '
-            '  FROM agent_devices d '
-            '  LEFT JOIN agents_status a ON a.agent_id = d.agent_id '
-            ' WHERE a.agent_id IS NULL'
-        )
-        rows = cur.fetchall()
-        moved = 0
-        for r in rows or []:
-            ip = (r['ip'] or '').strip()
-            if not ip:
-                continue
-            canonical_id = get_latest_agent_by_ip(ip)
-            if not canonical_id:
-                continue
-            if normalize_agent_id(canonical_id) == normalize_agent_id(r['agent_id']):
-                continue
-            # Copia para o canônico e remove origem
+        with db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            # Seleciona devices cujo agent_id não está presente em agents_status
             cur.execute(
-                'INSERT INTO agent_devices '
-                ' (agent_id, identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name) '
-                ' VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) '
-                'ON CONFLICT (agent_id, identifier) DO UPDATE SET '
-                'name=EXCLUDED.name, tipo=EXCLUDED.tipo, status=EXCLUDED.status, last_update=EXCLUDED.last_update, '
-                'ip=EXCLUDED.ip, last_catalog_sync=EXCLUDED.last_catalog_sync, catalog_count=EXCLUDED.catalog_count, store_code=EXCLUDED.store_code, store_name=EXCLUDED.store_name',
-                (normalize_agent_id(canonical_id), r['identifier'], r['name'], r['tipo'], r['status'], r['last_update'], r['ip'], r['last_catalog_sync'], r['catalog_count'], r['store_code'], r['store_name'])
+                'SELECT d.agent_id, d.identifier, d.name, d.tipo, d.status, d.last_update, d.ip, '
+                '       d.last_catalog_sync, d.catalog_count, d.store_code, d.store_name '
+                '  FROM agent_devices d '
+                '  LEFT JOIN agents_status a ON a.agent_id = d.agent_id '
+                ' WHERE a.agent_id IS NULL'
             )
-            cur.execute('DELETE FROM agent_devices WHERE agent_id = %s AND identifier = %s', (r['agent_id'], r['identifier']))
-            moved += 1
-        if moved:
-            conn.commit()
-        conn.close()
+            rows = cur.fetchall()
+            moved = 0
+            for r in rows or []:
+                ip = (r['ip'] or '').strip()
+                if not ip:
+                    continue
+                canonical_id = get_latest_agent_by_ip(ip)
+                if not canonical_id:
+                    continue
+                if normalize_agent_id(canonical_id) == normalize_agent_id(r['agent_id']):
+                    continue
+                # Copia para o canônico e remove origem
+                cur.execute(
+                    'INSERT INTO agent_devices '
+                    ' (agent_id, identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name) '
+                    ' VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) '
+                    'ON CONFLICT (agent_id, identifier) DO UPDATE SET '
+                    'name=EXCLUDED.name, tipo=EXCLUDED.tipo, status=EXCLUDED.status, last_update=EXCLUDED.last_update, '
+                    'ip=EXCLUDED.ip, last_catalog_sync=EXCLUDED.last_catalog_sync, catalog_count=EXCLUDED.catalog_count, store_code=EXCLUDED.store_code, store_name=EXCLUDED.store_name',
+                    (normalize_agent_id(canonical_id), r['identifier'], r['name'], r['tipo'], r['status'], r['last_update'], r['ip'], r['last_catalog_sync'], r['catalog_count'], r['store_code'], r['store_name'])
+                )
+                cur.execute('DELETE FROM agent_devices WHERE agent_id = %s AND identifier = %s', (r['agent_id'], r['identifier']))
+                moved += 1
+            if moved:
+                conn.commit()
     except Exception as e:
         logging.error(f"[DB][reassign_orphan_agent_devices_by_ip] {e}")
 
+# --- Reconciliação incremental de identidade (heartbeat) ---
+# Chave do pg_advisory_xact_lock por IP/agente: heartbeats simultâneos da mesma máquina se serializam
+_AGENT_RECONCILE_LOCK_KEY = 7301003
+# Varredura completa agendada (jobs.py): evita duas execuções simultâneas entre workers
+_AGENT_SWEEP_LOCK_KEY = 7301004
+
+def _merge_agents_into(cur, canonical_id: str, raw_ids: list):
+    """Move lojas e dispositivos de raw_ids para canonical_id (set-based) e remove os agentes antigos."""
+    if not raw_ids:
+        return
+    cur.execute(
+        'INSERT INTO agent_stores (agent_id, loja_codigo, loja_nome) '
+        'SELECT DISTINCT ON (loja_codigo) %s, loja_codigo, loja_nome FROM agent_stores '
+        ' WHERE agent_id = ANY(%s) ORDER BY loja_codigo '
+        'ON CONFLICT (agent_id, loja_codigo) DO UPDATE SET loja_nome = EXCLUDED.loja_nome',
+        (canonical_id, raw_ids)
+    )
+    cur.execute(
+        'INSERT INTO agent_devices '
+        ' (agent_id, identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name) '
+        'SELECT DISTINCT ON (identifier) %s, identifier, name, tipo, status, last_update, ip, last_catalog_sync, '
+        '       catalog_count, store_code, store_name '
+        '  FROM agent_devices WHERE agent_id = ANY(%s) '
+        ' ORDER BY identifier, last_update DESC NULLS LAST '
+        'ON CONFLICT (agent_id, identifier) DO UPDATE SET '
+        'name=EXCLUDED.name, tipo=EXCLUDED.tipo, status=EXCLUDED.status, last_update=EXCLUDED.last_update, '
+        'ip=EXCLUDED.ip, last_catalog_sync=EXCLUDED.last_catalog_sync, catalog_count=EXCLUDED.catalog_count, '
+        'store_code=EXCLUDED.store_code, store_name=EXCLUDED.store_name',
+        (canonical_id, raw_ids)
+    )
+    cur.execute('DELETE FROM agent_stores WHERE agent_id = ANY(%s)', (raw_ids,))
+    cur.execute('DELETE FROM agent_devices WHERE agent_id = ANY(%s)', (raw_ids,))
+    cur.execute('DELETE FROM agents_status WHERE agent_id = ANY(%s)', (raw_ids,))
+
+def reconcile_agent_identity(agent_id: str, ip: str = None) -> dict:
+    """Versão incremental de dedupe_agents/dedupe_agents_by_ip/reassign_orphan_agent_devices_by_ip.
+
+    Toca apenas o agente do heartbeat atual (já canônico, ver get_latest_agent_by_ip):
+    - variantes do mesmo id (maiúsculas/espaços) são fundidas nele
+    - outros agentes com o mesmo IP são fundidos nele
+    - dispositivos órfãos (agente inexistente) com esse IP passam para ele
+    Custo proporcional às linhas do agente/IP, não ao tamanho da frota.
+    """
+    agent_id = normalize_agent_id(agent_id)
+    ip = (ip or '').strip() or None
+    result = {'merged_ids': 0, 'merged_ip': 0, 'orphans': 0}
+    if not agent_id:
+        return result
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))', (_AGENT_RECONCILE_LOCK_KEY, ip or agent_id))
+        cur.execute(
+            'SELECT agent_id FROM agents_status WHERE lower(trim(agent_id)) = %s AND agent_id <> %s',
+            (agent_id, agent_id)
+        )
+        variants = [r[0] for r in cur.fetchall()]
+        _merge_agents_into(cur, agent_id, variants)
+        result['merged_ids'] = len(variants)
+        if ip:
+            cur.execute('SELECT agent_id FROM agents_status WHERE ip = %s AND agent_id <> %s', (ip, agent_id))
+            same_ip = [r[0] for r in cur.fetchall()]
+            _merge_agents_into(cur, agent_id, same_ip)
+            result['merged_ip'] = len(same_ip)
+            cur.execute(
+                'SELECT DISTINCT d.agent_id FROM agent_devices d '
+                '  LEFT JOIN agents_status a ON a.agent_id = d.agent_id '
+                ' WHERE d.ip = %s AND a.agent_id IS NULL AND d.agent_id <> %s',
+                (ip, agent_id)
+            )
+            orphan_ids = [r[0] for r in cur.fetchall()]
+            if orphan_ids:
+                cur.execute(
+                    'SELECT COUNT(*) FROM agent_devices WHERE ip = %s AND agent_id = ANY(%s)',
+                    (ip, orphan_ids)
+                )
+                result['orphans'] = cur.fetchone()[0]
+                cur.execute(
+                    'INSERT INTO agent_devices '
+                    ' (agent_id, identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name) '
+                    'SELECT DISTINCT ON (identifier) %s, identifier, name, tipo, status, last_update, ip, last_catalog_sync, '
+                    '       catalog_count, store_code, store_name '
+                    '  FROM agent_devices WHERE ip = %s AND agent_id = ANY(%s) '
+                    ' ORDER BY identifier, last_update DESC NULLS LAST '
+                    'ON CONFLICT (agent_id, identifier) DO UPDATE SET '
+                    'name=EXCLUDED.name, tipo=EXCLUDED.tipo, status=EXCLUDED.status, last_update=EXCLUDED.last_update, '
+                    'ip=EXCLUDED.ip, last_catalog_sync=EXCLUDED.last_catalog_sync, catalog_count=EXCLUDED.catalog_count, '
+                    'store_code=EXCLUDED.store_code, store_name=EXCLUDED.store_name',
+                    (agent_id, ip, orphan_ids)
+                )
+                cur.execute('DELETE FROM agent_devices WHERE ip = %s AND agent_id = ANY(%s)', (ip, orphan_ids))
+        cur.close()
+    if any(result.values()):
+        logging.info(f"[DB][reconcile_agent_identity] agent_id={agent_id} ip={ip} {result}")
+    return result
+
+def run_agent_identity_sweep() -> dict:
+    """Varredura completa (dedupe por id e IP + órfãos), executada como job agendado.
+
+    Usa advisory lock de sessão para rodar em apenas um worker por vez.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT pg_try_advisory_lock(%s)', (_AGENT_SWEEP_LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            cur.close()
+            return {'skipped': 'lock ocupado por outro worker'}
+        try:
+            cur.execute('SELECT COUNT(*) FROM agents_status')
+            before = cur.fetchone()[0]
+            # As funções abaixo reutilizam esta mesma conexão (db_connection é reentrante)
+            dedupe_agents()
+            dedupe_agents_by_ip()
+            reassign_orphan_agent_devices_by_ip()
+            cur.execute('SELECT COUNT(*) FROM agents_status')
+            after = cur.fetchone()[0]
+        finally:
+            cur.execute('SELECT pg_advisory_unlock(%s)', (_AGENT_SWEEP_LOCK_KEY,))
+            cur.close()
+    return {'agents_before': before, 'agents_after': after, 'removed': before - after}
+
 # --- Agent Devices (legacy) ---
+_AGENT_DEVICE_COLUMNS = ('agent_id', 'identifier', 'name', 'tipo', 'status', 'last_update', 'ip',
+                         'last_catalog_sync', 'catalog_count', 'store_code', 'store_name')
+# Campos ausentes (NULL) preservam o valor já gravado
+_AGENT_DEVICE_UPSERT_SQL = f'''
+        INSERT INTO agent_devices ({', '.join(_AGENT_DEVICE_COLUMNS)})
+        VALUES %s
+            ON CONFLICT (agent_id, identifier) DO UPDATE SET
+                name=COALESCE(EXCLUDED.name, agent_devices.name),
+                tipo=COALESCE(EXCLUDED.tipo, agent_devices.tipo),
+                status=COALESCE(EXCLUDED.status, agent_devices.status),
+                last_update=COALESCE(EXCLUDED.last_update, agent_devices.last_update),
+                ip=COALESCE(EXCLUDED.ip, agent_devices.ip),
+                last_catalog_sync=COALESCE(EXCLUDED.last_catalog_sync, agent_devices.last_catalog_sync),
+                catalog_count=COALESCE(EXCLUDED.catalog_count, agent_devices.catalog_count),
+                store_code=COALESCE(EXCLUDED.store_code, agent_devices.store_code),
+                store_name=COALESCE(EXCLUDED.store_name, agent_devices.store_name)
+'''
+
 def upsert_agent_device(agent_id: str, identifier: str, name: str = None, tipo: str = 'LEGACY', status: str = None, last_update: str = None, ip: str = None, last_catalog_sync: str = None, catalog_count: int = None, store_code: str = None, store_name: str = None):
     agent_id = normalize_agent_id(agent_id)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('''
-    INSERT INTO agent_devices (agent_id, identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (agent_id, identifier) DO UPDATE SET
-            name=COALESCE(EXCLUDED.name, agent_devices.name),
-            tipo=COALESCE(EXCLUDED.tipo, agent_devices.tipo),
-            status=COALESCE(EXCLUDED.status, agent_devices.status),
-            last_update=COALESCE(EXCLUDED.last_update, agent_devices.last_update),
-            ip=COALESCE(EXCLUDED.ip, agent_devices.ip),
-            last_catalog_sync=COALESCE(EXCLUDED.last_catalog_sync, agent_devices.last_catalog_sync),
-            catalog_count=COALESCE(EXCLUDED.catalog_count, agent_devices.catalog_count),
-            store_code=COALESCE(EXCLUDED.store_code, agent_devices.store_code),
-            store_name=COALESCE(EXCLUDED.store_name, agent_devices.store_name)
-    ''', (agent_id, identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name))
-    conn.commit()
-    conn.close()
-
-def bulk_upsert_agent_devices(agent_id: str, devices: list):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        psycopg2.extras.execute_values(
+            cur, _AGENT_DEVICE_UPSERT_SQL,
+            [(agent_id, identifier, name, tipo, status, last_update, ip, last_catalog_sync, catalog_count, store_code, store_name)]
+        )
+        conn.commit()
+
+def _agent_device_rows(agent_id: str, devices: list, now: str) -> list:
+    """Linhas (na ordem de _AGENT_DEVICE_COLUMNS) para o upsert em lote; último valor vence por identifier."""
+    rows = {}
+    for d in devices or []:
+        identifier = str(d.get('identifier') or '').strip()
+        rows[identifier] = (
+            agent_id,
+            identifier,
+            d.get('name'),
+            d.get('tipo') or 'LEGACY',
+            d.get('status') or 'online',
+            d.get('last_update') or now,
+            d.get('ip'),
+            d.get('last_catalog_sync'),
+            d.get('catalog_count'),
+            d.get('store_code') or d.get('loja') or d.get('loja_codigo'),
+            d.get('store_name') or d.get('loja_nome'),
+        )
+    return list(rows.values())
+
+def bulk_upsert_agent_devices(agent_id: str, devices: list) -> int:
+    """Upsert de todos os dispositivos do agente em uma transação (INSERT ... ON CONFLICT multi-linha).
+
+    Mesma semântica de upsert_agent_device por linha; identificadores repetidos no payload são
+    reduzidos ao último (o ON CONFLICT não aceita a mesma chave duas vezes no mesmo comando).
+    """
     from datetime import datetime
     agent_id = normalize_agent_id(agent_id)
     # Usa horário local para compatibilidade com cálculo em get_agent_devices
     now = datetime.now().isoformat()
-    for d in devices or []:
-        upsert_agent_device(
-            agent_id=agent_id,
-            identifier=str(d.get('identifier') or '').strip(),
-            name=d.get('name'),
-            tipo=d.get('tipo') or 'LEGACY',
-            status=d.get('status') or 'online',
-            last_update=d.get('last_update') or now,
-            ip=d.get('ip'),
-            last_catalog_sync=d.get('last_catalog_sync'),
-            catalog_count=d.get('catalog_count'),
-            store_code=d.get('store_code') or d.get('loja') or d.get('loja_codigo'),
-            store_name=d.get('store_name') or d.get('loja_nome')
-        )
+    rows = _agent_device_rows(agent_id, devices, now)
+    if not rows:
+        return 0
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        psycopg2.extras.execute_values(cur, _AGENT_DEVICE_UPSERT_SQL, rows, page_size=1000)
+        cur.close()
+    return len(rows)
+
+def flush_agent_device_heartbeats(batch: dict) -> dict:
+    """Grava heartbeats de dispositivos de agentes ({(agent_id, identifier): {'ts', 'name', ...}}) em lote.
+
+    Mesma semântica de upsert_agent_device (COALESCE preserva o que não veio no heartbeat);
+    ts está em horário local, como o restante de agent_devices.last_update.
+    """
+    if not batch:
+        return {'upserted': 0}
+    rows = [
+        (agent_id, identifier, v.get('name'), v.get('tipo') or 'LEGACY', v.get('status') or 'online',
+         v['ts'].isoformat(), v.get('ip'), None, None, None, None)
+        for (agent_id, identifier), v in batch.items()
+    ]
+    with db_transaction() as conn:
+        cur = conn.cursor()
+        psycopg2.extras.execute_values(cur, _AGENT_DEVICE_UPSERT_SQL, rows, page_size=1000)
+        cur.close()
+    return {'upserted': len(rows)}
+
+# Heartbeats de agent_devices ainda no buffer (heartbeats.py): fn((agent_id, identifier)) -> {'ts', 'status', ...} | None
+_agent_device_presence_source = None
+
+def set_agent_device_presence_source(fn):
+    global _agent_device_presence_source
+    _agent_device_presence_source = fn
+
+def _overlay_agent_device_heartbeat(agent_id: str, d: dict) -> dict:
+    if _agent_device_presence_source is None:
+        return d
+    try:
+        buffered = _agent_device_presence_source((agent_id, d.get('identifier')))
+    except Exception:
+        buffered = None
+    if buffered is not None:
+        d['last_update'] = buffered['ts'].isoformat()
+        if buffered.get('status'):
+            d['status'] = buffered['status']
+        if buffered.get('ip'):
+            d['ip'] = buffered['ip']
+    return d
+
+def _agent_device_status(d: dict, now) -> dict:
+    """Aplica em `d` o status calculado (texto legado + frescor de last_update) e o booleano online."""
+    from datetime import datetime, timedelta
+    # normaliza status textual legado
+    raw_status = (d.get('status') or '').strip().lower()
+    mapped = None
+    if raw_status in ('ok', 'online', 'ligado', 'ativo', 'sucesso'):
+        mapped = 'online'
+    elif raw_status in ('desconhecido', 'unknown', 'offline', 'desligado', 'inativo', 'falha', 'erro'):
+        mapped = 'offline'
+    # Regra: se mapeado explicitamente como offline/unknown, respeita isso.
+    # Caso contrário, usa frescor de last_update para decidir online/offline.
+    final_status = mapped
+    if final_status != 'offline':
+        lu = d.get('last_update')
+        if lu and now:
+            try:
+                # aceita ISO 8601 ou 'YYYY-mm-dd HH:MM:SS'
+                if isinstance(lu, datetime):
+                    dt = lu
+                else:
+                    try:
+                        dt = datetime.fromisoformat(str(lu))
+                    except Exception:
+                        dt = datetime.strptime(str(lu), '%Y-%m-%d %H:%M:%S')
+                final_status = 'online' if (now - dt) <= timedelta(seconds=120) else 'offline'
+            except Exception:
+                pass
+    # aplica cálculo (fallback para valor já salvo)
+    d['status'] = final_status or (d.get('status') or 'offline')
+    # opcional: booleano para facilitar UI futuras
+    d['online'] = 1 if (d.get('status') or '').lower() == 'online' else 0
+    return d
 
 def get_agent_devices(agent_id: str):
     """Lista dispositivos de um agente com status calculado por frescor de last_update.
     Regra: online se last_update dentro da janela de 120s (mesma lógica do PWA/heartbeat).
     """
+    from datetime import datetime
     agent_id = normalize_agent_id(agent_id)
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute('SELECT * FROM agent_devices WHERE agent_id = %s ORDER BY name, identifier', (agent_id,))
-    rows = cur.fetchall()
-    conn.close()
-    devices = []
-    try:
-        from datetime import datetime, timedelta
-        # Usa horário local para comparar com last_update enviado pelo agente (também local)
-        now = datetime.now()
-    except Exception:
-        now = None
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute('SELECT * FROM agent_devices WHERE agent_id = %s ORDER BY name, identifier', (agent_id,))
+        rows = cur.fetchall()
+    # Usa horário local para comparar com last_update enviado pelo agente (também local)
+    now = datetime.now()
+    return [_agent_device_status(_overlay_agent_device_heartbeat(agent_id, dict(row)), now) for row in rows]
+
+# Árvore agente -> lojas/dispositivos em uma única consulta (GET /admin/agents)
+_AGENTS_TREE_SQL = '''
+    SELECT a.*,
+           COALESCE((SELECT json_agg(json_build_object('loja_codigo', s.loja_codigo, 'loja_nome', s.loja_nome)
+                                     ORDER BY s.loja_codigo)
+                       FROM agent_stores s WHERE s.agent_id = a.agent_id), '[]'::json) AS lojas,
+           COALESCE((SELECT json_agg(to_jsonb(d) ORDER BY d.name, d.identifier)
+                       FROM agent_devices d WHERE d.agent_id = a.agent_id), '[]'::json) AS devices
+      FROM agents_status a
+'''
+
+# Agentes simulados ocultos por padrão no painel
+FAKE_AGENT_IDS = ('cli-check-01', 'fake-agent', 'simulador')
+AGENT_ONLINE_WINDOW_S = 120
+
+def get_agents_tree():
+    """Agentes com lojas e dispositivos (status calculado) em um único round-trip ao banco."""
+    from datetime import datetime
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute(_AGENTS_TREE_SQL)
+        rows = cur.fetchall()
+    now = datetime.now()
+    out = []
     for row in rows:
         d = dict(row)
-        # normaliza status textual legado
-        raw_status = (d.get('status') or '').strip().lower()
-        mapped = None
-        if raw_status in ('ok', 'online', 'ligado', 'ativo', 'sucesso'):
-            mapped = 'online'
-        elif raw_status in ('desconhecido', 'unknown', 'offline', 'desligado', 'inativo', 'falha', 'erro'):
-            mapped = 'offline'
-        # Regra: se mapeado explicitamente como offline/unknown, respeita isso.
-        # Caso contrário, usa frescor de last_update para decidir online/offline.
-        final_status = mapped
-        if final_status != 'offline':
-            lu = d.get('last_update')
-            if lu and now:
-                try:
-                    # aceita ISO 8601 ou 'YYYY-mm-dd HH:MM:SS'
-                    try:
-                        dt = datetime.fromisoformat(str(lu))
-                    except Exception:
-                        from datetime import datetime as _dt
-                        dt = _dt.strptime(str(lu), '%Y-%m-%d %H:%M:%S')
-                    final_status = 'online' if (now - dt) <= timedelta(seconds=120) else 'offline'
-                except Exception:
-                    pass
-        # aplica cálculo (fallback para valor já salvo)
-        d['status'] = final_status or (d.get('status') or 'offline')
-        # opcional: booleano para facilitar UI futuras
-        d['online'] = 1 if (d.get('status') or '').lower() == 'online' else 0
-        devices.append(d)
-    return devices
+        d['agent_id'] = normalize_agent_id(d.get('agent_id'))
+        d['lojas'] = d.get('lojas') or []
+        d['devices'] = [
+            _agent_device_status(_overlay_agent_device_heartbeat(dev.get('agent_id'), dev), now)
+            for dev in (d.get('devices') or [])
+        ]
+        out.append(d)
+    return out
+
+def get_agents_summary(include_fakes: bool = False) -> dict:
+    """Totais de agentes online/offline calculados no banco (sem montar a árvore)."""
+    where = ''
+    params = [AGENT_ONLINE_WINDOW_S]
+    if not include_fakes:
+        where = ' WHERE lower(trim(agent_id)) <> ALL(%s)'
+        params.append(list(FAKE_AGENT_IDS))
+    with db_connection() as conn:
+        cur = conn.cursor()
+        # Mesma regra de /admin/agents: last_update (UTC) dentro da janela; sem data, vale o status salvo
+        cur.execute(
+            'SELECT COUNT(DISTINCT lower(trim(agent_id))), '
+            '       COUNT(DISTINCT lower(trim(agent_id))) FILTER (WHERE CASE WHEN last_update IS NOT NULL '
+            "            THEN last_update >= (now() AT TIME ZONE 'UTC') - %s * interval '1 second' "
+            "            ELSE lower(coalesce(status, '')) = 'online' END) "
+            '  FROM agents_status' + where,
+            params
+        )
+        total, online = cur.fetchone()
+        cur.close()
+    return {'total': total, 'online': online, 'offline': total - online}
 
 def delete_agent_device(agent_id: str, identifier: str):
     agent_id = normalize_agent_id(agent_id)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM agent_devices WHERE agent_id = %s AND identifier = %s', (agent_id, identifier))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM agent_devices WHERE agent_id = %s AND identifier = %s', (agent_id, identifier))
+        conn.commit()
 
 def add_user(username: str, password: str, role: str = 'operador', store_id: int = None, permissoes: str = None):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO admin_users (username, password, role, store_id, permissoes) VALUES (%s, %s, %s, %s, %s) ON CONFLICT (username) DO NOTHING',
-                (username, password, role, store_id, permissoes))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO admin_users (username, password, role, store_id, permissoes) VALUES (%s, %s, %s, %s, %s) ON CONFLICT (username) DO NOTHING',
+                    (username, password, role, store_id, permissoes))
+        conn.commit()
 
 def update_user(username: str, password: str = None, role: str = None, store_id: int = None, permissoes: str = None):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    # Busca valores atuais
-    cur.execute('SELECT password, role, store_id, permissoes FROM admin_users WHERE username = %s', (username,))
-    row = cur.fetchone()
-    current_password = row['password'] if row else None
-    current_role = row['role'] if row else None
-    current_store_id = row['store_id'] if row else None
-    current_permissoes = row['permissoes'] if row else None
-    password = password if password else current_password
-    role = role if role else current_role
-    store_id = store_id if store_id is not None else current_store_id
-    permissoes = permissoes if permissoes is not None else current_permissoes
-    cur.execute('UPDATE admin_users SET password = %s, role = %s, store_id = %s, permissoes = %s WHERE username = %s',
-                (password, role, store_id, permissoes, username))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        # Busca valores atuais
+        cur.execute('SELECT password, role, store_id, permissoes FROM admin_users WHERE username = %s', (username,))
+        row = cur.fetchone()
+        current_password = row['password'] if row else None
+        current_role = row['role'] if row else None
+        current_store_id = row['store_id'] if row else None
+        current_permissoes = row['permissoes'] if row else None
+        password = password if password else current_password
+        role = role if role else current_role
+        store_id = store_id if store_id is not None else current_store_id
+        permissoes = permissoes if permissoes is not None else current_permissoes
+        cur.execute('UPDATE admin_users SET password = %s, role = %s, store_id = %s, permissoes = %s WHERE username = %s',
+                    (password, role, store_id, permissoes, username))
+        conn.commit()
 
 def delete_user(username: str):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM admin_users WHERE username = %s', (username,))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM admin_users WHERE username = %s', (username,))
+        conn.commit()
@@ -0,0 +1,199 @@
+"""
+Módulo: db_async.py
+-------------------
+Acesso ao banco a partir de endpoints async sem travar o event loop do uvicorn.
+
+- run_db(fn, *args): executa funções bloqueantes (psycopg2, arquivos, HTTP) num executor
+  dedicado com concorrência limitada (PRECIX_DB_EXECUTOR_WORKERS, padrão = máximo do pool)
+- O contexto (contextvars) da requisição é propagado para a thread do executor
+- LoopLagMonitor: mede o atraso do event loop e registra travamentos acima do limite
+  (PRECIX_LOOP_LAG_THRESHOLD_MS), com a pilha da thread do loop no momento do travamento
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# Mais threads que conexões no pool só gera espera no pool: o padrão acompanha o máximo
+DB_EXECUTOR_WORKERS = int(os.environ.get('PRECIX_DB_EXECUTOR_WORKERS', os.environ.get('PRECIX_PG_POOL_MAX', '20')))
+LOOP_LAG_INTERVAL_S = float(os.environ.get('PRECIX_LOOP_LAG_INTERVAL_S', '0.5'))
+LOOP_LAG_THRESHOLD_MS = float(os.environ.get('PRECIX_LOOP_LAG_THRESHOLD_MS', '100'))
+
+
+class DBExecutor:
+    """ThreadPoolExecutor dedicado ao banco, com métricas de fila e execução."""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, int(max_workers))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'errors': 0,
+            'in_flight': 0,
+            'max_in_flight': 0,
+            'queue_wait_max_ms': 0.0,
+            'queue_wait_total_ms': 0.0,
+            'run_max_ms': 0.0,
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='precix-db')
+        return self._executor
+
+    def _run(self, submitted_at: float, ctx: contextvars.Context, call: Callable):
+        started = time.perf_counter()
+        wait_ms = (started - submitted_at) * 1000.0
+        with self._lock:
+            self._stats['in_flight'] += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._stats['in_flight'])
+            self._stats['queue_wait_total_ms'] += wait_ms
+            self._stats['queue_wait_max_ms'] = max(self._stats['queue_wait_max_ms'], wait_ms)
+        ok = False
+        try:
+            result = ctx.run(call)
+            ok = True
+            return result
+        finally:
+            run_ms = (time.perf_counter() - started) * 1000.0
+            with self._lock:
+                self._stats['in_flight'] -= 1
+                self._stats['completed'] += 1
+                if not ok:
+                    self._stats['errors'] += 1
+                self._stats['run_max_ms'] = max(self._stats['run_max_ms'], run_ms)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        with self._lock:
+            self._stats['submitted'] += 1
+        return await loop.run_in_executor(
+            self._get_executor(), self._run, time.perf_counter(), contextvars.copy_context(), call
+        )
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        out['max_workers'] = self.max_workers
+        out['queued'] = max(0, out['submitted'] - out['completed'] - out['in_flight'])
+        done = out['completed'] or 1
+        out['queue_wait_avg_ms'] = round(out['queue_wait_total_ms'] / done, 3)
+        for k in ('queue_wait_max_ms', 'queue_wait_total_ms', 'run_max_ms'):
+            out[k] = round(out[k], 3)
+        return out
+
+
+db_executor = DBExecutor(DB_EXECUTOR_WORKERS)
+
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """Executa fn(*args, **kwargs) no executor do banco e aguarda o resultado sem bloquear o loop."""
+    return await db_executor.run(fn, *args, **kwargs)
+
+
+class LoopLagMonitor:
+    """Mede o atraso do event loop (sleep agendado vs. acordado de fato).
+
+    Uma thread watchdog acompanha o último "tick" do loop: se ele passar do limite, a pilha
+    da thread do loop é registrada enquanto o travamento ainda está acontecendo, apontando
+    o código bloqueante responsável.
+    """
+
+    def __init__(self, interval_s: float = LOOP_LAG_INTERVAL_S, threshold_ms: float = LOOP_LAG_THRESHOLD_MS):
+        self.interval_s = max(0.05, float(interval_s))
+        self.threshold_ms = float(threshold_ms)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._loop_thread_id = None
+        self._last_tick = 0.0
+        self._stack_logged_for = 0.0
+        self._stats = {
+            'samples': 0,
+            'stalls': 0,
+            'lag_last_ms': 0.0,
+            'lag_max_ms': 0.0,
+            'last_stall_ms': 0.0,
+            'last_stall_at': None,
+        }
+
+    def start(self):
+        """Inicia o monitor no loop corrente (chamar de dentro de um handler de startup async)."""
+        if self._task is not None or self.threshold_ms <= 0:
+            return
+        self._stop.clear()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name='precix-loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while not self._stop.is_set():
+            expected = time.monotonic() + self.interval_s
+            await asyncio.sleep(self.interval_s)
+            now = time.monotonic()
+            lag_ms = max(0.0, (now - expected) * 1000.0)
+            with self._lock:
+                self._last_tick = now
+                self._stats['samples'] += 1
+                self._stats['lag_last_ms'] = round(lag_ms, 3)
+                self._stats['lag_max_ms'] = round(max(self._stats['lag_max_ms'], lag_ms), 3)
+                stalled = lag_ms >= self.threshold_ms
+                if stalled:
+                    self._stats['stalls'] += 1
+                    self._stats['last_stall_ms'] = round(lag_ms, 3)
+                    self._stats['last_stall_at'] = time.time()
+            if stalled:
+                logging.warning(f"[LOOP] Event loop travado por {lag_ms:.0f}ms (limite {self.threshold_ms:.0f}ms)")
+
+    def _watch(self):
+        limit_s = self.interval_s + self.threshold_ms / 1000.0
+        while not self._stop.wait(self.threshold_ms / 1000.0):
+            with self._lock:
+                last_tick = self._last_tick
+            if time.monotonic() - last_tick < limit_s or self._stack_logged_for == last_tick:
+                continue
+            # Uma pilha por travamento
+            self._stack_logged_for = last_tick
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                stack = ''.join(traceback.format_stack(frame, limit=15))
+                logging.warning(f"[LOOP] Event loop sem responder há {(time.monotonic() - last_tick) * 1000.0:.0f}ms; pilha atual:\n{stack}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        out['running'] = self._task is not None
+        out['interval_s'] = self.interval_s
+        out['threshold_ms'] = self.threshold_ms
+        return out
+
+
+loop_monitor = LoopLagMonitor()
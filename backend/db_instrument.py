@@ -0,0 +1,98 @@
+"""
+Módulo: db_instrument.py
+------------------------
+Conexão psycopg2 instrumentada: cronometra cada execute()/executemany() de qualquer cursor.
+
+- InstrumentedConnection é passada como connection_factory em _open_raw_connection
+  (database.py); cursores criados com cursor_factory próprio (RealDictCursor, DictCursor...)
+  também são cronometrados (subclasse com o mixin, criada uma vez por fábrica)
+- add_query_observer(fn) registra fn(segundos, query, ok) chamada após cada comando
+  (ex.: histograma de /metrics)
+- O tempo de cada comando é somado à requisição corrente (request_timing.current_request) e
+  comandos acima de PRECIX_SLOW_QUERY_MS vão para o log de consultas lentas
+"""
+
+import logging
+import time
+from typing import Callable, Dict, List
+
+import psycopg2.extensions
+
+try:
+    from .request_timing import current_request, slow_queries
+except ImportError:
+    from request_timing import current_request, slow_queries
+
+_observers: List[Callable[[float, object, bool], None]] = []
+
+
+def add_query_observer(fn: Callable[[float, object, bool], None]):
+    _observers.append(fn)
+
+
+def _notify(cursor, seconds: float, query, vars, ok: bool, explainable: bool = True):
+    ctx = current_request()
+    if ctx is not None:
+        ctx.add_query(seconds)
+    for fn in _observers:
+        try:
+            fn(seconds, query, ok)
+        except Exception as e:
+            logging.debug(f"[DB][instrument] Observador falhou: {e}")
+    if slow_queries.is_slow(seconds):
+        try:
+            if not isinstance(query, (str, bytes)):
+                # sql.Composed / sql.SQL
+                query = query.as_string(cursor.connection)
+            # O próprio EXPLAIN do log de lentas não é registrado de novo
+            head = query.lstrip()[:7]
+            if (head if isinstance(head, str) else head.decode('ascii', 'replace')).upper() == 'EXPLAIN':
+                return
+            literal_sql = (lambda: cursor.mogrify(query, vars)) if explainable else None
+            slow_queries.record(seconds, query, ok, literal_sql=literal_sql)
+        except Exception as e:
+            logging.debug(f"[DB][instrument] Falha ao registrar consulta lenta: {e}")
+
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            result = super().execute(query, vars)
+            ok = True
+            return result
+        finally:
+            _notify(self, time.perf_counter() - t0, query, vars, ok)
+
+    def executemany(self, query, vars_list):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            result = super().executemany(query, vars_list)
+            ok = True
+            return result
+        finally:
+            # Sem EXPLAIN para lotes: literal_sql usaria só a primeira linha
+            _notify(self, time.perf_counter() - t0, query, None, ok, explainable=False)
+
+
+_timed_factories: Dict[type, type] = {}
+
+
+def _timed_factory(factory: type) -> type:
+    timed = _timed_factories.get(factory)
+    if timed is None:
+        if issubclass(factory, _TimedCursorMixin):
+            timed = factory
+        else:
+            timed = type(f'Timed{factory.__name__}', (_TimedCursorMixin, factory), {})
+        _timed_factories[factory] = timed
+    return timed
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _timed_factory(factory)
+        return super().cursor(*args, **kwargs)
@@ -0,0 +1,318 @@
+"""
+Módulo: db_pool.py
+------------------
+Pool de conexões PostgreSQL thread-safe usado por database.py.
+
+- Reaproveita conexões físicas (evita handshake TCP+auth a cada chamada)
+- Verifica conexões ociosas antigas antes de entregar (health-check com SELECT 1)
+- Descarta conexões quebradas/fechadas ao devolver
+- Expõe estatísticas (em uso, esperas, tempo de espera) para o painel admin
+"""
+
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# Códigos de transaction status do libpq (psycopg2.extensions.TRANSACTION_STATUS_*)
+_TX_IDLE = 0
+_TX_UNKNOWN = 4
+
+
+class PoolTimeoutError(Exception):
+    """Nenhuma conexão ficou disponível dentro do timeout de aquisição."""
+
+
+class PooledConnection:
+    """Proxy de conexão emprestada do pool.
+
+    Mantém compatibilidade com o código legado que faz ``conn.close()``:
+    em vez de fechar a conexão física, ``close()`` devolve ao pool.
+    """
+
+    __slots__ = ('_pool', '_raw', '_returned')
+
+    def __init__(self, pool: 'ConnectionPool', raw):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_raw', raw)
+        object.__setattr__(self, '_returned', False)
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def close(self):
+        if not self._returned:
+            object.__setattr__(self, '_returned', True)
+            self._pool.putconn(self._raw)
+
+    def discard(self):
+        """Devolve marcando a conexão como inutilizável (será fechada)."""
+        if not self._returned:
+            object.__setattr__(self, '_returned', True)
+            self._pool.putconn(self._raw, close=True)
+
+    @property
+    def closed(self):
+        return 1 if self._returned else self._raw.closed
+
+    def __getattr__(self, name):
+        if self._returned:
+            # Evita usar uma conexão física que já pode estar com outra thread
+            raise RuntimeError('Conexão já devolvida ao pool')
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        # Ex.: conn.autocommit = False deve valer para a conexão física
+        setattr(self._raw, name, value)
+
+    def __del__(self):
+        # Segurança: conexão esquecida sem close() volta ao pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Pool simples com limite máximo, espera bloqueante e métricas.
+
+    connect: função sem argumentos que abre uma conexão física nova.
+    minconn: conexões abertas antecipadamente em warmup().
+    maxconn: limite de conexões físicas simultâneas.
+    acquire_timeout: segundos máximos aguardando uma conexão livre.
+    health_check_after: conexões ociosas há mais que N segundos são testadas antes do uso.
+    max_idle: conexões ociosas há mais que N segundos são fechadas (0 desativa).
+    """
+
+    def __init__(self, connect: Callable, minconn: int = 1, maxconn: int = 20,
+                 acquire_timeout: float = 10.0, health_check_after: float = 30.0,
+                 max_idle: float = 600.0):
+        self._connect = connect
+        self.minconn = max(0, int(minconn))
+        self.maxconn = max(1, int(maxconn))
+        self.acquire_timeout = float(acquire_timeout)
+        self.health_check_after = float(health_check_after)
+        self.max_idle = float(max_idle)
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()  # (conn, idle_since)
+        self._in_use = set()
+        self._opening = 0
+        self._closed = False
+        self._stats = {
+            'acquired': 0,
+            'released': 0,
+            'created': 0,
+            'discarded': 0,
+            'waits': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+            'timeouts': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'connect_errors': 0,
+        }
+        # Ganchos opcionais (ex.: métricas): chamados com o tempo de aquisição em segundos
+        self.on_acquire: Optional[Callable[[float], None]] = None
+
+    # --- ciclo de vida ---
+    def warmup(self):
+        """Abre até minconn conexões ociosas (erros são apenas logados)."""
+        while True:
+            with self._cond:
+                total = len(self._idle) + len(self._in_use) + self._opening
+                if self._closed or total >= self.minconn:
+                    return
+                self._opening += 1
+            try:
+                conn = self._open()
+            except Exception as e:
+                logging.warning(f"[DB][pool] Falha no warmup: {e}")
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                return
+            with self._cond:
+                self._opening -= 1
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for c in idle:
+            self._close_quietly(c)
+
+    # --- empréstimo/devolução ---
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.acquire_timeout
+        waited = False
+        while True:
+            conn = None
+            idle_since = None
+            must_open = False
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError('Pool encerrado')
+                while True:
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        # Conta como em uso já durante a validação (respeita maxconn)
+                        self._in_use.add(conn)
+                        break
+                    if len(self._in_use) + self._opening < self.maxconn:
+                        self._opening += 1
+                        must_open = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f'Timeout de {self.acquire_timeout}s aguardando conexão '
+                            f'(em uso={len(self._in_use)}, max={self.maxconn})'
+                        )
+                    if not waited:
+                        waited = True
+                        self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+            if must_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._stats['connect_errors'] += 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._in_use.add(conn)
+                break
+            # Conexão ociosa: valida antes de entregar
+            if self._is_usable(conn, idle_since):
+                break
+            self._close_quietly(conn)
+            with self._cond:
+                self._in_use.discard(conn)
+                self._stats['discarded'] += 1
+                self._cond.notify()
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._stats['acquired'] += 1
+            if waited:
+                ms = elapsed * 1000.0
+                self._stats['wait_time_total_ms'] += ms
+                if ms > self._stats['wait_time_max_ms']:
+                    self._stats['wait_time_max_ms'] = ms
+        if self.on_acquire:
+            try:
+                self.on_acquire(elapsed)
+            except Exception:
+                pass
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        with self._cond:
+            self._in_use.discard(conn)
+            self._stats['released'] += 1
+        if not close:
+            close = not self._reset(conn)
+        if close or self._closed:
+            self._close_quietly(conn)
+            with self._cond:
+                self._stats['discarded'] += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def connection(self) -> PooledConnection:
+        """Empresta uma conexão embrulhada em PooledConnection (close() devolve)."""
+        return PooledConnection(self, self.getconn())
+
+    @contextmanager
+    def borrow(self):
+        """Context manager: empresta e sempre devolve a conexão ao sair."""
+        pc = self.connection()
+        try:
+            yield pc
+        finally:
+            # Em caso de erro o reset faz rollback (ou descarta a conexão quebrada)
+            pc.close()
+
+    # --- estatísticas ---
+    def stats(self) -> dict:
+        with self._cond:
+            out = dict(self._stats)
+            out['in_use'] = len(self._in_use)
+            out['idle'] = len(self._idle)
+            out['opening'] = self._opening
+            out['size'] = len(self._in_use) + len(self._idle)
+            out['min'] = self.minconn
+            out['max'] = self.maxconn
+        out['wait_time_total_ms'] = round(out['wait_time_total_ms'], 3)
+        out['wait_time_max_ms'] = round(out['wait_time_max_ms'], 3)
+        out['wait_time_avg_ms'] = round(out['wait_time_total_ms'] / out['waits'], 3) if out['waits'] else 0.0
+        return out
+
+    # --- internos ---
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    def _is_usable(self, conn, idle_since) -> bool:
+        if getattr(conn, 'closed', 0):
+            return False
+        idle_for = time.monotonic() - (idle_since or 0)
+        if self.max_idle and idle_for > self.max_idle:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        with self._cond:
+            self._stats['health_checks'] += 1
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute('SELECT 1')
+                cur.fetchone()
+            finally:
+                cur.close()
+            return True
+        except Exception as e:
+            logging.warning(f"[DB][pool] Conexão ociosa falhou no health-check, descartando: {e}")
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    @staticmethod
+    def _reset(conn) -> bool:
+        """Deixa a conexão pronta para reuso. Retorna False se deve ser descartada."""
+        try:
+            if getattr(conn, 'closed', 0):
+                return False
+            status = conn.get_transaction_status()
+            if status == _TX_UNKNOWN:
+                return False
+            if status != _TX_IDLE:
+                conn.rollback()
+            if not conn.autocommit:
+                conn.autocommit = True
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,262 @@
+"""
+Módulo: device_events.py
+------------------------
+Eventos recentes de dispositivos (consultas de preço, syncs de catálogo, saúde) para o painel.
+
+- Buffer circular de tamanho fixo (PRECIX_DEVICE_EVENTS_MAX): inserir e descartar o mais antigo é O(1)
+- Índices secundários por identifier e por loja (seqs em ordem crescente; o evento descartado é
+  sempre o mais antigo do seu índice, então a limpeza também é O(1))
+- Loja do dispositivo resolvida por um mapa identifier -> store_id em cache (DeviceStoreMap),
+  sem varrer a tabela devices a cada requisição
+- Opcional: PRECIX_DEVICE_EVENTS_PATH grava os eventos em NDJSON. O arquivo sobrevive a
+  reinícios e é a fonte compartilhada entre workers do uvicorn: cada worker acrescenta
+  linhas e lê as novas linhas (dos outros) antes de responder. O arquivo é compactado para
+  os últimos PRECIX_DEVICE_EVENTS_MAX eventos quando cresce demais
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos (um worker)
+    fcntl = None
+
+DEVICE_EVENTS_MAX = int(os.environ.get('PRECIX_DEVICE_EVENTS_MAX', '500'))
+DEVICE_EVENTS_PATH = os.environ.get('PRECIX_DEVICE_EVENTS_PATH', '').strip() or None
+DEVICE_STORE_MAP_TTL_S = float(os.environ.get('PRECIX_DEVICE_STORE_MAP_TTL_S', '60'))
+# O arquivo é reescrito quando passa de COMPACT_FACTOR x capacidade linhas
+COMPACT_FACTOR = 4
+
+
+class DeviceStoreMap:
+    """Cache identifier -> store_id recarregado a cada ttl_s (ou antes, para identifier desconhecido)."""
+
+    def __init__(self, loader: Callable[[], Dict[str, int]], ttl_s: float = DEVICE_STORE_MAP_TTL_S,
+                 min_refresh_s: float = 5.0):
+        self._loader = loader
+        self.ttl_s = ttl_s
+        self.min_refresh_s = min_refresh_s
+        self._map: Dict[str, int] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mapping = self._loader() or {}
+        except Exception as e:
+            logging.warning(f"[EVENTS] Falha ao carregar mapa dispositivo -> loja: {e}")
+            mapping = None
+        with self._lock:
+            if mapping is not None:
+                self._map = mapping
+            self._loaded_at = time.monotonic()
+
+    def get(self, identifier: str) -> Optional[int]:
+        age = time.monotonic() - self._loaded_at
+        if age >= self.ttl_s or (identifier not in self._map and age >= self.min_refresh_s):
+            self._refresh()
+        return self._map.get(identifier)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+
+class DeviceEventStore:
+    def __init__(self, capacity: int = DEVICE_EVENTS_MAX, store_of: Callable[[str], Optional[int]] = None,
+                 path: Optional[str] = DEVICE_EVENTS_PATH):
+        self.capacity = max(1, int(capacity))
+        self._store_of = store_of
+        self.path = path
+        self._lock = threading.RLock()
+        self._reset()
+        self._stats = {'pushed': 0, 'loaded': 0, 'compactions': 0, 'persist_errors': 0}
+
+    def _reset(self):
+        # slot = seq % capacity -> (seq, evento, store_id)
+        self._ring: List[Optional[tuple]] = [None] * self.capacity
+        self._next_seq = 0
+        self._by_identifier: Dict[str, deque] = {}
+        self._by_store: Dict[int, deque] = {}
+        self._offset = 0
+        self._inode = None
+        self._file_lines = 0
+
+    # --- índice em memória ---
+    def _resolve_store(self, identifier: str) -> Optional[int]:
+        if self._store_of is None or not identifier:
+            return None
+        try:
+            return self._store_of(identifier)
+        except Exception:
+            return None
+
+    def _ingest(self, event: dict):
+        seq = self._next_seq
+        slot = seq % self.capacity
+        evicted = self._ring[slot]
+        if evicted is not None:
+            self._unindex(evicted)
+        identifier = str(event.get('identifier') or '')
+        store_id = event.get('store_id')
+        if store_id is None:
+            store_id = self._resolve_store(identifier)
+        self._ring[slot] = (seq, event, store_id)
+        self._by_identifier.setdefault(identifier, deque()).append(seq)
+        if store_id is not None:
+            self._by_store.setdefault(store_id, deque()).append(seq)
+        self._next_seq = seq + 1
+
+    def _unindex(self, record: tuple):
+        seq, event, store_id = record
+        for index, key in ((self._by_identifier, str(event.get('identifier') or '')), (self._by_store, store_id)):
+            seqs = index.get(key)
+            if seqs and seqs[0] == seq:
+                seqs.popleft()
+                if not seqs:
+                    del index[key]
+
+    def _event_at(self, seq: int) -> dict:
+        return self._ring[seq % self.capacity][1]
+
+    # --- persistência compartilhada ---
+    def _file_lock(self):
+        return _FileLock(self.path + '.lock') if fcntl is not None else _NoLock()
+
+    def _sync(self):
+        """Lê as linhas novas do arquivo (deste e de outros workers)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self._inode is not None:
+                self._reset()
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # Arquivo compactado/substituído: recarrega do início
+            self._reset()
+            self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as fh:
+            fh.seek(self._offset)
+            data = fh.read(st.st_size - self._offset)
+        end = data.rfind(b'\n')
+        if end < 0:
+            return
+        for line in data[:end].split(b'\n'):
+            if not line.strip():
+                continue
+            try:
+                self._ingest(json.loads(line))
+            except ValueError:
+                continue
+            self._file_lines += 1
+            self._stats['loaded'] += 1
+        self._offset += end + 1
+
+    def _append(self, event: dict):
+        line = (json.dumps(event, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        with self._file_lock():
+            with open(self.path, 'ab') as fh:
+                fh.write(line)
+            self._sync()
+            if self._file_lines > self.capacity * COMPACT_FACTOR:
+                self._compact()
+
+    def _compact(self):
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'wb') as fh:
+                for seq in range(max(0, self._next_seq - self.capacity), self._next_seq):
+                    record = self._ring[seq % self.capacity]
+                    fh.write((json.dumps(record[1], ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+            os.replace(tmp, self.path)
+            self._stats['compactions'] += 1
+        except OSError as e:
+            logging.warning(f"[EVENTS] Falha ao compactar {self.path}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        # Recarrega do arquivo novo (mesmos eventos, offsets novos)
+        self._reset()
+        self._sync()
+
+    # --- API ---
+    def push(self, event: dict) -> dict:
+        event['timestamp'] = event.get('timestamp') or datetime.utcnow().isoformat()
+        with self._lock:
+            self._stats['pushed'] += 1
+            if self.path:
+                try:
+                    self._append(event)
+                    return event
+                except OSError as e:
+                    self._stats['persist_errors'] += 1
+                    logging.warning(f"[EVENTS] Falha ao gravar evento em {self.path}: {e}")
+            self._ingest(event)
+        return event
+
+    def query(self, limit: int = 100, identifier: str = None, store_id: int = None) -> List[dict]:
+        """Eventos mais recentes primeiro, com filtros opcionais por identifier e loja."""
+        with self._lock:
+            if self.path:
+                try:
+                    self._sync()
+                except OSError as e:
+                    logging.warning(f"[EVENTS] Falha ao ler {self.path}: {e}")
+            if identifier:
+                seqs = self._by_identifier.get(str(identifier), ())
+                if store_id is not None:
+                    seqs = [s for s in seqs if self._ring[s % self.capacity][2] == store_id]
+            elif store_id is not None:
+                seqs = self._by_store.get(store_id, ())
+            else:
+                seqs = range(max(0, self._next_seq - self.capacity), self._next_seq)
+            out = []
+            for seq in reversed(seqs):
+                out.append(dict(self._event_at(seq)))
+                if len(out) >= limit:
+                    break
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out['size'] = min(self._next_seq, self.capacity)
+            out['identifiers'] = len(self._by_identifier)
+            out['stores'] = len(self._by_store)
+        out['capacity'] = self.capacity
+        out['path'] = self.path
+        return out
+
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self._fh = open(self.path, 'a')
+        fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._fh.close()
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
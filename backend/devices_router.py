@@ -0,0 +1,234 @@
+"""
+Módulo: devices_router.py
+-------------------------
+Rotas dos equipamentos (PWAs): cadastro, heartbeat, eventos recentes (/admin/devices/events...)
+e os rollups das consultas de preço (/admin/analytics/price-queries/...).
+"""
+
+import json
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Body, HTTPException, Query, Request
+
+try:
+    from .database import (
+        get_db_connection, get_all_devices, add_device, update_device, delete_device, add_audit_log,
+        update_device_catalog_sync, get_device_counts, get_device_store_map, get_price_query_top,
+        get_price_query_series, get_device_identifier
+    )
+    from .ai_agent_integration import notify_ai_agent
+    from .db_async import run_db
+    from .device_events import DeviceEventStore, DeviceStoreMap
+    from .heartbeats import device_heartbeats
+    from .price_query_stats import PriceQueryAggregator
+except ImportError:
+    from database import (
+        get_db_connection, get_all_devices, add_device, update_device, delete_device, add_audit_log,
+        update_device_catalog_sync, get_device_counts, get_device_store_map, get_price_query_top,
+        get_price_query_series, get_device_identifier
+    )
+    from ai_agent_integration import notify_ai_agent
+    from db_async import run_db
+    from device_events import DeviceEventStore, DeviceStoreMap
+    from heartbeats import device_heartbeats
+    from price_query_stats import PriceQueryAggregator
+
+router = APIRouter()
+
+
+# Device events: buffer circular indexado por identifier/loja (device_events.py);
+# com PRECIX_DEVICE_EVENTS_PATH os eventos persistem em disco e são compartilhados entre workers
+device_store_map = DeviceStoreMap(get_device_store_map)
+device_events = DeviceEventStore(store_of=device_store_map.get)
+# Rollups das consultas de preço; o audit_log só recebe as consultas conforme PRECIX_PRICE_QUERY_AUDIT
+# (all | fail | none; padrão fail: falhas continuam rastreáveis linha a linha)
+price_queries = PriceQueryAggregator()
+PRICE_QUERY_AUDIT = os.environ.get('PRECIX_PRICE_QUERY_AUDIT', 'fail').strip().lower()
+
+def _push_device_event(event: dict):
+    try:
+        device_events.push(event)
+    except Exception:
+        pass
+
+
+@router.post('/admin/devices/events/price-query')
+def log_price_query(data: dict = Body(...)):
+    identifier = (data.get('identifier') or '').strip()
+    barcode = (data.get('barcode') or '').strip()
+    ok = bool(data.get('ok'))
+    price = data.get('price')
+    error = data.get('error')
+    if not identifier or not barcode:
+        raise HTTPException(status_code=400, detail='identifier e barcode são obrigatórios')
+    latency_ms = data.get('latency_ms')
+    price_queries.record(identifier, barcode, ok, latency_ms=latency_ms, store_id=device_store_map.get(identifier))
+    if PRICE_QUERY_AUDIT == 'all' or (PRICE_QUERY_AUDIT == 'fail' and not ok):
+        action = 'PRICE_QUERY_OK' if ok else 'PRICE_QUERY_FAIL'
+        add_audit_log(None, identifier, action, json.dumps({'barcode': barcode, 'price': price, 'error': error}, ensure_ascii=False))
+    _push_device_event({'type': 'price_query', 'identifier': identifier, 'barcode': barcode, 'ok': ok, 'price': price, 'error': error})
+    return {"success": True}
+
+
+@router.post('/admin/devices/events/catalog-sync')
+def log_catalog_sync(data: dict = Body(...)):
+    identifier = (data.get('identifier') or '').strip()
+    total = data.get('total_products')
+    timestamp = data.get('timestamp')
+    if not identifier:
+        raise HTTPException(status_code=400, detail='identifier é obrigatório')
+    update_device_catalog_sync(identifier, total_products=int(total or 0), timestamp=timestamp)
+    _push_device_event({'type': 'catalog_sync', 'identifier': identifier, 'total_products': int(total or 0)})
+    return {"success": True}
+
+
+@router.get('/admin/devices/events')
+def list_device_events(limit: int = Query(100, ge=1, le=500), identifier: str = Query(None), store_id: int = Query(None)):
+    return device_events.query(limit, identifier=identifier, store_id=store_id)
+
+
+@router.get('/admin/devices/events/stats')
+def device_events_stats():
+    return device_events.stats()
+
+
+@router.get('/admin/analytics/price-queries/top')
+def price_queries_top(dimension: str = Query('barcode'), hours: int = Query(24, ge=1, le=24 * 90),
+                      limit: int = Query(20, ge=1, le=500), order: str = Query('queries')):
+    # Inclui os contadores ainda em memória deste worker
+    price_queries.flush()
+    try:
+        return get_price_query_top(dimension, hours=hours, limit=limit, order=order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get('/admin/analytics/price-queries/series')
+def price_queries_series(hours: int = Query(24, ge=1, le=24 * 90), dimension: str = Query(None), key: str = Query(None)):
+    price_queries.flush()
+    try:
+        return get_price_query_series(hours=hours, dimension=dimension, key=key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get('/admin/analytics/price-queries/stats')
+def price_queries_stats():
+    return price_queries.stats()
+
+
+@router.post('/admin/devices/events/health')
+def device_health_event(event: dict = Body(...)):
+    try:
+        identifier = (event.get('identifier') or '').strip()
+        status = (event.get('status') or '').strip().lower()
+        if not identifier or status not in ('online', 'offline'):
+            raise HTTPException(status_code=400, detail='identifier e status (online/offline) são obrigatórios')
+        ev = {
+            'type': 'health',
+            'identifier': identifier,
+            'status': status,
+            'previous': event.get('previous'),
+            'agent_id': event.get('agent_id'),
+            'ip': event.get('ip'),
+            'timestamp': event.get('ts'),
+        }
+        _push_device_event(ev)
+        return {"success": True}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post('/admin/devices/register')
+async def register_device_by_store_code(request: Request):
+    data = await request.json()
+    store_codigo = data.get('store_codigo')
+    name = data.get('name')
+    identifier = data.get('identifier')
+    if not store_codigo or not name or not identifier:
+        return {"success": False, "message": "Todos os campos são obrigatórios (store_codigo, name, identifier)."}
+    from database import get_store_by_code
+    store = await run_db(get_store_by_code, str(store_codigo).strip())
+    if not store:
+        return {"success": False, "message": f"Loja com código {store_codigo} não encontrada."}
+    store_id = store['id']
+    await run_db(add_device, store_id, name, identifier=identifier)
+    return {"success": True, "message": "Equipamento registrado com sucesso."}
+
+
+@router.get('/admin/devices')
+def api_get_devices(store_id: int = Query(None), online: Optional[bool] = Query(None)):
+    # Presença e filtros resolvidos no SQL (ver get_all_devices)
+    return get_all_devices(store_id=store_id, online=online)
+
+
+@router.get('/admin/devices/summary')
+def devices_summary(store_id: int = Query(None)):
+    return get_device_counts(store_id)
+
+
+@router.post('/admin/devices')
+async def api_add_device(request: Request):
+    data = await request.json()
+    store_id = data.get('store_id')
+    name = data.get('name')
+    identifier = data.get('identifier')
+    if not store_id or not name or not identifier:
+        return {"success": False, "message": "Todos os campos são obrigatórios."}
+    await run_db(add_device, store_id, name, identifier=identifier)
+    try:
+        await run_db(notify_ai_agent, 'device_added', {'store_id': store_id, 'name': name, 'identifier': identifier})
+    except Exception:
+        pass
+    return {"success": True}
+
+
+@router.put('/admin/devices/{device_id}')
+def api_update_device(device_id: int, name: str, status: str, last_sync: str = None, online: int = None, store_id: int = None, identifier: str = None):
+    old_identifier = get_device_identifier(device_id)
+    update_device(device_id, name, status, last_sync, online, store_id=store_id, identifier=identifier)
+    # Identifier antigo deixa de valer para heartbeats (buffer não recria o device com ele)
+    if old_identifier and identifier is not None and identifier != old_identifier:
+        device_heartbeats.forget(old_identifier)
+    # Loja/identifier podem ter mudado: novos eventos usam o mapa recarregado
+    device_store_map.invalidate()
+    return {"success": True}
+
+
+@router.delete('/admin/devices/{device_id}')
+def api_delete_device(device_id: int):
+    identifier = get_device_identifier(device_id)
+    delete_device(device_id)
+    # Pings seguintes voltam a consultar o banco e recebem 404
+    if identifier:
+        device_heartbeats.forget(identifier)
+    return {"success": True}
+
+
+@router.post('/device/heartbeat/{identifier}')
+def device_heartbeat(identifier: str):
+    # Dispositivo já visto recentemente: só atualiza o buffer (sem conexão ao banco)
+    if not device_heartbeats.is_known(identifier):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        # Uma consulta: identificador exato ou, na falta dele, comparação sem maiúsculas/espaços
+        cur.execute(
+            'SELECT identifier FROM devices WHERE identifier = %s OR TRIM(LOWER(identifier)) = %s '
+            'ORDER BY (identifier = %s) DESC LIMIT 1',
+            (identifier, identifier.strip().lower(), identifier)
+        )
+        row = cur.fetchone()
+        conn.close()
+        if not row:
+            raise HTTPException(status_code=404, detail='Dispositivo não encontrado')
+        identifier = row[0]
+        device_heartbeats.mark_known(identifier)
+    device_heartbeats.record(identifier)
+    try:
+        notify_ai_agent('device_heartbeat', {'identifier': identifier})
+    except Exception:
+        pass
+    return {"success": True}
@@ -0,0 +1,147 @@
+"""
+Módulo: health.py
+-----------------
+Health probes internos do backend, executados em processo (sem requisições HTTP ao próprio servidor).
+
+- Cada probe é uma função registrada com add_probe(nome, fn, critical); retorna um dict de detalhes
+  (com 'status' opcional: ok | degraded | fail) ou levanta exceção (= fail)
+- run_once() executa todos os probes, cronometra cada um e guarda o resultado com horário;
+  roda como job do agendador a cada PRECIX_HEALTH_INTERVAL_S segundos
+- snapshot() devolve o último resultado em cache (GET /health, /admin/ia-health-dashboard); só executa
+  os probes na hora se ainda não houver resultado ou ele estiver vencido e nenhuma execução em andamento
+- Histórico curto em memória das falhas (PRECIX_HEALTH_HISTORY), no lugar do logs/healthcheck.log
+- on_change(nome, status_anterior, resultado) é chamado quando um probe muda de status
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+HEALTH_INTERVAL_S = float(os.environ.get('PRECIX_HEALTH_INTERVAL_S', '30'))
+HEALTH_HISTORY = int(os.environ.get('PRECIX_HEALTH_HISTORY', '200'))
+
+STATUSES = ('ok', 'degraded', 'fail')
+
+
+class HealthMonitor:
+    """Probes registrados e o último resultado de cada um.
+
+    max_age_s: idade a partir da qual o resultado em cache é considerado vencido ('stale').
+    """
+
+    def __init__(self, max_age_s: float = HEALTH_INTERVAL_S * 3, history: int = HEALTH_HISTORY):
+        self.max_age_s = float(max_age_s)
+        self._probes: List[Tuple[str, Callable[[], dict], bool]] = []
+        self._results: Dict[str, dict] = {}
+        self._checked_at: Optional[float] = None
+        self._history = deque(maxlen=max(1, int(history)))
+        self._lock = threading.Lock()
+        # Uma execução por vez: job do agendador e snapshot() sob demanda não se sobrepõem
+        self._run_lock = threading.Lock()
+        self._runs = 0
+        self.on_change: Optional[Callable[[str, Optional[str], dict], None]] = None
+
+    def add_probe(self, name: str, fn: Callable[[], dict], critical: bool = False):
+        """critical: falha do probe torna o backend indisponível (/health responde 503)."""
+        with self._lock:
+            if any(n == name for n, _, _ in self._probes):
+                raise ValueError(f'Probe de health duplicado: {name}')
+            self._probes.append((name, fn, critical))
+        return fn
+
+    def run_once(self) -> dict:
+        """Executa todos os probes; resumo usado como resultado do job."""
+        with self._run_lock:
+            return self._run()
+
+    def _run(self) -> dict:
+        with self._lock:
+            probes = list(self._probes)
+        changes = []
+        for name, fn, critical in probes:
+            result = self._run_probe(name, fn, critical)
+            with self._lock:
+                previous = self._results.get(name)
+                self._results[name] = result
+                if result['status'] != 'ok':
+                    self._history.append(result)
+            prev_status = previous['status'] if previous else None
+            if prev_status != result['status'] and (prev_status is not None or result['status'] != 'ok'):
+                changes.append((name, prev_status, result))
+        with self._lock:
+            self._checked_at = time.time()
+            self._runs += 1
+        for name, prev_status, result in changes:
+            level = logging.INFO if result['status'] == 'ok' else logging.WARNING
+            logging.log(level, f"[HEALTH] {name}: {prev_status or '-'} -> {result['status']}"
+                               + (f" ({result['error']})" if result['error'] else ''))
+            if self.on_change is not None:
+                try:
+                    self.on_change(name, prev_status, result)
+                except Exception as e:
+                    logging.warning(f"[HEALTH] Falha no callback de mudança de status: {e}")
+        summary = self._summary()
+        return {'status': summary['status'], 'probes': {n: r['status'] for n, r in summary['probes'].items()}}
+
+    @staticmethod
+    def _run_probe(name: str, fn: Callable[[], dict], critical: bool) -> dict:
+        t0 = time.perf_counter()
+        detail, error = {}, None
+        try:
+            detail = dict(fn() or {})
+            status = detail.pop('status', 'ok')
+            if status not in STATUSES:
+                status = 'degraded'
+        except Exception as e:
+            status, error = 'fail', f'{type(e).__name__}: {str(e).strip()}'
+        return {
+            'probe': name,
+            'status': status,
+            'ok': status == 'ok',
+            'critical': critical,
+            'ms': round((time.perf_counter() - t0) * 1000.0, 3),
+            'checked_at': time.time(),
+            'error': error,
+            'detail': detail,
+        }
+
+    def _summary(self) -> dict:
+        with self._lock:
+            results = {name: dict(r) for name, r in self._results.items()}
+            checked_at = self._checked_at
+            runs = self._runs
+        if any(r['status'] == 'fail' and r['critical'] for r in results.values()):
+            status = 'fail'
+        elif any(r['status'] != 'ok' for r in results.values()):
+            status = 'degraded'
+        else:
+            status = 'ok'
+        age = round(time.time() - checked_at, 3) if checked_at is not None else None
+        return {'status': status, 'checked_at': checked_at, 'age_s': age, 'runs': runs, 'probes': results}
+
+    def snapshot(self) -> dict:
+        """Último resultado em cache; executa os probes só se não houver resultado válido."""
+        with self._lock:
+            checked_at = self._checked_at
+        if checked_at is None or time.time() - checked_at > self.max_age_s:
+            # Sem bloquear: se o job já está executando, responde com o que houver
+            if self._run_lock.acquire(blocking=checked_at is None):
+                try:
+                    self._run()
+                finally:
+                    self._run_lock.release()
+        summary = self._summary()
+        summary['stale'] = summary['age_s'] is None or summary['age_s'] > self.max_age_s
+        return summary
+
+    def history(self, limit: Optional[int] = None) -> List[dict]:
+        """Resultados não-ok mais recentes (o mais novo por último)."""
+        with self._lock:
+            items = list(self._history)
+        return items[-limit:] if limit else items
+
+
+health_monitor = HealthMonitor()
@@ -0,0 +1,184 @@
+"""
+Módulo: heartbeat_buffer.py
+---------------------------
+Buffer write-behind de heartbeats (sem dependência de banco; instâncias em heartbeats.py).
+
+- Cada heartbeat só atualiza um dict em memória (último valor por chave); nada de conexão por ping
+- A cada PRECIX_HEARTBEAT_FLUSH_S segundos o buffer é gravado em lote
+  (UPDATE ... FROM (VALUES ...) / INSERT ... ON CONFLICT, ver flush_* em database.py)
+- Leituras de presença (get_all_devices, árvore de agentes) consultam o buffer, então o status
+  fica correto entre um flush e outro
+- Falha no flush devolve o lote ao buffer (sem sobrescrever heartbeats mais novos)
+- flush_fn pode devolver 'missing' (chaves sem linha no destino): essas deixam de ser conhecidas e o
+  próximo ping volta a consultar a existência; mark_known/forget mantêm o cache em dia com o cadastro
+- No shutdown o buffer é gravado uma última vez
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Optional
+
+HEARTBEAT_FLUSH_S = float(os.environ.get('PRECIX_HEARTBEAT_FLUSH_S', '5'))
+# Dispositivos conhecidos dispensam a consulta de existência a cada ping
+KNOWN_TTL_S = float(os.environ.get('PRECIX_HEARTBEAT_KNOWN_TTL_S', '300'))
+
+
+class HeartbeatBuffer:
+    """Coalesce heartbeats por chave e grava em lote via flush_fn(dict chave -> valor).
+
+    O valor é um dict com 'ts' (datetime sem fuso, na convenção da tabela de destino) e
+    campos extras opcionais. fresh() assume ts em UTC.
+    """
+
+    def __init__(self, name: str, flush_fn: Callable[[Dict], dict], interval_s: float = HEARTBEAT_FLUSH_S):
+        self.name = name
+        self._flush_fn = flush_fn
+        self.interval_s = max(0.5, float(interval_s))
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[Hashable, dict] = {}
+        # Enviados ao banco mas ainda visíveis para leituras até o próximo flush concluir
+        self._inflight: Dict[Hashable, dict] = {}
+        self._known: Dict[Hashable, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            'recorded': 0,
+            'coalesced': 0,
+            'flushes': 0,
+            'flushed_rows': 0,
+            'flush_errors': 0,
+            'last_flush_ms': 0.0,
+            'last_flush_at': None,
+            'last_result': None,
+        }
+
+    # --- escrita ---
+    def record(self, key: Hashable, ts: datetime = None, **fields):
+        value = dict(fields)
+        value['ts'] = ts or datetime.utcnow()
+        with self._lock:
+            self._stats['recorded'] += 1
+            prev = self._pending.get(key)
+            if prev is not None:
+                self._stats['coalesced'] += 1
+                if prev['ts'] > value['ts']:
+                    return
+            self._pending[key] = value
+
+    def flush(self) -> dict:
+        """Grava o conteúdo atual do buffer (chamado pela thread e no shutdown)."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return {}
+            t0 = time.perf_counter()
+            try:
+                result = dict(self._flush_fn(batch) or {})
+            except Exception as e:
+                with self._lock:
+                    # Devolve o lote; heartbeats que chegaram durante o flush são mais novos
+                    for key, value in batch.items():
+                        newer = self._pending.get(key)
+                        if newer is None or newer['ts'] < value['ts']:
+                            self._pending[key] = value
+                    self._inflight = {}
+                    self._stats['flush_errors'] += 1
+                logging.warning(f"[HEARTBEAT] Falha ao gravar {len(batch)} heartbeats de {self.name}: {e}")
+                return {'error': str(e)}
+            flush_ms = (time.perf_counter() - t0) * 1000.0
+            now = time.monotonic()
+            # Chaves que não existem mais no destino (ex.: dispositivo removido) deixam de ser conhecidas
+            missing = set(result.pop('missing', ()))
+            with self._lock:
+                self._inflight = {}
+                for key in batch:
+                    if key in missing:
+                        self._known.pop(key, None)
+                    else:
+                        self._known[key] = now
+                self._stats['flushes'] += 1
+                self._stats['flushed_rows'] += len(batch)
+                self._stats['last_flush_ms'] = round(flush_ms, 3)
+                self._stats['last_flush_at'] = time.time()
+                self._stats['last_result'] = result
+            logging.debug(f"[HEARTBEAT] {self.name}: {len(batch)} heartbeats gravados em {flush_ms:.1f}ms {result}")
+            return result
+
+    # --- leitura ---
+    def latest(self, key: Hashable) -> Optional[dict]:
+        with self._lock:
+            value = self._pending.get(key)
+            inflight = self._inflight.get(key)
+        if inflight is not None and (value is None or inflight['ts'] > value['ts']):
+            return inflight
+        return value
+
+    def fresh(self, window_s: float) -> Dict[Hashable, dict]:
+        """Heartbeats ainda não gravados com ts dentro da janela de presença."""
+        limit = _utc_timestamp(datetime.utcnow()) - window_s
+        with self._lock:
+            merged = dict(self._inflight)
+            for key, value in self._pending.items():
+                cur = merged.get(key)
+                if cur is None or cur['ts'] < value['ts']:
+                    merged[key] = value
+        return {k: v for k, v in merged.items() if _utc_timestamp(v['ts']) >= limit}
+
+    def is_known(self, key: Hashable) -> bool:
+        with self._lock:
+            seen = self._known.get(key)
+            return key in self._pending or (seen is not None and time.monotonic() - seen < KNOWN_TTL_S)
+
+    def mark_known(self, key: Hashable):
+        """Existência confirmada no banco (dispensa a consulta nos próximos pings)."""
+        with self._lock:
+            self._known[key] = time.monotonic()
+
+    def forget(self, key: Hashable):
+        """Chave removida/renomeada no cadastro: descarta o heartbeat pendente e o cache de existência."""
+        with self._lock:
+            self._known.pop(key, None)
+            self._pending.pop(key, None)
+
+    # --- ciclo de vida ---
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f'precix-heartbeat-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self, flush: bool = True):
+        self._stop.set()
+        if flush:
+            self.flush()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.flush()
+            self._expire_known()
+
+    def _expire_known(self):
+        limit = time.monotonic() - KNOWN_TTL_S
+        with self._lock:
+            for key in [k for k, seen in self._known.items() if seen < limit]:
+                del self._known[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out['pending'] = len(self._pending)
+            out['known'] = len(self._known)
+        out['interval_s'] = self.interval_s
+        return out
+
+
+def _utc_timestamp(dt: datetime) -> float:
+    # ts é UTC sem fuso: compara como UTC, independente do fuso do servidor
+    return (dt - datetime(1970, 1, 1)).total_seconds()
@@ -0,0 +1,46 @@
+"""
+Módulo: heartbeats.py
+---------------------
+Instâncias do buffer write-behind de heartbeats (heartbeat_buffer.py) ligadas ao banco.
+
+- device_heartbeats: POST /device/heartbeat/{identifier} -> devices.last_sync (UTC)
+- agent_device_heartbeats: POST /admin/agents/{agent_id}/devices/heartbeat -> agent_devices
+  (last_update em horário local, mesma convenção de bulk_upsert_agent_devices)
+- Fontes de presença registradas em database.py para as leituras enxergarem o buffer
+"""
+
+try:
+    from .database import (
+        flush_device_heartbeats, flush_agent_device_heartbeats,
+        set_device_presence_source, set_agent_device_presence_source
+    )
+    from .heartbeat_buffer import HeartbeatBuffer
+except ImportError:
+    from database import (
+        flush_device_heartbeats, flush_agent_device_heartbeats,
+        set_device_presence_source, set_agent_device_presence_source
+    )
+    from heartbeat_buffer import HeartbeatBuffer
+
+# Chave = identifier
+device_heartbeats = HeartbeatBuffer('devices', flush_device_heartbeats)
+# Chave = (agent_id, identifier)
+agent_device_heartbeats = HeartbeatBuffer('agent_devices', flush_agent_device_heartbeats)
+
+set_device_presence_source(device_heartbeats.fresh)
+set_agent_device_presence_source(agent_device_heartbeats.latest)
+
+
+def start_heartbeat_buffers():
+    device_heartbeats.start()
+    agent_device_heartbeats.start()
+
+
+def stop_heartbeat_buffers():
+    # Grava o que ainda estiver pendente antes de fechar o pool
+    device_heartbeats.stop()
+    agent_device_heartbeats.stop()
+
+
+def heartbeat_stats() -> dict:
+    return {'devices': device_heartbeats.stats(), 'agent_devices': agent_device_heartbeats.stats()}
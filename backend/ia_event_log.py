@@ -2,12 +2,13 @@ import os
 import json
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
 import time
 try:
-    from .ai_agent_integration import notify_ai_agent
+    from .ai_agent_integration import ask_ai_agent
 except ImportError:
-    from ai_agent_integration import notify_ai_agent
+    from ai_agent_integration import ask_ai_agent
 
 router = APIRouter()
 LOG_FILE = os.path.join(os.path.dirname(__file__), 'logs', 'ia_events.log')
@@ -42,7 +43,7 @@ def api_get_ia_events(limit: int = 100):
 @router.get('/admin/ia-health')
 def ia_health():
     try:
-        resp = notify_ai_agent('ping', {'timestamp': time.time()})
+        resp = ask_ai_agent('ping', {'timestamp': time.time()})
         online = bool(resp)
         return {"online": online, "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S')}
     except Exception:
@@ -56,9 +57,15 @@ async def ia_chat(request: Request):
     user = data.get('user', 'anon')
     if not message:
         return JSONResponse({"error": "Mensagem não informada."}, status_code=400)
+    # Envio à IA (até PRECIX_IA_TIMEOUT s) e gravação do log fora do event loop
+    resp = await run_in_threadpool(_chat, message, user)
+    reply = resp.get('reply') if resp else None
+    return {"reply": reply or "Sem resposta da IA."}
+
+
+def _chat(message, user):
     start = time.time()
-    resp = notify_ai_agent('chat', {'message': message})
+    resp = ask_ai_agent('chat', {'message': message})
     elapsed = round(time.time() - start, 3)
-    reply = resp.get('reply') if resp else None
     log_ia_event('chat', {'message': message}, resp, user=user, elapsed=elapsed)
-    return {"reply": reply or "Sem resposta da IA."}
+    return resp
@@ -0,0 +1,316 @@
+"""
+Módulo: ia_monitor.py
+---------------------
+Monitoramento proativo da IA: health probes internos (banco, pool, cache, snapshot do catálogo,
+jobs, gravações em lote e event loop; ver health.py), análise das falhas recentes com sugestões de
+otimização e rotinas autônomas de correção de dados.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+from fastapi import APIRouter
+
+try:
+    from .database import (
+        get_db_connection, set_device_offline, invalidate_product_cache, maintain_audit_partitions,
+        ping_db, get_pool_stats, get_product_cache_stats
+    )
+    from .ai_agent_integration import notify_ai_agent
+    from .audit_writer import audit_writer
+    from .catalog_snapshot import catalog_store
+    from .db_async import loop_monitor
+    from .health import health_monitor
+    from .heartbeats import heartbeat_stats
+    from .jobs import scheduler
+except ImportError:
+    from database import (
+        get_db_connection, set_device_offline, invalidate_product_cache, maintain_audit_partitions,
+        ping_db, get_pool_stats, get_product_cache_stats
+    )
+    from ai_agent_integration import notify_ai_agent
+    from audit_writer import audit_writer
+    from catalog_snapshot import catalog_store
+    from db_async import loop_monitor
+    from health import health_monitor
+    from heartbeats import heartbeat_stats
+    from jobs import scheduler
+
+router = APIRouter()
+
+
+# Limites dos health probes (resultados em GET /health e /admin/ia-health-dashboard)
+HEALTH_POOL_SATURATION = float(os.environ.get('PRECIX_HEALTH_POOL_SATURATION', '0.9'))
+HEALTH_LOOP_LAG_MS = float(os.environ.get('PRECIX_HEALTH_LOOP_LAG_MS', '500'))
+
+
+def probe_db():
+    # Ping pelo pool: mesmo caminho das requisições, sem consultar tabelas
+    return {'latency_ms': round(ping_db(), 3)}
+
+
+def probe_db_pool():
+    pool = get_pool_stats()
+    saturation = pool['in_use'] / pool['max'] if pool['max'] else 0.0
+    return {
+        'status': 'degraded' if saturation >= HEALTH_POOL_SATURATION else 'ok',
+        'in_use': pool['in_use'],
+        'max': pool['max'],
+        'saturation': round(saturation, 3),
+        'timeouts': pool['timeouts'],
+        'connect_errors': pool['connect_errors'],
+    }
+
+
+def probe_product_cache():
+    # Itens vencem pelo TTL e são invalidados nas escritas; aqui só os contadores do cache
+    cache = get_product_cache_stats()
+    return {k: cache[k] for k in ('size', 'maxsize', 'hit_ratio', 'ttl_s', 'invalidations', 'stale_loads_discarded')}
+
+
+def probe_catalog_snapshot():
+    # Idade e revisão do snapshot já montado; nunca reconstrói (isso fica para /product/all)
+    snap = catalog_store.stats()
+    out = {'built': 'built_at' in snap, 'builds': snap['builds'], 'build_errors': snap['build_errors']}
+    if out['built']:
+        out['age_s'] = round(time.time() - snap['built_at'], 1)
+        out['revision'] = snap['revision']
+        out['products'] = snap['products']
+        db_revision = catalog_store.current_revision()
+        out['db_revision'] = db_revision
+        # Desatualizado só significa que a próxima requisição reconstrói
+        out['behind'] = db_revision is not None and db_revision != snap['revision']
+    return out
+
+
+def probe_jobs():
+    # Job vivo: executando há menos de max(intervalo, 5 min) ou com a próxima execução em dia
+    stats = scheduler.stats()
+    if not stats['enabled']:
+        return {'enabled': False}
+    now = time.time()
+    stalled = []
+    for name, job in stats['jobs'].items():
+        grace = max(60.0, job['interval_s'])
+        if job['running']:
+            if job['last_started_at'] and now - job['last_started_at'] > max(job['interval_s'], 300.0):
+                stalled.append(name)
+        elif job['next_run_at'] and now - job['next_run_at'] > grace:
+            stalled.append(name)
+    ok = stats['running'] and not stalled
+    return {
+        'status': 'ok' if ok else 'degraded',
+        'running': stats['running'],
+        'jobs': len(stats['jobs']),
+        'stalled': stalled,
+        'failures': {name: job['failures'] for name, job in stats['jobs'].items() if job['failures']},
+    }
+
+
+def probe_writers():
+    # Gravações em lote (audit_log e heartbeats): thread ativa e filas dentro do limite
+    audit = audit_writer.stats()
+    hb = heartbeat_stats()
+    full = audit['depth'] >= audit['max_queue']
+    return {
+        'status': 'ok' if audit['running'] and not full else 'degraded',
+        'audit_running': audit['running'],
+        'audit_depth': audit['depth'],
+        'audit_dropped': audit['dropped'],
+        'heartbeats_pending': {kind: s['pending'] for kind, s in hb.items()},
+        'heartbeat_flush_errors': sum(s['flush_errors'] for s in hb.values()),
+    }
+
+
+def probe_event_loop():
+    loop = loop_monitor.stats()
+    return {
+        'status': 'degraded' if loop['lag_last_ms'] >= HEALTH_LOOP_LAG_MS else 'ok',
+        'running': loop['running'],
+        'lag_last_ms': loop['lag_last_ms'],
+    }
+
+
+health_monitor.add_probe('db', probe_db, critical=True)
+health_monitor.add_probe('db_pool', probe_db_pool)
+health_monitor.add_probe('product_cache', probe_product_cache)
+health_monitor.add_probe('catalog_snapshot', probe_catalog_snapshot)
+health_monitor.add_probe('jobs', probe_jobs)
+health_monitor.add_probe('writers', probe_writers)
+health_monitor.add_probe('event_loop', probe_event_loop)
+
+
+def _notify_health_change(name, previous, result):
+    # A IA só é avisada na transição para falha (não a cada execução dos probes)
+    if result['status'] == 'fail':
+        notify_ai_agent('healthcheck_fail', {'probe': name, 'previous': previous, 'error': result['error'],
+                                             'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')})
+
+
+health_monitor.on_change = _notify_health_change
+
+
+# --- Funções auxiliares de automação IA ---
+IA_AUTONOMOUS_ACTIONS_LOG = os.path.join(os.path.dirname(__file__), 'logs', 'ia_autonomous_actions.log')
+os.makedirs(os.path.dirname(IA_AUTONOMOUS_ACTIONS_LOG), exist_ok=True)
+
+def log_ia_autonomous_action(action, result, details=None):
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'action': action,
+        'result': result,
+        'details': details or {}
+    }
+    with open(IA_AUTONOMOUS_ACTIONS_LOG, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+def ia_autonomous_check_devices():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT id, name, identifier, last_sync, online FROM devices')
+    now = datetime.now()
+    offline_count = 0
+    for row in cur.fetchall():
+        last_sync = row['last_sync']
+        online = row['online']
+        if last_sync:
+            try:
+                last_dt = datetime.fromisoformat(last_sync)
+            except Exception:
+                continue
+            diff = (now - last_dt).total_seconds() / 60
+            if diff > 10 and online:
+                set_device_offline(row['id'])
+                log_ia_autonomous_action(
+                    action='set_device_offline',
+                    result='success',
+                    details={'device_id': row['id'], 'name': row['name'], 'identifier': row['identifier'], 'reason': f'No heartbeat for {diff:.1f} min'}
+                )
+                notify_ai_agent('device_offline_auto', {'device_id': row['id'], 'name': row['name'], 'identifier': row['identifier'], 'reason': f'No heartbeat for {diff:.1f} min'})
+                offline_count += 1
+    conn.close()
+    return offline_count
+
+def ia_autonomous_cleanup_logs():
+    # Remove logs fora da retenção (PRECIX_AUDIT_RETENTION_DAYS, padrão 30 dias):
+    # partições inteiras do audit_log (DROP), sem DELETE linha a linha
+    result = maintain_audit_partitions()
+    removidos = result['deleted_rows']
+    log_ia_autonomous_action(
+        action='cleanup_logs',
+        result='success',
+        details={'removed_logs': removidos, 'dropped_partitions': result['dropped'], 'older_than': result['cutoff']}
+    )
+    return removidos
+
+def ia_autonomous_fix_product_data():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    alterados = set()
+    # Corrige produtos com nome vazio
+    cur.execute("UPDATE products SET name = 'Produto sem nome' WHERE name IS NULL OR TRIM(name) = '' RETURNING barcode")
+    nome_corrigido = cur.rowcount
+    alterados.update(r[0] for r in cur.fetchall())
+    # Corrige preços negativos ou nulos
+    cur.execute("UPDATE products SET price = 0.01 WHERE price IS NULL OR price <= 0 RETURNING barcode")
+    preco_corrigido = cur.rowcount
+    alterados.update(r[0] for r in cur.fetchall())
+    # Corrige promoções inconsistentes (promo nulo vira string vazia)
+    cur.execute("UPDATE products SET promo = '' WHERE promo IS NULL RETURNING barcode")
+    promo_corrigido = cur.rowcount
+    alterados.update(r[0] for r in cur.fetchall())
+    conn.commit()
+    conn.close()
+    invalidate_product_cache(alterados)
+    total = nome_corrigido + preco_corrigido + promo_corrigido
+    log_ia_autonomous_action(
+        action='fix_product_data',
+        result='success',
+        details={'name_fixed': nome_corrigido, 'price_fixed': preco_corrigido, 'promo_fixed': promo_corrigido}
+    )
+    return total
+
+def ia_autonomous_fix_outlier_prices():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    # Busca todos os preços válidos
+    cur.execute("SELECT price FROM products WHERE price IS NOT NULL AND price > 0 ORDER BY price")
+    prices = [row[0] for row in cur.fetchall()]
+    if not prices:
+        conn.close()
+        return 0
+    # Calcula mediana
+    n = len(prices)
+    if n % 2 == 1:
+        mediana = prices[n // 2]
+    else:
+        mediana = (prices[n // 2 - 1] + prices[n // 2]) / 2
+    # Define limites de outlier (ex: 10x acima ou 0.1x abaixo da mediana)
+    limite_sup = mediana * 10
+    limite_inf = mediana * 0.1
+    alterados = set()
+    # Corrige preços muito altos
+    cur.execute("UPDATE products SET price = %s WHERE price > %s RETURNING barcode", (limite_sup, limite_sup))
+    acima = cur.rowcount
+    alterados.update(r[0] for r in cur.fetchall())
+    # Corrige preços muito baixos (mas > 0)
+    cur.execute("UPDATE products SET price = %s WHERE price < %s AND price > 0 RETURNING barcode", (limite_inf, limite_inf))
+    abaixo = cur.rowcount
+    alterados.update(r[0] for r in cur.fetchall())
+    conn.commit()
+    conn.close()
+    invalidate_product_cache(alterados)
+    total = acima + abaixo
+    log_ia_autonomous_action(
+        action='fix_outlier_prices',
+        result='success',
+        details={'fixed_above': acima, 'fixed_below': abaixo, 'median': mediana, 'limit_sup': limite_sup, 'limit_inf': limite_inf}
+    )
+    return total
+
+
+OPTIMIZATION_LOG = os.path.join(os.path.dirname(__file__), 'logs', 'optimization_suggestions.log')
+
+def ia_analyze_logs_and_optimize():
+    # IA analisa as falhas recentes dos health probes e sugere melhorias
+    issues = [
+        {'probe': r['probe'], 'status': r['status'], 'error': r['error'],
+         'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(r['checked_at']))}
+        for r in health_monitor.history(100)
+    ]
+    if issues:
+        suggestion = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'suggestion': f"Foram detectados {len(issues)} falhas recentes nos health probes. Recomenda-se revisar logs e infraestrutura.",
+            'issues': issues
+        }
+        with open(OPTIMIZATION_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(suggestion, ensure_ascii=False) + '\n')
+        notify_ai_agent('optimization_suggestion', suggestion)
+
+@router.get('/admin/ia-health-dashboard')
+def ia_health_dashboard():
+    # Últimos resultados dos health probes (em cache, atualizados pelo job health_probes)
+    snap = health_monitor.snapshot()
+    health = [
+        {'probe': name, 'ok': r['ok'], 'status': r['status'], 'error': r['error'], 'ms': r['ms'],
+         'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(r['checked_at']))}
+        for name, r in snap['probes'].items()
+    ]
+    # Últimas sugestões de otimização
+    optim = []
+    if os.path.exists(OPTIMIZATION_LOG):
+        with open(OPTIMIZATION_LOG, 'r', encoding='utf-8') as f:
+            optim = [json.loads(l) for l in f.readlines()[-10:]]
+    return {
+        'status': snap['status'],
+        'healthchecks': health,
+        'optimizations': optim
+    }
+
+@router.post('/admin/ia-analyze-logs')
+def ia_analyze_logs_endpoint():
+    ia_analyze_logs_and_optimize()
+    return {'success': True, 'message': 'Análise de logs e sugestão de otimização executada.'}
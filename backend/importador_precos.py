@@ -15,10 +15,10 @@ from datetime import datetime
 # Suporte a import dual-mode (pacote ou script)
 try:
     from .integration_config import get_integrations
-    from .database import get_db_connection
+    from .database import get_db_connection, invalidate_product_cache
 except ImportError:  # quando carregado fora de pacote (ex: reloader)
     from integration_config import get_integrations
-    from database import get_db_connection
+    from database import get_db_connection, invalidate_product_cache
 
 # Função principal: executa a importação para todas as integrações ativas
 def importar_todos_precos():
@@ -141,18 +141,20 @@ def atualizar_preco(dados, loja_id):
         conn = get_db_connection()
         cur = conn.cursor()
         # Verifica existência
-        cur.execute('SELECT 1 FROM products WHERE barcode = ?', (barcode,))
+        cur.execute('SELECT 1 FROM products WHERE barcode = %s', (barcode,))
         exists = cur.fetchone() is not None
         if exists:
             # Atualiza somente o que veio
             if name:
-                cur.execute('UPDATE products SET name = ?, price = ?, promo = COALESCE(?, promo) WHERE barcode = ?', (name, price, promo, barcode))
+                cur.execute('UPDATE products SET name = %s, price = %s, promo = COALESCE(%s, promo) WHERE barcode = %s', (name, price, promo, barcode))
             else:
-                cur.execute('UPDATE products SET price = ?, promo = COALESCE(?, promo) WHERE barcode = ?', (price, promo, barcode))
+                cur.execute('UPDATE products SET price = %s, promo = COALESCE(%s, promo) WHERE barcode = %s', (price, promo, barcode))
         else:
-            cur.execute('INSERT INTO products (barcode, name, price, promo) VALUES (?, ?, ?, ?)', (barcode, name or f'Produto {barcode}', price, promo))
+            cur.execute('INSERT INTO products (barcode, name, price, promo) VALUES (%s, %s, %s, %s)', (barcode, name or f'Produto {barcode}', price, promo))
         conn.commit()
         conn.close()
+        # Remove a versão em cache do produto (positiva ou negativa)
+        invalidate_product_cache([barcode])
         return True
     except Exception:
         return False
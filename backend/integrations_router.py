@@ -0,0 +1,415 @@
+"""
+Módulo: integrations_router.py
+------------------------------
+Integrações de preço (/admin/integracoes...) e importação sob demanda (/admin/importar-precos).
+
+importador_precos (e requests) só são carregados quando uma importação ou teste de API é pedido.
+"""
+
+import io
+import json
+import logging
+import sys
+from typing import List
+
+from fastapi import APIRouter, Body, HTTPException, Query, Request
+
+try:
+    from .database import add_audit_log
+    from .db_async import run_db
+    from .integration_config import (
+        upsert_integration, get_integrations, update_integration_by_id, delete_integration
+    )
+except ImportError:
+    from database import add_audit_log
+    from db_async import run_db
+    from integration_config import (
+        upsert_integration, get_integrations, update_integration_by_id, delete_integration
+    )
+
+router = APIRouter()
+
+
+# Capture limited import logs for /admin/importar-precos/logs
+_import_logs: List[str] = []
+class ImportLogCatcher(io.StringIO):
+    def write(self, txt):
+        super().write(txt)
+        _import_logs.append(txt)
+        if len(_import_logs) > 100:
+            _import_logs.pop(0)
+
+
+def capture_import_logs():
+    """Redireciona o stdout para o buffer de /admin/importar-precos/logs (uma vez por processo)."""
+    if not isinstance(sys.stdout, ImportLogCatcher):
+        sys.stdout = ImportLogCatcher()
+
+
+@router.post('/admin/importar-precos')
+def acionar_importacao():
+    try:
+        try:
+            from .importador_precos import importar_todos_precos
+        except ImportError:
+            from importador_precos import importar_todos_precos
+        importar_todos_precos()
+        return {"success": True, "message": "Importação executada."}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+
+@router.get('/admin/importar-precos/logs')
+def get_import_logs():
+    return {"logs": _import_logs[-50:]}
+
+
+@router.get('/admin/integracoes')
+def listar_integracoes(loja_id: int = Query(None)):
+    try:
+        result = get_integrations(loja_id)
+        print(f"[DEBUG] Listando integrações: loja_id={loja_id}, resultado={len(result)} registros")
+        return result
+    except Exception as e:
+        print(f"[ERROR] Erro ao listar integrações: {e}")
+        return []
+
+
+@router.post('/admin/integracoes')
+def salvar_integracao(data: dict = Body(...)):
+    id_ = data.get('id')
+    raw_loja = data.get('loja_id')
+    if raw_loja in (None, '', 'null'):
+        loja_id = None
+    else:
+        try:
+            loja_id = int(raw_loja)
+        except Exception:
+            loja_id = None
+    tipo = data.get('tipo')
+    parametro1 = data.get('parametro1')
+    parametro2 = data.get('parametro2')
+    ativo = data.get('ativo', 1)
+    layout = data.get('layout')
+    if not tipo or not parametro1:
+        return {"success": False, "message": "Campos obrigatórios: tipo e parametro1"}
+    if id_ is not None:
+        update_integration_by_id(id_, loja_id, tipo, parametro1, parametro2, ativo, layout)
+    else:
+        upsert_integration(loja_id, tipo, parametro1, parametro2, ativo, layout)
+    return {"success": True}
+
+
+@router.post('/admin/integracoes/testar-api')
+def testar_integracao_api(data: dict = Body(...)):
+    url = (data.get('url') or data.get('parametro1') or '').strip()
+    token = (data.get('token') or data.get('parametro2') or '').strip()
+    if not url:
+        return {"success": False, "message": "Informe a URL da API."}
+    headers = {}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    try:
+        import requests
+        r = requests.get(url, headers=headers, timeout=8)
+        r.raise_for_status()
+        try:
+            js = r.json()
+        except Exception:
+            return {"success": False, "message": "A resposta não é JSON válido."}
+        count = len(js) if isinstance(js, list) else (len(js.keys()) if isinstance(js, dict) else 1)
+        sample = js[0] if isinstance(js, list) and js else js
+        return {"success": True, "status": r.status_code, "count": int(count), "sample": sample if isinstance(sample, dict) else None}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+
+@router.put('/admin/integracoes/{integracao_id}')
+async def atualizar_integracao(integracao_id: int, request: Request):
+    """Atualizar uma integração existente."""
+    try:
+        data = await request.json()
+        
+        # Converter ativo para int
+        ativo = data.get('ativo', True)
+        ativo_int = 1 if ativo else 0
+        
+        await run_db(
+            update_integration_by_id,
+            integracao_id,
+            data.get('loja_id'),
+            data.get('tipo'),
+            data.get('parametro1'),
+            data.get('parametro2'),
+            ativo_int,
+            data.get('layout', '{}')
+        )
+        
+        return {"success": True, "message": "Integração atualizada com sucesso"}
+    except Exception as e:
+        import traceback
+        logging.error(f"Erro ao atualizar integração {integracao_id}: {str(e)}")
+        logging.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete('/admin/integracoes/{integracao_id}')
+def deletar_integracao(integracao_id: int):
+    try:
+        delete_integration(integracao_id)
+        return {"success": True}
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post('/admin/integracoes/log')
+def log_integration_event(data: dict = Body(...)):
+    """Registra eventos de integração na auditoria."""
+    try:
+        action = data.get('action', 'INTEGRATION_EVENT')
+        details = data.get('details', {})
+        store_name = data.get('store_name', 'Global')
+        
+        # Adicionar log de auditoria
+        add_audit_log(None, store_name, action, json.dumps(details, ensure_ascii=False))
+        
+        return {"success": True, "message": "Log registrado com sucesso"}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+
+@router.post('/admin/integracoes/seed')
+def criar_integracoes_exemplo():
+    """Cria integrações de exemplo para teste."""
+    try:
+        # Verificar se já existem integrações
+        existing = get_integrations()
+        if len(existing) > 0:
+            return {"success": False, "message": f"Já existem {len(existing)} integrações configuradas"}
+        
+        # Criar exemplos
+        exemplos = [
+            {
+                "loja_id": None,
+                "tipo": "api",
+                "parametro1": "http://192.168.18.7:8000/product/all",
+                "parametro2": "",
+                "ativo": 1,
+                "layout": '{"paginacao": false, "authType": "", "mapeamento": {"codigo": "codigo", "descricao": "descricao", "preco": "preco"}}'
+            },
+            {
+                "loja_id": None,
+                "tipo": "arquivo",
+                "parametro1": "C:\\precos\\produtos.csv",
+                "parametro2": "",
+                "ativo": 1,
+                "layout": '{"separador": ";", "encoding": "utf-8", "temCabecalho": true, "mapeamento": {"codigo": "codigo", "descricao": "descricao", "preco": "preco"}}'
+            }
+        ]
+        
+        for exemplo in exemplos:
+            upsert_integration(
+                exemplo["loja_id"],
+                exemplo["tipo"],
+                exemplo["parametro1"],
+                exemplo["parametro2"],
+                exemplo["ativo"],
+                exemplo["layout"]
+            )
+        
+        return {"success": True, "message": f"Criadas {len(exemplos)} integrações de exemplo"}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+
+@router.post('/admin/integracoes/preview-arquivo')
+async def preview_arquivo_integracao(request: Request):
+    """Preview de arquivo para integração."""
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail='JSON inválido')
+    # Leitura do arquivo e consulta de cada produto no banco fora do event loop
+    return await run_db(_preview_arquivo_integracao, data)
+
+
+def _preview_arquivo_integracao(data: dict):
+    try:
+        caminho = data.get('caminho')
+        layout = data.get('layout', {})
+        loja_id = data.get('loja_id')
+        
+        if not caminho:
+            raise HTTPException(status_code=400, detail="Caminho do arquivo é obrigatório")
+        
+        # Tentar ler o arquivo
+        try:
+            # Usar encoding configurado ou padrão
+            encoding = layout.get('encoding', 'utf-8')
+            separador = layout.get('separador', ';')
+            tem_cabecalho = layout.get('temCabecalho', True)
+            
+            import os
+            import csv
+            import codecs
+            
+            # Resolver caminho absoluto
+            # Se o caminho não for absoluto, tentar alguns locais padrão
+            if not os.path.isabs(caminho):
+                # Diretório base do projeto
+                base_dir = os.path.dirname(os.path.dirname(__file__))
+                
+                # Tentar vários locais possíveis
+                possible_paths = [
+                    os.path.join(base_dir, caminho),                    # raiz do projeto
+                    os.path.join(base_dir, 'agente_local', 'dist', caminho),  # agente_local/dist
+                    os.path.join(base_dir, 'backend', caminho),         # backend
+                    os.path.join(base_dir, 'frontend', caminho),        # frontend
+                    caminho  # caminho original como última tentativa
+                ]
+                
+                caminho_final = None
+                for possible_path in possible_paths:
+                    if os.path.exists(possible_path):
+                        caminho_final = possible_path
+                        break
+                
+                if not caminho_final:
+                    raise HTTPException(status_code=404, detail=f"Arquivo não encontrado em nenhum dos locais possíveis. Arquivo: {caminho}. Locais verificados: {possible_paths}")
+                
+                caminho = caminho_final
+            
+            if not os.path.exists(caminho):
+                raise HTTPException(status_code=404, detail=f"Arquivo não encontrado: {caminho}")
+            
+            # Informações do arquivo
+            arquivo_info = {
+                'caminho': caminho,
+                'tamanho': os.path.getsize(caminho),
+                'modificado': os.path.getmtime(caminho)
+            }
+            
+            dados = []
+            with codecs.open(caminho, 'r', encoding=encoding) as arquivo:
+                # Detectar separador automaticamente se necessário
+                primeira_linha = arquivo.readline()
+                arquivo.seek(0)
+                
+                if separador == 'auto':
+                    # Tentar detectar separador
+                    if ';' in primeira_linha:
+                        separador = ';'
+                    elif ',' in primeira_linha:
+                        separador = ','
+                    elif '\t' in primeira_linha:
+                        separador = '\t'
+                    elif '|' in primeira_linha:
+                        separador = '|'
+                    else:
+                        separador = ';'  # padrão
+                
+                reader = csv.reader(arquivo, delimiter=separador)
+                
+                # Pular cabeçalho se configurado
+                if tem_cabecalho:
+                    next(reader, None)
+                
+                # Ler até 100 linhas para preview
+                count = 0
+                for linha in reader:
+                    if count >= 100:  # Limite para preview
+                        break
+                    
+                    if len(linha) >= 2:  # Pelo menos código e preço
+                        # Mapear campos baseado na configuração
+                        mapeamento = layout.get('mapeamento', {})
+                        
+                        try:
+                            # Usar mapeamento ou posições padrão
+                            codigo_idx = int(mapeamento.get('codigo', 0)) if str(mapeamento.get('codigo', '0')).isdigit() else 0
+                            descricao_idx = int(mapeamento.get('descricao', 1)) if str(mapeamento.get('descricao', '1')).isdigit() else 1
+                            preco_idx = int(mapeamento.get('preco', 2)) if str(mapeamento.get('preco', '2')).isdigit() else 2
+                            
+                            # Extrair dados
+                            codigo = linha[codigo_idx] if len(linha) > codigo_idx else ''
+                            descricao = linha[descricao_idx] if len(linha) > descricao_idx else ''
+                            preco_str = linha[preco_idx] if len(linha) > preco_idx else ''
+                            
+                            # Converter preço
+                            try:
+                                preco = float(preco_str.replace(',', '.').replace('R$', '').strip())
+                            except:
+                                preco = 0.0
+                            
+                            # Verificar se o produto existe no banco
+                            produto_existente = None
+                            status = 'novo'  # padrão: produto novo
+                            observacoes = 'OK'
+                            
+                            try:
+                                from database import get_product_by_barcode
+                                produto_existente = get_product_by_barcode(codigo.strip())
+                                if produto_existente:
+                                    status = 'existente'
+                                    # Comparar preços se possível
+                                    if 'preco' in produto_existente:
+                                        preco_atual = float(produto_existente['preco'])
+                                        diferenca = abs(preco - preco_atual)
+                                        if diferenca > 0.01:  # diferença significativa
+                                            observacoes = f'Preço atual: R$ {preco_atual:.2f}'
+                                        else:
+                                            observacoes = 'Preço igual'
+                                else:
+                                    status = 'novo'
+                                    observacoes = 'Produto não encontrado no banco'
+                            except Exception as e:
+                                status = 'erro'
+                                observacoes = f'Erro ao verificar: {str(e)}'
+                            
+                            dados.append({
+                                'codigo': codigo.strip(),
+                                'descricao': descricao.strip(),
+                                'preco': preco,
+                                'status': status,
+                                'observacoes': observacoes,
+                                'linha_original': linha
+                            })
+                        except (IndexError, ValueError) as e:
+                            # Linha com problema, adicionar mesmo assim para debug
+                            dados.append({
+                                'codigo': linha[0] if len(linha) > 0 else '',
+                                'descricao': linha[1] if len(linha) > 1 else '',
+                                'preco': 0.0,
+                                'status': 'erro',
+                                'observacoes': f'Erro na linha: {str(e)}',
+                                'erro': str(e),
+                                'linha_original': linha
+                            })
+                    
+                    count += 1
+            
+            return {
+                "success": True,
+                "arquivo_info": arquivo_info,
+                "dados": dados,
+                "total_preview": len(dados),
+                "configuracao": {
+                    "encoding": encoding,
+                    "separador": separador,
+                    "tem_cabecalho": tem_cabecalho,
+                    "mapeamento": layout.get('mapeamento', {})
+                }
+            }
+            
+        except UnicodeDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Erro de encoding do arquivo. Tente outro encoding. Erro: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao processar arquivo: {str(e)}")
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        logging.error(f"Erro no preview de arquivo: {str(e)}")
+        logging.error(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
@@ -0,0 +1,169 @@
+"""
+Módulo: jobs.py
+---------------
+Agendador simples de tarefas periódicas em background (threads daemon).
+
+- register(name, fn, interval_s, initial_delay_s): fn roda a cada interval_s segundos
+- Uma thread por job; execuções nunca se sobrepõem (o próximo ciclo começa após o término)
+- Métricas por job (execuções, falhas, duração, último resultado/erro) em GET /admin/jobs
+- run_now(name) antecipa a próxima execução (POST /admin/jobs/{name}/run)
+- scheduler.on_run recebe (nome, segundos, ok) de cada execução (histograma em /metrics)
+- PRECIX_JOBS_ENABLED=0 desativa o agendador (ex.: workers extras atrás de um balanceador)
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+JOBS_ENABLED = os.environ.get('PRECIX_JOBS_ENABLED', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+class Job:
+    def __init__(self, name: str, fn: Callable, interval_s: float, initial_delay_s: float = 0.0,
+                 on_finish: Optional[Callable[[str, float, bool], None]] = None):
+        self.name = name
+        self.fn = fn
+        self.on_finish = on_finish
+        self.interval_s = max(1.0, float(interval_s))
+        self.initial_delay_s = max(0.0, float(initial_delay_s))
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self.stats = {
+            'runs': 0,
+            'failures': 0,
+            'last_started_at': None,
+            'last_finished_at': None,
+            'last_duration_ms': None,
+            'max_duration_ms': 0.0,
+            'total_duration_ms': 0.0,
+            'last_result': None,
+            'last_error': None,
+            'next_run_at': None,
+        }
+
+    def run_once(self):
+        with self.lock:
+            self.running = True
+            self.stats['last_started_at'] = time.time()
+        t0 = time.perf_counter()
+        result, error = None, None
+        try:
+            result = self.fn()
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            logging.exception(f"[JOBS] Falha no job {self.name}")
+        duration_ms = (time.perf_counter() - t0) * 1000.0
+        with self.lock:
+            self.running = False
+            self.stats['runs'] += 1
+            self.stats['last_finished_at'] = time.time()
+            self.stats['last_duration_ms'] = round(duration_ms, 3)
+            self.stats['max_duration_ms'] = round(max(self.stats['max_duration_ms'], duration_ms), 3)
+            self.stats['total_duration_ms'] = round(self.stats['total_duration_ms'] + duration_ms, 3)
+            if error:
+                self.stats['failures'] += 1
+                self.stats['last_error'] = error
+            else:
+                self.stats['last_result'] = result
+        if not error:
+            logging.info(f"[JOBS] {self.name} concluído em {duration_ms:.1f}ms: {result}")
+        if self.on_finish is not None:
+            try:
+                self.on_finish(self.name, duration_ms / 1000.0, error is None)
+            except Exception:
+                pass
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            out = dict(self.stats)
+            out['running'] = self.running
+        out['interval_s'] = self.interval_s
+        runs = out['runs'] or 1
+        out['avg_duration_ms'] = round(out['total_duration_ms'] / runs, 3)
+        return out
+
+
+class JobScheduler:
+    def __init__(self, enabled: bool = JOBS_ENABLED):
+        self.enabled = enabled
+        self._jobs: Dict[str, Job] = {}
+        self._stop = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+        # Gancho opcional (ex.: métricas): on_run(nome, segundos, ok) após cada execução
+        self.on_run: Optional[Callable[[str, float, bool], None]] = None
+
+    def register(self, name: str, fn: Callable, interval_s: float, initial_delay_s: float = 0.0) -> Job:
+        job = Job(name, fn, interval_s, initial_delay_s, on_finish=self._job_finished)
+        with self._lock:
+            self._jobs[name] = job
+            started = self._started
+        if started:
+            self._start_job(job)
+        return job
+
+    def start(self):
+        with self._lock:
+            if self._started or not self.enabled:
+                return
+            self._started = True
+            self._stop.clear()
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            self._start_job(job)
+        logging.info(f"[JOBS] Agendador iniciado com {len(jobs)} jobs")
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self._started = False
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.wakeup.set()
+
+    def run_now(self, name: str) -> bool:
+        """Antecipa a execução do job (ou executa na hora se o agendador estiver parado)."""
+        job = self._jobs.get(name)
+        if job is None:
+            return False
+        if job.thread is not None and job.thread.is_alive():
+            job.wakeup.set()
+        else:
+            threading.Thread(target=job.run_once, name=f'precix-job-{name}', daemon=True).start()
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = dict(self._jobs)
+        return {
+            'enabled': self.enabled,
+            'running': self._started,
+            'jobs': {name: job.snapshot() for name, job in jobs.items()},
+        }
+
+    def _job_finished(self, name: str, seconds: float, ok: bool):
+        if self.on_run is not None:
+            self.on_run(name, seconds, ok)
+
+    def _start_job(self, job: Job):
+        job.thread = threading.Thread(target=self._loop, args=(job,), name=f'precix-job-{job.name}', daemon=True)
+        job.thread.start()
+
+    def _loop(self, job: Job):
+        delay = job.initial_delay_s
+        while not self._stop.is_set():
+            with job.lock:
+                job.stats['next_run_at'] = time.time() + delay
+            job.wakeup.wait(delay)
+            job.wakeup.clear()
+            if self._stop.is_set():
+                return
+            job.run_once()
+            delay = job.interval_s
+
+
+scheduler = JobScheduler()
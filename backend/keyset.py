@@ -0,0 +1,31 @@
+"""
+Módulo: keyset.py
+-----------------
+Cursor opaco para paginação por chave (keyset) em (timestamp, id), usado pelo audit_log.
+
+- A próxima página é WHERE (timestamp, id) < (cursor) ORDER BY timestamp DESC, id DESC:
+  custo constante em qualquer profundidade (sem OFFSET)
+- O token é base64url de "timestamp ISO|id"; o cliente só devolve o valor de X-Next-Cursor
+"""
+
+import base64
+from datetime import datetime
+from typing import Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = f'{ts.isoformat()}|{int(row_id)}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[datetime, int]:
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        ts, row_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|', 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        raise InvalidCursor('Cursor de paginação inválido')
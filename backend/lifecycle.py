@@ -0,0 +1,128 @@
+"""
+Módulo: lifecycle.py
+--------------------
+Sequência única de inicialização/encerramento do backend.
+
+- As fases são registradas uma vez (main.py) e executadas em ordem por run(); chamadas
+  repetidas (vários apps, reload, testes) não executam nada de novo
+- Cada fase é cronometrada; uma fase que falha é registrada e logada, e as seguintes continuam
+  (o backend sobe mesmo sem banco, como antes)
+- shutdown() executa os encerramentos registrados uma única vez, mesmo após falhas no startup
+- stats() (GET /admin/startup) traz o tempo de import/criação do app, a duração de cada fase
+  e a memória residente do processo ao fim de cada etapa
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Memória residente do processo (bytes); None se a plataforma não informar."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        pass
+    try:
+        import resource
+        # Pico (não o valor atual) onde /proc não existe; em KiB no Linux, bytes no macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+    except Exception:
+        return None
+
+
+def _mb(value: Optional[int]) -> Optional[float]:
+    return round(value / (1024 * 1024), 1) if value is not None else None
+
+
+class StartupSequence:
+    def __init__(self):
+        self._phases: List[Tuple[str, Callable[[], None]]] = []
+        self._shutdown: List[Tuple[str, Callable[[], None]]] = []
+        self._lock = threading.Lock()
+        self._state = 'pending'
+        self._results: List[dict] = []
+        self._import_seconds: Optional[float] = None
+        self._import_rss: Optional[int] = None
+        self._startup_seconds: Optional[float] = None
+
+    def phase(self, name: str, fn: Callable[[], None] = None):
+        """Registra uma fase do startup; utilizável como decorador (@startup.phase('nome'))."""
+        if fn is None:
+            return lambda f: self.phase(name, f)
+        with self._lock:
+            if any(n == name for n, _ in self._phases):
+                raise ValueError(f'Fase de startup duplicada: {name}')
+            self._phases.append((name, fn))
+        return fn
+
+    def on_shutdown(self, name: str, fn: Callable[[], None]):
+        with self._lock:
+            self._shutdown.append((name, fn))
+
+    def mark_imported(self, seconds: float):
+        """Tempo do import do main até o app pronto para receber o startup."""
+        self._import_seconds = seconds
+        self._import_rss = current_rss_bytes()
+
+    def run(self) -> bool:
+        with self._lock:
+            if self._state != 'pending':
+                return False
+            self._state = 'running'
+            phases = list(self._phases)
+        t_start = time.perf_counter()
+        for name, fn in phases:
+            t0 = time.perf_counter()
+            ok, error = True, None
+            try:
+                fn()
+            except Exception as e:
+                ok, error = False, f'{type(e).__name__}: {str(e).strip()}'
+                logging.warning(f"[STARTUP] Fase {name} falhou: {error}")
+            self._results.append({
+                'phase': name,
+                'ok': ok,
+                'ms': round((time.perf_counter() - t0) * 1000.0, 1),
+                'error': error,
+                'rss_mb': _mb(current_rss_bytes()),
+            })
+        self._startup_seconds = time.perf_counter() - t_start
+        with self._lock:
+            self._state = 'done'
+        logging.info(
+            f"[STARTUP] Pronto em {self._startup_seconds * 1000.0:.0f}ms: "
+            + ', '.join(f"{r['phase']}={r['ms']:.0f}ms{'' if r['ok'] else ' (falhou)'}" for r in self._results)
+        )
+        return True
+
+    def shutdown(self) -> bool:
+        with self._lock:
+            if self._state == 'stopped':
+                return False
+            self._state = 'stopped'
+            steps = list(self._shutdown)
+        for name, fn in steps:
+            try:
+                fn()
+            except Exception as e:
+                logging.warning(f"[STARTUP] Encerramento {name} falhou: {e}")
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'state': self._state,
+            'import_ms': round(self._import_seconds * 1000.0, 1) if self._import_seconds is not None else None,
+            'import_rss_mb': _mb(self._import_rss),
+            'startup_ms': round(self._startup_seconds * 1000.0, 1) if self._startup_seconds is not None else None,
+            'rss_mb': _mb(current_rss_bytes()),
+            'phases': [dict(r) for r in self._results],
+        }
+
+
+startup = StartupSequence()
@@ -1,1421 +1,170 @@
-﻿from dotenv import load_dotenv
+﻿import time
+# Início do import do backend: base do tempo de cold start em GET /admin/startup
+_IMPORT_T0 = time.perf_counter()
+
+from dotenv import load_dotenv
 load_dotenv()
 import os
-import io
-import sys
-import json
-import shutil
-import threading
-import time
 import logging
-import requests
-from datetime import datetime
-from typing import List, Dict, Union
 
-from fastapi import FastAPI, HTTPException, Request, Body, Depends, Query
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 try:
     from database import (
-        get_product_by_barcode, init_db, populate_example_data, get_db_connection, authenticate_admin,
-        get_system_status, export_products_to_txt, get_all_stores, update_store, delete_store,
-        get_all_devices, add_device, update_device, delete_device, set_device_online, set_device_offline,
-        add_audit_log, get_audit_logs, get_device_audit_logs, upsert_agent_status,
-        upsert_products, delete_agent_status, update_agent_status, update_device_catalog_sync,
-        get_device_by_identifier, bulk_upsert_agent_devices, get_agent_devices, delete_agent_device,
-        replace_agent_stores, get_agent_stores, dedupe_agents, dedupe_agents_by_ip, get_latest_agent_by_ip,
-        reassign_orphan_agent_devices_by_ip, add_store_with_code, update_store_code
+        init_db, populate_example_data, get_db_connection, dedupe_agents, dedupe_agents_by_ip,
+        reassign_orphan_agent_devices_by_ip, get_pool_stats, close_pool, get_product_cache_stats,
+        run_agent_identity_sweep, insert_audit_logs, maintain_audit_partitions, flush_price_query_stats,
+        add_pool_acquire_observer, explain_query
     )
     from static_middleware import mount_frontend
-    from ai_agent_integration import notify_ai_agent
+    from ai_agent_integration import notify_ai_agent, ai_events
+    from lifecycle import startup
+    from catalog_snapshot import catalog_store
+    from catalog_changes import prune_tombstones
+    from metrics import registry as metrics_registry, MetricsMiddleware, db_acquire, observe_db_query, observe_job, route_template
+    from db_instrument import add_query_observer
+    from request_timing import RequestTimingMiddleware, slow_queries
+    from db_async import db_executor, loop_monitor
+    from jobs import scheduler
+    from health import health_monitor, HEALTH_INTERVAL_S
+    from audit_writer import audit_writer
+    from heartbeats import start_heartbeat_buffers, stop_heartbeat_buffers, heartbeat_stats
+    from integration_config import create_integration_table
+    from admin_router import router as admin_router
+    from agents_router import router as agents_router
+    from devices_router import router as devices_router, price_queries
+    from stores_router import router as stores_router
+    from catalog_router import router as catalog_router, catalog_events
+    from users_router import router as users_router
+    from integrations_router import router as integrations_router, capture_import_logs
+    from banners_router import router as banners_router
+    from ia_monitor import router as ia_monitor_router
     from ia_event_log import router as ia_event_router
-    from auth_jwt import create_access_token, verify_access_token
     from backup_restore import router as backup_restore_router
     from device_store_router import router as device_store_router
-    from importador_precos import importar_todos_precos
-    from integration_config import (
-        create_integration_table, upsert_integration, get_integrations,
-        update_integration_by_id, delete_integration
-    )
 except ImportError:
     from database import (
-        get_product_by_barcode, init_db, populate_example_data, get_db_connection, authenticate_admin,
-        get_system_status, export_products_to_txt, get_all_stores, update_store, delete_store,
-        get_all_devices, add_device, update_device, delete_device, set_device_online, set_device_offline,
-        add_audit_log, get_audit_logs, get_device_audit_logs, upsert_agent_status,
-        upsert_products, delete_agent_status, update_agent_status, update_device_catalog_sync,
-        get_device_by_identifier, bulk_upsert_agent_devices, get_agent_devices, delete_agent_device,
-        replace_agent_stores, get_agent_stores, dedupe_agents, dedupe_agents_by_ip, get_latest_agent_by_ip,
-        reassign_orphan_agent_devices_by_ip, add_store_with_code, update_store_code
+        init_db, populate_example_data, get_db_connection, dedupe_agents, dedupe_agents_by_ip,
+        reassign_orphan_agent_devices_by_ip, get_pool_stats, close_pool, get_product_cache_stats,
+        run_agent_identity_sweep, insert_audit_logs, maintain_audit_partitions, flush_price_query_stats,
+        add_pool_acquire_observer, explain_query
     )
     from static_middleware import mount_frontend
-    from ai_agent_integration import notify_ai_agent
+    from ai_agent_integration import notify_ai_agent, ai_events
+    from lifecycle import startup
+    from catalog_snapshot import catalog_store
+    from catalog_changes import prune_tombstones
+    from metrics import registry as metrics_registry, MetricsMiddleware, db_acquire, observe_db_query, observe_job, route_template
+    from db_instrument import add_query_observer
+    from request_timing import RequestTimingMiddleware, slow_queries
+    from db_async import db_executor, loop_monitor
+    from jobs import scheduler
+    from health import health_monitor, HEALTH_INTERVAL_S
+    from audit_writer import audit_writer
+    from heartbeats import start_heartbeat_buffers, stop_heartbeat_buffers, heartbeat_stats
+    from integration_config import create_integration_table
+    from admin_router import router as admin_router
+    from agents_router import router as agents_router
+    from devices_router import router as devices_router, price_queries
+    from stores_router import router as stores_router
+    from catalog_router import router as catalog_router, catalog_events
+    from users_router import router as users_router
+    from integrations_router import router as integrations_router, capture_import_logs
+    from banners_router import router as banners_router
+    from ia_monitor import router as ia_monitor_router
     from ia_event_log import router as ia_event_router
-    from auth_jwt import create_access_token, verify_access_token
     from backup_restore import router as backup_restore_router
     from device_store_router import router as device_store_router
-    from importador_precos import importar_todos_precos
-    from integration_config import (
-        create_integration_table, upsert_integration, get_integrations,
-        update_integration_by_id, delete_integration
-    )
-
 
-# Capture limited import logs for /admin/importar-precos/logs
-_import_logs: List[str] = []
-class ImportLogCatcher(io.StringIO):
-    def write(self, txt):
-        super().write(txt)
-        _import_logs.append(txt)
-        if len(_import_logs) > 100:
-            _import_logs.pop(0)
 
-_old_stdout = sys.stdout
-sys.stdout = ImportLogCatcher()
-
-
-FRONTEND_PUBLIC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'public'))
-BANNERS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'banners'))
-os.makedirs(BANNERS_DIR, exist_ok=True)
+logging.basicConfig(level=logging.INFO)
 
 
-app = FastAPI()
-security = HTTPBearer()
+# Manutenção periódica fora do caminho das requisições (métricas em /admin/jobs)
+AGENT_SWEEP_INTERVAL_S = float(os.environ.get('PRECIX_AGENT_SWEEP_INTERVAL_S', '900'))
+TOMBSTONE_PRUNE_INTERVAL_S = float(os.environ.get('PRECIX_TOMBSTONE_PRUNE_INTERVAL_S', '21600'))
+scheduler.register('agent_identity_sweep', run_agent_identity_sweep, AGENT_SWEEP_INTERVAL_S)
+scheduler.register('prune_tombstones', prune_tombstones, TOMBSTONE_PRUNE_INTERVAL_S, initial_delay_s=60)
+# Partições futuras do audit_log e retenção por DROP de partição (PRECIX_AUDIT_RETENTION_DAYS)
+AUDIT_PARTITION_MAINTENANCE_S = float(os.environ.get('PRECIX_AUDIT_PARTITION_MAINTENANCE_S', '3600'))
+scheduler.register('audit_partitions', maintain_audit_partitions, AUDIT_PARTITION_MAINTENANCE_S, initial_delay_s=30)
+# Health probes internos (ia_monitor.py) com resultado em cache para /health e o painel da IA;
+# a primeira execução é disparada ao fim do startup (fase health_probes)
+scheduler.register('health_probes', health_monitor.run_once, HEALTH_INTERVAL_S, initial_delay_s=HEALTH_INTERVAL_S)
+
+
+# Métricas Prometheus (GET /metrics): requisições pelo MetricsMiddleware, tempos do banco e dos jobs
+# por ganchos; o restante é lido das estatísticas existentes no momento do scrape
+add_pool_acquire_observer(db_acquire.observe)
+add_query_observer(lambda seconds, query, ok: observe_db_query(seconds, ok))
+scheduler.on_run = observe_job
+
+
+def _metrics_collector():
+    pool = get_pool_stats()
+    yield ('db_pool_connections', 'gauge', 'Conexões do pool por estado',
+           [({'state': k}, pool[k]) for k in ('in_use', 'idle', 'opening', 'max')])
+    yield ('db_pool_events_total', 'counter', 'Eventos do pool de conexões',
+           [({'event': k}, pool[k]) for k in ('acquired', 'created', 'discarded', 'waits', 'timeouts', 'connect_errors')])
+    executor = db_executor.stats()
+    yield ('db_executor_tasks', 'gauge', 'Tarefas do executor do banco (run_db)',
+           [({'state': 'in_flight'}, executor['in_flight']), ({'state': 'queued'}, executor['queued'])])
+    cache = get_product_cache_stats()
+    yield ('product_cache_lookups_total', 'counter', 'Consultas ao cache de produtos por resultado',
+           [({'result': k}, cache[k]) for k in ('hits', 'negative_hits', 'misses', 'expired')])
+    yield ('product_cache_hit_ratio', 'gauge', 'Taxa de acerto do cache de produtos', [({}, cache['hit_ratio'])])
+    yield ('product_cache_entries', 'gauge', 'Itens no cache de produtos', [({}, cache['size'])])
+    snap = catalog_store.stats()
+    served = snap['served_200'] + snap['served_304']
+    yield ('catalog_snapshot_served_total', 'counter', 'Respostas de /product/all por status',
+           [({'status': '200'}, snap['served_200']), ({'status': '304'}, snap['served_304'])])
+    yield ('catalog_snapshot_not_modified_ratio', 'gauge', 'Fração de /product/all respondida com 304',
+           [({}, round(snap['served_304'] / served, 4) if served else 0.0)])
+    yield ('catalog_snapshot_builds_total', 'counter', 'Reconstruções do snapshot do catálogo', [({}, snap['builds'])])
+    audit = audit_writer.stats()
+    yield ('audit_queue_depth', 'gauge', 'Linhas do audit_log aguardando gravação', [({}, audit['depth'])])
+    yield ('audit_rows_total', 'counter', 'Linhas do audit_log por destino',
+           [({'outcome': k}, audit[k]) for k in ('flushed', 'dropped')])
+    hb = heartbeat_stats()
+    yield ('heartbeats_pending', 'gauge', 'Heartbeats aguardando gravação em lote',
+           [({'kind': kind}, stats['pending']) for kind, stats in hb.items()])
+    yield ('sse_clients', 'gauge', 'Clientes conectados em /product/events', [({}, catalog_events.stats()['clients'])])
+    yield ('event_loop_lag_seconds', 'gauge', 'Último atraso medido do event loop',
+           [({}, loop_monitor.stats()['lag_last_ms'] / 1000.0)])
+    ai = ai_events.stats()
+    yield ('ai_events_total', 'counter', 'Eventos para o agente de IA por destino',
+           [({'outcome': k}, ai[k]) for k in ('sent', 'dropped', 'failed')])
+    yield ('ai_events_queue_depth', 'gauge', 'Eventos aguardando envio ao agente de IA', [({}, ai['depth'])])
+    yield ('ai_circuit_open', 'gauge', 'Circuit breaker do agente de IA aberto (1) ou não (0)',
+           [({}, 1 if ai['breaker']['state'] == 'open' else 0)])
+    jobs = scheduler.stats()['jobs']
+    yield ('job_failures_total', 'counter', 'Falhas por job', [({'job': n}, j['failures']) for n, j in jobs.items()])
+
+
+metrics_registry.add_collector(_metrics_collector)
+# SELECTs lentos ganham EXPLAIN em segundo plano (PRECIX_SLOW_QUERY_EXPLAIN_MS)
+slow_queries.explain_fn = explain_query
+
+
+# Sequência única de inicialização (lifecycle.py): cada fase roda uma vez por processo e tem a
+# duração registrada em GET /admin/startup; falhas (ex.: banco fora do ar) não impedem as seguintes
+@startup.phase('init_db')
+def _init_db():
+    init_db()
+    populate_example_data()
 
-# Routers
-app.include_router(ia_event_router)
-app.include_router(backup_restore_router)
-app.include_router(device_store_router)
 
-# Try to ensure integration table exists (may require elevated DB privileges)
-try:
+@startup.phase('integration_table')
+def _integration_table():
+    # Pode exigir privilégios elevados no banco
     create_integration_table()
-except Exception:
-    pass
-
-
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    username = verify_access_token(token)
-    if not username:
-        raise HTTPException(status_code=401, detail="Token inválido ou expirado")
-    return username
-
-
-@app.get('/favicon.ico')
-def favicon():
-    file_path = os.path.join(FRONTEND_PUBLIC_DIR, 'favicon.ico')
-    if os.path.exists(file_path):
-        return FileResponse(file_path)
-    raise HTTPException(status_code=404, detail='favicon not found')
-
-
-@app.get('/health')
-def health():
-    return {"status": "ok"}
-
-
-@app.on_event("startup")
-def on_startup():
-    try:
-        init_db()
-        populate_example_data()
-        dedupe_agents(); dedupe_agents_by_ip(); reassign_orphan_agent_devices_by_ip()
-    except Exception:
-        pass
-
-
-@app.get("/status")
-async def system_status():
-    return JSONResponse(content=get_system_status())
-
-
-@app.post("/notify-ai-agent/")
-async def notify_agent(request: Request):
-    data = await request.json()
-    try:
-        response = notify_ai_agent(data)
-    except Exception as e:
-        response = {"success": False, "error": str(e)}
-    return JSONResponse(content=response)
-
-
-# Agents endpoints
-@app.get('/admin/agents')
-def listar_agentes(include_fakes: bool = Query(False)):
-    try:
-        reassign_orphan_agent_devices_by_ip()
-    except Exception:
-        pass
-    # Usa apenas PostgreSQL, não mais o arquivo JSON
-    from database import get_all_agents_status as get_pg_agents_status
-    rows = get_pg_agents_status()
-    out = []
-    seen = set()
-    from datetime import datetime, timezone
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
-    for r in rows:
-        rec = dict(r)
-        rec['id'] = (rec.get('agent_id') or rec.get('id') or '').strip().lower()
-        if not rec['id'] or rec['id'] in seen:
-            continue
-        seen.add(rec['id'])
-        last = rec.get('last_update') or rec.get('ultima_atualizacao')
-        status_calc = None
-        normalized_last = None
-        try:
-            if last:
-                try:
-                    dt = datetime.strptime(str(last), '%Y-%m-%d %H:%M:%S')
-                    dt = dt.replace(tzinfo=timezone.utc)
-                except Exception:
-                    try:
-                        dt = datetime.strptime(str(last), '%d/%m/%Y, %H:%M:%S')
-                        dt = dt.replace(tzinfo=timezone.utc)
-                    except Exception:
-                        dt = datetime.fromisoformat(str(last))
-                        if dt.tzinfo is None:
-                            dt = dt.replace(tzinfo=timezone.utc)
-                diff = (now - dt).total_seconds()
-                status_calc = 'online' if diff <= 120 else 'offline'
-                normalized_last = dt.isoformat(timespec='seconds')
-        except Exception:
-            status_calc = None
-            normalized_last = None
-        if normalized_last:
-            rec['last_update'] = normalized_last
-            rec['ultima_atualizacao'] = dt.strftime('%d/%m/%Y, %H:%M:%S')
-        rec['status'] = status_calc or rec.get('status') or 'offline'
-        try:
-            rec['lojas'] = get_agent_stores(rec['id'])
-            if not rec.get('loja_nome') and rec.get('lojas'):
-                rec['loja_nome'] = rec['lojas'][0].get('loja_nome')
-                rec['loja_codigo'] = rec.get('loja_codigo') or rec['lojas'][0].get('loja_codigo')
-        except Exception:
-            rec['lojas'] = []
-        try:
-            rec['devices'] = get_agent_devices(rec['id'])
-        except Exception:
-            rec['devices'] = []
-        if not include_fakes and rec['id'] in ('cli-check-01', 'fake-agent', 'simulador'):
-            continue
-        out.append(rec)
-    return out
-
-
-def _client_ip(req: Request):
-    try:
-        if not req:
-            return None
-        xf = req.headers.get('x-forwarded-for') or req.headers.get('X-Forwarded-For')
-        if xf:
-            parts = [p.strip() for p in xf.split(',') if p.strip()]
-            if parts:
-                return parts[0]
-        xr = req.headers.get('x-real-ip') or req.headers.get('X-Real-IP')
-        if xr:
-            return xr.strip()
-        return req.client.host if req.client else None
-    except Exception:
-        return req.client.host if req and req.client else None
-
-
-@app.post('/admin/agents/status')
-async def upsert_agent_status_handler(request: Request):
-    try:
-        data = await request.json()
-    except Exception:
-        raise HTTPException(status_code=400, detail='Invalid JSON payload')
-    agent_id = (data.get('agent_id') or '').strip().lower()
-    if not agent_id:
-        raise HTTPException(status_code=400, detail='agent_id é obrigatório')
-    loja_codigo = data.get('loja_codigo')
-    loja_nome = data.get('loja_nome') or data.get('store_name')
-    status = data.get('status') or 'online'
-    last_update = data.get('last_update') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    req_ip = _client_ip(request)
-    ip = req_ip or data.get('ip')
-    try:
-        same_ip_id = get_latest_agent_by_ip(ip)
-        if same_ip_id:
-            agent_id = same_ip_id
-    except Exception:
-        pass
-    try:
-        upsert_agent_status(agent_id, loja_codigo=loja_codigo, loja_nome=loja_nome, status=status, last_update=last_update, ip=ip)
-        try:
-            dedupe_agents(); dedupe_agents_by_ip(); reassign_orphan_agent_devices_by_ip()
-        except Exception:
-            pass
-        lojas = data.get('lojas')
-        if isinstance(lojas, list):
-            replace_agent_stores(agent_id, lojas)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.get('/admin/agents/summary')
-def agents_summary():
-    rows = listar_agentes()
-    total = len(rows)
-    online = sum(1 for r in rows if str(r.get('status')).lower() == 'online')
-    offline = total - online
-    return {"total": total, "online": online, "offline": offline}
-
-
-@app.delete('/admin/agents/{agent_id}')
-def delete_agent(agent_id: str):
-    try:
-        delete_agent_status(agent_id)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.put('/admin/agents/{agent_id}')
-def edit_agent(agent_id: str, data: dict = Body(...)):
-    try:
-        loja_codigo = data.get('loja_codigo')
-        loja_nome = data.get('loja_nome')
-        status = data.get('status')
-        ip = data.get('ip')
-        last_update = data.get('last_update')
-        update_agent_status(agent_id, loja_codigo=loja_codigo, loja_nome=loja_nome, status=status, ip=ip, last_update=last_update)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post('/admin/agents/{agent_id}/devices')
-def upsert_agent_devices(agent_id: str, payload: dict = Body(...), request: Request = None):
-    try:
-        try:
-            req_ip = _client_ip(request)
-            canon = get_latest_agent_by_ip(req_ip)
-            if canon:
-                agent_id = canon
-        except Exception:
-            pass
-        devices = payload.get('devices') or []
-        devices = [d for d in devices if str(d.get('identifier') or '').strip()]
-        bulk_upsert_agent_devices(agent_id, devices)
-        try:
-            reassign_orphan_agent_devices_by_ip()
-        except Exception:
-            pass
-        return {"success": True, "count": len(devices)}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post('/admin/agents/{agent_id}/devices/heartbeat')
-def agent_device_heartbeat(agent_id: str, data: dict = Body(...), request: Request = None):
-    try:
-        ip = (data.get('ip') or '').strip()
-        port = str(data.get('port') or '21').strip()
-        identifier = (data.get('identifier') or '').strip()
-        if not identifier:
-            if not ip:
-                raise HTTPException(status_code=400, detail='identifier ou ip são obrigatórios')
-            identifier = f'PC-{ip}:{port}'
-        name = data.get('name') or 'PC'
-        status = data.get('status') or 'online'
-        from datetime import datetime as _dt
-        now = _dt.now().isoformat()
-        try:
-            req_ip = _client_ip(request)
-            canon = get_latest_agent_by_ip(req_ip)
-            if canon:
-                agent_id = canon
-        except Exception:
-            pass
-        from database import upsert_agent_device
-        upsert_agent_device(
-            agent_id=agent_id,
-            identifier=identifier,
-            name=name,
-            tipo='LEGACY',
-            status=status,
-            last_update=now,
-            ip=ip
-        )
-        try:
-            reassign_orphan_agent_devices_by_ip()
-        except Exception:
-            pass
-        return {"success": True, "identifier": identifier, "last_update": now}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.get('/admin/agents/{agent_id}/devices')
-def list_agent_devices(agent_id: str):
-    try:
-        return get_agent_devices(agent_id)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.delete('/admin/agents/{agent_id}/devices/{identifier}')
-def remove_agent_device(agent_id: str, identifier: str):
-    try:
-        delete_agent_device(agent_id, identifier)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-# Device events (in-memory)
-_device_events: List[dict] = []
-
-def _push_device_event(event: dict):
-    try:
-        from datetime import datetime as _dt
-        event['timestamp'] = event.get('timestamp') or _dt.utcnow().isoformat()
-        _device_events.append(event)
-        if len(_device_events) > 500:
-            _device_events.pop(0)
-    except Exception:
-        pass
-
-
-@app.post('/admin/devices/events/price-query')
-def log_price_query(data: dict = Body(...)):
-    identifier = (data.get('identifier') or '').strip()
-    barcode = (data.get('barcode') or '').strip()
-    ok = bool(data.get('ok'))
-    price = data.get('price')
-    error = data.get('error')
-    if not identifier or not barcode:
-        raise HTTPException(status_code=400, detail='identifier e barcode são obrigatórios')
-    action = 'PRICE_QUERY_OK' if ok else 'PRICE_QUERY_FAIL'
-    add_audit_log(None, identifier, action, json.dumps({'barcode': barcode, 'price': price, 'error': error}, ensure_ascii=False))
-    _push_device_event({'type': 'price_query', 'identifier': identifier, 'barcode': barcode, 'ok': ok, 'price': price, 'error': error})
-    return {"success": True}
-
-
-@app.post('/admin/devices/events/catalog-sync')
-def log_catalog_sync(data: dict = Body(...)):
-    identifier = (data.get('identifier') or '').strip()
-    total = data.get('total_products')
-    timestamp = data.get('timestamp')
-    if not identifier:
-        raise HTTPException(status_code=400, detail='identifier é obrigatório')
-    update_device_catalog_sync(identifier, total_products=int(total or 0), timestamp=timestamp)
-    _push_device_event({'type': 'catalog_sync', 'identifier': identifier, 'total_products': int(total or 0)})
-    return {"success": True}
-
-
-@app.get('/admin/devices/events')
-def list_device_events(limit: int = Query(100, ge=1, le=500), identifier: str = Query(None), store_id: int = Query(None)):
-    evts = _device_events[-500:]
-    if identifier:
-        evts = [e for e in evts if str(e.get('identifier')) == str(identifier)]
-    if store_id is not None:
-        try:
-            devices = get_all_devices()
-            idents = {d.get('identifier') for d in devices if str(d.get('store_id')) == str(store_id)}
-            evts = [e for e in evts if e.get('identifier') in idents]
-        except Exception:
-            pass
-    return list(reversed(evts[-limit:]))
-
-
-@app.post('/admin/devices/events/health')
-def device_health_event(event: dict = Body(...)):
-    try:
-        identifier = (event.get('identifier') or '').strip()
-        status = (event.get('status') or '').strip().lower()
-        if not identifier or status not in ('online', 'offline'):
-            raise HTTPException(status_code=400, detail='identifier e status (online/offline) são obrigatórios')
-        ev = {
-            'type': 'health',
-            'identifier': identifier,
-            'status': status,
-            'previous': event.get('previous'),
-            'agent_id': event.get('agent_id'),
-            'ip': event.get('ip'),
-            'timestamp': event.get('ts'),
-        }
-        _push_device_event(ev)
-        return {"success": True}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-# Importação de preços
-@app.post('/admin/importar-precos')
-def acionar_importacao():
-    try:
-        importar_todos_precos()
-        return {"success": True, "message": "Importação executada."}
-    except Exception as e:
-        return {"success": False, "message": str(e)}
-
-
-@app.get('/admin/importar-precos/logs')
-def get_import_logs():
-    return {"logs": _import_logs[-50:]}
-
-
-# Integrações de preço
-@app.get('/admin/integracoes')
-def listar_integracoes(loja_id: int = Query(None)):
-    try:
-        result = get_integrations(loja_id)
-        print(f"[DEBUG] Listando integrações: loja_id={loja_id}, resultado={len(result)} registros")
-        return result
-    except Exception as e:
-        print(f"[ERROR] Erro ao listar integrações: {e}")
-        return []
-
-
-@app.post('/admin/integracoes')
-def salvar_integracao(data: dict = Body(...)):
-    id_ = data.get('id')
-    raw_loja = data.get('loja_id')
-    if raw_loja in (None, '', 'null'):
-        loja_id = None
-    else:
-        try:
-            loja_id = int(raw_loja)
-        except Exception:
-            loja_id = None
-    tipo = data.get('tipo')
-    parametro1 = data.get('parametro1')
-    parametro2 = data.get('parametro2')
-    ativo = data.get('ativo', 1)
-    layout = data.get('layout')
-    if not tipo or not parametro1:
-        return {"success": False, "message": "Campos obrigatórios: tipo e parametro1"}
-    if id_ is not None:
-        update_integration_by_id(id_, loja_id, tipo, parametro1, parametro2, ativo, layout)
-    else:
-        upsert_integration(loja_id, tipo, parametro1, parametro2, ativo, layout)
-    return {"success": True}
-
-
-@app.post('/admin/integracoes/testar-api')
-def testar_integracao_api(data: dict = Body(...)):
-    url = (data.get('url') or data.get('parametro1') or '').strip()
-    token = (data.get('token') or data.get('parametro2') or '').strip()
-    if not url:
-        return {"success": False, "message": "Informe a URL da API."}
-    headers = {}
-    if token:
-        headers['Authorization'] = f'Bearer {token}'
-    try:
-        r = requests.get(url, headers=headers, timeout=8)
-        r.raise_for_status()
-        try:
-            js = r.json()
-        except Exception:
-            return {"success": False, "message": "A resposta não é JSON válido."}
-        count = len(js) if isinstance(js, list) else (len(js.keys()) if isinstance(js, dict) else 1)
-        sample = js[0] if isinstance(js, list) and js else js
-        return {"success": True, "status": r.status_code, "count": int(count), "sample": sample if isinstance(sample, dict) else None}
-    except Exception as e:
-        return {"success": False, "message": str(e)}
-
-
-@app.put('/admin/integracoes/{integracao_id}')
-async def atualizar_integracao(integracao_id: int, request: Request):
-    """Atualizar uma integração existente."""
-    try:
-        data = await request.json()
-        
-        # Converter ativo para int
-        ativo = data.get('ativo', True)
-        ativo_int = 1 if ativo else 0
-        
-        update_integration_by_id(
-            integracao_id,
-            data.get('loja_id'),
-            data.get('tipo'),
-            data.get('parametro1'),
-            data.get('parametro2'),
-            ativo_int,
-            data.get('layout', '{}')
-        )
-        
-        return {"success": True, "message": "Integração atualizada com sucesso"}
-    except Exception as e:
-        import traceback
-        logging.error(f"Erro ao atualizar integração {integracao_id}: {str(e)}")
-        logging.error(f"Traceback: {traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.delete('/admin/integracoes/{integracao_id}')
-def deletar_integracao(integracao_id: int):
-    try:
-        delete_integration(integracao_id)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
-
-
-# Device registration by store code
-@app.post('/admin/devices/register')
-async def register_device_by_store_code(request: Request):
-    data = await request.json()
-    store_codigo = data.get('store_codigo')
-    name = data.get('name')
-    identifier = data.get('identifier')
-    if not store_codigo or not name or not identifier:
-        return {"success": False, "message": "Todos os campos são obrigatórios (store_codigo, name, identifier)."}
-    from database import get_store_by_code
-    store = get_store_by_code(str(store_codigo).strip())
-    if not store:
-        return {"success": False, "message": f"Loja com código {store_codigo} não encontrada."}
-    store_id = store['id']
-    add_device(store_id, name, identifier=identifier)
-    return {"success": True, "message": "Equipamento registrado com sucesso."}
-
-
-# Banners
-@app.get('/admin/banners')
-def list_banners(store_id: str = Query(None)):
-    files = [f for f in os.listdir(BANNERS_DIR) if f.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".webp"))]
-    meta_path = os.path.join(BANNERS_DIR, 'banners_meta.json')
-    meta = {}
-    if os.path.exists(meta_path):
-        try:
-            with open(meta_path, 'r', encoding='utf-8') as f:
-                meta = json.load(f)
-        except Exception:
-            meta = {}
-    filtered = []
-    logging.info(f"[BANNERS] list_banners chamado com store_id={store_id}")
-    for f in files:
-        m = meta.get(f, {})
-        meta_store_id = str(m.get('store_id')).strip() if m.get('store_id') is not None else None
-        req_store_id = str(store_id).strip() if store_id is not None else None
-        all_stores_flag = bool(m.get('all_stores'))
-        logging.info(f"[BANNERS][DEBUG] Banner: {f} | meta_store_id: '{meta_store_id}' | req_store_id: '{req_store_id}' | all_stores: {all_stores_flag}")
-        if all_stores_flag:
-            filtered.append({"filename": f, "url": f"/admin/banners/{f}"})
-        elif req_store_id and meta_store_id and meta_store_id == req_store_id:
-            filtered.append({"filename": f, "url": f"/admin/banners/{f}"})
-    logging.info(f"[BANNERS] Retornando {len(filtered)} banners para store_id={store_id}")
-    return filtered
-
-
-@app.get('/admin/banners/{filename}')
-def get_banner(filename: str):
-    file_path = os.path.join(BANNERS_DIR, filename)
-    if not os.path.exists(file_path):
-        return {"success": False, "message": "Arquivo não encontrado."}
-    return FileResponse(file_path)
-
-
-@app.delete('/admin/banners/{filename}')
-def delete_banner(filename: str):
-    file_path = os.path.join(BANNERS_DIR, filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
-        return {"success": True}
-    return {"success": False, "message": "Arquivo não encontrado."}
-
-
-@app.post('/admin/banners/upload')
-async def upload_banner(request: Request, username: str = Depends(get_current_user)):
-    form = await request.form()
-    file = form.get('file')
-    store_id = form.get('store_id')
-    all_stores = form.get('all_stores')
-    logging.info(f"[UPLOAD] username={username} file={getattr(file, 'filename', None)} store_id={store_id} all_stores={all_stores}")
-    if not file or not hasattr(file, 'filename'):
-        raise HTTPException(status_code=400, detail="Arquivo de imagem obrigatório.")
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-        raise HTTPException(status_code=400, detail="Formato de arquivo não suportado.")
-    if not store_id and not all_stores:
-        raise HTTPException(status_code=400, detail="É obrigatório informar a loja ou marcar 'todas as lojas'.")
-    file_path = os.path.join(BANNERS_DIR, file.filename)
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        logging.error(f"[UPLOAD] Erro ao salvar arquivo: {e}")
-        raise HTTPException(status_code=500, detail="Erro ao salvar arquivo.")
-    meta_path = os.path.join(BANNERS_DIR, 'banners_meta.json')
-    try:
-        if os.path.exists(meta_path):
-            with open(meta_path, 'r', encoding='utf-8') as f:
-                meta = json.load(f)
-        else:
-            meta = {}
-    except Exception as e:
-        logging.error(f"[UPLOAD] Erro ao ler banners_meta.json: {e}")
-        meta = {}
-    store_id_clean = str(store_id).strip() if store_id else None
-    all_stores_flag = str(all_stores).lower() in ['1', 'true', 'on', 'yes'] if all_stores is not None else False
-    meta[file.filename] = {
-        'store_id': store_id_clean,
-        'all_stores': all_stores_flag,
-        'uploaded_by': username
-    }
-    try:
-        with open(meta_path, 'w', encoding='utf-8') as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logging.error(f"[UPLOAD] Erro ao salvar banners_meta.json: {e}")
-        raise HTTPException(status_code=500, detail="Erro ao salvar metadados.")
-    return {"success": True, "filename": file.filename}
-
-
-# Products
-@app.post('/admin/products/bulk')
-def admin_products_bulk(payload: Union[List[Dict], Dict, str] = Body(...), username: str = Depends(get_current_user)):
-    try:
-        data_list: List[Dict] = []
-        if isinstance(payload, list):
-            data_list = [p for p in payload if isinstance(p, dict)]
-        elif isinstance(payload, dict):
-            if isinstance(payload.get('produtos'), list):
-                data_list = [p for p in payload.get('produtos') if isinstance(p, dict)]
-            elif isinstance(payload.get('products'), list):
-                data_list = [p for p in payload.get('products') if isinstance(p, dict)]
-            else:
-                data_list = [payload]
-        elif isinstance(payload, str):
-            try:
-                parsed = json.loads(payload)
-                if isinstance(parsed, list):
-                    data_list = [p for p in parsed if isinstance(p, dict)]
-                elif isinstance(parsed, dict):
-                    if isinstance(parsed.get('produtos'), list):
-                        data_list = [p for p in parsed.get('produtos') if isinstance(p, dict)]
-                    elif isinstance(parsed.get('products'), list):
-                        data_list = [p for p in parsed.get('products') if isinstance(p, dict)]
-                    else:
-                        data_list = [parsed]
-            except Exception:
-                raise HTTPException(status_code=400, detail='Payload inválido (string não é JSON válido)')
-        if not data_list:
-            raise HTTPException(status_code=400, detail='Nenhum produto válido no payload')
-        result = upsert_products(data_list)
-        try:
-            add_audit_log(None, None, 'PRODUCTS_BULK_UPSERT', json.dumps({'user': username, 'result': result}, ensure_ascii=False))
-        except Exception:
-            pass
-        return JSONResponse(content={'success': True, 'result': result})
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.exception('Erro no endpoint admin/products/bulk')
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.get('/product/all')
-def get_all_products():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT barcode, name, price, promo FROM products')
-    rows = cur.fetchall()
-    conn.close()
-    produtos = []
-    for row in rows:
-        if isinstance(row, dict):
-            produto = row
-        else:
-            produto = {'barcode': row[0], 'name': row[1], 'price': row[2], 'promo': row[3]}
-        preco = produto.get('price')
-        if preco and preco < 1:
-            produto['price'] = round(preco * 100, 2)
-        produtos.append(produto)
-    try:
-        notify_ai_agent('sync_success', {'source': 'backend', 'info': 'Produtos sincronizados'})
-    except Exception:
-        pass
-    return produtos
-
-
-@app.get('/api/produtos')
-def alias_api_produtos():
-    return get_all_products()
 
 
-# Admin auth and users
-@app.post('/admin/login')
-async def admin_login(request: Request):
-    data = await request.json()
-    username = data.get('username')
-    password = data.get('password')
-    if not username or not password:
-        return JSONResponse(status_code=400, content={"success": False, "message": "Usuário e senha obrigatórios"})
+@startup.phase('admin_user')
+def _ensure_admin_user():
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT username, password, role, store_id, permissoes FROM admin_users WHERE username = %s', (username,))
-    row = cur.fetchone()
-    conn.close()
-    user = None
-    if row:
-        # Sempre converte para dict
-        user = {
-            'username': row[0],
-            'password': row[1],
-            'role': row[2] if len(row) > 2 else 'admin',
-            'store_id': row[3] if len(row) > 3 else None,
-            'permissoes': row[4] if len(row) > 4 else None,
-        }
-    if user and authenticate_admin(username, password):
-        role = user.get('role') or 'admin'
-        store_id = user.get('store_id')
-        permissoes = user.get('permissoes')
-        if permissoes:
-            try:
-                permissoes = json.loads(permissoes)
-            except Exception:
-                permissoes = []
-        else:
-            permissoes = []
-        access_token = create_access_token({"sub": username, "role": role})
-        store_codigo = None
-        if store_id:
-            try:
-                if isinstance(store_id, str) and not store_id.isdigit():
-                    from database import get_store_by_code
-                    store = get_store_by_code(store_id)
-                    store_codigo = store['codigo'] if store else None
-                else:
-                    conn2 = get_db_connection()
-                    cur2 = conn2.cursor()
-                    cur2.execute('SELECT codigo FROM stores WHERE id = %s', (store_id,))
-                    row2 = cur2.fetchone()
-                    conn2.close()
-                    if row2:
-                        store_codigo = row2[0] if not isinstance(row2, dict) else row2.get('codigo')
-            except Exception:
-                store_codigo = None
-        return {
-            "success": True,
-            "access_token": access_token,
-            "token_type": "bearer",
-            "role": role,
-            "store_id": store_id,
-            "store_codigo": store_codigo,
-            "permissoes": permissoes,
-            "username": username
-        }
-    else:
-        return JSONResponse(status_code=401, content={"success": False, "message": "Usuário ou senha inválidos"})
-
-
-from jose import jwt
-SECRET_KEY = "precix_super_secret_key_2025"
-ALGORITHM = "HS256"
-
-
-def require_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        if payload.get('role') != 'admin':
-            raise HTTPException(status_code=403, detail='Acesso restrito a administradores')
-    except Exception:
-        raise HTTPException(status_code=401, detail='Token inválido ou expirado')
-
-
-def require_admin_or_perm(perm: str):
-    def _inner(credentials: HTTPAuthorizationCredentials = Depends(security)):
-        token = credentials.credentials
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username = payload.get('sub')
-            role = payload.get('role')
-            if role == 'admin':
-                return username
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute('SELECT permissoes FROM admin_users WHERE username = %s', (username,))
-            row = cur.fetchone()
-            conn.close()
-            perms = []
-            if row:
-                p = row[0] if not isinstance(row, dict) else row.get('permissoes')
-                if p:
-                    try:
-                        perms = json.loads(p) if isinstance(p, str) else p
-                    except Exception:
-                        perms = []
-            if perm in perms:
-                return username
-            raise HTTPException(status_code=403, detail='Acesso restrito: falta permissão')
-        except HTTPException:
-            raise
-        except Exception:
-            raise HTTPException(status_code=401, detail='Token inválido ou expirado')
-    return _inner
-
-
-@app.post('/admin/token/refresh')
-def refresh_token(current_user: str = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT role FROM admin_users WHERE username = %s', (current_user,))
-    row = cur.fetchone()
-    conn.close()
-    role = None
-    if row:
-        role = row[0] if not isinstance(row, dict) else row.get('role')
-    role = role or 'admin'
-    new_token = create_access_token({"sub": current_user, "role": role})
-    return {"success": True, "access_token": new_token, "token_type": "bearer", "role": role}
-
-
-@app.get('/admin/users')
-def list_admin_users(current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT username, role, store_id, permissoes FROM admin_users')
-    users = []
-    for row in cur.fetchall():
-        # Sempre converte para dict
-        u = {'username': row[0], 'role': row[1] if len(row) > 1 else 'admin', 'store_id': row[2] if len(row) > 2 else None, 'permissoes': row[3] if len(row) > 3 else None}
-        permissoes = u.get('permissoes')
-        if permissoes:
-            try:
-                permissoes = json.loads(permissoes)
-            except Exception:
-                permissoes = []
-        else:
-            permissoes = []
-        users.append({
-            'username': u.get('username'),
-            'role': u.get('role') or 'admin',
-            'store_id': u.get('store_id'),
-            'permissoes': permissoes
-        })
-    conn.close()
-    return {'users': users}
-
-
-@app.post('/admin/users')
-def create_admin_user_endpoint(data: dict = Body(...), current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    from database import hash_password
-    username = data.get('username')
-    password = data.get('password')
-    role = data.get('role', 'admin')
-    if not username or not password:
-        raise HTTPException(status_code=400, detail='Usuário e senha obrigatórios')
-    hashed = hash_password(password)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute('INSERT INTO admin_users (username, password, role) VALUES (%s, %s, %s)', (username, hashed, role))
-        conn.commit()
-    except Exception as e:
-        conn.close()
-        if 'duplicate key' in str(e).lower():
-            raise HTTPException(status_code=409, detail='Usuário já existe')
-        raise HTTPException(status_code=500, detail='Erro ao criar usuário')
-    conn.close()
-    return {'success': True, 'message': 'Usuário criado com sucesso'}
-
-
-@app.put('/admin/users/{username}')
-def update_admin_user(username: str, data: dict = Body(...), current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    from database import hash_password
-    password = data.get('password')
-    role = data.get('role')
-    permissoes = data.get('permissoes')
-    store_id = data.get('store_id')
-    if permissoes is not None and not isinstance(permissoes, str):
-        permissoes = json.dumps(permissoes)
-    if not password and not role and permissoes is None and store_id is None:
-        raise HTTPException(status_code=400, detail='Nada para atualizar')
-    conn = get_db_connection()
-    cur = conn.cursor()
-    if password and role and permissoes is not None and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, role = %s, permissoes = %s, store_id = %s WHERE username = %s', (hashed, role, permissoes, store_id, username))
-    elif password and role and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, role = %s, store_id = %s WHERE username = %s', (hashed, role, store_id, username))
-    elif password and permissoes is not None and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, permissoes = %s, store_id = %s WHERE username = %s', (hashed, permissoes, store_id, username))
-    elif role and permissoes is not None and store_id is not None:
-        cur.execute('UPDATE admin_users SET role = %s, permissoes = %s, store_id = %s WHERE username = %s', (role, permissoes, store_id, username))
-    elif password and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, store_id = %s WHERE username = %s', (hashed, store_id, username))
-    elif role and store_id is not None:
-        cur.execute('UPDATE admin_users SET role = %s, store_id = %s WHERE username = %s', (role, store_id, username))
-    elif permissoes is not None and store_id is not None:
-        cur.execute('UPDATE admin_users SET permissoes = %s, store_id = %s WHERE username = %s', (permissoes, store_id, username))
-    elif store_id is not None:
-        cur.execute('UPDATE admin_users SET store_id = %s WHERE username = %s', (store_id, username))
-    elif password and role and permissoes is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, role = %s, permissoes = %s WHERE username = %s', (hashed, role, permissoes, username))
-    elif password and role:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, role = %s WHERE username = %s', (hashed, role, username))
-    elif password and permissoes is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, permissoes = %s WHERE username = %s', (hashed, permissoes, username))
-    elif role and permissoes is not None:
-        cur.execute('UPDATE admin_users SET role = %s, permissoes = %s WHERE username = %s', (role, permissoes, username))
-    if cur.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail='Usuário não encontrado')
-    conn.commit()
-    conn.close()
-    return {'success': True, 'message': 'Usuário atualizado com sucesso'}
-
-
-@app.delete('/admin/users/{username}')
-def delete_admin_user(username: str, current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM admin_users WHERE username = %s', (username,))
-    if cur.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail='Usuário não encontrado')
-    conn.commit()
-    conn.close()
-    return {'success': True, 'message': 'Usuário removido com sucesso'}
-
-
-# Stores
-@app.get('/admin/stores')
-def api_get_stores():
-    return get_all_stores()
-
-
-@app.post('/admin/stores')
-async def api_add_store(request: Request):
-    data = await request.json()
-    codigo = data.get('codigo') or data.get('code')
-    name = data.get('name')
-    status = data.get('status') or 'ativo'
-    if not codigo or not name:
-        return {"success": False, "message": "Código e nome da loja são obrigatórios."}
-    try:
-        add_store_with_code(str(codigo), name, status)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-
-@app.put('/admin/stores/{store_id}')
-async def api_update_store(store_id: int, request: Request):
-    data = await request.json()
-    codigo = data.get('codigo') or data.get('code')
-    name = data.get('name')
-    status = data.get('status') or 'ativo'
-    try:
-        if codigo is not None:
-            update_store_code(store_id, str(codigo), name, status)
-        else:
-            update_store(store_id, name, status)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-
-@app.delete('/admin/stores/{store_id}')
-def api_delete_store(store_id: int):
-    delete_store(store_id)
-    return {"success": True}
-
-
-# Devices
-@app.get('/admin/devices')
-def api_get_devices():
-    return get_all_devices()
-
-
-@app.post('/admin/devices')
-async def api_add_device(request: Request):
-    data = await request.json()
-    store_id = data.get('store_id')
-    name = data.get('name')
-    identifier = data.get('identifier')
-    if not store_id or not name or not identifier:
-        return {"success": False, "message": "Todos os campos são obrigatórios."}
-    add_device(store_id, name, identifier=identifier)
     try:
-        notify_ai_agent('device_added', {'store_id': store_id, 'name': name, 'identifier': identifier})
-    except Exception:
-        pass
-    return {"success": True}
-
-
-@app.put('/admin/devices/{device_id}')
-def api_update_device(device_id: int, name: str, status: str, last_sync: str = None, online: int = None, store_id: int = None, identifier: str = None):
-    update_device(device_id, name, status, last_sync, online, store_id=store_id, identifier=identifier)
-    return {"success": True}
-
-
-@app.delete('/admin/devices/{device_id}')
-def api_delete_device(device_id: int):
-    delete_device(device_id)
-    return {"success": True}
-
-
-@app.post('/device/heartbeat/{identifier}')
-def device_heartbeat(identifier: str):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT id FROM devices WHERE identifier = %s', (identifier,))
-    row = cur.fetchone()
-    conn.close()
-    if not row:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT id FROM devices WHERE TRIM(LOWER(identifier)) = %s', (identifier.strip().lower(),))
-        row = cur.fetchone()
-        conn.close()
-        if not row:
-            raise HTTPException(status_code=404, detail='Dispositivo não encontrado')
-    set_device_online(identifier)
-    try:
-        notify_ai_agent('device_heartbeat', {'identifier': identifier})
-    except Exception:
-        pass
-    return {"success": True}
-
-
-@app.get('/admin/export-txt')
-def export_txt():
-    txt_path = export_products_to_txt()
-    try:
-        notify_ai_agent('export', {'file': txt_path})
-    except Exception:
-        pass
-    return FileResponse(txt_path, media_type='text/plain', filename='produtos.txt')
-
-
-@app.get('/admin/audit-logs')
-def api_get_audit_logs(limit: int = 50):
-    return get_audit_logs(limit)
-
-
-@app.post('/admin/integracoes/log')
-def log_integration_event(data: dict = Body(...)):
-    """Registra eventos de integração na auditoria."""
-    try:
-        action = data.get('action', 'INTEGRATION_EVENT')
-        details = data.get('details', {})
-        store_name = data.get('store_name', 'Global')
-        
-        # Adicionar log de auditoria
-        add_audit_log(None, store_name, action, json.dumps(details, ensure_ascii=False))
-        
-        return {"success": True, "message": "Log registrado com sucesso"}
-    except Exception as e:
-        return {"success": False, "message": str(e)}
-
-
-@app.post('/admin/integracoes/seed')
-def criar_integracoes_exemplo():
-    """Cria integrações de exemplo para teste."""
-    try:
-        # Verificar se já existem integrações
-        existing = get_integrations()
-        if len(existing) > 0:
-            return {"success": False, "message": f"Já existem {len(existing)} integrações configuradas"}
-        
-        # Criar exemplos
-        exemplos = [
-            {
-                "loja_id": None,
-                "tipo": "api",
-                "parametro1": "http://192.168.18.7:8000/product/all",
-                "parametro2": "",
-                "ativo": 1,
-                "layout": '{"paginacao": false, "authType": "", "mapeamento": {"codigo": "codigo", "descricao": "descricao", "preco": "preco"}}'
-            },
-            {
-                "loja_id": None,
-                "tipo": "arquivo",
-                "parametro1": "C:\\precos\\produtos.csv",
-                "parametro2": "",
-                "ativo": 1,
-                "layout": '{"separador": ";", "encoding": "utf-8", "temCabecalho": true, "mapeamento": {"codigo": "codigo", "descricao": "descricao", "preco": "preco"}}'
-            }
-        ]
-        
-        for exemplo in exemplos:
-            upsert_integration(
-                exemplo["loja_id"],
-                exemplo["tipo"],
-                exemplo["parametro1"],
-                exemplo["parametro2"],
-                exemplo["ativo"],
-                exemplo["layout"]
-            )
-        
-        return {"success": True, "message": f"Criadas {len(exemplos)} integrações de exemplo"}
-    except Exception as e:
-        return {"success": False, "message": str(e)}
-
-
-@app.post('/admin/integracoes/preview-arquivo')
-async def preview_arquivo_integracao(request: Request):
-    """Preview de arquivo para integração."""
-    try:
-        data = await request.json()
-        caminho = data.get('caminho')
-        layout = data.get('layout', {})
-        loja_id = data.get('loja_id')
-        
-        if not caminho:
-            raise HTTPException(status_code=400, detail="Caminho do arquivo é obrigatório")
-        
-        # Tentar ler o arquivo
-        try:
-            # Usar encoding configurado ou padrão
-            encoding = layout.get('encoding', 'utf-8')
-            separador = layout.get('separador', ';')
-            tem_cabecalho = layout.get('temCabecalho', True)
-            
-            import os
-            import csv
-            import codecs
-            
-            # Resolver caminho absoluto
-            # Se o caminho não for absoluto, tentar alguns locais padrão
-            if not os.path.isabs(caminho):
-                # Diretório base do projeto
-                base_dir = os.path.dirname(os.path.dirname(__file__))
-                
-                # Tentar vários locais possíveis
-                possible_paths = [
-                    os.path.join(base_dir, caminho),                    # raiz do projeto
-                    os.path.join(base_dir, 'agente_local', 'dist', caminho),  # agente_local/dist
-                    os.path.join(base_dir, 'backend', caminho),         # backend
-                    os.path.join(base_dir, 'frontend', caminho),        # frontend
-                    caminho  # caminho original como última tentativa
-                ]
-                
-                caminho_final = None
-                for possible_path in possible_paths:
-                    if os.path.exists(possible_path):
-                        caminho_final = possible_path
-                        break
-                
-                if not caminho_final:
-                    raise HTTPException(status_code=404, detail=f"Arquivo não encontrado em nenhum dos locais possíveis. Arquivo: {caminho}. Locais verificados: {possible_paths}")
-                
-                caminho = caminho_final
-            
-            if not os.path.exists(caminho):
-                raise HTTPException(status_code=404, detail=f"Arquivo não encontrado: {caminho}")
-            
-            # Informações do arquivo
-            arquivo_info = {
-                'caminho': caminho,
-                'tamanho': os.path.getsize(caminho),
-                'modificado': os.path.getmtime(caminho)
-            }
-            
-            dados = []
-            with codecs.open(caminho, 'r', encoding=encoding) as arquivo:
-                # Detectar separador automaticamente se necessário
-                primeira_linha = arquivo.readline()
-                arquivo.seek(0)
-                
-                if separador == 'auto':
-                    # Tentar detectar separador
-                    if ';' in primeira_linha:
-                        separador = ';'
-                    elif ',' in primeira_linha:
-                        separador = ','
-                    elif '\t' in primeira_linha:
-                        separador = '\t'
-                    elif '|' in primeira_linha:
-                        separador = '|'
-                    else:
-                        separador = ';'  # padrão
-                
-                reader = csv.reader(arquivo, delimiter=separador)
-                
-                # Pular cabeçalho se configurado
-                if tem_cabecalho:
-                    next(reader, None)
-                
-                # Ler até 100 linhas para preview
-                count = 0
-                for linha in reader:
-                    if count >= 100:  # Limite para preview
-                        break
-                    
-                    if len(linha) >= 2:  # Pelo menos código e preço
-                        # Mapear campos baseado na configuração
-                        mapeamento = layout.get('mapeamento', {})
-                        
-                        try:
-                            # Usar mapeamento ou posições padrão
-                            codigo_idx = int(mapeamento.get('codigo', 0)) if str(mapeamento.get('codigo', '0')).isdigit() else 0
-                            descricao_idx = int(mapeamento.get('descricao', 1)) if str(mapeamento.get('descricao', '1')).isdigit() else 1
-                            preco_idx = int(mapeamento.get('preco', 2)) if str(mapeamento.get('preco', '2')).isdigit() else 2
-                            
-                            # Extrair dados
-                            codigo = linha[codigo_idx] if len(linha) > codigo_idx else ''
-                            descricao = linha[descricao_idx] if len(linha) > descricao_idx else ''
-                            preco_str = linha[preco_idx] if len(linha) > preco_idx else ''
-                            
-                            # Converter preço
-                            try:
-                                preco = float(preco_str.replace(',', '.').replace('R$', '').strip())
-                            except:
-                                preco = 0.0
-                            
-                            # Verificar se o produto existe no banco
-                            produto_existente = None
-                            status = 'novo'  # padrão: produto novo
-                            observacoes = 'OK'
-                            
-                            try:
-                                from database import get_product_by_barcode
-                                produto_existente = get_product_by_barcode(codigo.strip())
-                                if produto_existente:
-                                    status = 'existente'
-                                    # Comparar preços se possível
-                                    if 'preco' in produto_existente:
-                                        preco_atual = float(produto_existente['preco'])
-                                        diferenca = abs(preco - preco_atual)
-                                        if diferenca > 0.01:  # diferença significativa
-                                            observacoes = f'Preço atual: R$ {preco_atual:.2f}'
-                                        else:
-                                            observacoes = 'Preço igual'
-                                else:
-                                    status = 'novo'
-                                    observacoes = 'Produto não encontrado no banco'
-                            except Exception as e:
-                                status = 'erro'
-                                observacoes = f'Erro ao verificar: {str(e)}'
-                            
-                            dados.append({
-                                'codigo': codigo.strip(),
-                                'descricao': descricao.strip(),
-                                'preco': preco,
-                                'status': status,
-                                'observacoes': observacoes,
-                                'linha_original': linha
-                            })
-                        except (IndexError, ValueError) as e:
-                            # Linha com problema, adicionar mesmo assim para debug
-                            dados.append({
-                                'codigo': linha[0] if len(linha) > 0 else '',
-                                'descricao': linha[1] if len(linha) > 1 else '',
-                                'preco': 0.0,
-                                'status': 'erro',
-                                'observacoes': f'Erro na linha: {str(e)}',
-                                'erro': str(e),
-                                'linha_original': linha
-                            })
-                    
-                    count += 1
-            
-            return {
-                "success": True,
-                "arquivo_info": arquivo_info,
-                "dados": dados,
-                "total_preview": len(dados),
-                "configuracao": {
-                    "encoding": encoding,
-                    "separador": separador,
-                    "tem_cabecalho": tem_cabecalho,
-                    "mapeamento": layout.get('mapeamento', {})
-                }
-            }
-            
-        except UnicodeDecodeError as e:
-            raise HTTPException(status_code=400, detail=f"Erro de encoding do arquivo. Tente outro encoding. Erro: {str(e)}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Erro ao processar arquivo: {str(e)}")
-            
-    except HTTPException:
-        raise
-    except Exception as e:
-        import traceback
-        logging.error(f"Erro no preview de arquivo: {str(e)}")
-        logging.error(f"Traceback: {traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
-
-
-@app.get('/admin/devices/{device_id}/audit-logs')
-def api_get_device_audit_logs(device_id: int, limit: int = 20):
-    return get_device_audit_logs(device_id, limit)
-
-
-# Mount frontend build if present
-def mount_frontend_if_exists():
-    FRONTEND_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist'))
-    if os.path.exists(FRONTEND_PATH):
-        logging.info(f"Montando frontend na pasta: {FRONTEND_PATH}")
-        mount_frontend(app, FRONTEND_PATH)
-    else:
-        logging.warning(f"Pasta {FRONTEND_PATH} não encontrada. Certifique-se de que o build do frontend foi gerado corretamente.")
-
-
-mount_frontend_if_exists()
-
-
-# CORS for dev
-logging.basicConfig(level=logging.INFO)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-# Healthcheck loop (optional)
-HEALTHCHECK_ENDPOINTS = ['/admin/status', '/admin/devices', '/admin/stores', '/product/all', '/health']
-HEALTHCHECK_LOG = os.path.join(os.path.dirname(__file__), 'logs', 'healthcheck.log')
-os.makedirs(os.path.dirname(HEALTHCHECK_LOG), exist_ok=True)
-
-
-def ia_healthcheck_loop():
-    while True:
-        results = []
-        for ep in HEALTHCHECK_ENDPOINTS:
-            try:
-                url = f'http://127.0.0.1:8000{ep}'
-                r = requests.get(url, timeout=5)
-                status = r.status_code
-                ok = status == 200
-            except Exception as e:
-                ok = False
-                status = str(e)
-            results.append({'endpoint': ep, 'ok': ok, 'status': status, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')})
-        with open(HEALTHCHECK_LOG, 'a', encoding='utf-8') as f:
-            for res in results:
-                f.write(json.dumps(res, ensure_ascii=False) + '\n')
-        for res in results:
-            if not res['ok']:
-                try:
-                    notify_ai_agent('healthcheck_fail', res)
-                except Exception:
-                    pass
-        time.sleep(60)
-
-
-def start_ia_healthcheck():
-    t = threading.Thread(target=ia_healthcheck_loop, daemon=True)
-    t.start()
-
-
-@app.on_event('startup')
-def start_health_and_notify():
-    try:
-        conn = get_db_connection()
         cur = conn.cursor()
         cur.execute('SELECT COUNT(*) FROM admin_users')
         row = cur.fetchone()
@@ -1424,1257 +173,66 @@ def start_health_and_notify():
             cur.execute('INSERT INTO admin_users (username, password) VALUES (%s, %s)', ('admin', 'admin'))
             conn.commit()
             logging.info('Usuário admin padrão criado: admin/admin')
+    finally:
         conn.close()
-    except Exception:
-        pass
-    try:
-        notify_ai_agent('startup', {'source': 'backend', 'info': 'Backend iniciado'})
-    except Exception:
-        pass
-    try:
-        start_ia_healthcheck()
-    except Exception:
-        pass
 
-# ==== INÍCIO DOS IMPORTS ÚNICOS ====
-import os
-import json
-import io
-import sys
-import shutil
-# Deduplicação defensiva na inicialização (id canônico e por IP)
-try:
+
+@startup.phase('agent_dedupe')
+def _dedupe_agents():
+    # Deduplicação defensiva (id canônico e por IP); a varredura periódica é o job agent_identity_sweep
     dedupe_agents()
     dedupe_agents_by_ip()
     reassign_orphan_agent_devices_by_ip()
-except Exception:
-    pass
-
-# --- Endpoint para agentes locais ---
-@app.get('/admin/agents')
-def listar_agentes(include_fakes: bool = Query(False, description="Se falso, tenta ocultar agentes simulados/fictícios")):
-    """Retorna lista de agentes do banco, ajustando chaves para o painel."""
-    # Antes de listar, tenta reatribuir devices órfãos
-    try:
-        reassign_orphan_agent_devices_by_ip()
-    except Exception:
-        pass
-    rows = get_all_agents_status()
-    out = []
-    seen = set()
-    now = datetime.now()
-    for r in rows:
-        rec = dict(r)
-        # Normaliza ID esperado pelo frontend
-        rec['id'] = (rec.get('agent_id') or rec.get('id') or '').strip().lower()
-        if not rec['id']:
-            continue
-        if rec['id'] in seen:
-            # deduplica
-            continue
-        seen.add(rec['id'])
-        # Opcional: remove itens claramente fictícios pelo ID conhecido/padrão
-        if not include_fakes and rec.get('id') in (None, '', 'cli-check-01', 'fake-agent', 'simulador'):
-            continue
-        # Calcula status online/offline por frescor do last_update (fallback para status salvo)
-        last = rec.get('last_update') or rec.get('ultima_atualizacao')
-        status_calc = None
-        # Normaliza formato de last_update para ISO 8601 quando possível
-        normalized_last = None
-        try:
-            if last:
-                # aceita 'YYYY-mm-dd HH:MM:SS'
-                try:
-                    dt = datetime.strptime(str(last), '%Y-%m-%d %H:%M:%S')
-                except Exception:
-                    # aceita '%d/%m/%Y, %H:%M:%S'
-                    from datetime import datetime as _dt
-                    dt = _dt.strptime(str(last), '%d/%m/%Y, %H:%M:%S')
-                diff = (now - dt).total_seconds()
-                # relaxa a janela para 120s para evitar flutuação
-                status_calc = 'online' if diff <= 120 else 'offline'
-                normalized_last = dt.isoformat(timespec='seconds')
-        except Exception:
-            status_calc = None
-            normalized_last = None
-        if normalized_last:
-            rec['last_update'] = normalized_last
-            # também mantém campo legível se o frontend quiser exibir raw
-            rec['ultima_atualizacao'] = dt.strftime('%d/%m/%Y, %H:%M:%S')
-        rec['status'] = status_calc or rec.get('status') or 'offline'
-        # Enriquecer com lojas vinculadas
-        try:
-            rec['lojas'] = get_agent_stores(rec['id'])
-            # Se não veio loja_nome direto, deriva da primeira loja vinculada
-            if not rec.get('loja_nome') and rec.get('lojas'):
-                rec['loja_nome'] = rec['lojas'][0].get('loja_nome')
-                rec['loja_codigo'] = rec.get('loja_codigo') or rec['lojas'][0].get('loja_codigo')
-        except Exception:
-            rec['lojas'] = []
-        # Anexa devices legados (se houver)
-        try:
-            rec['devices'] = get_agent_devices(rec['id'])
-        except Exception:
-            rec['devices'] = []
-        out.append(rec)
-    return out
-
-@app.post('/admin/agents/status')
-async def upsert_agent_status_handler(request: Request):
-    """Recebe heartbeat/status do agente local e persiste no banco para o painel.
-    Espera JSON: { agent_id, status, last_update, loja_codigo?, loja_nome?, ip? }
-    """
-    try:
-        data = await request.json()
-    except Exception:
-        raise HTTPException(status_code=400, detail='Invalid JSON payload')
-    # Normaliza agent_id para evitar duplicados por case/espacos
-    agent_id = (data.get('agent_id') or '').strip().lower()
-    if not agent_id:
-        raise HTTPException(status_code=400, detail='agent_id é obrigatório')
-    loja_codigo = data.get('loja_codigo')
-    loja_nome = data.get('loja_nome') or data.get('store_name')
-    status = data.get('status') or 'online'
-    last_update = data.get('last_update') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    # Preferir IP do request (edge/gateway) para evitar colisões com '127.0.0.1' enviados pelo agente
-    # Descobre IP real: respeita X-Forwarded-For / X-Real-IP se existir (proxy/reverso)
-    def _client_ip(req: Request):
-        try:
-            if not req:
-                return None
-            xf = req.headers.get('x-forwarded-for') or req.headers.get('X-Forwarded-For')
-            if xf:
-                # pode conter lista, pega o primeiro não vazio
-                parts = [p.strip() for p in xf.split(',') if p.strip()]
-                if parts:
-                    return parts[0]
-            xr = req.headers.get('x-real-ip') or req.headers.get('X-Real-IP')
-            if xr:
-                return xr.strip()
-            return req.client.host if req.client else None
-        except Exception:
-            return req.client.host if req and req.client else None
-    req_ip = _client_ip(request)
-    ip = req_ip or data.get('ip')
-    # Coalescer agentes do mesmo IP (sem janela de tempo) e normalizar id já existente
-    try:
-        # 1) Se já existe um agent_id para este IP, usa o mais recente
-        same_ip_id = get_latest_agent_by_ip(ip)
-        if same_ip_id:
-            agent_id = same_ip_id
-    except Exception:
-        pass
-    try:
-        upsert_agent_status(agent_id, loja_codigo=loja_codigo, loja_nome=loja_nome, status=status, last_update=last_update, ip=ip)
-        # Dedup pós-upsert para capturar corridas entre processos (GUI/Serviço)
-        try:
-            dedupe_agents(); dedupe_agents_by_ip(); reassign_orphan_agent_devices_by_ip()
-        except Exception:
-            pass
-        # opcional: lista de lojas vinculadas
-        lojas = data.get('lojas')
-        if isinstance(lojas, list):
-            replace_agent_stores(agent_id, lojas)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get('/admin/agents/summary')
-def agents_summary():
-    """Resumo simples de monitoramento: total/online/offline."""
-    rows = listar_agentes()
-    total = len(rows)
-    online = sum(1 for r in rows if str(r.get('status')).lower() == 'online')
-    offline = total - online
-    return {"total": total, "online": online, "offline": offline}
-
-# Edição/Exclusão de agentes (manutenção)
-@app.delete('/admin/agents/{agent_id}')
-def delete_agent(agent_id: str):
-    try:
-        delete_agent_status(agent_id)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.put('/admin/agents/{agent_id}')
-def edit_agent(agent_id: str, data: dict = Body(...)):
-    try:
-        loja_codigo = data.get('loja_codigo')
-        loja_nome = data.get('loja_nome')
-        status = data.get('status')
-        ip = data.get('ip')
-        last_update = data.get('last_update')
-        update_agent_status(agent_id, loja_codigo=loja_codigo, loja_nome=loja_nome, status=status, ip=ip, last_update=last_update)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# --- Legacy devices reportados via Agente Local ---
-@app.post('/admin/agents/{agent_id}/devices')
-def upsert_agent_devices(agent_id: str, payload: dict = Body(...), request: Request = None):
-    """Recebe lista de devices legados de um agente local.
-    Body: { devices: [ {identifier, name?, tipo?, status?, ip?, last_update?, last_catalog_sync?, catalog_count?}, ... ] }
-    """
-    try:
-        # Normaliza para o agent_id canônico pelo IP do request se possível
-        try:
-            req_ip = _client_ip(request)
-            canon = get_latest_agent_by_ip(req_ip)
-            if canon:
-                agent_id = canon
-        except Exception:
-            pass
-        devices = payload.get('devices') or []
-        # Sanitiza e ignora entradas sem identifier
-        devices = [d for d in devices if str(d.get('identifier') or '').strip()]
-        bulk_upsert_agent_devices(agent_id, devices)
-        # Após inserir, reatribui possíveis órfãos
-        try:
-            reassign_orphan_agent_devices_by_ip()
-        except Exception:
-            pass
-        return {"success": True, "count": len(devices)}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Heartbeat simples por device do agente (mais fácil de integrar)
-@app.post('/admin/agents/{agent_id}/devices/heartbeat')
-def agent_device_heartbeat(agent_id: str, data: dict = Body(...), request: Request = None):
-    """Marca um device legado como online com last_update atual.
-    Body: { identifier?, ip?, port?, name?, status? }
-    - Se não vier identifier, será montado como "PC-<ip>:<port>" (port padrão 21)
-    """
-    try:
-        ip = (data.get('ip') or '').strip()
-        port = str(data.get('port') or '21').strip()
-        identifier = (data.get('identifier') or '').strip()
-        if not identifier:
-            if not ip:
-                raise HTTPException(status_code=400, detail='identifier ou ip são obrigatórios')
-            identifier = f'PC-{ip}:{port}'
-        name = data.get('name') or 'PC'
-        status = data.get('status') or 'online'
-        from datetime import datetime as _dt
-        # Usa horário local para bater com a janela de 120s
-        now = _dt.now().isoformat()
-        # Persistir/atualizar apenas este device
-        from database import upsert_agent_device
-        # Normaliza agent_id pelo IP do request
-        try:
-            req_ip = _client_ip(request)
-            canon = get_latest_agent_by_ip(req_ip)
-            if canon:
-                agent_id = canon
-        except Exception:
-            pass
-        upsert_agent_device(
-            agent_id=agent_id,
-            identifier=identifier,
-            name=name,
-            tipo='LEGACY',
-            status=status,
-            last_update=now,
-            ip=ip
-        )
-        try:
-            reassign_orphan_agent_devices_by_ip()
-        except Exception:
-            pass
-        return {"success": True, "identifier": identifier, "last_update": now}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get('/admin/agents/{agent_id}/devices')
-def list_agent_devices(agent_id: str):
-    try:
-        return get_agent_devices(agent_id)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.delete('/admin/agents/{agent_id}/devices/{identifier}')
-def remove_agent_device(agent_id: str, identifier: str):
-    try:
-        delete_agent_device(agent_id, identifier)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# --- Eventos de dispositivos (consultas de preço e sincronizações) ---
-_device_events = []  # memória recente
-
-def _push_device_event(event: dict):
-    try:
-        from datetime import datetime as _dt
-        event['timestamp'] = event.get('timestamp') or _dt.utcnow().isoformat()
-        _device_events.append(event)
-        if len(_device_events) > 500:
-            _device_events.pop(0)
-    except Exception:
-        pass
-
-@app.post('/admin/devices/events/price-query')
-def log_price_query(data: dict = Body(...)):
-    """Registra consulta de preço por um equipamento.
-    Espera: { identifier, barcode, ok: bool, price?, error? }
-    """
-    identifier = (data.get('identifier') or '').strip()
-    barcode = (data.get('barcode') or '').strip()
-    ok = bool(data.get('ok'))
-    price = data.get('price')
-    error = data.get('error')
-    if not identifier or not barcode:
-        raise HTTPException(status_code=400, detail='identifier e barcode são obrigatórios')
-    # Guardar em memória e auditar básico
-    action = 'PRICE_QUERY_OK' if ok else 'PRICE_QUERY_FAIL'
-    add_audit_log(None, identifier, action, json.dumps({'barcode': barcode, 'price': price, 'error': error}, ensure_ascii=False))
-    _push_device_event({'type': 'price_query', 'identifier': identifier, 'barcode': barcode, 'ok': ok, 'price': price, 'error': error})
-    return {"success": True}
-
-@app.post('/admin/devices/events/catalog-sync')
-def log_catalog_sync(data: dict = Body(...)):
-    """Registra sincronização de catálogo feita por um equipamento PWA.
-    Espera: { identifier, total_products, timestamp? }
-    """
-    identifier = (data.get('identifier') or '').strip()
-    total = data.get('total_products')
-    timestamp = data.get('timestamp')
-    if not identifier:
-        raise HTTPException(status_code=400, detail='identifier é obrigatório')
-    update_device_catalog_sync(identifier, total_products=int(total or 0), timestamp=timestamp)
-    _push_device_event({'type': 'catalog_sync', 'identifier': identifier, 'total_products': int(total or 0)})
-    return {"success": True}
-
-@app.get('/admin/devices/events')
-def list_device_events(limit: int = Query(100, ge=1, le=500), identifier: str = Query(None), store_id: int = Query(None)):
-    """Lista eventos recentes (consultas e syncs) com filtros opcionais por identifier e store_id."""
-    evts = _device_events[-500:]
-    # Filtra por identifier
-    if identifier:
-        evts = [e for e in evts if str(e.get('identifier')) == str(identifier)]
-    # Filtra por store_id (mapeando identifiers conhecidos no banco)
-    if store_id is not None:
-        try:
-            devices = get_all_devices()
-            idents = {d.get('identifier') for d in devices if str(d.get('store_id')) == str(store_id)}
-            evts = [e for e in evts if e.get('identifier') in idents]
-        except Exception:
-            pass
-    return list(reversed(evts[-limit:]))
-
-# Health events from Local Agent (online/offline transitions)
-@app.post('/admin/devices/events/health')
-def device_health_event(event: dict = Body(...)):
-    """Registra eventos de saúde de dispositivos reportados pelo Agente Local.
-    Espera: { identifier, status: 'online'|'offline', previous?, agent_id?, ip?, ts? }
-    """
-    try:
-        identifier = (event.get('identifier') or '').strip()
-        status = (event.get('status') or '').strip().lower()
-        if not identifier or status not in ('online', 'offline'):
-            raise HTTPException(status_code=400, detail='identifier e status (online/offline) são obrigatórios')
-        ev = {
-            'type': 'health',
-            'identifier': identifier,
-            'status': status,
-            'previous': event.get('previous'),
-            'agent_id': event.get('agent_id'),
-            'ip': event.get('ip'),
-            'timestamp': event.get('ts'),
-        }
-        _push_device_event(ev)
-        return {"success": True}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-security = HTTPBearer()
-
-# Inclusão dos routers
-app.include_router(ia_event_router)
-app.include_router(backup_restore_router)
-app.include_router(device_store_router)
-
-# Endpoints de importação de preços
-@app.post('/admin/importar-precos')
-def acionar_importacao():
-    """
-    Aciona manualmente a rotina de importação de preços para todas as integrações ativas.
-    """
-    try:
-        importar_todos_precos()
-        return {"success": True, "message": "Importação executada."}
-    except Exception as e:
-        return {"success": False, "message": str(e)}
-
-@app.get('/admin/importar-precos/logs')
-def get_import_logs():
-    """
-    Retorna os últimos logs de importação de preços.
-    """
-    return {"logs": _import_logs[-50:]}
-
-# Endpoints de integração de preços
-@app.get('/admin/integracoes')
-def listar_integracoes(loja_id: int = Query(None)):
-    """
-    Lista integrações de preço cadastradas. Se loja_id for informado, filtra por loja.
-    """
-    return get_integrations(loja_id)
-
-
-
-@app.post('/admin/integracoes')
-def salvar_integracao(data: dict = Body(...)):
-    """
-    Adiciona ou atualiza uma integração de preço para uma loja ou global, incluindo layout do arquivo.
-    """
-    id_ = data.get('id')
-    # Coerção de loja_id vindo do UI (pode ser '', 'null', null, número)
-    raw_loja = data.get('loja_id')
-    if raw_loja in (None, '', 'null'):
-        loja_id = None
-    else:
-        try:
-            loja_id = int(raw_loja)
-        except Exception:
-            loja_id = None
-    tipo = data.get('tipo')
-    parametro1 = data.get('parametro1')
-    parametro2 = data.get('parametro2')
-    ativo = data.get('ativo', 1)
-    layout = data.get('layout')
-    # Validação básica
-    if not tipo or not parametro1:
-        return {"success": False, "message": "Campos obrigatórios: tipo e parametro1"}
-    if id_ is not None:
-        # Atualiza pelo id
-        update_integration_by_id(id_, loja_id, tipo, parametro1, parametro2, ativo, layout)
-    else:
-        # Insere ou atualiza por (loja_id, tipo)
-        upsert_integration(loja_id, tipo, parametro1, parametro2, ativo, layout)
-    return {"success": True}
-
-# Testa uma integração do tipo API (sem salvar), útil para o modal
-@app.post('/admin/integracoes/testar-api')
-def testar_integracao_api(data: dict = Body(...)):
-    url = (data.get('url') or data.get('parametro1') or '').strip()
-    token = (data.get('token') or data.get('parametro2') or '').strip()
-    if not url:
-        return {"success": False, "message": "Informe a URL da API."}
-    headers = {}
-    if token:
-        headers['Authorization'] = f'Bearer {token}'
-    try:
-        r = requests.get(url, headers=headers, timeout=8)
-        r.raise_for_status()
-        try:
-            js = r.json()
-        except Exception:
-            return {"success": False, "message": "A resposta não é JSON válido."}
-        count = len(js) if isinstance(js, list) else (len(js.keys()) if isinstance(js, dict) else 1)
-        sample = js[0] if isinstance(js, list) and js else js
-        # Não retornar payload completo para não poluir a UI
-        return {"success": True, "status": r.status_code, "count": int(count), "sample": sample if isinstance(sample, dict) else None}
-    except Exception as e:
-        return {"success": False, "message": str(e)}
-
-@app.post('/admin/devices/register')
-async def register_device_by_store_code(request: Request):
-    data = await request.json()
-    store_codigo = data.get('store_codigo')
-    name = data.get('name')
-    identifier = data.get('identifier')
-    if not store_codigo or not name or not identifier:
-        return {"success": False, "message": "Todos os campos são obrigatórios (store_codigo, name, identifier)."}
-    from database import get_store_by_code, add_device
-    store = get_store_by_code(str(store_codigo).strip())
-    if not store:
-        return {"success": False, "message": f"Loja com código {store_codigo} não encontrada."}
-    store_id = store['id']
-    add_device(store_id, name, identifier=identifier)
-    return {"success": True, "message": "Equipamento registrado com sucesso."}
-
-
-BANNERS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'banners'))
-os.makedirs(BANNERS_DIR, exist_ok=True)
-import logging
-
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    username = verify_access_token(token)
-    if not username:
-        raise HTTPException(status_code=401, detail="Token inválido ou expirado")
-    return username
-
-@app.get('/admin/status')
-def admin_status():
-    import datetime
-    status = get_system_status()
-    # Determina status online: se existe pelo menos 1 device online
-    devices = get_all_devices()
-    online = any([d.get('online') for d in devices])
-    # Busca último backup
-    try:
-        from backup_restore import get_last_backup
-        backup = get_last_backup()
-        last_backup = backup['timestamp'] if backup and 'timestamp' in backup else None
-    except Exception:
-        last_backup = None
-    status['online'] = online
-    status['last_backup'] = last_backup
-    
-    # Serializa datetime para string recursivamente
-    def serialize_datetime(obj):
-        if isinstance(obj, datetime.datetime):
-            return obj.isoformat()
-        elif isinstance(obj, dict):
-            return {k: serialize_datetime(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [serialize_datetime(item) for item in obj]
-        return obj
-    
-    serialized_status = serialize_datetime(status)
-    return JSONResponse(content=serialized_status)
-
-# Endpoint para servir favicon.ico
-@app.get('/favicon.ico')
-def favicon():
-    file_path = os.path.join(FRONTEND_PUBLIC_DIR, 'favicon.ico')
-    if os.path.exists(file_path):
-        return FileResponse(file_path)
-    raise HTTPException(status_code=404, detail='favicon not found')
-
-# Endpoint simples de healthcheck para monitoramento
-@app.get('/health')
-def health():
-    return {"status": "ok"}
-
-
-# Inicializa o banco de dados e popula com dados de exemplo ao iniciar o app
-@app.on_event("startup")
-def startup():
-    init_db()
-    populate_example_data()
-
-@app.get("/status")
-async def system_status():
-    # Verifica o status do sistema
-    status = get_system_status()
-    return JSONResponse(content=status)
-
-@app.post("/notify-ai-agent/")
-async def notify_agent(request: Request):
-    # Notifica o agente AI sobre uma nova requisição
-    data = await request.json()
-    response = notify_ai_agent(data)
-    return JSONResponse(content=response)
-
-# Resto dos endpoints e lógica da aplicação... (continua com todo o conteúdo do main_backup_20250730.py, linha a linha, até o final)
-
-# Endpoint para listar banners filtrando por loja
-from fastapi import Query
-@app.get('/admin/banners')
-def list_banners(store_id: str = Query(None)):
-    files = [f for f in os.listdir(BANNERS_DIR) if f.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".webp"))]
-    meta_path = os.path.join(BANNERS_DIR, 'banners_meta.json')
-    meta = {}
-    if os.path.exists(meta_path):
-        try:
-            with open(meta_path, 'r', encoding='utf-8') as f:
-                meta = json.load(f)
-        except Exception:
-            meta = {}
-    filtered = []
-    import logging
-    logging.info(f"[BANNERS] list_banners chamado com store_id={store_id}")
-    for f in files:
-        m = meta.get(f, {})
-        # Padroniza store_id: sempre string, sem espaços
-        meta_store_id = str(m.get('store_id')).strip() if m.get('store_id') is not None else None
-        req_store_id = str(store_id).strip() if store_id is not None else None
-        all_stores_flag = bool(m.get('all_stores'))
-        logging.info(f"[BANNERS][DEBUG] Banner: {f} | meta_store_id: '{meta_store_id}' | req_store_id: '{req_store_id}' | all_stores: {all_stores_flag}")
-        if all_stores_flag:
-            filtered.append({"filename": f, "url": f"/admin/banners/{f}"})
-        elif req_store_id and meta_store_id and meta_store_id == req_store_id:
-            filtered.append({"filename": f, "url": f"/admin/banners/{f}"})
-    logging.info(f"[BANNERS] Retornando {len(filtered)} banners para store_id={store_id}")
-    return filtered
-
-
-# Endpoint para receber atualizações em lote (bulk) de produtos
-@app.post('/admin/products/bulk')
-def admin_products_bulk(payload: Union[List[Dict], Dict, str] = Body(...), username: str = Depends(get_current_user)):
-    """Recebe produtos e faz upsert no banco local.
-
-    Aceita formatos:
-    - Lista de produtos: [ {barcode, name, price, promo?}, ... ]
-    - Objeto com chave 'produtos' ou 'products': { produtos: [...]} ou { products: [...] }
-    - Objeto de um único produto: { barcode, name, price }
-    """
-    try:
-        data_list: List[Dict] = []
-        # Normaliza para lista de dicionários
-        if isinstance(payload, list):
-            data_list = [p for p in payload if isinstance(p, dict)]
-        elif isinstance(payload, dict):
-            if isinstance(payload.get('produtos'), list):
-                data_list = [p for p in payload.get('produtos') if isinstance(p, dict)]
-            elif isinstance(payload.get('products'), list):
-                data_list = [p for p in payload.get('products') if isinstance(p, dict)]
-            else:
-                # considera como um único produto
-                data_list = [payload]
-        elif isinstance(payload, str):
-            try:
-                parsed = json.loads(payload)
-                if isinstance(parsed, list):
-                    data_list = [p for p in parsed if isinstance(p, dict)]
-                elif isinstance(parsed, dict):
-                    if isinstance(parsed.get('produtos'), list):
-                        data_list = [p for p in parsed.get('produtos') if isinstance(p, dict)]
-                    elif isinstance(parsed.get('products'), list):
-                        data_list = [p for p in parsed.get('products') if isinstance(p, dict)]
-                    else:
-                        data_list = [parsed]
-            except Exception:
-                raise HTTPException(status_code=400, detail='Payload inválido (string não é JSON válido)')
-
-        if not data_list:
-            raise HTTPException(status_code=400, detail='Nenhum produto válido no payload')
-
-        result = upsert_products(data_list)
-        # registra auditoria
-        try:
-            add_audit_log(None, None, 'PRODUCTS_BULK_UPSERT', json.dumps({'user': username, 'result': result}, ensure_ascii=False))
-        except Exception:
-            pass
-        return JSONResponse(content={'success': True, 'result': result})
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.exception('Erro no endpoint admin/products/bulk')
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Endpoint para servir banner individual
-@app.get('/admin/banners/{filename}')
-def get_banner(filename: str):
-    file_path = os.path.join(BANNERS_DIR, filename)
-    if not os.path.exists(file_path):
-        return {"success": False, "message": "Arquivo não encontrado."}
-    return FileResponse(file_path)
 
-# Endpoint para deletar banner
-@app.delete('/admin/banners/{filename}')
-def delete_banner(filename: str):
-    file_path = os.path.join(BANNERS_DIR, filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
-        return {"success": True}
-    return {"success": False, "message": "Arquivo não encontrado."}
 
-# Endpoint para fazer upload de banner
-
-
-
-
-@app.post('/admin/banners/upload')
-async def upload_banner(request: Request, username: str = Depends(get_current_user)):
-    import logging
-    form = await request.form()
-    file = form.get('file')
-    store_id = form.get('store_id')
-    all_stores = form.get('all_stores')
-    logging.info(f"[UPLOAD] username={username} file={getattr(file, 'filename', None)} store_id={store_id} all_stores={all_stores}")
-    # Validação: arquivo obrigatório
-    if not file or not hasattr(file, 'filename'):
-        logging.error("[UPLOAD] Falta arquivo de imagem.")
-        raise HTTPException(status_code=400, detail="Arquivo de imagem obrigatório.")
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-        logging.error(f"[UPLOAD] Formato não suportado: {file_ext}")
-        raise HTTPException(status_code=400, detail="Formato de arquivo não suportado.")
-    if not store_id and not all_stores:
-        logging.error("[UPLOAD] Falta store_id e all_stores.")
-        raise HTTPException(status_code=400, detail="É obrigatório informar a loja ou marcar 'todas as lojas'.")
-    # Salva arquivo
-    file_path = os.path.join(BANNERS_DIR, file.filename)
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        logging.info(f"[UPLOAD] Arquivo salvo em {file_path}")
-    except Exception as e:
-        logging.error(f"[UPLOAD] Erro ao salvar arquivo: {e}")
-        raise HTTPException(status_code=500, detail="Erro ao salvar arquivo.")
-    # Salva metadados do banner
-    meta_path = os.path.join(BANNERS_DIR, 'banners_meta.json')
-    try:
-        if os.path.exists(meta_path):
-            with open(meta_path, 'r', encoding='utf-8') as f:
-                meta = json.load(f)
-        else:
-            meta = {}
-    except Exception as e:
-        logging.error(f"[UPLOAD] Erro ao ler banners_meta.json: {e}")
-        meta = {}
-    # Padroniza store_id para string limpa
-    store_id_clean = str(store_id).strip() if store_id else None
-    all_stores_flag = str(all_stores).lower() in ['1', 'true', 'on', 'yes'] if all_stores is not None else False
-    logging.info(f"[UPLOAD][DEBUG] Salvando banner: {getattr(file, 'filename', None)} | store_id: '{store_id}' | store_id_clean: '{store_id_clean}' | all_stores: {all_stores_flag} | uploaded_by: {username}")
-    meta[file.filename] = {
-        'store_id': store_id_clean,
-        'all_stores': all_stores_flag,
-        'uploaded_by': username
-    }
-    try:
-        with open(meta_path, 'w', encoding='utf-8') as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
-        logging.info(f"[UPLOAD] Metadados salvos para {file.filename}")
-    except Exception as e:
-        logging.error(f"[UPLOAD] Erro ao salvar banners_meta.json: {e}")
-        raise HTTPException(status_code=500, detail="Erro ao salvar metadados.")
-    return {"success": True, "filename": file.filename}
-
-# Configuração básica de logs
-logging.basicConfig(level=logging.INFO)
-
-# Permitir CORS em desenvolvimento (frontend separado)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Eventos da IA saem por uma fila com thread de envio (ai_agent_integration.py), antes dos jobs que notificam;
+# nenhum aviso à IA bloqueia o startup ou as requisições
+startup.phase('ai_events', ai_events.start)
+# Varredura de agentes e demais jobs (primeira execução imediata)
+startup.phase('jobs', scheduler.start)
+# Heartbeats são gravados em lote (write-behind), não a cada ping
+startup.phase('heartbeat_buffers', start_heartbeat_buffers)
+# audit_log gravado em lote por uma thread (add_audit_log só enfileira)
+startup.phase('audit_writer', lambda: audit_writer.start(insert_audit_logs))
+# Consultas de preço viram contadores horários gravados periodicamente (price_query_stats.py)
+startup.phase('price_queries', lambda: price_queries.start(flush_price_query_stats))
+# As duas fases abaixo precisam do event loop corrente (o startup roda num handler async):
+# travamentos do event loop e poller da revisão do catálogo que alimenta /product/events (SSE)
+startup.phase('loop_monitor', loop_monitor.start)
+startup.phase('catalog_events', catalog_events.start)
+startup.phase('ai_notify', lambda: notify_ai_agent('startup', {'source': 'backend', 'info': 'Backend iniciado'}))
+startup.phase('health_probes', lambda: scheduler.run_now('health_probes'))
+
+startup.on_shutdown('jobs', scheduler.stop)
+# Grava os heartbeats, o audit_log e os contadores pendentes antes de fechar o pool
+startup.on_shutdown('heartbeat_buffers', stop_heartbeat_buffers)
+startup.on_shutdown('audit_writer', audit_writer.stop)
+startup.on_shutdown('price_queries', price_queries.stop)
+startup.on_shutdown('loop_monitor', loop_monitor.stop)
+startup.on_shutdown('catalog_events', catalog_events.stop)
+startup.on_shutdown('ai_events', ai_events.stop)
+startup.on_shutdown('db_executor', db_executor.shutdown)
+# Fecha as conexões ociosas do pool PostgreSQL
+startup.on_shutdown('db_pool', close_pool)
+
+
+async def _on_startup():
+    startup.run()
+
+
+def _on_shutdown():
+    startup.shutdown()
+
+
+# Ordem de inclusão = ordem de roteamento; rotas dinâmicas (/product/{barcode}) ficam no fim de cada router
+ROUTERS = (
+    admin_router, agents_router, devices_router, stores_router, catalog_router, users_router,
+    integrations_router, banners_router, ia_monitor_router, ia_event_router, backup_restore_router,
+    device_store_router,
 )
 
 
-
-@app.on_event('startup')
-def startup():
-    init_db()
-    # Cria usuário admin padrão se não existir nenhum
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT COUNT(*) as total FROM admin_users')
-    total = cur.fetchone()[0]
-    if total == 0:
-        cur.execute('INSERT INTO admin_users (username, password) VALUES (%s, %s)', ('admin', 'admin'))
-        conn.commit()
-        import logging
-        logging.info('Usuário admin padrão criado: admin/admin')
-    conn.close()
-    # Deduplica agentes existentes e normaliza IDs
-    try:
-        from database import dedupe_agents
-        dedupe_agents()
-    except Exception:
-        pass
-    notify_ai_agent('startup', {'source': 'backend', 'info': 'Backend iniciado'})
-    start_ia_healthcheck()  # Inicia monitoramento proativo
-
-# --- Funções auxiliares de automação IA ---
-IA_AUTONOMOUS_ACTIONS_LOG = os.path.join(os.path.dirname(__file__), 'logs', 'ia_autonomous_actions.log')
-os.makedirs(os.path.dirname(IA_AUTONOMOUS_ACTIONS_LOG), exist_ok=True)
-
-def log_ia_autonomous_action(action, result, details=None):
-    entry = {
-        'timestamp': datetime.now().isoformat(),
-        'action': action,
-        'result': result,
-        'details': details or {}
-    }
-    with open(IA_AUTONOMOUS_ACTIONS_LOG, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-
-def ia_autonomous_check_devices():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT id, name, identifier, last_sync, online FROM devices')
-    now = datetime.now()
-    offline_count = 0
-    for row in cur.fetchall():
-        last_sync = row['last_sync']
-        online = row['online']
-        if last_sync:
-            try:
-                last_dt = datetime.fromisoformat(last_sync)
-            except Exception:
-                continue
-            diff = (now - last_dt).total_seconds() / 60
-            if diff > 10 and online:
-                set_device_offline(row['id'])
-                log_ia_autonomous_action(
-                    action='set_device_offline',
-                    result='success',
-                    details={'device_id': row['id'], 'name': row['name'], 'identifier': row['identifier'], 'reason': f'No heartbeat for {diff:.1f} min'}
-                )
-                notify_ai_agent('device_offline_auto', {'device_id': row['id'], 'name': row['name'], 'identifier': row['identifier'], 'reason': f'No heartbeat for {diff:.1f} min'})
-                offline_count += 1
-    conn.close()
-    return offline_count
-
-def ia_autonomous_cleanup_logs():
-    from datetime import datetime, timedelta
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Remove logs com mais de 30 dias
-    limite = (datetime.utcnow() - timedelta(days=30)).isoformat()
-    cur.execute('DELETE FROM audit_log WHERE timestamp < %s', (limite,))
-    removidos = cur.rowcount
-    conn.commit()
-    conn.close()
-    log_ia_autonomous_action(
-        action='cleanup_logs',
-        result='success',
-        details={'removed_logs': removidos, 'older_than': limite}
-    )
-    return removidos
-
-def ia_autonomous_fix_product_data():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Corrige produtos com nome vazio
-    cur.execute("UPDATE products SET name = 'Produto sem nome' WHERE name IS NULL OR TRIM(name) = ''")
-    nome_corrigido = cur.rowcount
-    # Corrige preços negativos ou nulos
-    cur.execute("UPDATE products SET price = 0.01 WHERE price IS NULL OR price <= 0")
-    preco_corrigido = cur.rowcount
-    # Corrige promoções inconsistentes (promo nulo vira string vazia)
-    cur.execute("UPDATE products SET promo = '' WHERE promo IS NULL")
-    promo_corrigido = cur.rowcount
-    conn.commit()
-    conn.close()
-    total = nome_corrigido + preco_corrigido + promo_corrigido
-    log_ia_autonomous_action(
-        action='fix_product_data',
-        result='success',
-        details={'name_fixed': nome_corrigido, 'price_fixed': preco_corrigido, 'promo_fixed': promo_corrigido}
-    )
-    return total
-
-def ia_autonomous_fix_outlier_prices():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Busca todos os preços válidos
-    cur.execute("SELECT price FROM products WHERE price IS NOT NULL AND price > 0 ORDER BY price")
-    prices = [row['price'] for row in cur.fetchall()]
-    if not prices:
-        conn.close()
-        return 0
-    # Calcula mediana
-    n = len(prices)
-    if n % 2 == 1:
-        mediana = prices[n // 2]
-    else:
-        mediana = (prices[n // 2 - 1] + prices[n // 2]) / 2
-    # Define limites de outlier (ex: 10x acima ou 0.1x abaixo da mediana)
-    limite_sup = mediana * 10
-    limite_inf = mediana * 0.1
-    # Corrige preços muito altos
-    cur.execute("UPDATE products SET price = %s WHERE price > %s", (limite_sup, limite_sup))
-    acima = cur.rowcount
-    # Corrige preços muito baixos (mas > 0)
-    cur.execute("UPDATE products SET price = %s WHERE price < %s AND price > 0", (limite_inf, limite_inf))
-    abaixo = cur.rowcount
-    conn.commit()
-    conn.close()
-    total = acima + abaixo
-    log_ia_autonomous_action(
-        action='fix_outlier_prices',
-        result='success',
-        details={'fixed_above': acima, 'fixed_below': abaixo, 'median': mediana, 'limit_sup': limite_sup, 'limit_inf': limite_inf}
-    )
-    return total
-
-# --- IA Monitoramento Proativo e Otimização do Sistema ---
-HEALTHCHECK_ENDPOINTS = [
-    '/admin/status',
-    '/admin/devices',
-    '/admin/stores',
-    '/product/all',
-    '/health'
-]
-
-HEALTHCHECK_LOG = os.path.join(os.path.dirname(__file__), 'logs', 'healthcheck.log')
-os.makedirs(os.path.dirname(HEALTHCHECK_LOG), exist_ok=True)
-
-# Função para checar endpoints periodicamente
-def ia_healthcheck_loop():
-    while True:
-        results = []
-        for ep in HEALTHCHECK_ENDPOINTS:
-            try:
-                url = f'http://127.0.0.1:8000{ep}'
-                r = requests.get(url, timeout=5)
-                status = r.status_code
-                ok = status == 200
-            except Exception as e:
-                ok = False
-                status = str(e)
-            results.append({'endpoint': ep, 'ok': ok, 'status': status, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')})
-        # Loga resultado
-        with open(HEALTHCHECK_LOG, 'a', encoding='utf-8') as f:
-            for res in results:
-                f.write(json.dumps(res, ensure_ascii=False) + '\n')
-        # Notifica IA se algum endpoint falhar
-        for res in results:
-            if not res['ok']:
-                notify_ai_agent('healthcheck_fail', res)
-        # Executa automações autônomas da IA a cada ciclo
-        try:
-            ia_autonomous_execute_all()
-        except Exception as e:
-            log_ia_autonomous_action('autonomous_execute', 'fail', {'error': str(e)})
-        time.sleep(60)  # roda a cada 1 min
-
-def start_ia_healthcheck():
-    t = threading.Thread(target=ia_healthcheck_loop, daemon=True)
-    t.start()
-
-OPTIMIZATION_LOG = os.path.join(os.path.dirname(__file__), 'logs', 'optimization_suggestions.log')
-
-def ia_analyze_logs_and_optimize():
-    # Exemplo: IA analisa healthcheck.log e sugere melhorias
-    if not os.path.exists(HEALTHCHECK_LOG):
-        return
-    with open(HEALTHCHECK_LOG, 'r', encoding='utf-8') as f:
-        lines = f.readlines()[-100:]
-    issues = [json.loads(l) for l in lines if not json.loads(l)['ok']]
-    if issues:
-        suggestion = {
-            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
-            'suggestion': f"Foram detectados {len(issues)} falhas recentes em endpoints. Recomenda-se revisar logs e infraestrutura.",
-            'issues': issues
-        }
-        with open(OPTIMIZATION_LOG, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(suggestion, ensure_ascii=False) + '\n')
-        notify_ai_agent('optimization_suggestion', suggestion)
-
-@app.get('/admin/ia-health-dashboard')
-def ia_health_dashboard():
-    # Últimos healthchecks
-    health = []
-    if os.path.exists(HEALTHCHECK_LOG):
-        with open(HEALTHCHECK_LOG, 'r', encoding='utf-8') as f:
-            health = [json.loads(l) for l in f.readlines()[-20:]]
-    # Últimas sugestões de otimização
-    optim = []
-    if os.path.exists(OPTIMIZATION_LOG):
-        with open(OPTIMIZATION_LOG, 'r', encoding='utf-8') as f:
-            optim = [json.loads(l) for l in f.readlines()[-10:]]
-    return {
-        'healthchecks': health,
-        'optimizations': optim
-    }
-
-@app.post('/admin/ia-analyze-logs')
-def ia_analyze_logs_endpoint():
-    ia_analyze_logs_and_optimize()
-    return {'success': True, 'message': 'Análise de logs e sugestão de otimização executada.'}
-
-@app.on_event('startup')
-def startup():
-    init_db()
-    # Cria usuário admin padrão se não existir nenhum
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT COUNT(*) as total FROM admin_users')
-    total = cur.fetchone()[0]
-    if total == 0:
-        cur.execute('INSERT INTO admin_users (username, password) VALUES (?, ?)', ('admin', 'admin'))
-        conn.commit()
-        import logging
-        logging.info('Usuário admin padrão criado: admin/admin')
-    conn.close()
-    notify_ai_agent('startup', {'source': 'backend', 'info': 'Backend iniciado'})
-    start_ia_healthcheck()  # Inicia monitoramento proativo
-
-# Endpoint para retornar todos os produtos (para sync do frontend)
-@app.get('/product/all')
-def get_all_products():
-    import psycopg2.extras
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute('SELECT barcode, name, price, promo FROM products')
-    rows = cur.fetchall()
-    conn.close()
-    # Corrige preço para reais se estiver em centavos
-    produtos = []
-    for row in rows:
-        produto = dict(row)
-        preco = produto['price']
-        # Se o preço for menor que 1 e não for zero, provavelmente está em centavos
-        if preco and preco < 1:
-            produto['price'] = round(preco * 100, 2)
-        produtos.append(produto)
-    notify_ai_agent('sync_success', {'source': 'backend', 'info': 'Produtos sincronizados'})
-    return produtos
-
-# Alias legacy para compatibilidade com agentes locais antigos
-@app.get('/api/produtos')
-def alias_api_produtos():
-    return get_all_products()
-
-# Endpoint de login admin
-from fastapi.responses import JSONResponse
-@app.post('/admin/login')
-async def admin_login(request: Request):
-    data = await request.json()
-    username = data.get('username')
-    password = data.get('password')
-    if not username or not password:
-        return JSONResponse(status_code=400, content={"success": False, "message": "Usuário e senha obrigatórios"})
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT username, password, role, store_id, permissoes FROM admin_users WHERE username = %s', (username,))
-    row = cur.fetchone()
-    conn.close()
-    user = None
-    if row:
-        user = {
-            'username': row[0],
-            'password': row[1],
-            'role': row[2] if len(row) > 2 else 'admin',
-            'store_id': row[3] if len(row) > 3 else None,
-            'permissoes': row[4] if len(row) > 4 else None,
-        }
-    if user and authenticate_admin(username, password):
-        role = user.get('role') or 'admin'
-        store_id = user.get('store_id')
-        permissoes = user.get('permissoes')
-        if permissoes:
-            try:
-                permissoes = json.loads(permissoes)
-            except Exception:
-                permissoes = []
-        else:
-            permissoes = []
-        access_token = create_access_token({"sub": username, "role": role})
-        store_codigo = None
-        if store_id:
-            try:
-                if isinstance(store_id, str) and not store_id.isdigit():
-                    from database import get_store_by_code
-                    store = get_store_by_code(store_id)
-                    store_codigo = store['codigo'] if store else None
-                else:
-                    conn2 = get_db_connection()
-                    cur2 = conn2.cursor()
-                    cur2.execute('SELECT codigo FROM stores WHERE id = %s', (store_id,))
-                    row2 = cur2.fetchone()
-                    conn2.close()
-                    if row2:
-                        store_codigo = row2[0] if not isinstance(row2, dict) else row2.get('codigo')
-            except Exception:
-                store_codigo = None
-        return {
-            "success": True,
-            "access_token": access_token,
-            "token_type": "bearer",
-            "role": role,
-            "store_id": store_id,
-            "store_codigo": store_codigo,
-            "permissoes": permissoes,
-            "username": username
-        }
-    else:
-        return JSONResponse(status_code=401, content={"success": False, "message": "Usuário ou senha inválidos"})
-
-# Endpoint para renovar token (antes de expirar)
-@app.post('/admin/token/refresh')
-def refresh_token(current_user: str = Depends(get_current_user)):
-    # Busca o papel (role) atual do usuário para manter as claims
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT role FROM admin_users WHERE username = ?', (current_user,))
-    row = cur.fetchone()
-    conn.close()
-    role = row['role'] if row and 'role' in row.keys() else 'admin'
-    new_token = create_access_token({"sub": current_user, "role": role})
-    return {"success": True, "access_token": new_token, "token_type": "bearer", "role": role}
-
-# Função utilitária para checar se usuário é admin
-from jose import jwt
-SECRET_KEY = "precix_super_secret_key_2025"
-ALGORITHM = "HS256"
-def require_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        if payload.get('role') != 'admin':
-            raise HTTPException(status_code=403, detail='Acesso restrito a administradores')
-    except Exception:
-        raise HTTPException(status_code=401, detail='Token inválido ou expirado')
-
-def require_admin_or_perm(perm: str):
-    def _inner(credentials: HTTPAuthorizationCredentials = Depends(security)):
-        token = credentials.credentials
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username = payload.get('sub')
-            role = payload.get('role')
-            if role == 'admin':
-                return username
-            # Busca permissões no banco para o usuário
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute('SELECT permissoes FROM admin_users WHERE username = %s', (username,))
-            row = cur.fetchone()
-            conn.close()
-            perms = []
-            if row and ('permissoes' in row.keys()):
-                p = row['permissoes']
-                if p:
-                    try:
-                        perms = json.loads(p) if isinstance(p, str) else p
-                    except Exception:
-                        perms = []
-            if perm in perms:
-                return username
-            raise HTTPException(status_code=403, detail='Acesso restrito: falta permissão')
-        except HTTPException:
-            raise
-        except Exception:
-            raise HTTPException(status_code=401, detail='Token inválido ou expirado')
-    return _inner
-
-# --- Endpoints de administração de usuários admin ---
-from fastapi import Body
-
-@app.get('/admin/users')
-def list_admin_users(current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT username, role, store_id, permissoes FROM admin_users')
-    users = []
-    for row in cur.fetchall():
-        # Sempre converte para dict
-        u = {'username': row[0], 'role': row[1] if len(row) > 1 else 'admin', 'store_id': row[2] if len(row) > 2 else None, 'permissoes': row[3] if len(row) > 3 else None}
-        permissoes = u.get('permissoes')
-        if permissoes:
-            try:
-                permissoes = json.loads(permissoes)
-            except Exception:
-                permissoes = []
-        else:
-            permissoes = []
-        users.append({
-            'username': u.get('username'),
-            'role': u.get('role') or 'admin',
-            'store_id': u.get('store_id'),
-            'permissoes': permissoes
-        })
-    conn.close()
-    return {'users': users}
-
-@app.post('/admin/users')
-def create_admin_user_endpoint(data: dict = Body(...), current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    from database import hash_password
-    username = data.get('username')
-    password = data.get('password')
-    role = data.get('role', 'admin')
-    if not username or not password:
-        raise HTTPException(status_code=400, detail='Usuário e senha obrigatórios')
-    hashed = hash_password(password)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute('INSERT INTO admin_users (username, password, role) VALUES (%s, %s, %s)', (username, hashed, role))
-        conn.commit()
-    except Exception as e:
-        conn.close()
-        if 'UNIQUE constraint failed' in str(e):
-            raise HTTPException(status_code=409, detail='Usuário já existe')
-        raise HTTPException(status_code=500, detail='Erro ao criar usuário')
-    conn.close()
-    return {'success': True, 'message': 'Usuário criado com sucesso'}
-
-@app.put('/admin/users/{username}')
-def update_admin_user(username: str, data: dict = Body(...), current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    from database import hash_password
-    password = data.get('password')
-    role = data.get('role')
-    permissoes = data.get('permissoes')
-    store_id = data.get('store_id')
-    # Garante que permissoes seja string JSON para o banco
-    if permissoes is not None and not isinstance(permissoes, str):
-        permissoes = json.dumps(permissoes)
-    if not password and not role and permissoes is None and store_id is None:
-        raise HTTPException(status_code=400, detail='Nada para atualizar')
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Atualiza todos os campos enviados
-    if password and role and permissoes is not None and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, role = %s, permissoes = %s, store_id = %s WHERE username = %s', (hashed, role, permissoes, store_id, username))
-    elif password and role and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, role = %s, store_id = %s WHERE username = %s', (hashed, role, store_id, username))
-    elif password and permissoes is not None and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, permissoes = %s, store_id = %s WHERE username = %s', (hashed, permissoes, store_id, username))
-    elif role and permissoes is not None and store_id is not None:
-        cur.execute('UPDATE admin_users SET role = %s, permissoes = %s, store_id = %s WHERE username = %s', (role, permissoes, store_id, username))
-    elif password and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, store_id = %s WHERE username = %s', (hashed, store_id, username))
-    elif role and store_id is not None:
-        cur.execute('UPDATE admin_users SET role = %s, store_id = %s WHERE username = %s', (role, store_id, username))
-    elif permissoes is not None and store_id is not None:
-        cur.execute('UPDATE admin_users SET permissoes = %s, store_id = %s WHERE username = %s', (permissoes, store_id, username))
-    elif store_id is not None:
-        cur.execute('UPDATE admin_users SET store_id = %s WHERE username = %s', (store_id, username))
-    elif password and role and permissoes is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, role = %s, permissoes = %s WHERE username = %s', (hashed, role, permissoes, username))
-    elif password and role:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, role = %s WHERE username = %s', (hashed, role, username))
-    elif password and permissoes is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s, permissoes = %s WHERE username = %s', (hashed, permissoes, username))
-    elif role and permissoes is not None:
-        cur.execute('UPDATE admin_users SET role = %s, permissoes = %s WHERE username = %s', (role, permissoes, username))
-    elif password:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = %s WHERE username = %s', (hashed, username))
-    elif role:
-        cur.execute('UPDATE admin_users SET role = %s WHERE username = %s', (role, username))
-    elif permissoes is not None:
-        cur.execute('UPDATE admin_users SET permissoes = %s WHERE username = %s', (permissoes, username))
-    if cur.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail='Usuário não encontrado')
-    conn.commit()
-    conn.close()
-    return {'success': True, 'message': 'Usuário atualizado com sucesso'}
-
-@app.delete('/admin/users/{username}')
-def delete_admin_user(username: str, current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM admin_users WHERE username = %s', (username,))
-    if cur.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail='Usuário não encontrado')
-    conn.commit()
-    conn.close()
-    return {'success': True, 'message': 'Usuário removido com sucesso'}
-
-# Endpoint para buscar produto pelo código de barras
-@app.get('/product/{barcode}')
-def get_product(barcode: str):
-    product = get_product_by_barcode(barcode)
-    if not product:
-        raise HTTPException(status_code=404, detail='Produto não encontrado')
-    return product
-
-
-# Serve o frontend (build) se existir, mas não impede execução separada
-def mount_frontend_if_exists():
+def mount_frontend_if_exists(app: FastAPI):
     FRONTEND_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist'))
     if os.path.exists(FRONTEND_PATH):
         logging.info(f"Montando frontend na pasta: {FRONTEND_PATH}")
@@ -2682,397 +240,30 @@ def mount_frontend_if_exists():
     else:
         logging.warning(f"Pasta {FRONTEND_PATH} não encontrada. Certifique-se de que o build do frontend foi gerado corretamente.")
 
-mount_frontend_if_exists()
-
-# Endpoints de lojas
-@app.get('/admin/stores')
-def api_get_stores():
-    return get_all_stores()
-
-@app.post('/admin/stores')
-async def api_add_store(request: Request):
-    data = await request.json()
-    codigo = data.get('codigo') or data.get('code')
-    name = data.get('name')
-    status = data.get('status') or 'ativo'
-    if not codigo or not name:
-        return {"success": False, "message": "Código e nome da loja são obrigatórios."}
-    try:
-        from database import add_store_with_code
-        add_store_with_code(str(codigo), name, status)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@app.put('/admin/stores/{store_id}')
-async def api_update_store(store_id: int, request: Request):
-    data = await request.json()
-    codigo = data.get('codigo') or data.get('code')
-    name = data.get('name')
-    status = data.get('status') or 'ativo'
-    try:
-        if codigo is not None:
-            from database import update_store_code
-            update_store_code(store_id, str(codigo), name, status)
-        else:
-            update_store(store_id, name, status)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@app.delete('/admin/stores/{store_id}')
-def api_delete_store(store_id: int):
-    delete_store(store_id)
-    return {"success": True}
 
-# Endpoints de equipamentos
-@app.get('/admin/devices')
-def api_get_devices():
-    return get_all_devices()
-
-@app.post('/admin/devices')
-async def api_add_device(request: Request):
-    data = await request.json()
-    store_id = data.get('store_id')
-    name = data.get('name')
-    identifier = data.get('identifier')
-    if not store_id or not name or not identifier:
-        return {"success": False, "message": "Todos os campos são obrigatórios."}
-    # Adiciona dispositivo já com o identifier correto
-    add_device(store_id, name, identifier=identifier)
-    notify_ai_agent('device_added', {'store_id': store_id, 'name': name, 'identifier': identifier})
-    return {"success": True}
-
-@app.put('/admin/devices/{device_id}')
-def api_update_device(device_id: int, name: str, status: str, last_sync: str = None, online: int = None, store_id: int = None, identifier: str = None):
-    update_device(device_id, name, status, last_sync, online, store_id=store_id, identifier=identifier)
-    return {"success": True}
-
-@app.delete('/admin/devices/{device_id}')
-def api_delete_device(device_id: int):
-    delete_device(device_id)
-    return {"success": True}
-
-# Endpoint heartbeat: equipamento envia ping para marcar online
-@app.post('/device/heartbeat/{identifier}')
-def device_heartbeat(identifier: str):
-    # Busca o device pelo identificador (UUID)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT id FROM devices WHERE identifier = %s', (identifier,))
-    row = cur.fetchone()
-    conn.close()
-    if not row:
-        # Tenta buscar por identifier ignorando case e espaços
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT id FROM devices WHERE TRIM(LOWER(identifier)) = %s', (identifier.strip().lower(),))
-        row = cur.fetchone()
-        conn.close()
-        if not row:
-            raise HTTPException(status_code=404, detail='Dispositivo não encontrado')
-    set_device_online(identifier)
-    try:
-        notify_ai_agent('device_heartbeat', {'identifier': identifier})
-    except Exception:
-        pass
-    return {"success": True}
-
-# Endpoint para exportar produtos para .txt
-@app.get('/admin/export-txt')
-def export_txt():
-    txt_path = export_products_to_txt()
-    notify_ai_agent('export', {'file': txt_path})
-    return FileResponse(txt_path, media_type='text/plain', filename='produtos.txt')
-
-# Endpoints de auditoria
-@app.get('/admin/audit-logs')
-def api_get_audit_logs(limit: int = 50):
-    """Retorna logs de auditoria gerais do sistema"""
-    return get_audit_logs(limit)
-
-@app.get('/admin/devices/{device_id}/audit-logs')
-def api_get_device_audit_logs(device_id: int, limit: int = 20):
-    """Retorna logs de auditoria específicos de um dispositivo"""
-    return get_device_audit_logs(device_id, limit)
-
-# --- Endpoints de administração de usuários admin ---
-from fastapi import Body
-
-@app.get('/admin/users')
-def list_admin_users(current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT username, role, store_id, permissoes FROM admin_users')
-    users = []
-    for row in cur.fetchall():
-        permissoes = row['permissoes'] if 'permissoes' in row.keys() else None
-        if permissoes:
-            try:
-                permissoes = json.loads(permissoes)
-            except Exception:
-                permissoes = []
-        else:
-            permissoes = []
-        users.append({
-            'username': row['username'],
-            'role': row['role'] if 'role' in row.keys() else 'admin',
-            'store_id': row['store_id'] if 'store_id' in row.keys() else None,
-            'permissoes': permissoes
-        })
-   
-    conn.close()
-    return {'users': users}
-
-@app.post('/admin/users')
-def create_admin_user_endpoint(data: dict = Body(...), current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    from database import hash_password
-    username = data.get('username')
-    password = data.get('password')
-    role = data.get('role', 'admin')
-    if not username or not password:
-        raise HTTPException(status_code=400, detail='Usuário e senha obrigatórios')
-    hashed = hash_password(password)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute('INSERT INTO admin_users (username, password, role) VALUES (?, ?, ?)', (username, hashed, role))
-        conn.commit()
-    except Exception as e:
-        conn.close()
-        if 'UNIQUE constraint failed' in str(e):
-            raise HTTPException(status_code=409, detail='Usuário já existe')
-        raise HTTPException(status_code=500, detail='Erro ao criar usuário')
-    conn.close()
-    return {'success': True, 'message': 'Usuário criado com sucesso'}
-
-@app.put('/admin/users/{username}')
-def update_admin_user(username: str, data: dict = Body(...), current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    from database import hash_password
-    password = data.get('password')
-    role = data.get('role')
-    permissoes = data.get('permissoes')
-    store_id = data.get('store_id')
-    # Garante que permissoes seja string JSON para o banco
-    if permissoes is not None and not isinstance(permissoes, str):
-        permissoes = json.dumps(permissoes)
-    if not password and not role and permissoes is None and store_id is None:
-        raise HTTPException(status_code=400, detail='Nada para atualizar')
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # Atualiza todos os campos enviados
-    if password and role and permissoes is not None and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = ?, role = ?, permissoes = ?, store_id = ? WHERE username = ?', (hashed, role, permissoes, store_id, username))
-    elif password and role and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = ?, role = ?, store_id = ? WHERE username = ?', (hashed, role, store_id, username))
-    elif password and permissoes is not None and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = ?, permissoes = ?, store_id = ? WHERE username = ?', (hashed, permissoes, store_id, username))
-    elif role and permissoes is not None and store_id is not None:
-        cur.execute('UPDATE admin_users SET role = ?, permissoes = ?, store_id = ? WHERE username = ?', (role, permissoes, store_id, username))
-    elif password and store_id is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = ?, store_id = ? WHERE username = ?', (hashed, store_id, username))
-    elif role and store_id is not None:
-        cur.execute('UPDATE admin_users SET role = ?, store_id = ? WHERE username = ?', (role, store_id, username))
-    elif permissoes is not None and store_id is not None:
-        cur.execute('UPDATE admin_users SET permissoes = ?, store_id = ? WHERE username = ?', (permissoes, store_id, username))
-    elif store_id is not None:
-        cur.execute('UPDATE admin_users SET store_id = ? WHERE username = ?', (store_id, username))
-    elif password and role and permissoes is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = ?, role = ?, permissoes = ? WHERE username = ?', (hashed, role, permissoes, username))
-    elif password and role:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = ?, role = ? WHERE username = ?', (hashed, role, username))
-    elif password and permissoes is not None:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = ?, permissoes = ? WHERE username = ?', (hashed, permissoes, username))
-    elif role and permissoes is not None:
-        cur.execute('UPDATE admin_users SET role = ?, permissoes = ? WHERE username = ?', (role, permissoes, username))
-    elif password:
-        hashed = hash_password(password)
-        cur.execute('UPDATE admin_users SET password = ? WHERE username = ?', (hashed, username))
-    elif role:
-        cur.execute('UPDATE admin_users SET role = ? WHERE username = ?', (role, username))
-    elif permissoes is not None:
-        cur.execute('UPDATE admin_users SET permissoes = ? WHERE username = ?', (permissoes, username))
-    if cur.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail='Usuário não encontrado')
-    conn.commit()
-    conn.close()
-    return {'success': True, 'message': 'Usuário atualizado com sucesso'}
-
-@app.delete('/admin/users/{username}')
-def delete_admin_user(username: str, current_user: str = Depends(require_admin_or_perm('usuarios'))):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM admin_users WHERE username = ?', (username,))
-    if cur.rowcount == 0:
-        conn.close()
-        raise HTTPException(status_code=404, detail='Usuário não encontrado')
-    conn.commit()
-    conn.close()
-    return {'success': True, 'message': 'Usuário removido com sucesso'}
-
-# Endpoint para buscar produto pelo código de barras
-@app.get('/product/{barcode}')
-def get_product(barcode: str):
-    product = get_product_by_barcode(barcode)
-    if not product:
-        raise HTTPException(status_code=404, detail='Produto não encontrado')
-    return product
-
-
-# Serve o frontend (build) se existir, mas não impede execução separada
-def mount_frontend_if_exists():
-    FRONTEND_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist'))
-    if os.path.exists(FRONTEND_PATH):
-        logging.info(f"Montando frontend na pasta: {FRONTEND_PATH}")
-        mount_frontend(app, FRONTEND_PATH)
-    else:
-        logging.warning(f"Pasta {FRONTEND_PATH} não encontrada. Certifique-se de que o build do frontend foi gerado corretamente.")
-
-mount_frontend_if_exists()
-
-# Endpoints de lojas
-@app.get('/admin/stores')
-def api_get_stores():
-    return get_all_stores()
-
-@app.post('/admin/stores')
-async def api_add_store(request: Request):
-    data = await request.json()
-    codigo = data.get('codigo') or data.get('code')
-    name = data.get('name')
-    status = data.get('status') or 'ativo'
-    if not codigo or not name:
-        return {"success": False, "message": "Código e nome da loja são obrigatórios."}
-    try:
-        from database import add_store_with_code
-        add_store_with_code(str(codigo), name, status)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@app.put('/admin/stores/{store_id}')
-async def api_update_store(store_id: int, request: Request):
-    data = await request.json()
-    codigo = data.get('codigo') or data.get('code')
-    name = data.get('name')
-    status = data.get('status') or 'ativo'
-    try:
-        if codigo is not None:
-            from database import update_store_code
-            update_store_code(store_id, str(codigo), name, status)
-        else:
-            update_store(store_id, name, status)
-        return {"success": True}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@app.delete('/admin/stores/{store_id}')
-def api_delete_store(store_id: int):
-    delete_store(store_id)
-    return {"success": True}
-
-# Endpoints de equipamentos
-@app.get('/admin/devices')
-def api_get_devices():
-    return get_all_devices()
-
-@app.post('/admin/devices')
-async def api_add_device(request: Request):
-    data = await request.json()
-    store_id = data.get('store_id')
-    name = data.get('name')
-    identifier = data.get('identifier')
-    if not store_id or not name or not identifier:
-        return {"success": False, "message": "Todos os campos são obrigatórios."}
-    # Adiciona dispositivo já com o identifier correto
-    add_device(store_id, name, identifier=identifier)
-    notify_ai_agent('device_added', {'store_id': store_id, 'name': name, 'identifier': identifier})
-    return {"success": True}
-
-@app.put('/admin/devices/{device_id}')
-def api_update_device(device_id: int, name: str, status: str, last_sync: str = None, online: int = None, store_id: int = None, identifier: str = None):
-    update_device(device_id, name, status, last_sync, online, store_id=store_id, identifier=identifier)
-    return {"success": True}
+def create_app() -> FastAPI:
+    """Monta o app: routers, middlewares e frontend. O startup/shutdown é compartilhado e idempotente."""
+    # Saída do importador de preços disponível em /admin/importar-precos/logs
+    capture_import_logs()
+    app = FastAPI(on_startup=[_on_startup], on_shutdown=[_on_shutdown])
+    for router in ROUTERS:
+        app.include_router(router)
+    # Latência por rota/status e requisições em andamento (GET /metrics)
+    app.add_middleware(MetricsMiddleware)
+    # Tempo de banco por requisição (Server-Timing, X-Request-ID) e log de consultas lentas
+    app.add_middleware(RequestTimingMiddleware, route_of=route_template)
+    # CORS for dev (mais externo: vale também para as respostas dos middlewares acima)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", "X-Catalog-Revision", "X-Next-Cursor", "X-Request-ID", "Server-Timing"],
+    )
+    mount_frontend_if_exists(app)
+    return app
 
-@app.delete('/admin/devices/{device_id}')
-def api_delete_device(device_id: int):
-    delete_device(device_id)
-    return {"success": True}
 
-# Endpoint heartbeat: equipamento envia ping para marcar online
-@app.post('/device/heartbeat/{identifier}')
-async def device_heartbeat(identifier: str, request: Request):
-    # Busca o device pelo identificador (UUID)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT id FROM devices WHERE identifier = %s', (identifier,))
-    # Se precisar usar o resultado, pode usar cur.fetchone()
-    data = await request.json()
-    username = data.get('username')
-    password = data.get('password')
-    if not username or not password:
-        return JSONResponse(status_code=400, content={"success": False, "message": "Usuário e senha obrigatórios"})
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT username, password, role, store_id, permissoes FROM admin_users WHERE username = %s', (username,))
-    row = cur.fetchone()
-    conn.close()
-    user = None
-    if row:
-        # psycopg2 default: tuple, not dict
-        user = {
-            'username': row[0],
-            'password': row[1],
-            'role': row[2] if len(row) > 2 else 'admin',
-            'store_id': row[3] if len(row) > 3 else None,
-            'permissoes': row[4] if len(row) > 4 else None,
-        }
-    if user and authenticate_admin(username, password):
-        role = user.get('role') or 'admin'
-        store_id = user.get('store_id')
-        permissoes = user.get('permissoes')
-        if permissoes:
-            try:
-                permissoes = json.loads(permissoes)
-            except Exception:
-                permissoes = []
-        else:
-            permissoes = []
-        access_token = create_access_token({"sub": username, "role": role})
-        store_codigo = None
-        if store_id:
-            try:
-                if isinstance(store_id, str) and not store_id.isdigit():
-                    from database import get_store_by_code
-                    store = get_store_by_code(store_id)
-                    store_codigo = store['codigo'] if store else None
-                else:
-                    conn2 = get_db_connection()
-                    cur2 = conn2.cursor()
-                    cur2.execute('SELECT codigo FROM stores WHERE id = %s', (store_id,))
-                    row2 = cur2.fetchone()
-                    conn2.close()
-                    if row2:
-                        store_codigo = row2[0] if not isinstance(row2, dict) else row2.get('codigo')
-            except Exception:
-                store_codigo = None
-        return {
-            "success": True,
-            "access_token": access_token,
-            "token_type": "bearer",
-            "role": role,
-            "store_id": store_id,
-            "store_codigo": store_codigo,
-            "permissoes": permissoes,
-            "username": username
-        }
-    else:
-        return JSONResponse(status_code=401, content={"success": False, "message": "Usuário ou senha inválidos"})
+app = create_app()
+startup.mark_imported(time.perf_counter() - _IMPORT_T0)
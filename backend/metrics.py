@@ -0,0 +1,291 @@
+"""
+Módulo: metrics.py
+------------------
+Métricas no formato texto do Prometheus (GET /metrics).
+
+- Contadores, gauges e histogramas gravados em "shards" por thread: o caminho quente só
+  mexe no dicionário da própria thread (sem lock); a coleta soma os shards no scrape
+- Shards de threads encerradas (workers ociosos do threadpool, threads avulsas) são somados a um
+  total "aposentado" e descartados, então a memória e o custo do scrape não crescem com o tempo
+- MetricsMiddleware (ASGI puro) mede cada requisição HTTP por método, rota (template do
+  FastAPI, ex.: /product/{barcode}) e status, e mantém o gauge de requisições em andamento
+- Coletores registrados com add_collector(fn) leem estatísticas já existentes (pool, caches,
+  fila do audit_log...) só no momento do scrape
+- Leitura concorrente a uma escrita pode ver um histograma com um incremento a menos:
+  aceitável para métricas e é o que mantém o custo da instrumentação em microssegundos
+"""
+
+import math
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Limites (s) padrão dos histogramas de latência
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Rota usada para caminhos que não casam com nenhuma rota (evita uma série por URL de 404)
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self._registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues, value: float = 1.0):
+        shard = self._registry._shard()
+        key = (self.name, labelvalues)
+        shard[key] = shard.get(key, 0.0) + value
+
+
+class Gauge(_Metric):
+    """Gauge somado entre threads (inc/dec); use um coletor para valores absolutos."""
+    kind = 'gauge'
+
+    def inc(self, *labelvalues, value: float = 1.0):
+        shard = self._registry._shard()
+        key = (self.name, labelvalues)
+        shard[key] = shard.get(key, 0.0) + value
+
+    def dec(self, *labelvalues, value: float = 1.0):
+        self.inc(*labelvalues, value=-value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, value: float, *labelvalues):
+        shard = self._registry._shard()
+        key = (self.name, labelvalues)
+        cell = shard.get(key)
+        if cell is None:
+            # [contagem por bucket (não cumulativa)..., +Inf, soma, contagem]
+            cell = shard[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = 'precix_'):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+        # (weakref da thread dona, shard); shards de threads mortas vão para _retired
+        self._shards: List[Tuple[weakref.ref, dict]] = []
+        self._retired: dict = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._retire_dead()
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    def _retire_dead(self):
+        # Chamado com _lock: uma thread encerrada não escreve mais no próprio shard
+        live = []
+        for ref, shard in self._shards:
+            thread = ref()
+            if thread is not None and thread.is_alive():
+                live.append((ref, shard))
+            else:
+                _merge_into(self._retired, shard)
+        self._shards = live
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(self, self.prefix + name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(self, self.prefix + name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, self.prefix + name, help_text, labelnames, buckets))
+
+    def add_collector(self, fn: Callable[[], Iterable[tuple]]):
+        """fn() -> iterável de (nome, tipo, ajuda, [(labels dict, valor), ...]), chamado a cada scrape."""
+        self._collectors.append(fn)
+
+    # --- coleta ---
+    def _merged(self) -> dict:
+        with self._lock:
+            self._retire_dead()
+            shards = [shard for _, shard in self._shards]
+            merged = {k: list(v) if isinstance(v, list) else v for k, v in self._retired.items()}
+        for shard in shards:
+            # Cópia rápida: a thread dona pode inserir chaves novas durante a iteração
+            _merge_into(merged, shard)
+        return merged
+
+    def render(self) -> str:
+        merged = self._merged()
+        by_metric: Dict[str, list] = {}
+        for (name, labelvalues), value in merged.items():
+            by_metric.setdefault(name, []).append((labelvalues, value))
+        lines: List[str] = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for labelvalues, value in sorted(by_metric.get(metric.name, ()), key=lambda x: x[0]):
+                labels = dict(zip(metric.labelnames, labelvalues))
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    for bound, n in zip(metric.buckets + (math.inf,), value[:-2]):
+                        cumulative += n
+                        lines.append(f"{metric.name}_bucket{_labels(labels, le=_fmt(bound))} {cumulative}")
+                    lines.append(f'{metric.name}_sum{_labels(labels)} {_fmt(value[-2])}')
+                    lines.append(f'{metric.name}_count{_labels(labels)} {value[-1]}')
+                else:
+                    lines.append(f'{metric.name}{_labels(labels)} {_fmt(value)}')
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                lines.append(f'# coletor {getattr(collector, "__name__", "?")} falhou: {type(e).__name__}')
+                continue
+            for name, kind, help_text, samples in families:
+                name = self.prefix + name
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f'{name}{_labels(labels)} {_fmt(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _merge_into(dst: dict, shard: dict):
+    for key, value in list(shard.items()):
+        if isinstance(value, list):
+            acc = dst.get(key)
+            dst[key] = list(value) if acc is None else [a + b for a, b in zip(acc, value)]
+        else:
+            dst[key] = dst.get(key, 0.0) + value
+
+
+def _fmt(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: dict, **extra) -> str:
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.histogram(
+    'http_request_duration_seconds', 'Duração das requisições HTTP por método, rota e status',
+    ('method', 'route', 'status'))
+http_in_flight = registry.gauge('http_requests_in_flight', 'Requisições HTTP em andamento')
+db_acquire = registry.histogram(
+    'db_pool_acquire_seconds', 'Tempo para obter uma conexão do pool',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0))
+db_queries = registry.histogram(
+    'db_query_duration_seconds', 'Duração de cada execute() no PostgreSQL', ('status',))
+job_runs = registry.histogram(
+    'job_duration_seconds', 'Duração das execuções dos jobs em background', ('job', 'status'),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0))
+
+
+def observe_db_query(seconds: float, ok: bool = True):
+    db_queries.observe(seconds, 'ok' if ok else 'error')
+
+
+def observe_job(name: str, seconds: float, ok: bool):
+    job_runs.observe(seconds, name, 'ok' if ok else 'error')
+
+
+# Por app: endpoint -> template da rota (Starlette antigo não grava scope['route'])
+_route_paths: Dict[int, Dict[object, str]] = {}
+
+
+def route_template(scope) -> str:
+    """Template da rota que atendeu a requisição (após o roteamento), ex.: /product/{barcode}."""
+    route = scope.get('route')
+    path = getattr(route, 'path', None)
+    if path:
+        return path
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    app = scope.get('app')
+    paths = _route_paths.get(id(app))
+    if paths is None:
+        router = getattr(app, 'router', None)
+        paths = _route_paths[id(app)] = {
+            getattr(r, 'endpoint', None): getattr(r, 'path', None)
+            for r in getattr(router, 'routes', ())
+        }
+    return paths.get(endpoint) or getattr(endpoint, '__name__', UNMATCHED_ROUTE)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: histograma por (método, template da rota, status) e requisições em andamento."""
+
+    def __init__(self, app, exclude_paths: Tuple[str, ...] = ('/metrics',)):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope.get('path') in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        http_in_flight.inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            http_requests.observe(time.perf_counter() - t0, scope.get('method', ''),
+                                  route_template(scope), str(status[0]))
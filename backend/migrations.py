@@ -0,0 +1,283 @@
+"""
+Módulo: migrations.py
+---------------------
+Migrações incrementais de schema aplicadas na inicialização (init_db).
+
+- Cada migração tem versão, nome e SQL idempotente (IF NOT EXISTS / OR REPLACE)
+- Versões aplicadas ficam registradas em schema_migrations
+- Advisory lock evita que vários workers apliquem a mesma migração ao mesmo tempo
+- Falta de privilégio (usuário da aplicação sem DDL) é apenas logada: o DBA pode
+  aplicar o SQL manualmente com o owner do schema (ver MIGRATIONS abaixo)
+"""
+
+import logging
+import threading
+
+try:
+    from .database import db_connection, db_transaction
+except ImportError:
+    from database import db_connection, db_transaction
+
+# Chave arbitrária do pg_advisory_xact_lock das migrações
+_LOCK_KEY = 7301001
+
+MIGRATIONS = [
+    (1, 'catalog_revision', '''
+        -- Revisão global do catálogo: incrementada por qualquer escrita em products
+        CREATE SEQUENCE IF NOT EXISTS catalog_revision_seq;
+        CREATE TABLE IF NOT EXISTS catalog_state (
+            id SMALLINT PRIMARY KEY CHECK (id = 1),
+            revision BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        INSERT INTO catalog_state (id, revision)
+        VALUES (1, nextval('catalog_revision_seq'))
+        ON CONFLICT (id) DO NOTHING;
+        CREATE OR REPLACE FUNCTION precix_bump_catalog_revision() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE catalog_state
+               SET revision = nextval('catalog_revision_seq'), updated_at = now()
+             WHERE id = 1;
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS trg_products_catalog_revision ON products;
+        CREATE TRIGGER trg_products_catalog_revision
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+            FOR EACH STATEMENT EXECUTE PROCEDURE precix_bump_catalog_revision();
+    '''),
+    (2, 'product_change_revisions', '''
+        -- Revisão por produto + tombstones de exclusão (sync incremental /product/changes)
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS rev BIGINT;
+        UPDATE products SET rev = nextval('catalog_revision_seq') WHERE rev IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_products_rev ON products (rev);
+        CREATE TABLE IF NOT EXISTS product_tombstones (
+            barcode VARCHAR PRIMARY KEY,
+            rev BIGINT NOT NULL,
+            deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS idx_product_tombstones_rev ON product_tombstones (rev);
+        -- Revisões abaixo do piso não podem mais ser servidas como delta (tombstones podados/TRUNCATE)
+        ALTER TABLE catalog_state ADD COLUMN IF NOT EXISTS delta_floor BIGINT NOT NULL DEFAULT 0;
+        UPDATE catalog_state SET delta_floor = (SELECT COALESCE(MAX(rev), 0) FROM products) WHERE id = 1;
+
+        -- Serializa escritores de products: a ordem das revisões passa a ser a ordem de commit,
+        -- então um cliente nunca "pula" uma revisão menor que ainda não estava visível
+        CREATE OR REPLACE FUNCTION precix_products_write_lock() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(7301002);
+            IF TG_OP = 'TRUNCATE' THEN
+                UPDATE catalog_state SET delta_floor = nextval('catalog_revision_seq') WHERE id = 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS trg_products_write_lock ON products;
+        CREATE TRIGGER trg_products_write_lock
+            BEFORE INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+            FOR EACH STATEMENT EXECUTE PROCEDURE precix_products_write_lock();
+
+        CREATE OR REPLACE FUNCTION precix_products_row_rev() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO product_tombstones (barcode, rev, deleted_at)
+                VALUES (OLD.barcode, nextval('catalog_revision_seq'), now())
+                ON CONFLICT (barcode) DO UPDATE SET rev = EXCLUDED.rev, deleted_at = EXCLUDED.deleted_at;
+                RETURN OLD;
+            END IF;
+            IF TG_OP = 'UPDATE' THEN
+                -- Regravação idêntica (reimportação) não gera mudança para os clientes
+                IF NEW.barcode IS NOT DISTINCT FROM OLD.barcode
+                   AND NEW.name IS NOT DISTINCT FROM OLD.name
+                   AND NEW.price IS NOT DISTINCT FROM OLD.price
+                   AND NEW.promo IS NOT DISTINCT FROM OLD.promo THEN
+                    NEW.rev := OLD.rev;
+                    RETURN NEW;
+                END IF;
+                IF NEW.barcode IS DISTINCT FROM OLD.barcode THEN
+                    INSERT INTO product_tombstones (barcode, rev, deleted_at)
+                    VALUES (OLD.barcode, nextval('catalog_revision_seq'), now())
+                    ON CONFLICT (barcode) DO UPDATE SET rev = EXCLUDED.rev, deleted_at = EXCLUDED.deleted_at;
+                END IF;
+            END IF;
+            NEW.rev := nextval('catalog_revision_seq');
+            IF TG_OP = 'INSERT' THEN
+                DELETE FROM product_tombstones WHERE barcode = NEW.barcode;
+            ELSIF NEW.barcode IS DISTINCT FROM OLD.barcode THEN
+                DELETE FROM product_tombstones WHERE barcode = NEW.barcode;
+            END IF;
+            RETURN NEW;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS trg_products_row_rev ON products;
+        CREATE TRIGGER trg_products_row_rev
+            BEFORE INSERT OR UPDATE OR DELETE ON products
+            FOR EACH ROW EXECUTE PROCEDURE precix_products_row_rev();
+    '''),
+    (3, 'device_presence_indexes', '''
+        -- Presença calculada no SQL (last_sync dentro da janela), com filtro por loja
+        CREATE INDEX IF NOT EXISTS idx_devices_last_sync ON devices (last_sync);
+        CREATE INDEX IF NOT EXISTS idx_devices_store_last_sync ON devices (store_id, last_sync);
+    '''),
+    (4, 'agent_identity_indexes', '''
+        -- Reconciliação incremental por heartbeat (reconcile_agent_identity): busca por id normalizado e IP
+        CREATE INDEX IF NOT EXISTS idx_agents_status_norm_id ON agents_status ((lower(trim(agent_id))));
+        CREATE INDEX IF NOT EXISTS idx_agents_status_ip ON agents_status (ip);
+        CREATE INDEX IF NOT EXISTS idx_agent_devices_ip ON agent_devices (ip);
+    '''),
+    (5, 'audit_log_partitioned', '''
+        -- audit_log particionado por mês (ou dia): retenção remove partições inteiras em vez de DELETE
+        -- (ver maintain_audit_partitions em database.py)
+        CREATE OR REPLACE FUNCTION precix_audit_log_ensure_partition(p_start date, p_interval text DEFAULT 'month')
+        RETURNS text LANGUAGE plpgsql AS $$
+        DECLARE
+            v_start date := CASE WHEN p_interval = 'day' THEN p_start ELSE date_trunc('month', p_start)::date END;
+            v_end date := CASE WHEN p_interval = 'day' THEN v_start + 1 ELSE (v_start + interval '1 month')::date END;
+            v_name text := 'audit_log_' || to_char(v_start, CASE WHEN p_interval = 'day' THEN 'YYYYMMDD' ELSE 'YYYYMM' END);
+        BEGIN
+            IF to_regclass(v_name) IS NOT NULL THEN
+                RETURN NULL;
+            END IF;
+            -- Linhas do período que caíram na partição default impedem a criação: move-as antes
+            CREATE TEMP TABLE IF NOT EXISTS precix_audit_log_moving (LIKE audit_log) ON COMMIT DROP;
+            WITH moved AS (
+                DELETE FROM audit_log_default WHERE timestamp >= v_start AND timestamp < v_end RETURNING *
+            )
+            INSERT INTO precix_audit_log_moving SELECT * FROM moved;
+            EXECUTE format('CREATE TABLE %I PARTITION OF audit_log FOR VALUES FROM (%L) TO (%L)', v_name, v_start, v_end);
+            INSERT INTO audit_log SELECT * FROM precix_audit_log_moving;
+            DELETE FROM precix_audit_log_moving;
+            RETURN v_name;
+        END
+        $$;
+
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('audit_log') AND relkind = 'r') THEN
+                ALTER TABLE audit_log RENAME TO audit_log_legacy;
+                ALTER INDEX IF EXISTS audit_log_pkey RENAME TO audit_log_legacy_pkey;
+                ALTER SEQUENCE IF EXISTS audit_log_id_seq RENAME TO audit_log_legacy_id_seq;
+            END IF;
+        END
+        $$;
+
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id BIGSERIAL,
+            timestamp TIMESTAMP NOT NULL,
+            device_id INTEGER REFERENCES devices(id),
+            device_name VARCHAR,
+            action VARCHAR NOT NULL,
+            details VARCHAR,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+        CREATE TABLE IF NOT EXISTS audit_log_default PARTITION OF audit_log DEFAULT;
+        CREATE INDEX IF NOT EXISTS idx_audit_log_timestamp ON audit_log (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_audit_log_device_ts ON audit_log (device_id, timestamp);
+
+        -- Partições do período já existente até dois meses à frente; depois copia as linhas antigas
+        DO $$
+        DECLARE
+            v_month date := date_trunc('month', now() AT TIME ZONE 'UTC')::date;
+            v_first date := v_month;
+        BEGIN
+            IF to_regclass('audit_log_legacy') IS NOT NULL THEN
+                EXECUTE 'SELECT COALESCE(date_trunc(''month'', MIN(timestamp))::date, $1) FROM audit_log_legacy'
+                    INTO v_first USING v_month;
+            END IF;
+            WHILE v_first <= v_month + interval '2 months' LOOP
+                PERFORM precix_audit_log_ensure_partition(v_first, 'month');
+                v_first := (v_first + interval '1 month')::date;
+            END LOOP;
+            IF to_regclass('audit_log_legacy') IS NOT NULL THEN
+                INSERT INTO audit_log (id, timestamp, device_id, device_name, action, details)
+                SELECT id, timestamp, device_id, device_name, action, details FROM audit_log_legacy;
+                PERFORM setval(pg_get_serial_sequence('audit_log', 'id'),
+                               GREATEST((SELECT MAX(id) FROM audit_log), 1));
+                DROP TABLE audit_log_legacy;
+            END IF;
+        END
+        $$;
+    '''),
+    (6, 'audit_log_keyset_indexes', '''
+        -- Paginação keyset em (timestamp, id) (query_audit_logs): índices com o desempate por id
+        CREATE INDEX IF NOT EXISTS idx_audit_log_ts_id ON audit_log (timestamp, id);
+        CREATE INDEX IF NOT EXISTS idx_audit_log_device_ts_id ON audit_log (device_id, timestamp, id);
+        CREATE INDEX IF NOT EXISTS idx_audit_log_action_ts_id ON audit_log (action, timestamp, id);
+        DROP INDEX IF EXISTS idx_audit_log_timestamp;
+        DROP INDEX IF EXISTS idx_audit_log_device_ts;
+    '''),
+    (7, 'price_query_stats', '''
+        -- Rollups horários das consultas de preço (price_query_stats.py); os painéis leem daqui
+        -- em vez de varrer o audit_log. dimension: barcode | device | store
+        CREATE TABLE IF NOT EXISTS price_query_stats (
+            bucket TIMESTAMP NOT NULL,
+            dimension VARCHAR(16) NOT NULL,
+            key VARCHAR NOT NULL,
+            queries BIGINT NOT NULL DEFAULT 0,
+            hits BIGINT NOT NULL DEFAULT 0,
+            misses BIGINT NOT NULL DEFAULT 0,
+            latency_count BIGINT NOT NULL DEFAULT 0,
+            latency_sum_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+            latency_hist BIGINT[] NOT NULL DEFAULT '{}',
+            PRIMARY KEY (bucket, dimension, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_price_query_stats_dim_bucket ON price_query_stats (dimension, bucket);
+    '''),
+]
+
+_APPLIED = False
+_LOCK = threading.Lock()
+
+
+def apply_migrations() -> list:
+    """Aplica as migrações pendentes (uma vez por processo). Retorna as versões aplicadas agora."""
+    global _APPLIED
+    if _APPLIED:
+        return []
+    with _LOCK:
+        if _APPLIED:
+            return []
+        applied_now = []
+        try:
+            with db_transaction() as conn:
+                cur = conn.cursor()
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name VARCHAR NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    )
+                ''')
+        except Exception as e:
+            logging.warning(f"[DB][migrations] Não foi possível criar schema_migrations: {e}")
+            return applied_now
+        for version, name, sql in MIGRATIONS:
+            try:
+                with db_transaction() as conn:
+                    cur = conn.cursor()
+                    cur.execute('SELECT pg_advisory_xact_lock(%s)', (_LOCK_KEY,))
+                    cur.execute('SELECT 1 FROM schema_migrations WHERE version = %s', (version,))
+                    if cur.fetchone():
+                        continue
+                    cur.execute(sql)
+                    cur.execute('INSERT INTO schema_migrations (version, name) VALUES (%s, %s)', (version, name))
+                applied_now.append(version)
+                logging.info(f"[DB][migrations] Migração {version} ({name}) aplicada")
+            except Exception as e:
+                # Migrações seguintes podem depender desta: interrompe
+                logging.error(f"[DB][migrations] Falha na migração {version} ({name}): {e}")
+                return applied_now
+        _APPLIED = True
+        return applied_now
+
+
+def get_applied_migrations() -> list:
+    """Lista as migrações registradas no banco (para diagnóstico)."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT version, name, applied_at FROM schema_migrations ORDER BY version')
+        rows = cur.fetchall()
+    return [{'version': r[0], 'name': r[1], 'applied_at': r[2].isoformat() if r[2] else None} for r in rows]
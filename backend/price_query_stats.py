@@ -0,0 +1,198 @@
+"""
+Módulo: price_query_stats.py
+----------------------------
+Agregação em memória das consultas de preço (POST /admin/devices/events/price-query).
+
+- Contadores por hora (UTC) e dimensão: barcode, device (identifier) e store
+- Por chave: consultas, acertos (ok), falhas, histograma de latência informada pelo cliente
+  (latency_ms) com limites em PRECIX_PRICE_QUERY_LATENCY_BUCKETS_MS, soma e contagem de latências
+- A cada PRECIX_PRICE_QUERY_FLUSH_S segundos os contadores acumulados são somados à tabela
+  price_query_stats (um upsert em lote; ver flush_price_query_stats em database.py)
+- Os painéis consultam os rollups (get_price_query_top / get_price_query_series), não o audit_log
+- Falha no flush devolve os contadores ao buffer (somados aos que chegaram no meio tempo)
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+PRICE_QUERY_FLUSH_S = float(os.environ.get('PRECIX_PRICE_QUERY_FLUSH_S', '60'))
+LATENCY_BUCKETS_MS = tuple(
+    float(b) for b in os.environ.get('PRECIX_PRICE_QUERY_LATENCY_BUCKETS_MS', '50,100,250,500,1000,2500').split(',')
+    if b.strip()
+)
+
+DIMENSIONS = ('barcode', 'device', 'store')
+
+
+def hour_bucket(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+class _Counter:
+    __slots__ = ('queries', 'hits', 'misses', 'latency_count', 'latency_sum_ms', 'hist')
+
+    def __init__(self, n_buckets: int):
+        self.queries = 0
+        self.hits = 0
+        self.misses = 0
+        self.latency_count = 0
+        self.latency_sum_ms = 0.0
+        # Um contador por limite + o excedente (> último limite)
+        self.hist = [0] * (n_buckets + 1)
+
+    def merge(self, other: '_Counter'):
+        self.queries += other.queries
+        self.hits += other.hits
+        self.misses += other.misses
+        self.latency_count += other.latency_count
+        self.latency_sum_ms += other.latency_sum_ms
+        self.hist = [a + b for a, b in zip(self.hist, other.hist)]
+
+
+class PriceQueryAggregator:
+    def __init__(self, flush_fn: Callable[[List[tuple]], None] = None, interval_s: float = PRICE_QUERY_FLUSH_S,
+                 buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self._flush_fn = flush_fn
+        self.interval_s = max(1.0, float(interval_s))
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (hora, dimensão, chave) -> _Counter
+        self._counters: Dict[tuple, _Counter] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'recorded': 0, 'flushes': 0, 'flushed_rows': 0, 'flush_errors': 0, 'last_flush_ms': 0.0}
+
+    def _bucket_index(self, latency_ms: float) -> int:
+        for i, limit in enumerate(self.buckets_ms):
+            if latency_ms <= limit:
+                return i
+        return len(self.buckets_ms)
+
+    def record(self, identifier: str, barcode: str, ok: bool, latency_ms: float = None,
+               store_id: int = None, ts: datetime = None):
+        hour = hour_bucket(ts or datetime.utcnow())
+        keys = [('barcode', barcode), ('device', identifier)]
+        if store_id is not None:
+            keys.append(('store', str(store_id)))
+        bucket = None
+        if latency_ms is not None:
+            try:
+                latency_ms = float(latency_ms)
+            except (TypeError, ValueError):
+                latency_ms = None
+            # Infinity/NaN (aceitos pelo parser JSON) quebrariam a soma e as respostas da análise
+            if latency_ms is not None and not math.isfinite(latency_ms):
+                latency_ms = None
+            if latency_ms is not None:
+                latency_ms = max(0.0, latency_ms)
+                bucket = self._bucket_index(latency_ms)
+        with self._lock:
+            self._stats['recorded'] += 1
+            for dimension, key in keys:
+                if not key:
+                    continue
+                c = self._counters.get((hour, dimension, key))
+                if c is None:
+                    c = self._counters[(hour, dimension, key)] = _Counter(len(self.buckets_ms))
+                c.queries += 1
+                if ok:
+                    c.hits += 1
+                else:
+                    c.misses += 1
+                if bucket is not None:
+                    c.latency_count += 1
+                    c.latency_sum_ms += latency_ms
+                    c.hist[bucket] += 1
+
+    def flush(self) -> int:
+        """Soma os contadores acumulados na tabela de rollups. Retorna linhas gravadas."""
+        if self._flush_fn is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                counters, self._counters = self._counters, {}
+            if not counters:
+                return 0
+            rows = [
+                (hour, dimension, key, c.queries, c.hits, c.misses, c.latency_count, c.latency_sum_ms, c.hist)
+                for (hour, dimension, key), c in counters.items()
+            ]
+            t0 = time.perf_counter()
+            try:
+                self._flush_fn(rows)
+            except Exception as e:
+                with self._lock:
+                    for k, c in counters.items():
+                        current = self._counters.get(k)
+                        if current is None:
+                            self._counters[k] = c
+                        else:
+                            current.merge(c)
+                    self._stats['flush_errors'] += 1
+                logging.warning(f"[PRICE_QUERY] Falha ao gravar {len(rows)} rollups: {e}")
+                return 0
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['flushed_rows'] += len(rows)
+                self._stats['last_flush_ms'] = round((time.perf_counter() - t0) * 1000.0, 3)
+            return len(rows)
+
+    def start(self, flush_fn: Callable[[List[tuple]], None] = None):
+        if flush_fn is not None:
+            self._flush_fn = flush_fn
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='precix-price-query-stats', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout_s: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout_s)
+            self._thread = None
+        self.flush()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out['pending_keys'] = len(self._counters)
+        out['interval_s'] = self.interval_s
+        out['latency_buckets_ms'] = list(self.buckets_ms)
+        return out
+
+
+def summarize(row: dict, buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS) -> dict:
+    """Completa uma linha agregada com taxa de acerto/falha, latência média e p50/p95 estimados."""
+    queries = row.get('queries') or 0
+    row['hit_ratio'] = round(row.get('hits', 0) / queries, 4) if queries else None
+    row['failure_rate'] = round(row.get('misses', 0) / queries, 4) if queries else None
+    count = row.get('latency_count') or 0
+    row['latency_avg_ms'] = round(row.get('latency_sum_ms', 0.0) / count, 1) if count else None
+    hist = list(row.get('latency_hist') or [])
+    for name, q in (('latency_p50_ms', 0.5), ('latency_p95_ms', 0.95)):
+        row[name] = _quantile(hist, buckets_ms, q, count)
+    return row
+
+
+def _quantile(hist: list, buckets_ms: Tuple[float, ...], q: float, count: int) -> Optional[float]:
+    # Limite superior do bucket que contém o quantil (None = acima do último limite)
+    if not count or not hist:
+        return None
+    target = q * count
+    acc = 0
+    for i, n in enumerate(hist):
+        acc += n
+        if acc >= target:
+            return buckets_ms[i] if i < len(buckets_ms) else None
+    return None
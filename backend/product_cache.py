@@ -0,0 +1,137 @@
+"""
+Módulo: product_cache.py
+------------------------
+Cache em memória (LRU + TTL) para consultas de produto por código de barras.
+
+- Atende o caminho mais quente do sistema (GET /product/{barcode} nos terminais)
+- Cache negativo: códigos inexistentes também são lembrados (TTL menor)
+- Invalidação explícita por barcode quando um produto é gravado
+- Contadores de hit/miss/evicção para o painel admin
+
+O cache é por processo: com vários workers, cada um invalida o próprio cache e o
+TTL limita por quanto tempo outro worker pode servir um valor antigo.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+# Marcador de "produto não existe" (diferente de ausência no cache)
+_MISSING = object()
+
+
+class ProductCache:
+    """LRU com expiração por entrada, thread-safe.
+
+    maxsize: número máximo de entradas (positivas + negativas).
+    ttl: segundos de validade de um produto encontrado (0 desativa o cache).
+    negative_ttl: segundos de validade de um "não encontrado".
+    """
+
+    def __init__(self, maxsize: int = 50000, ttl: float = 300.0, negative_ttl: float = 30.0):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.negative_ttl = float(negative_ttl)
+        self._data = OrderedDict()  # barcode -> (valor | _MISSING, expira_em)
+        self._lock = threading.Lock()
+        # Incrementado a cada invalidação: carga iniciada antes dela não é gravada
+        self._generation = 0
+        self._stats = {
+            'hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'clears': 0,
+            'stale_loads_discarded': 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get_or_load(self, barcode: str, loader: Callable[[str], Optional[dict]]) -> Optional[dict]:
+        """Retorna o produto do cache ou chama loader(barcode) e guarda o resultado.
+
+        Exceções do loader são propagadas e nada é guardado (erro de banco não vira
+        cache negativo). Sempre retorna uma cópia do dicionário.
+        """
+        if not self.enabled:
+            return loader(barcode)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(barcode)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._data.move_to_end(barcode)
+                    if value is _MISSING:
+                        self._stats['negative_hits'] += 1
+                        return None
+                    self._stats['hits'] += 1
+                    return dict(value)
+                del self._data[barcode]
+                self._stats['expired'] += 1
+            self._stats['misses'] += 1
+            generation = self._generation
+        value = loader(barcode)
+        self._store(barcode, value, generation)
+        return dict(value) if value is not None else None
+
+    def _store(self, barcode: str, value: Optional[dict], generation: int):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                # Houve escrita durante a consulta: o valor lido pode estar desatualizado
+                self._stats['stale_loads_discarded'] += 1
+                return
+            self._data[barcode] = (dict(value) if value is not None else _MISSING, time.monotonic() + ttl)
+            self._data.move_to_end(barcode)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, barcode: str):
+        self.invalidate_many((barcode,))
+
+    def invalidate_many(self, barcodes: Iterable[str]):
+        """Remove os barcodes informados (positivos e negativos)."""
+        with self._lock:
+            self._generation += 1
+            if not self._data:
+                return
+            for bc in barcodes:
+                if bc is None:
+                    continue
+                if self._data.pop(str(bc).strip(), None) is not None:
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            self._stats['clears'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out['size'] = len(self._data)
+        lookups = out['hits'] + out['negative_hits'] + out['misses']
+        out['hit_ratio'] = round((out['hits'] + out['negative_hits']) / lookups, 4) if lookups else 0.0
+        out['maxsize'] = self.maxsize
+        out['ttl_s'] = self.ttl
+        out['negative_ttl_s'] = self.negative_ttl
+        return out
+
+
+# Instância global usada por database.get_product_by_barcode
+product_cache = ProductCache(
+    maxsize=int(os.environ.get('PRECIX_PRODUCT_CACHE_SIZE', '50000')),
+    ttl=float(os.environ.get('PRECIX_PRODUCT_CACHE_TTL_S', '300')),
+    negative_ttl=float(os.environ.get('PRECIX_PRODUCT_CACHE_NEG_TTL_S', '30')),
+)
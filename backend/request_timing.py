@@ -0,0 +1,258 @@
+"""
+Módulo: request_timing.py
+-------------------------
+Contabilização do tempo de banco por requisição e log de consultas lentas.
+
+- RequestTimingMiddleware (ASGI) abre um RequestTiming por requisição num contextvar; o
+  contexto acompanha a requisição até as threads do FastAPI e do executor (run_db)
+- db_instrument.py soma o tempo de cada execute() ao RequestTiming corrente e envia os
+  comandos acima de PRECIX_SLOW_QUERY_MS para o SlowQueryLog
+- Resposta ganha X-Request-ID (o recebido ou um novo) e, com PRECIX_SERVER_TIMING=1,
+  Server-Timing: db;dur=..;desc="N queries", app;dur=.. (Python), total;dur=..
+- Consultas lentas são logadas com rota e request id, com literais trocados por '?'
+  (nenhum valor de parâmetro vai para o log)
+- PRECIX_SLOW_QUERY_EXPLAIN_MS > 0: SELECTs acima desse tempo ganham um
+  EXPLAIN (ANALYZE, BUFFERS) executado em segundo plano, no máximo uma vez por consulta a cada
+  PRECIX_SLOW_QUERY_EXPLAIN_INTERVAL_S; as mais recentes ficam em GET /admin/db/slow-queries
+"""
+
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+SLOW_QUERY_MS = float(os.environ.get('PRECIX_SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN_MS = float(os.environ.get('PRECIX_SLOW_QUERY_EXPLAIN_MS', '0'))
+SLOW_QUERY_EXPLAIN_INTERVAL_S = float(os.environ.get('PRECIX_SLOW_QUERY_EXPLAIN_INTERVAL_S', '300'))
+SLOW_QUERY_KEEP = int(os.environ.get('PRECIX_SLOW_QUERY_KEEP', '100'))
+SERVER_TIMING = os.environ.get('PRECIX_SERVER_TIMING', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+# Tamanho máximo do SQL guardado/logado (INSERT ... VALUES em lote pode ter megabytes)
+MAX_SQL_CHARS = 2000
+
+_STRING_LITERAL = re.compile(r"[EeBbXxNn]?'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w$.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+_VALUES_LIST = re.compile(r'(\(\?(?:, \?)*\))(?:,\s*\(\?(?:, \?)*\))+')
+_SPACES = re.compile(r'\s+')
+
+
+def redact_sql(query) -> str:
+    """SQL sem valores: literais de texto e números viram '?', listas VALUES longas são resumidas."""
+    if isinstance(query, (bytes, bytearray, memoryview)):
+        query = bytes(query).decode('utf-8', 'replace')
+    text = _STRING_LITERAL.sub('?', str(query))
+    text = _NUMBER_LITERAL.sub('?', text)
+    text = _SPACES.sub(' ', text).strip()
+    text = _VALUES_LIST.sub(r'\1, ...', text)
+    if len(text) > MAX_SQL_CHARS:
+        text = text[:MAX_SQL_CHARS] + '...'
+    return text
+
+
+def redact_plan(plan: str) -> str:
+    # No plano só os literais de texto carregam valores; custos e contagens ficam
+    return _STRING_LITERAL.sub('?', plan)
+
+
+class RequestTiming:
+    __slots__ = ('request_id', 'method', 'path', 'scope', 'started', 'db_seconds', 'db_queries', 'route_of')
+
+    def __init__(self, request_id: str, method: str = '', path: str = '', scope: dict = None,
+                 route_of: Callable[[dict], str] = None):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.scope = scope
+        self.route_of = route_of
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.db_queries = 0
+
+    @property
+    def route(self) -> str:
+        if self.route_of is not None and self.scope is not None:
+            try:
+                return self.route_of(self.scope)
+            except Exception:
+                pass
+        return self.path
+
+    def add_query(self, seconds: float):
+        self.db_seconds += seconds
+        self.db_queries += 1
+
+    def server_timing(self) -> str:
+        total_ms = (time.perf_counter() - self.started) * 1000.0
+        db_ms = self.db_seconds * 1000.0
+        return (f'db;dur={db_ms:.1f};desc="{self.db_queries} queries", '
+                f'app;dur={max(0.0, total_ms - db_ms):.1f}, total;dur={total_ms:.1f}')
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar('precix_request_timing', default=None)
+
+
+def current_request() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+class RequestTimingMiddleware:
+    def __init__(self, app, route_of: Callable[[dict], str] = None, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.route_of = route_of
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get('headers') or ():
+            if name == b'x-request-id':
+                request_id = value.decode('latin-1')[:64]
+                break
+        timing = RequestTiming(request_id or uuid.uuid4().hex[:16], scope.get('method', ''),
+                               scope.get('path', ''), scope, self.route_of)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers') or [])
+                headers.append((b'x-request-id', timing.request_id.encode('latin-1')))
+                if self.server_timing:
+                    headers.append((b'server-timing', timing.server_timing().encode('latin-1')))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        token = _current.set(timing)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+
+
+# Funções com efeito fora da transação (o EXPLAIN ANALYZE executa a consulta): lock de sessão
+# sobrevive ao rollback, sequências não voltam atrás e NOTIFY é entregue
+_SIDE_EFFECT_FUNCS = re.compile(r'\b(PG_(TRY_)?ADVISORY\w*|SETVAL|NEXTVAL|PG_NOTIFY)\s*\(')
+
+
+def _is_read_only(sql: str) -> bool:
+    head = sql.lstrip().lstrip('(').upper()
+    if not (head.startswith('SELECT') or head.startswith('WITH')):
+        return False
+    if _SIDE_EFFECT_FUNCS.search(head):
+        return False
+    return not re.search(r'\b(INSERT|UPDATE|DELETE|MERGE|FOR\s+(NO\s+KEY\s+)?UPDATE|FOR\s+SHARE)\b', head)
+
+
+class SlowQueryLog:
+    """Guarda as consultas lentas recentes e agenda EXPLAIN (ANALYZE, BUFFERS) para SELECTs.
+
+    explain_fn(sql com valores) -> texto do plano; roda numa thread própria, fora da requisição.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, explain_ms: float = SLOW_QUERY_EXPLAIN_MS,
+                 explain_interval_s: float = SLOW_QUERY_EXPLAIN_INTERVAL_S, keep: int = SLOW_QUERY_KEEP,
+                 explain_fn: Callable[[str], str] = None):
+        self.threshold_ms = float(threshold_ms)
+        self.explain_ms = float(explain_ms)
+        self.explain_interval_s = float(explain_interval_s)
+        self.explain_fn = explain_fn
+        self._entries: deque = deque(maxlen=max(1, int(keep)))
+        self._explained_at: dict = {}
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=16)
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'slow': 0, 'explains': 0, 'explain_errors': 0, 'explains_dropped': 0}
+
+    def is_slow(self, seconds: float) -> bool:
+        return self.threshold_ms > 0 and seconds * 1000.0 >= self.threshold_ms
+
+    def record(self, seconds: float, query, ok: bool = True, literal_sql: Callable[[], str] = None) -> dict:
+        """Registra um comando lento. literal_sql() devolve o SQL com valores (só usado no EXPLAIN)."""
+        ms = round(seconds * 1000.0, 1)
+        ctx = current_request()
+        entry = {
+            'timestamp': time.time(),
+            'duration_ms': ms,
+            'ok': ok,
+            'route': ctx.route if ctx is not None else None,
+            'request_id': ctx.request_id if ctx is not None else None,
+            'query': redact_sql(query),
+            'explain': None,
+        }
+        with self._lock:
+            self._stats['slow'] += 1
+            self._entries.append(entry)
+        logging.warning(
+            f"[DB][slow] {ms:.1f}ms route={entry['route'] or '-'} request_id={entry['request_id'] or '-'} "
+            f"{'' if ok else '(erro) '}{entry['query']}"
+        )
+        if ok and literal_sql is not None and self.explain_fn is not None and 0 < self.explain_ms <= ms:
+            self._maybe_explain(entry, literal_sql)
+        return entry
+
+    def _maybe_explain(self, entry: dict, literal_sql: Callable[[], str]):
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained_at.get(entry['query'])
+            if last is not None and now - last < self.explain_interval_s:
+                return
+            self._explained_at[entry['query']] = now
+            if len(self._explained_at) > 1000:
+                self._explained_at.clear()
+        try:
+            sql = literal_sql()
+        except Exception:
+            return
+        if isinstance(sql, (bytes, bytearray)):
+            sql = bytes(sql).decode('utf-8', 'replace')
+        if not _is_read_only(sql):
+            return
+        try:
+            self._queue.put_nowait((entry, sql))
+        except queue.Full:
+            with self._lock:
+                self._stats['explains_dropped'] += 1
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._explain_loop, name='precix-slow-explain', daemon=True)
+            self._thread.start()
+
+    def _explain_loop(self):
+        while True:
+            try:
+                entry, sql = self._queue.get(timeout=60)
+            except queue.Empty:
+                return
+            try:
+                plan = self.explain_fn(sql)
+                entry['explain'] = redact_plan(plan)
+                with self._lock:
+                    self._stats['explains'] += 1
+                logging.info(f"[DB][slow] EXPLAIN de request_id={entry['request_id'] or '-'}:\n{entry['explain']}")
+            except Exception as e:
+                with self._lock:
+                    self._stats['explain_errors'] += 1
+                logging.warning(f"[DB][slow] Falha no EXPLAIN: {e}")
+
+    def recent(self, limit: int = 50) -> list:
+        with self._lock:
+            entries = list(self._entries)
+        entries.sort(key=lambda e: e['duration_ms'], reverse=True)
+        return [dict(e) for e in entries[:limit]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out['kept'] = len(self._entries)
+        out['threshold_ms'] = self.threshold_ms
+        out['explain_ms'] = self.explain_ms
+        return out
+
+
+slow_queries = SlowQueryLog()
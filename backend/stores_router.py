@@ -0,0 +1,58 @@
+"""
+Módulo: stores_router.py
+------------------------
+CRUD das lojas (/admin/stores).
+"""
+
+from fastapi import APIRouter, HTTPException, Request
+
+try:
+    from .database import get_all_stores, update_store, delete_store, add_store_with_code, update_store_code
+    from .db_async import run_db
+except ImportError:
+    from database import get_all_stores, update_store, delete_store, add_store_with_code, update_store_code
+    from db_async import run_db
+
+router = APIRouter()
+
+
+@router.get('/admin/stores')
+def api_get_stores():
+    return get_all_stores()
+
+
+@router.post('/admin/stores')
+async def api_add_store(request: Request):
+    data = await request.json()
+    codigo = data.get('codigo') or data.get('code')
+    name = data.get('name')
+    status = data.get('status') or 'ativo'
+    if not codigo or not name:
+        return {"success": False, "message": "Código e nome da loja são obrigatórios."}
+    try:
+        await run_db(add_store_with_code, str(codigo), name, status)
+        return {"success": True}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.put('/admin/stores/{store_id}')
+async def api_update_store(store_id: int, request: Request):
+    data = await request.json()
+    codigo = data.get('codigo') or data.get('code')
+    name = data.get('name')
+    status = data.get('status') or 'ativo'
+    try:
+        if codigo is not None:
+            await run_db(update_store_code, store_id, str(codigo), name, status)
+        else:
+            await run_db(update_store, store_id, name, status)
+        return {"success": True}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete('/admin/stores/{store_id}')
+def api_delete_store(store_id: int):
+    delete_store(store_id)
+    return {"success": True}
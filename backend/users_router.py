@@ -0,0 +1,221 @@
+"""
+Módulo: users_router.py
+-----------------------
+Login do painel, renovação do token e CRUD dos usuários administrativos (/admin/users).
+"""
+
+import json
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+try:
+    from .database import get_db_connection, authenticate_admin
+    from .auth_jwt import create_access_token, get_current_user, require_admin_or_perm
+    from .db_async import run_db
+except ImportError:
+    from database import get_db_connection, authenticate_admin
+    from auth_jwt import create_access_token, get_current_user, require_admin_or_perm
+    from db_async import run_db
+
+router = APIRouter()
+
+
+@router.post('/admin/login')
+async def admin_login(request: Request):
+    data = await request.json()
+    # Consulta do usuário + bcrypt são bloqueantes
+    return await run_db(_admin_login, data)
+
+
+def _admin_login(data: dict):
+    username = data.get('username')
+    password = data.get('password')
+    if not username or not password:
+        return JSONResponse(status_code=400, content={"success": False, "message": "Usuário e senha obrigatórios"})
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT username, password, role, store_id, permissoes FROM admin_users WHERE username = %s', (username,))
+    row = cur.fetchone()
+    conn.close()
+    user = None
+    if row:
+        # Sempre converte para dict
+        user = {
+            'username': row[0],
+            'password': row[1],
+            'role': row[2] if len(row) > 2 else 'admin',
+            'store_id': row[3] if len(row) > 3 else None,
+            'permissoes': row[4] if len(row) > 4 else None,
+        }
+    if user and authenticate_admin(username, password):
+        role = user.get('role') or 'admin'
+        store_id = user.get('store_id')
+        permissoes = user.get('permissoes')
+        if permissoes:
+            try:
+                permissoes = json.loads(permissoes)
+            except Exception:
+                permissoes = []
+        else:
+            permissoes = []
+        access_token = create_access_token({"sub": username, "role": role})
+        store_codigo = None
+        if store_id:
+            try:
+                if isinstance(store_id, str) and not store_id.isdigit():
+                    from database import get_store_by_code
+                    store = get_store_by_code(store_id)
+                    store_codigo = store['codigo'] if store else None
+                else:
+                    conn2 = get_db_connection()
+                    cur2 = conn2.cursor()
+                    cur2.execute('SELECT codigo FROM stores WHERE id = %s', (store_id,))
+                    row2 = cur2.fetchone()
+                    conn2.close()
+                    if row2:
+                        store_codigo = row2[0] if not isinstance(row2, dict) else row2.get('codigo')
+            except Exception:
+                store_codigo = None
+        return {
+            "success": True,
+            "access_token": access_token,
+            "token_type": "bearer",
+            "role": role,
+            "store_id": store_id,
+            "store_codigo": store_codigo,
+            "permissoes": permissoes,
+            "username": username
+        }
+    else:
+        return JSONResponse(status_code=401, content={"success": False, "message": "Usuário ou senha inválidos"})
+
+
+@router.post('/admin/token/refresh')
+def refresh_token(current_user: str = Depends(get_current_user)):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT role FROM admin_users WHERE username = %s', (current_user,))
+    row = cur.fetchone()
+    conn.close()
+    role = None
+    if row:
+        role = row[0] if not isinstance(row, dict) else row.get('role')
+    role = role or 'admin'
+    new_token = create_access_token({"sub": current_user, "role": role})
+    return {"success": True, "access_token": new_token, "token_type": "bearer", "role": role}
+
+
+@router.get('/admin/users')
+def list_admin_users(current_user: str = Depends(require_admin_or_perm('usuarios'))):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT username, role, store_id, permissoes FROM admin_users')
+    users = []
+    for row in cur.fetchall():
+        # Sempre converte para dict
+        u = {'username': row[0], 'role': row[1] if len(row) > 1 else 'admin', 'store_id': row[2] if len(row) > 2 else None, 'permissoes': row[3] if len(row) > 3 else None}
+        permissoes = u.get('permissoes')
+        if permissoes:
+            try:
+                permissoes = json.loads(permissoes)
+            except Exception:
+                permissoes = []
+        else:
+            permissoes = []
+        users.append({
+            'username': u.get('username'),
+            'role': u.get('role') or 'admin',
+            'store_id': u.get('store_id'),
+            'permissoes': permissoes
+        })
+    conn.close()
+    return {'users': users}
+
+
+@router.post('/admin/users')
+def create_admin_user_endpoint(data: dict = Body(...), current_user: str = Depends(require_admin_or_perm('usuarios'))):
+    from database import hash_password
+    username = data.get('username')
+    password = data.get('password')
+    role = data.get('role', 'admin')
+    if not username or not password:
+        raise HTTPException(status_code=400, detail='Usuário e senha obrigatórios')
+    hashed = hash_password(password)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute('INSERT INTO admin_users (username, password, role) VALUES (%s, %s, %s)', (username, hashed, role))
+        conn.commit()
+    except Exception as e:
+        conn.close()
+        if 'duplicate key' in str(e).lower():
+            raise HTTPException(status_code=409, detail='Usuário já existe')
+        raise HTTPException(status_code=500, detail='Erro ao criar usuário')
+    conn.close()
+    return {'success': True, 'message': 'Usuário criado com sucesso'}
+
+
+@router.put('/admin/users/{username}')
+def update_admin_user(username: str, data: dict = Body(...), current_user: str = Depends(require_admin_or_perm('usuarios'))):
+    from database import hash_password
+    password = data.get('password')
+    role = data.get('role')
+    permissoes = data.get('permissoes')
+    store_id = data.get('store_id')
+    if permissoes is not None and not isinstance(permissoes, str):
+        permissoes = json.dumps(permissoes)
+    if not password and not role and permissoes is None and store_id is None:
+        raise HTTPException(status_code=400, detail='Nada para atualizar')
+    conn = get_db_connection()
+    cur = conn.cursor()
+    if password and role and permissoes is not None and store_id is not None:
+        hashed = hash_password(password)
+        cur.execute('UPDATE admin_users SET password = %s, role = %s, permissoes = %s, store_id = %s WHERE username = %s', (hashed, role, permissoes, store_id, username))
+    elif password and role and store_id is not None:
+        hashed = hash_password(password)
+        cur.execute('UPDATE admin_users SET password = %s, role = %s, store_id = %s WHERE username = %s', (hashed, role, store_id, username))
+    elif password and permissoes is not None and store_id is not None:
+        hashed = hash_password(password)
+        cur.execute('UPDATE admin_users SET password = %s, permissoes = %s, store_id = %s WHERE username = %s', (hashed, permissoes, store_id, username))
+    elif role and permissoes is not None and store_id is not None:
+        cur.execute('UPDATE admin_users SET role = %s, permissoes = %s, store_id = %s WHERE username = %s', (role, permissoes, store_id, username))
+    elif password and store_id is not None:
+        hashed = hash_password(password)
+        cur.execute('UPDATE admin_users SET password = %s, store_id = %s WHERE username = %s', (hashed, store_id, username))
+    elif role and store_id is not None:
+        cur.execute('UPDATE admin_users SET role = %s, store_id = %s WHERE username = %s', (role, store_id, username))
+    elif permissoes is not None and store_id is not None:
+        cur.execute('UPDATE admin_users SET permissoes = %s, store_id = %s WHERE username = %s', (permissoes, store_id, username))
+    elif store_id is not None:
+        cur.execute('UPDATE admin_users SET store_id = %s WHERE username = %s', (store_id, username))
+    elif password and role and permissoes is not None:
+        hashed = hash_password(password)
+        cur.execute('UPDATE admin_users SET password = %s, role = %s, permissoes = %s WHERE username = %s', (hashed, role, permissoes, username))
+    elif password and role:
+        hashed = hash_password(password)
+        cur.execute('UPDATE admin_users SET password = %s, role = %s WHERE username = %s', (hashed, role, username))
+    elif password and permissoes is not None:
+        hashed = hash_password(password)
+        cur.execute('UPDATE admin_users SET password = %s, permissoes = %s WHERE username = %s', (hashed, permissoes, username))
+    elif role and permissoes is not None:
+        cur.execute('UPDATE admin_users SET role = %s, permissoes = %s WHERE username = %s', (role, permissoes, username))
+    if cur.rowcount == 0:
+        conn.close()
+        raise HTTPException(status_code=404, detail='Usuário não encontrado')
+    conn.commit()
+    conn.close()
+    return {'success': True, 'message': 'Usuário atualizado com sucesso'}
+
+
+@router.delete('/admin/users/{username}')
+def delete_admin_user(username: str, current_user: str = Depends(require_admin_or_perm('usuarios'))):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('DELETE FROM admin_users WHERE username = %s', (username,))
+    if cur.rowcount == 0:
+        conn.close()
+        raise HTTPException(status_code=404, detail='Usuário não encontrado')
+    conn.commit()
+    conn.close()
+    return {'success': True, 'message': 'Usuário removido com sucesso'}
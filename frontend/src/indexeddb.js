@@ -37,7 +37,8 @@ export function clearProducts() {
 const DB_NAME = 'precix_db';
 const STORE_NAME = 'products';
 const DEVICE_STORE = 'device_info';
-const DB_VERSION = 2;
+const SYNC_STORE = 'sync_meta';
+const DB_VERSION = 3;
 
 export function openDB() {
   return new Promise((resolve, reject) => {
@@ -50,6 +51,9 @@ export function openDB() {
       if (!db.objectStoreNames.contains(DEVICE_STORE)) {
         db.createObjectStore(DEVICE_STORE, { keyPath: 'key' });
       }
+      if (!db.objectStoreNames.contains(SYNC_STORE)) {
+        db.createObjectStore(SYNC_STORE, { keyPath: 'key' });
+      }
     };
     request.onsuccess = () => resolve(request.result);
     request.onerror = () => reject(request.error);
@@ -107,3 +111,60 @@ export function getDeviceUUID() {
     });
   });
 }
+
+// Conta os produtos armazenados
+export function countProducts() {
+  return openDB().then(db => {
+    return new Promise((resolve, reject) => {
+      const tx = db.transaction(STORE_NAME, 'readonly');
+      const req = tx.objectStore(STORE_NAME).count();
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  });
+}
+
+// Aplica um delta do backend (/product/changes) numa única transação
+export function applyProductChanges(upserts, deletes) {
+  return openDB().then(db => {
+    return new Promise((resolve, reject) => {
+      const tx = db.transaction(STORE_NAME, 'readwrite');
+      const store = tx.objectStore(STORE_NAME);
+      for (const prod of upserts || []) {
+        if (prod.barcode) store.put(prod);
+      }
+      for (const barcode of deletes || []) {
+        store.delete(barcode);
+      }
+      tx.oncomplete = () => resolve();
+      tx.onerror = () => reject(tx.error);
+    });
+  });
+}
+
+// Estado do sync incremental: { revision } da última sincronização aplicada
+export function getSyncState() {
+  return openDB().then(db => {
+    return new Promise((resolve, reject) => {
+      const tx = db.transaction(SYNC_STORE, 'readonly');
+      const req = tx.objectStore(SYNC_STORE).get('catalog');
+      req.onsuccess = () => resolve(req.result ? req.result.value : null);
+      req.onerror = () => reject(req.error);
+    });
+  });
+}
+
+export function saveSyncState(state) {
+  return openDB().then(db => {
+    return new Promise((resolve, reject) => {
+      const tx = db.transaction(SYNC_STORE, 'readwrite');
+      if (state) {
+        tx.objectStore(SYNC_STORE).put({ key: 'catalog', value: state });
+      } else {
+        tx.objectStore(SYNC_STORE).delete('catalog');
+      }
+      tx.oncomplete = () => resolve();
+      tx.onerror = () => reject(tx.error);
+    });
+  });
+}
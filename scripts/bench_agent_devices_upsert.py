@@ -0,0 +1,102 @@
+# Benchmark do upsert de dispositivos de agente (POST /admin/agents/{id}/devices):
+# caminho antigo (upsert_agent_device por dispositivo, um commit cada) vs bulk_upsert_agent_devices
+# (uma transação, INSERT ... ON CONFLICT multi-linha).
+# Precisa de um PostgreSQL configurado como o backend (.env / PRECIX_PG_*); usa um agent_id
+# descartável e apaga as linhas no final.
+#
+# Uso: python scripts/bench_agent_devices_upsert.py [tamanhos...]   (ex.: 10 100 1000)
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from dotenv import load_dotenv  # noqa: E402
+load_dotenv()
+
+from database import (  # noqa: E402
+    upsert_agent_device, bulk_upsert_agent_devices, db_connection, _open_raw_connection,
+    _AGENT_DEVICE_UPSERT_SQL
+)
+import psycopg2.extras  # noqa: E402
+
+AGENT_ID = 'bench-agent-devices'
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', '3'))
+
+
+def _devices(n):
+    now = datetime.now().isoformat()
+    return [
+        {'identifier': f'BAL-{i:05d}', 'name': f'Balança {i}', 'tipo': 'LEGACY', 'status': 'online',
+         'last_update': now, 'ip': f'10.0.{i // 250}.{i % 250 + 1}', 'store_code': '001'}
+        for i in range(n)
+    ]
+
+
+def _row_args(d):
+    return dict(agent_id=AGENT_ID, identifier=d['identifier'], name=d['name'], tipo=d['tipo'],
+                status=d['status'], last_update=d['last_update'], ip=d['ip'], store_code=d['store_code'])
+
+
+def rowwise_pool(devices):
+    # caminho antigo: uma chamada (e um commit) por dispositivo, conexões do pool
+    for d in devices:
+        upsert_agent_device(**_row_args(d))
+
+
+def rowwise_connect(devices):
+    # caminho antigo antes do pool: conexão nova por dispositivo
+    for d in devices:
+        a = _row_args(d)
+        conn = _open_raw_connection()
+        try:
+            cur = conn.cursor()
+            psycopg2.extras.execute_values(cur, _AGENT_DEVICE_UPSERT_SQL, [(
+                a['agent_id'], a['identifier'], a['name'], a['tipo'], a['status'], a['last_update'],
+                a['ip'], None, None, a['store_code'], None
+            )])
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def bulk(devices):
+    bulk_upsert_agent_devices(AGENT_ID, devices)
+
+
+def _cleanup():
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM agent_devices WHERE agent_id = %s', (AGENT_ID,))
+        conn.commit()
+
+
+def measure(fn, devices):
+    best = None
+    for _ in range(ROUNDS):
+        _cleanup()
+        t0 = time.perf_counter()
+        fn(devices)
+        elapsed = (time.perf_counter() - t0) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(sizes):
+    print(f"melhor de {ROUNDS} rodadas (ms)")
+    print(f"{'dispositivos':>12} | {'linha/pool':>12} | {'linha/conexão':>14} | {'bulk':>10} | {'ganho':>8}")
+    print('-' * 70)
+    try:
+        for n in sizes:
+            devices = _devices(n)
+            pool_ms = measure(rowwise_pool, devices)
+            connect_ms = measure(rowwise_connect, devices)
+            bulk_ms = measure(bulk, devices)
+            print(f"{n:>12} | {pool_ms:>12.1f} | {connect_ms:>14.1f} | {bulk_ms:>10.1f} | {pool_ms / bulk_ms:>7.1f}x")
+    finally:
+        _cleanup()
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [10, 100, 1000])
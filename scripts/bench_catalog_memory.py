@@ -0,0 +1,69 @@
+# Benchmark de memória do /product/all: modo completo (fetchall + lista + dumps) vs streaming
+# (cursor nomeado em lotes de itersize + serialização incremental de catalog_format).
+# Não precisa de banco: as linhas são sintéticas e o cursor nomeado é simulado em lotes.
+#
+# Uso: python scripts/bench_catalog_memory.py [tamanhos...]   (ex.: 10000 100000 300000)
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from catalog_format import normalize_product_row, dumps_products, iter_ndjson, iter_json_array  # noqa: E402
+
+ITERSIZE = int(os.environ.get('PRECIX_CATALOG_STREAM_ITERSIZE', '2000'))
+CHUNK_ROWS = int(os.environ.get('PRECIX_CATALOG_STREAM_CHUNK_ROWS', '1000'))
+
+
+def _row(i):
+    return (f'789{i:010d}', f'PRODUTO DE TESTE NUMERO {i} 500G', round(1 + (i % 5000) / 100.0, 2), i % 7 == 0)
+
+
+def fetchall_rows(n):
+    # cursor comum: o driver materializa todas as linhas de uma vez
+    return [_row(i) for i in range(n)]
+
+
+def named_cursor_rows(n, itersize=ITERSIZE):
+    # cursor nomeado: apenas um lote de itersize linhas em memória por vez
+    for start in range(0, n, itersize):
+        batch = [_row(i) for i in range(start, min(n, start + itersize))]
+        yield from batch
+
+
+def full_mode(n):
+    produtos = [normalize_product_row(r) for r in fetchall_rows(n)]
+    body = dumps_products(produtos)
+    return len(body)
+
+
+def stream_mode(n, serializer):
+    sent = 0
+    for chunk in serializer(named_cursor_rows(n), chunk_rows=CHUNK_ROWS):
+        sent += len(chunk)  # simula o envio ao socket: o bloco é descartado em seguida
+    return sent
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    size = fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak
+
+
+def main(sizes):
+    print(f"itersize={ITERSIZE} chunk_rows={CHUNK_ROWS}")
+    print(f"{'produtos':>10} | {'bytes':>12} | {'completo':>12} | {'ndjson':>12} | {'json stream':>12}")
+    print('-' * 70)
+    for n in sizes:
+        size, full_peak = measure(full_mode, n)
+        _, nd_peak = measure(stream_mode, n, iter_ndjson)
+        _, js_peak = measure(stream_mode, n, iter_json_array)
+        print(f"{n:>10} | {size:>12} | {full_peak / 1e6:>10.1f}MB | {nd_peak / 1e6:>10.2f}MB | {js_peak / 1e6:>10.2f}MB")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]] or [10000, 50000, 100000, 300000]
+    main(args)
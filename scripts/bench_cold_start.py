@@ -0,0 +1,117 @@
+# Cold start do backend: tempo de import do main.py (app criado, rotas registradas) e memória
+# residente ao final, medidos em interpretadores novos (sem cache de módulos entre execuções).
+# Não precisa de banco: o import não abre conexões (o startup em si é medido em GET /admin/startup).
+#
+# Compara a mediana das execuções com scripts/cold_start_baseline.json e sai com código 1 se
+# o tempo ou a memória passarem da tolerância, ou se um módulo de carga adiada (requests, jose,
+# importador_precos) voltar a ser importado no import do backend.
+#
+# Uso:
+#   python scripts/bench_cold_start.py                      # compara com a baseline
+#   python scripts/bench_cold_start.py --runs 9 --tolerance 0.3
+#   python scripts/bench_cold_start.py --update-baseline    # grava a baseline (na máquina de referência)
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND_DIR = os.path.abspath(os.path.join(ROOT, 'backend'))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cold_start_baseline.json')
+
+# Módulos que o backend só carrega no primeiro uso
+DEFERRED_MODULES = ('requests', 'jose', 'importador_precos')
+
+CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+elapsed = time.perf_counter() - t0
+from lifecycle import current_rss_bytes
+out = {
+    'import_s': elapsed,
+    'rss_bytes': current_rss_bytes(),
+    'routes': len(main.app.openapi()['paths']),
+    'loaded': [m for m in sys.argv[2].split(',') if m in sys.modules],
+}
+sys.__stdout__.write(json.dumps(out) + '\n')
+'''
+
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    # database.py exige as credenciais, mas o import não conecta
+    env.setdefault('PRECIX_PG_USER', 'bench')
+    env.setdefault('PRECIX_PG_PASS', 'bench')
+    proc = subprocess.run(
+        [sys.executable, '-c', CHILD, BACKEND_DIR, ','.join(DEFERRED_MODULES)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f'import do backend falhou (código {proc.returncode}):\n{proc.stderr[-2000:]}')
+    return json.loads(lines[-1])
+
+
+def measure(runs: int) -> dict:
+    # Primeira execução descartada: aquece o cache de disco e os .pyc
+    run_once()
+    samples = [run_once() for _ in range(runs)]
+    rss = [s['rss_bytes'] for s in samples if s['rss_bytes'] is not None]
+    return {
+        'import_ms': round(statistics.median(s['import_s'] for s in samples) * 1000.0, 1),
+        'import_ms_min': round(min(s['import_s'] for s in samples) * 1000.0, 1),
+        'rss_mb': round(statistics.median(rss) / (1024 * 1024), 1) if rss else None,
+        'routes': samples[-1]['routes'],
+        'deferred_loaded': sorted({m for s in samples for m in s['loaded']}),
+        'python': sys.version.split()[0],
+        'runs': runs,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    problems = []
+    for key in ('import_ms', 'rss_mb'):
+        base, value = baseline.get(key), result.get(key)
+        if base and value is not None and value > base * (1.0 + tolerance):
+            problems.append(f'{key}: {value} > {base} (+{tolerance:.0%})')
+    if result['deferred_loaded']:
+        problems.append(f"módulos de carga adiada importados no import: {', '.join(result['deferred_loaded'])}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tempo de import e memória do backend (cold start)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='folga sobre a baseline (0.25 = +25%%)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    result = measure(max(1, args.runs))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f'Baseline gravada em {args.baseline}', file=sys.stderr)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f'Sem baseline em {args.baseline}; use --update-baseline', file=sys.stderr)
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    problems = compare(result, baseline, args.tolerance)
+    for p in problems:
+        print(f'REGRESSÃO {p}', file=sys.stderr)
+    if not problems:
+        print(f"OK: import {result['import_ms']}ms (baseline {baseline.get('import_ms')}ms), "
+              f"rss {result['rss_mb']}MB (baseline {baseline.get('rss_mb')}MB)", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
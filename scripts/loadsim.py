@@ -0,0 +1,452 @@
+# Simulador de carga da frota: N lojas x M PWAs x K agentes locais contra o backend em execução.
+#
+# Cada PWA (coroutine com conexão keep-alive própria) repete o tráfego real:
+#   POST /device/heartbeat/{id}                  a cada ~30s (frontend/src/main.js)
+#   GET  /product/{barcode} + POST /admin/devices/events/price-query   a cada bipagem
+#   GET  /product/all (com If-None-Match)        sincronizações de catálogo
+# Cada agente local (agente_local/main.py), com IP próprio via X-Forwarded-For:
+#   POST /admin/agents/status                    a cada ~30s
+#   POST /admin/agents/{id}/devices              a cada ~30s (balanças/legados)
+# Os intervalos são sorteados (Poisson) em torno das taxas do perfil; o início é espalhado em ramp_s.
+#
+# Saída: relatório JSON (vazão, p50/p95/p99, taxa de erro e status por endpoint) em --out ou stdout,
+# e um resumo legível em stderr. 404 na bipagem (código não cadastrado) não conta como erro.
+#
+# --seed cria lojas SIM*, dispositivos sim-* e produtos 789* direto no PostgreSQL (configuração do
+# backend: .env / PRECIX_PG_*), para que heartbeats e consultas encontrem os registros.
+#
+# Uso:
+#   python scripts/loadsim.py --base-url http://127.0.0.1:8000 --profile default --out report.json
+#   python scripts/loadsim.py --stores 20 --devices 4 --agents 1 --duration 300 --seed
+#   python scripts/loadsim.py --profile-file meu_perfil.json
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+PROFILES = {
+    # Um dia comum: bipagens esparsas, heartbeats no ritmo real
+    'default': {
+        'stores': 10, 'devices_per_store': 3, 'agents_per_store': 1, 'legacy_devices_per_agent': 8,
+        'duration_s': 120, 'ramp_s': 30,
+        'device_heartbeat_per_min': 2, 'scans_per_min': 4, 'full_sync_per_hour': 2,
+        'agent_status_per_min': 2, 'agent_devices_per_min': 2,
+        'catalog_size': 20000, 'scan_hit_ratio': 0.95, 'price_query_events': True, 'revalidate_full_sync': True,
+    },
+    # Pico de movimento: muitas bipagens por equipamento
+    'peak': {
+        'stores': 30, 'devices_per_store': 5, 'agents_per_store': 1, 'legacy_devices_per_agent': 12,
+        'duration_s': 300, 'ramp_s': 30,
+        'device_heartbeat_per_min': 2, 'scans_per_min': 20, 'full_sync_per_hour': 2,
+        'agent_status_per_min': 2, 'agent_devices_per_min': 2,
+        'catalog_size': 50000, 'scan_hit_ratio': 0.9, 'price_query_events': True, 'revalidate_full_sync': True,
+    },
+    # Abertura das lojas / catálogo alterado: todos os PWAs baixam o catálogo completo
+    'sync_storm': {
+        'stores': 30, 'devices_per_store': 5, 'agents_per_store': 1, 'legacy_devices_per_agent': 8,
+        'duration_s': 120, 'ramp_s': 10,
+        'device_heartbeat_per_min': 2, 'scans_per_min': 2, 'full_sync_per_hour': 60,
+        'agent_status_per_min': 2, 'agent_devices_per_min': 2,
+        'catalog_size': 50000, 'scan_hit_ratio': 0.95, 'price_query_events': True, 'revalidate_full_sync': False,
+    },
+}
+
+# Bipagens fora do catálogo (respondem 404)
+MISS_PREFIX = '000'
+
+
+def barcode(i):
+    return f'789{i:010d}'
+
+
+def store_code(s):
+    return f'SIM{s + 1:03d}'
+
+
+def device_id(s, d):
+    return f'sim-s{s + 1:03d}-d{d + 1:03d}'
+
+
+def agent_id(s, a):
+    return f'sim-agent-s{s + 1:03d}-a{a + 1:02d}'
+
+
+# --- cliente HTTP/1.1 mínimo (keep-alive) sobre asyncio ---
+class HttpError(Exception):
+    pass
+
+
+class HttpConnection:
+    def __init__(self, host, port, timeout_s):
+        self.host = host
+        self.port = port
+        self.timeout_s = timeout_s
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    async def request(self, method, path, body=None, headers=None):
+        """(status, cabeçalhos, corpo). Reabre a conexão uma vez se o servidor a fechou."""
+        async with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await asyncio.wait_for(self._roundtrip(method, path, body, headers), self.timeout_s)
+                except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+                    await self.close()
+                    if attempt:
+                        raise HttpError(str(e) or type(e).__name__)
+                except asyncio.TimeoutError:
+                    await self.close()
+                    raise HttpError('timeout')
+
+    async def _roundtrip(self, method, path, body, headers):
+        payload = b''
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Connection: keep-alive']
+        if body is not None:
+            payload = json.dumps(body, separators=(',', ':')).encode('utf-8')
+            lines += ['Content-Type: application/json', f'Content-Length: {len(payload)}']
+        elif method in ('POST', 'PUT'):
+            lines.append('Content-Length: 0')
+        for k, v in (headers or {}).items():
+            lines.append(f'{k}: {v}')
+        self._writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+        await self._writer.drain()
+        status_line = await self._reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        resp_headers = {}
+        while True:
+            line = await self._reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            k, _, v = line.decode('latin-1').partition(':')
+            resp_headers[k.strip().lower()] = v.strip()
+        if resp_headers.get('transfer-encoding', '').lower() == 'chunked':
+            parts = []
+            while True:
+                size = int((await self._reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    await self._reader.readuntil(b'\r\n')
+                    break
+                parts.append(await self._reader.readexactly(size))
+                await self._reader.readexactly(2)
+            data = b''.join(parts)
+        elif 'content-length' in resp_headers:
+            data = await self._reader.readexactly(int(resp_headers['content-length']))
+        elif status in (204, 304) or method == 'HEAD':
+            data = b''
+        else:
+            data = await self._reader.read()
+            await self.close()
+        if resp_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, resp_headers, data
+
+
+# --- métricas ---
+class EndpointStats:
+    def __init__(self):
+        self.latencies_ms = []
+        self.errors = 0
+        self.status = {}
+        self.bytes = 0
+
+
+class Recorder:
+    def __init__(self):
+        self.endpoints = {}
+
+    def record(self, name, ms, status, error, nbytes=0):
+        ep = self.endpoints.get(name)
+        if ep is None:
+            ep = self.endpoints[name] = EndpointStats()
+        ep.latencies_ms.append(ms)
+        key = str(status)
+        ep.status[key] = ep.status.get(key, 0) + 1
+        ep.bytes += nbytes
+        if error:
+            ep.errors += 1
+
+    def report(self, elapsed_s):
+        out = {}
+        total = errors = 0
+        for name, ep in sorted(self.endpoints.items()):
+            lat = sorted(ep.latencies_ms)
+            n = len(lat)
+            total += n
+            errors += ep.errors
+            out[name] = {
+                'count': n,
+                'errors': ep.errors,
+                'error_rate': round(ep.errors / n, 4) if n else 0.0,
+                'rps': round(n / elapsed_s, 2) if elapsed_s else 0.0,
+                'p50_ms': percentile(lat, 50),
+                'p95_ms': percentile(lat, 95),
+                'p99_ms': percentile(lat, 99),
+                'max_ms': round(lat[-1], 2) if lat else None,
+                'status': ep.status,
+                'bytes': ep.bytes,
+            }
+        return {
+            'requests': total,
+            'errors': errors,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'rps': round(total / elapsed_s, 2) if elapsed_s else 0.0,
+        }, out
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return round(sorted_values[k], 2)
+
+
+# --- atores ---
+class Simulation:
+    def __init__(self, base_url, profile, timeout_s, seed):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.profile = profile
+        self.timeout_s = timeout_s
+        self.rng = random.Random(seed)
+        self.recorder = Recorder()
+        self.deadline = 0.0
+
+    async def call(self, conn, name, method, path, body=None, headers=None, ok_statuses=(200,)):
+        t0 = time.perf_counter()
+        try:
+            status, resp_headers, data = await conn.request(method, self.prefix + path, body, headers)
+        except HttpError as e:
+            self.recorder.record(name, (time.perf_counter() - t0) * 1000.0, f'error:{e}', True)
+            return None, {}, b''
+        ms = (time.perf_counter() - t0) * 1000.0
+        self.recorder.record(name, ms, status, status not in ok_statuses, len(data))
+        return status, resp_headers, data
+
+    def _interval(self, per_min):
+        return self.rng.expovariate(per_min / 60.0)
+
+    async def _every(self, per_min, action):
+        if per_min <= 0:
+            return
+        await asyncio.sleep(self.rng.uniform(0, self.profile['ramp_s']))
+        while True:
+            now = time.monotonic()
+            if now >= self.deadline:
+                return
+            await action()
+            delay = self._interval(per_min)
+            if time.monotonic() + delay >= self.deadline:
+                return
+            await asyncio.sleep(delay)
+
+    def _scan_barcode(self):
+        p = self.profile
+        if self.rng.random() < p['scan_hit_ratio']:
+            # Cauda longa: poucos itens concentram a maior parte das bipagens
+            return barcode((int(self.rng.paretovariate(1.2)) - 1) % p['catalog_size'])
+        return f'{MISS_PREFIX}{self.rng.randrange(10 ** 10):010d}'
+
+    async def device(self, s, d):
+        p = self.profile
+        conn = HttpConnection(self.host, self.port, self.timeout_s)
+        identifier = device_id(s, d)
+        etag = {'value': None}
+
+        async def heartbeat():
+            await self.call(conn, 'POST /device/heartbeat/{identifier}', 'POST', f'/device/heartbeat/{identifier}')
+
+        async def scan():
+            code = self._scan_barcode()
+            t0 = time.perf_counter()
+            status, _, data = await self.call(conn, 'GET /product/{barcode}', 'GET', f'/product/{code}', ok_statuses=(200, 404))
+            if not p['price_query_events'] or status is None:
+                return
+            event = {'identifier': identifier, 'barcode': code, 'ok': status == 200,
+                     'latency_ms': round((time.perf_counter() - t0) * 1000.0)}
+            if status == 200:
+                try:
+                    event['price'] = json.loads(data).get('price')
+                except ValueError:
+                    pass
+            else:
+                event['error'] = 'not_found'
+            await self.call(conn, 'POST /admin/devices/events/price-query', 'POST', '/admin/devices/events/price-query', event)
+
+        async def full_sync():
+            headers = {'Accept-Encoding': 'gzip'}
+            if p['revalidate_full_sync'] and etag['value']:
+                headers['If-None-Match'] = etag['value']
+            status, resp_headers, _ = await self.call(conn, 'GET /product/all', 'GET', '/product/all',
+                                                      headers=headers, ok_statuses=(200, 304))
+            if status == 200 and resp_headers.get('etag'):
+                etag['value'] = resp_headers['etag']
+
+        try:
+            await asyncio.gather(
+                self._every(p['device_heartbeat_per_min'], heartbeat),
+                self._every(p['scans_per_min'], scan),
+                self._every(p['full_sync_per_hour'] / 60.0, full_sync),
+            )
+        finally:
+            await conn.close()
+
+    async def agent(self, s, a):
+        p = self.profile
+        conn = HttpConnection(self.host, self.port, self.timeout_s)
+        aid = agent_id(s, a)
+        # IP próprio por agente: o backend agrupa agentes pelo IP de origem
+        headers = {'X-Forwarded-For': f'10.{200 + a}.{s // 250}.{s % 250 + 1}'}
+        legacy = [f'{aid}-bal{i + 1:02d}' for i in range(p['legacy_devices_per_agent'])]
+
+        async def status():
+            body = {'agent_id': aid, 'loja_codigo': store_code(s), 'loja_nome': f'Loja Simulada {s + 1}',
+                    'status': 'online', 'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'lojas': [{'codigo': store_code(s), 'nome': f'Loja Simulada {s + 1}'}]}
+            await self.call(conn, 'POST /admin/agents/status', 'POST', '/admin/agents/status', body, headers)
+
+        async def devices():
+            now = datetime.now().isoformat()
+            body = {'devices': [
+                {'identifier': ident, 'name': f'Balança {i + 1}', 'tipo': 'LEGACY',
+                 'status': 'online' if self.rng.random() > 0.05 else 'offline', 'last_update': now,
+                 'ip': f'192.168.{s % 250}.{i + 10}', 'store_code': store_code(s)}
+                for i, ident in enumerate(legacy)
+            ]}
+            await self.call(conn, 'POST /admin/agents/{agent_id}/devices', 'POST', f'/admin/agents/{aid}/devices', body, headers)
+
+        try:
+            await asyncio.gather(
+                self._every(p['agent_status_per_min'], status),
+                self._every(p['agent_devices_per_min'], devices),
+            )
+        finally:
+            await conn.close()
+
+    async def run(self):
+        p = self.profile
+        started = time.time()
+        t0 = time.monotonic()
+        self.deadline = t0 + p['duration_s']
+        actors = []
+        for s in range(p['stores']):
+            actors += [self.device(s, d) for d in range(p['devices_per_store'])]
+            actors += [self.agent(s, a) for a in range(p['agents_per_store'])]
+        await asyncio.gather(*actors)
+        elapsed = time.monotonic() - t0
+        totals, endpoints = self.recorder.report(elapsed)
+        return {
+            'profile': p,
+            'started_at': datetime.fromtimestamp(started).isoformat(),
+            'elapsed_s': round(elapsed, 2),
+            'actors': {'devices': p['stores'] * p['devices_per_store'], 'agents': p['stores'] * p['agents_per_store']},
+            'totals': totals,
+            'endpoints': endpoints,
+        }
+
+
+def seed_database(profile):
+    """Lojas, dispositivos e produtos usados pela simulação (idempotente)."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+    from dotenv import load_dotenv
+    load_dotenv()
+    from database import get_all_stores, add_store_with_code, add_device, get_device_by_identifier, upsert_products
+
+    stores = {st['codigo']: st['id'] for st in get_all_stores()}
+    for s in range(profile['stores']):
+        code = store_code(s)
+        if code not in stores:
+            add_store_with_code(code, f'Loja Simulada {s + 1}')
+    stores = {st['codigo']: st['id'] for st in get_all_stores()}
+    created = 0
+    for s in range(profile['stores']):
+        for d in range(profile['devices_per_store']):
+            ident = device_id(s, d)
+            if get_device_by_identifier(ident) is None:
+                add_device(stores[store_code(s)], f'PWA {ident}', identifier=ident)
+                created += 1
+    products = [{'barcode': barcode(i), 'name': f'PRODUTO SIMULADO {i}', 'price': round(1 + (i % 5000) / 100.0, 2)}
+                for i in range(profile['catalog_size'])]
+    result = upsert_products(products)
+    print(f'[LOADSIM] seed: {profile["stores"]} lojas, {created} dispositivos novos, '
+          f'produtos inseridos={result.get("inserted")} atualizados={result.get("updated")}', file=sys.stderr)
+
+
+def build_profile(args):
+    profile = dict(PROFILES[args.profile])
+    if args.profile_file:
+        with open(args.profile_file, encoding='utf-8') as fh:
+            profile.update(json.load(fh))
+    overrides = {'stores': args.stores, 'devices_per_store': args.devices, 'agents_per_store': args.agents,
+                 'duration_s': args.duration, 'ramp_s': args.ramp}
+    profile.update({k: v for k, v in overrides.items() if v is not None})
+    unknown = set(profile) - set(PROFILES['default'])
+    if unknown:
+        raise SystemExit(f'Campos de perfil desconhecidos: {sorted(unknown)}')
+    profile['ramp_s'] = min(profile['ramp_s'], profile['duration_s'])
+    return profile
+
+
+def print_summary(report):
+    t = report['totals']
+    print(f"\n{report['elapsed_s']}s  {t['requests']} req  {t['rps']} req/s  erros {t['errors']} ({t['error_rate']:.2%})",
+          file=sys.stderr)
+    print(f"{'endpoint':<45}{'n':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'erros':>8}", file=sys.stderr)
+    for name, ep in report['endpoints'].items():
+        print(f"{name:<45}{ep['count']:>8}{ep['rps']:>9}{ep['p50_ms'] or 0:>9}{ep['p95_ms'] or 0:>9}"
+              f"{ep['p99_ms'] or 0:>9}{ep['error_rate']:>8.2%}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulador de carga da frota PRECIX')
+    parser.add_argument('--base-url', default=os.environ.get('PRECIX_LOADSIM_URL', 'http://127.0.0.1:8000'))
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='default')
+    parser.add_argument('--profile-file', help='JSON com campos do perfil a sobrescrever')
+    parser.add_argument('--stores', type=int)
+    parser.add_argument('--devices', type=int, help='PWAs por loja')
+    parser.add_argument('--agents', type=int, help='agentes locais por loja')
+    parser.add_argument('--duration', type=float, help='duração em segundos')
+    parser.add_argument('--ramp', type=float, help='janela (s) para espalhar o início dos atores')
+    parser.add_argument('--timeout', type=float, default=30.0, help='timeout por requisição (s)')
+    parser.add_argument('--random-seed', type=int, default=None)
+    parser.add_argument('--seed', action='store_true', help='cria lojas/dispositivos/produtos simulados no banco antes')
+    parser.add_argument('--out', help='arquivo do relatório JSON (padrão: stdout)')
+    args = parser.parse_args()
+
+    profile = build_profile(args)
+    if args.seed:
+        seed_database(profile)
+    report = asyncio.run(Simulation(args.base_url, profile, args.timeout, args.random_seed).run())
+    report['base_url'] = args.base_url
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+    else:
+        print(text)
+    print_summary(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+import time
+
+import pytest
+
+
+def wait_until(cond, timeout=2.0):
+    """Espera cond() ficar verdadeira (threads em segundo plano); False se estourar o timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture(name='wait_until')
+def wait_until_fixture():
+    return wait_until
@@ -0,0 +1,83 @@
+import os
+
+from backend.ai_agent_integration import AIEventBus, CircuitBreaker, CircuitOpen, PromptCache
+
+
+def _bus(send, circuit, **kw):
+    return AIEventBus(send_fn=send, log_fn=lambda *a: None, circuit=circuit, **kw)
+
+
+def test_events_are_sent_in_background_in_order(wait_until):
+    sent = []
+    bus = _bus(lambda t, d: sent.append((t, d)) or {'ok': True}, CircuitBreaker(3, 1, 1), batch_size=2)
+    for i in range(5):
+        assert bus.publish('device_heartbeat', {'i': i})
+    bus.start()
+    try:
+        assert wait_until(lambda: bus.stats()['sent'] == 5)
+    finally:
+        bus.stop()
+    assert [d['i'] for _, d in sent] == [0, 1, 2, 3, 4]
+    stats = bus.stats()
+    assert stats['batches'] == 3
+    assert stats['failed'] == 0 and stats['dropped'] == 0
+
+
+def test_full_queue_drops_oldest():
+    bus = _bus(lambda t, d: {}, CircuitBreaker(), max_queue=2)
+    assert bus.publish('a')
+    assert bus.publish('b')
+    assert bus.publish('c') is False
+    assert bus.stats()['dropped'] == 1
+    assert bus.send_batch() == 2
+
+
+def test_breaker_opens_and_keeps_events_queued():
+    circuit = CircuitBreaker(failure_threshold=2, backoff_s=60, max_backoff_s=120)
+    attempts = []
+
+    def send(event_type, details):
+        if not circuit.allow():
+            raise CircuitOpen('pausa')
+        attempts.append(event_type)
+        circuit.record_failure()
+        raise ConnectionError('recusada')
+
+    bus = _bus(send, circuit)
+    for name in ('a', 'b', 'c', 'd'):
+        bus.publish(name)
+    assert bus.send_batch() == 0
+    # Duas falhas abrem o circuito; o restante volta para a fila sem tentativa
+    assert attempts == ['a', 'b']
+    stats = bus.stats()
+    assert stats['failed'] == 2
+    assert stats['depth'] == 2
+    assert stats['breaker']['state'] == 'open'
+    assert 59 < stats['breaker']['retry_in_s'] <= 60
+
+
+def test_backoff_doubles_and_success_closes(wait_until):
+    circuit = CircuitBreaker(failure_threshold=1, backoff_s=0.05, max_backoff_s=0.1)
+    circuit.record_failure()
+    assert not circuit.allow()
+    assert wait_until(circuit.allow)
+    assert circuit.stats()['state'] == 'half_open'
+    circuit.record_failure()
+    assert 0.05 < circuit.retry_in() <= 0.1
+    assert wait_until(circuit.allow)
+    circuit.record_success()
+    assert circuit.stats()['state'] == 'closed'
+
+
+def test_prompt_is_reread_only_when_mtime_changes(tmp_path):
+    path = tmp_path / 'prompt.txt'
+    path.write_text('v1', encoding='utf-8')
+    cache = PromptCache(str(path))
+    assert cache.get() == 'v1'
+    path.write_text('v2', encoding='utf-8')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, cache._mtime))
+    assert cache.get() == 'v1'
+    os.utime(path, ns=(st.st_atime_ns, cache._mtime + 1_000_000_000))
+    assert cache.get() == 'v2'
+    assert PromptCache(str(tmp_path / 'missing.txt')).get() is None
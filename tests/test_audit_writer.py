@@ -0,0 +1,115 @@
+import threading
+
+from backend.audit_writer import AuditWriter
+
+
+def test_batches_on_size_and_flushes_on_stop(wait_until):
+    batches = []
+    writer = AuditWriter(max_queue=100, batch_size=3, flush_interval_s=60)
+    writer.start(lambda rows: batches.append(list(rows)))
+    try:
+        for i in range(3):
+            assert writer.enqueue((i,))
+        # Lote cheio acorda a thread sem esperar o intervalo
+        assert wait_until(lambda: writer.stats()['flushed'] == 3)
+        writer.enqueue((3,))
+    finally:
+        writer.stop()
+    assert batches == [[(0,), (1,), (2,)], [(3,)]]
+    stats = writer.stats()
+    assert stats['queued'] == 4 and stats['flushed'] == 4 and stats['dropped'] == 0 and stats['depth'] == 0
+
+
+def test_overflow_policies():
+    oldest = AuditWriter(max_queue=2, overflow='drop_oldest')
+    for i in range(3):
+        oldest.enqueue((i,))
+    assert list(oldest._queue) == [(1,), (2,)] and oldest.stats()['dropped'] == 1
+
+    new = AuditWriter(max_queue=2, overflow='drop_new')
+    assert [new.enqueue((i,)) for i in range(3)] == [True, True, False]
+    assert list(new._queue) == [(0,), (1,)]
+
+    written = []
+    sync = AuditWriter(max_queue=1, overflow='sync')
+    sync._flush_fn = written.extend
+    sync.enqueue((0,))
+    sync.enqueue((1,))
+    assert written == [(1,)] and sync.stats()['sync_writes'] == 1
+
+    blocking = AuditWriter(max_queue=1, overflow='block', block_timeout_s=0.05)
+    blocking.enqueue((0,))
+    assert blocking.enqueue((1,)) is False
+    assert blocking.stats()['dropped'] == 1
+
+
+def test_block_waits_for_the_writer():
+    writer = AuditWriter(max_queue=1, overflow='block', block_timeout_s=2.0)
+    writer._flush_fn = lambda rows: None
+    writer.enqueue((0,))
+    threading.Timer(0.05, writer.flush).start()
+    assert writer.enqueue((1,)) is True
+    assert writer.stats()['dropped'] == 0
+
+
+def test_failed_flush_requeues_batch():
+    calls = []
+
+    def flaky(rows):
+        calls.append(list(rows))
+        if len(calls) == 1:
+            raise RuntimeError('banco indisponível')
+
+    writer = AuditWriter(max_queue=10, batch_size=10)
+    writer._flush_fn = flaky
+    writer.enqueue((0,))
+    writer.enqueue((1,))
+    assert writer.flush() == 0
+    assert writer.stats()['flush_errors'] == 1 and writer.stats()['depth'] == 2
+    assert writer.flush() == 2
+    assert calls[1] == [(0,), (1,)]
+
+
+class RowRejected(Exception):
+    pass
+
+
+def test_rejected_row_is_dropped_and_the_rest_written():
+    written = []
+
+    def insert(rows):
+        # Linha com device removido: recusada sempre (FK), sozinha ou no lote
+        if any(r[0] == 'orphan' for r in rows):
+            raise RowRejected('violates foreign key constraint')
+        written.extend(rows)
+
+    writer = AuditWriter(max_queue=10, batch_size=10, row_errors=(RowRejected,))
+    writer._flush_fn = insert
+    for row in [('a',), ('orphan',), ('b',)]:
+        writer.enqueue(row)
+    assert writer.flush() == 2
+    assert written == [('a',), ('b',)]
+    stats = writer.stats()
+    assert stats['rejected'] == 1 and stats['dropped'] == 1 and stats['depth'] == 0
+    # A fila segue gravando normalmente
+    writer.enqueue(('c',))
+    assert writer.flush() == 1
+
+
+def test_connection_error_while_isolating_rows_requeues_the_rest():
+    attempts = []
+
+    def insert(rows):
+        attempts.append(list(rows))
+        if len(rows) > 1:
+            raise RowRejected('bad row')
+        if rows[0] == ('b',):
+            raise RuntimeError('conexão perdida')
+
+    writer = AuditWriter(max_queue=10, batch_size=10, row_errors=(RowRejected,))
+    writer._flush_fn = insert
+    for row in [('a',), ('b',), ('c',)]:
+        writer.enqueue(row)
+    assert writer.flush() == 1
+    assert list(writer._queue) == [('b',), ('c',)]
+    assert writer.stats()['flush_errors'] == 1
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from backend.catalog_binary import build_catalog_binary
+from agente_local.catalog_reader import CatalogFormatError, CatalogReader
+
+
+def _write(tmp_path, rows, revision=None):
+    body, count = build_catalog_binary(rows, revision)
+    path = tmp_path / 'catalog.bin'
+    path.write_bytes(body)
+    return path, count
+
+
+def test_roundtrip_lookup(tmp_path):
+    rows = [
+        ('7891000100103', 'Leite Integral 1L', 4.99, False),
+        ('123', 'Pão Francês kg', 0.15, True),
+        ('7891000100103', 'Leite Integral 1L (novo)', 5.49, True),
+        ('', 'Sem código', 1.0, False),
+        ('999', 'Sem preço', None, False),
+    ]
+    path, count = _write(tmp_path, rows, revision=42)
+    assert count == 3
+    with CatalogReader(str(path)) as cat:
+        assert cat.revision == 42
+        assert len(cat) == 3
+        assert cat.lookup('7891000100103') == {
+            'barcode': '7891000100103', 'name': 'Leite Integral 1L (novo)', 'price': 5.49, 'promo': True,
+        }
+        # mesma normalização de centavos do /product/all
+        assert cat.lookup('123')['price'] == 15.0
+        assert cat.lookup('999')['price'] is None
+        assert cat.lookup('12') is None
+        assert cat.lookup('1234') is None
+        assert '123' in cat
+
+
+def test_lookup_matches_every_key(tmp_path):
+    rng = random.Random(7)
+    rows = [(str(rng.randrange(10 ** 12, 10 ** 13)), f'Produto {i}', rng.randrange(100, 10000) / 100.0, i % 3 == 0)
+            for i in range(2000)]
+    path, count = _write(tmp_path, rows)
+    expected = {r[0]: r for r in rows}
+    with CatalogReader(str(path)) as cat:
+        assert cat.revision is None
+        assert len(cat) == count == len(expected)
+        for barcode, row in expected.items():
+            p = cat.lookup(barcode)
+            assert (p['name'], p['price'], p['promo']) == (row[1], row[2], row[3])
+        assert [p['barcode'] for p in cat.iter_products()] == sorted(expected)
+
+
+def test_empty_catalog_and_bad_file(tmp_path):
+    path, count = _write(tmp_path, [])
+    with CatalogReader(str(path)) as cat:
+        assert count == len(cat) == 0
+        assert cat.lookup('1') is None
+    bad = tmp_path / 'bad.bin'
+    bad.write_bytes(b'not a catalog' * 10)
+    with pytest.raises(CatalogFormatError):
+        CatalogReader(str(bad))
@@ -0,0 +1,70 @@
+import asyncio
+
+from backend.catalog_events import CatalogEventBroker, format_sse
+
+
+class FakeCatalog:
+    def __init__(self):
+        self.revision = 10
+        self.products = {}
+
+    def current_revision(self, force=False):
+        return self.revision
+
+    def changes(self, since, limit):
+        if since < 5:
+            return {'revision': self.revision, 'resync': True}
+        ups = [p for p in self.products.values() if p['rev'] > since]
+        return {'revision': self.revision, 'upserts': ups, 'deletes': [], 'has_more': len(ups) > limit, 'resync': False}
+
+    def write(self, barcode, price):
+        self.revision += 1
+        self.products[barcode] = {'barcode': barcode, 'price': price, 'rev': self.revision}
+
+
+async def _run_blocking(fn, *args):
+    return fn(*args)
+
+
+async def _collect(agen, n, timeout=2.0):
+    out = []
+    async def take():
+        async for frame in agen:
+            out.append(frame.decode('utf-8'))
+            if len(out) >= n:
+                return
+    await asyncio.wait_for(take(), timeout)
+    return out
+
+
+def test_format_sse():
+    assert format_sse('changes', {'a': 1}, 7) == b'id: 7\nevent: changes\ndata: {"a":1}\n\n'
+
+
+def test_push_resume_and_heartbeat():
+    cat = FakeCatalog()
+
+    async def main():
+        broker = CatalogEventBroker(cat.current_revision, cat.changes, _run_blocking, poll_s=0.1, heartbeat_s=1.0)
+        broker.start()
+        await asyncio.sleep(0.3)
+        live = broker.stream()
+        first = await _collect(live, 2)
+        assert first[0].startswith('retry:') and 'event: revision' in first[1] and 'id: 10' in first[1]
+        cat.write('789', 9.99)
+        broker.notify_write(['789'])
+        frame = (await _collect(live, 1))[0]
+        assert 'id: 11' in frame and 'event: changes' in frame and '"barcode":"789"' in frame
+        # Retoma do backlog em memória a partir do Last-Event-ID
+        resumed = await _collect(broker.stream('10'), 2)
+        assert 'id: 11' in resumed[1]
+        # Fora da janela de deltas: resync
+        old = await _collect(broker.stream('1'), 2)
+        assert 'event: resync' in old[1]
+        # Sem eventos: comentário de heartbeat
+        assert (await _collect(live, 1, timeout=3.0))[0] == ': ping\n\n'
+        await live.aclose()
+        assert broker.stats()['published'] == 1
+        broker.stop()
+
+    asyncio.run(main())
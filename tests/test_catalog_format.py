@@ -0,0 +1,28 @@
+import json
+
+from backend.catalog_format import dumps_products, iter_json_array, iter_ndjson, normalize_product_row
+
+ROWS = [
+    ('1', 'Arroz', 0.5, False),
+    ('2', 'Feijão', None, True),
+    ('3', 'Café', float('nan'), False),
+    ('4', 'Leite', 4.99, False),
+]
+
+
+def test_json_array_stream_matches_full_body():
+    full = dumps_products([normalize_product_row(r) for r in ROWS])
+    for chunk_rows in (1, 2, 3, 1000):
+        assert b''.join(iter_json_array(iter(ROWS), chunk_rows=chunk_rows)) == full
+
+
+def test_json_array_stream_empty():
+    assert b''.join(iter_json_array(iter([]))) == b'[]'
+
+
+def test_ndjson_one_product_per_line():
+    chunks = list(iter_ndjson(iter(ROWS), chunk_rows=3))
+    assert len(chunks) == 2
+    lines = b''.join(chunks).decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == [normalize_product_row(r) for r in ROWS]
+    assert json.loads(lines[0])['price'] == 50.0
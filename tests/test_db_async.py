@@ -0,0 +1,84 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+from backend.db_async import DBExecutor, LoopLagMonitor
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+
+def test_run_returns_result_off_loop_thread():
+    ex = DBExecutor(2)
+
+    async def main():
+        loop_thread = threading.get_ident()
+        request_id.set('req-1')
+        tid, rid = await ex.run(lambda: (threading.get_ident(), request_id.get()))
+        return loop_thread, tid, rid
+
+    try:
+        loop_thread, tid, rid = asyncio.run(main())
+    finally:
+        ex.shutdown()
+    assert tid != loop_thread
+    # contexto da requisição chega na thread do executor
+    assert rid == 'req-1'
+
+
+def test_run_propagates_errors():
+    ex = DBExecutor(1)
+
+    def boom():
+        raise ValueError('falhou')
+
+    try:
+        with pytest.raises(ValueError):
+            asyncio.run(ex.run(boom))
+    finally:
+        ex.shutdown()
+    assert ex.stats()['errors'] == 1
+
+
+def test_concurrency_is_bounded():
+    ex = DBExecutor(2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.pop()
+
+    async def main():
+        await asyncio.gather(*(ex.run(work) for _ in range(8)))
+
+    try:
+        asyncio.run(main())
+    finally:
+        ex.shutdown()
+    assert max(peak) == 2
+    stats = ex.stats()
+    assert stats['completed'] == 8 and stats['in_flight'] == 0
+
+
+def test_loop_lag_monitor_reports_stall():
+    mon = LoopLagMonitor(interval_s=0.05, threshold_ms=50)
+
+    async def main():
+        mon.start()
+        await asyncio.sleep(0.12)
+        time.sleep(0.2)  # bloqueia o loop de propósito
+        await asyncio.sleep(0.12)
+        mon.stop()
+
+    asyncio.run(main())
+    stats = mon.stats()
+    assert stats['stalls'] >= 1
+    assert stats['lag_max_ms'] >= 100
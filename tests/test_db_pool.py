@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+
+from backend.db_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise RuntimeError('server closed the connection')
+        self.conn.executed.append(sql)
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = True
+        self.broken = False
+        self.tx_status = 0
+        self.rollbacks = 0
+        self.executed = []
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.tx_status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.tx_status = 0
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        c = FakeConnection()
+        created.append(c)
+        return c
+
+    return ConnectionPool(connect, **kwargs), created
+
+
+def test_reuses_connections():
+    pool, created = make_pool(maxconn=2)
+    for _ in range(5):
+        with pool.borrow() as conn:
+            conn.cursor().execute('SELECT 1')
+    assert len(created) == 1
+    stats = pool.stats()
+    assert stats['acquired'] == 5
+    assert stats['released'] == 5
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+
+
+def test_legacy_close_returns_to_pool():
+    pool, created = make_pool()
+    conn = pool.connection()
+    conn.close()
+    assert created[0].closed == 0
+    assert pool.stats()['idle'] == 1
+    with pytest.raises(RuntimeError):
+        conn.cursor()
+
+
+def test_timeout_when_exhausted():
+    pool, _ = make_pool(maxconn=1, acquire_timeout=0.05)
+    held = pool.connection()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    held.close()
+    stats = pool.stats()
+    assert stats['timeouts'] == 1
+    assert stats['waits'] == 1
+
+
+def test_waiter_gets_released_connection():
+    pool, created = make_pool(maxconn=1, acquire_timeout=2)
+    held = pool.connection()
+    got = []
+
+    def worker():
+        with pool.borrow() as c:
+            got.append(c.raw)
+
+    t = threading.Thread(target=worker)
+    t.start()
+    time.sleep(0.05)
+    held.close()
+    t.join(2)
+    assert got == [created[0]]
+    assert pool.stats()['wait_time_max_ms'] > 0
+
+
+def test_open_transaction_is_rolled_back_on_return():
+    pool, created = make_pool()
+    with pool.borrow() as conn:
+        conn.autocommit = False
+        created[0].tx_status = 2  # INTRANS
+    assert created[0].rollbacks == 1
+    assert created[0].autocommit is True
+
+
+def test_stale_idle_connection_is_health_checked_and_replaced():
+    pool, created = make_pool(health_check_after=0)
+    with pool.borrow():
+        pass
+    created[0].broken = True
+    with pool.borrow() as conn:
+        assert conn.raw is created[1]
+    stats = pool.stats()
+    assert stats['health_check_failures'] == 1
+    assert stats['discarded'] == 1
+    assert created[0].closed == 1
+
+
+def test_closed_connection_is_discarded_on_return():
+    pool, created = make_pool()
+    with pool.borrow():
+        created[0].closed = 1
+    assert pool.stats()['idle'] == 0
+    assert pool.stats()['discarded'] == 1
+
+
+def test_respects_maxconn_under_concurrency():
+    pool, created = make_pool(maxconn=3, acquire_timeout=5)
+    peak = []
+    lock = threading.Lock()
+    active = [0]
+
+    def worker():
+        for _ in range(20):
+            with pool.borrow():
+                with lock:
+                    active[0] += 1
+                    peak.append(active[0])
+                time.sleep(0.001)
+                with lock:
+                    active[0] -= 1
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(peak) <= 3
+    assert len(created) <= 3
@@ -0,0 +1,49 @@
+from backend.device_events import DeviceEventStore, DeviceStoreMap
+
+STORES = {'bal-1': 1, 'bal-2': 1, 'bal-3': 2}
+
+
+def test_ring_buffer_and_indexes():
+    store = DeviceEventStore(capacity=4, store_of=STORES.get, path=None)
+    for i in range(6):
+        store.push({'type': 'price_query', 'identifier': f'bal-{i % 3 + 1}', 'n': i})
+    # Só os 4 mais recentes, do mais novo para o mais antigo
+    assert [e['n'] for e in store.query(10)] == [5, 4, 3, 2]
+    assert [e['n'] for e in store.query(10, identifier='bal-1')] == [3]
+    assert [e['n'] for e in store.query(10, store_id=1)] == [4, 3]
+    assert [e['n'] for e in store.query(10, identifier='bal-3', store_id=2)] == [5, 2]
+    assert store.query(1, store_id=2)[0]['n'] == 5
+    stats = store.stats()
+    assert stats['size'] == 4 and stats['pushed'] == 6
+    assert all('timestamp' in e for e in store.query(10))
+
+
+def test_persistence_is_shared_and_compacted(tmp_path):
+    path = str(tmp_path / 'events.ndjson')
+    a = DeviceEventStore(capacity=3, store_of=STORES.get, path=path)
+    b = DeviceEventStore(capacity=3, store_of=STORES.get, path=path)
+    a.push({'identifier': 'bal-1', 'n': 1})
+    b.push({'identifier': 'bal-3', 'n': 2})
+    # Cada "worker" enxerga os eventos do outro
+    assert [e['n'] for e in a.query(10)] == [2, 1]
+    assert [e['n'] for e in b.query(10, store_id=1)] == [1]
+    for n in range(3, 20):
+        a.push({'identifier': 'bal-2', 'n': n})
+    assert a.stats()['compactions'] >= 1
+    assert [e['n'] for e in b.query(10)] == [19, 18, 17]
+    # Reinício: carrega do arquivo
+    c = DeviceEventStore(capacity=3, path=path)
+    assert [e['n'] for e in c.query(10)] == [19, 18, 17]
+
+
+def test_store_map_refreshes_unknown_identifiers():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {'bal-1': 1} if len(calls) == 1 else {'bal-1': 1, 'novo': 3}
+
+    mapping = DeviceStoreMap(loader, ttl_s=60, min_refresh_s=0)
+    assert mapping.get('bal-1') == 1
+    assert mapping.get('novo') == 3
+    assert mapping.get('bal-1') == 1 and len(calls) == 2
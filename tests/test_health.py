@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from backend.health import HealthMonitor
+
+
+def test_results_are_cached_and_critical_failure_fails_overall():
+    mon = HealthMonitor(max_age_s=60)
+    calls = []
+    state = {'db_up': True}
+
+    def db():
+        calls.append('db')
+        if not state['db_up']:
+            raise RuntimeError('conexão recusada\n')
+        return {'latency_ms': 1.0}
+
+    mon.add_probe('db', db, critical=True)
+    mon.add_probe('cache', lambda: {'status': 'degraded', 'size': 0})
+
+    snap = mon.snapshot()
+    assert snap['status'] == 'degraded'
+    assert snap['stale'] is False
+    assert snap['probes']['db']['detail'] == {'latency_ms': 1.0}
+    assert snap['probes']['cache']['status'] == 'degraded'
+    # Resultado em cache: snapshot() não executa os probes de novo
+    mon.snapshot()
+    assert calls == ['db']
+
+    state['db_up'] = False
+    assert mon.run_once()['status'] == 'fail'
+    snap = mon.snapshot()
+    assert snap['probes']['db']['error'] == 'RuntimeError: conexão recusada'
+    assert [r['probe'] for r in mon.history()] == ['cache', 'db', 'cache']
+
+
+def test_on_change_only_on_transitions():
+    mon = HealthMonitor(max_age_s=60)
+    state = {'ok': True}
+
+    def probe():
+        if not state['ok']:
+            raise RuntimeError('x')
+        return {}
+
+    mon.add_probe('db', probe, critical=True)
+    changes = []
+    mon.on_change = lambda name, prev, result: changes.append((name, prev, result['status']))
+    mon.run_once()
+    state['ok'] = False
+    mon.run_once()
+    mon.run_once()
+    state['ok'] = True
+    mon.run_once()
+    assert changes == [('db', 'ok', 'fail'), ('db', 'fail', 'ok')]
+
+
+def test_stale_results_are_refreshed_on_demand():
+    mon = HealthMonitor(max_age_s=0.05)
+    calls = []
+    mon.add_probe('jobs', lambda: calls.append(1) or {})
+    mon.snapshot()
+    time.sleep(0.1)
+    snap = mon.snapshot()
+    assert len(calls) == 2
+    assert snap['status'] == 'ok'
+
+
+def test_duplicate_probe_is_rejected():
+    mon = HealthMonitor()
+    mon.add_probe('db', lambda: {})
+    with pytest.raises(ValueError):
+        mon.add_probe('db', lambda: {})
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from backend.heartbeat_buffer import HeartbeatBuffer
+
+
+def test_heartbeats_are_coalesced_per_key():
+    batches = []
+    buf = HeartbeatBuffer('devices', lambda batch: batches.append(dict(batch)) or {'updated': len(batch)})
+    t0 = datetime.utcnow()
+    buf.record('dev-1', ts=t0)
+    buf.record('dev-1', ts=t0 + timedelta(seconds=5))
+    # Heartbeat atrasado não sobrescreve o mais novo
+    buf.record('dev-1', ts=t0 + timedelta(seconds=1))
+    buf.record('dev-2', ts=t0)
+    assert buf.flush() == {'updated': 2}
+    assert len(batches) == 1
+    assert batches[0]['dev-1']['ts'] == t0 + timedelta(seconds=5)
+    stats = buf.stats()
+    assert stats['recorded'] == 4 and stats['coalesced'] == 2 and stats['pending'] == 0
+    # Buffer vazio não chama o banco
+    assert buf.flush() == {}
+    assert len(batches) == 1
+
+
+def test_failed_flush_requeues_without_overwriting_newer():
+    t0 = datetime.utcnow()
+    buf = None
+
+    def failing(batch):
+        # Heartbeat mais novo chega durante o flush
+        buf.record('dev-1', ts=t0 + timedelta(seconds=10))
+        raise RuntimeError('banco indisponível')
+
+    buf = HeartbeatBuffer('devices', failing)
+    buf.record('dev-1', ts=t0)
+    buf.record('dev-2', ts=t0)
+    assert 'error' in buf.flush()
+    assert buf.stats()['flush_errors'] == 1
+    assert buf.latest('dev-1')['ts'] == t0 + timedelta(seconds=10)
+    assert buf.latest('dev-2')['ts'] == t0
+
+
+def test_fresh_and_known():
+    buf = HeartbeatBuffer('devices', lambda batch: {})
+    now = datetime.utcnow()
+    buf.record('novo', ts=now)
+    buf.record('antigo', ts=now - timedelta(seconds=600))
+    assert set(buf.fresh(120)) == {'novo'}
+    assert buf.is_known('novo') and not buf.is_known('outro')
+    buf.flush()
+    # Após o flush continua conhecido (dispensa a consulta de existência), mas sai do buffer
+    assert buf.is_known('novo') and buf.fresh(120) == {}
+    buf.forget('novo')
+    assert not buf.is_known('novo')
+
+
+def test_missing_keys_stop_being_known():
+    # Destino informa que 'removido' não existe mais: não fica conhecido nem volta ao buffer
+    buf = HeartbeatBuffer('devices', lambda batch: {'updated': 1, 'missing': ['removido']})
+    buf.mark_known('removido')
+    buf.record('removido')
+    buf.record('ativo')
+    assert buf.flush() == {'updated': 1}
+    assert buf.is_known('ativo')
+    assert not buf.is_known('removido')
+    assert buf.stats()['pending'] == 0
@@ -0,0 +1,57 @@
+import threading
+
+from backend.jobs import JobScheduler
+
+
+def test_job_runs_and_records_metrics(wait_until):
+    sched = JobScheduler(enabled=True)
+    calls = []
+    sched.register('sweep', lambda: calls.append(1) or {'removed': 0}, interval_s=60)
+    sched.start()
+    try:
+        assert wait_until(lambda: sched.stats()['jobs']['sweep']['runs'] == 1)
+        stats = sched.stats()['jobs']['sweep']
+        assert stats['failures'] == 0
+        assert stats['last_result'] == {'removed': 0}
+        assert stats['last_duration_ms'] is not None
+        # run_now antecipa o próximo ciclo sem esperar o intervalo
+        assert sched.run_now('sweep')
+        assert wait_until(lambda: sched.stats()['jobs']['sweep']['runs'] == 2)
+    finally:
+        sched.stop()
+    assert len(calls) == 2
+
+
+def test_failures_are_counted_and_do_not_stop_the_job(wait_until):
+    sched = JobScheduler(enabled=True)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('banco indisponível')
+        return 'ok'
+
+    sched.register('flaky', flaky, interval_s=60)
+    sched.start()
+    try:
+        assert wait_until(lambda: sched.stats()['jobs']['flaky']['runs'] == 1)
+        sched.run_now('flaky')
+        assert wait_until(lambda: sched.stats()['jobs']['flaky']['runs'] == 2)
+    finally:
+        sched.stop()
+    stats = sched.stats()['jobs']['flaky']
+    assert stats['failures'] == 1
+    assert 'banco indisponível' in stats['last_error']
+    assert stats['last_result'] == 'ok'
+
+
+def test_disabled_scheduler_only_runs_on_demand():
+    sched = JobScheduler(enabled=False)
+    done = threading.Event()
+    sched.register('manual', done.set, interval_s=60)
+    sched.start()
+    assert not done.wait(0.1)
+    assert sched.run_now('manual')
+    assert done.wait(1.0)
+    assert not sched.run_now('inexistente')
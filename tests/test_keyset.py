@@ -0,0 +1,18 @@
+from datetime import datetime
+
+import pytest
+
+from backend.keyset import InvalidCursor, decode_cursor, encode_cursor
+
+
+def test_cursor_roundtrip():
+    ts = datetime(2026, 10, 18, 12, 30, 5, 123456)
+    token = encode_cursor(ts, 42)
+    assert '=' not in token and '|' not in token
+    assert decode_cursor(token) == (ts, 42)
+
+
+@pytest.mark.parametrize('token', ['', 'lixo', encode_cursor(datetime(2026, 1, 1), 1)[:-3] + '!!!'])
+def test_invalid_cursor(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
@@ -0,0 +1,52 @@
+import pytest
+
+from backend.lifecycle import StartupSequence
+
+
+def test_phases_run_once_in_order_and_failures_do_not_stop_the_sequence():
+    seq = StartupSequence()
+    calls = []
+    seq.phase('db', lambda: calls.append('db'))
+
+    @seq.phase('broken')
+    def broken():
+        calls.append('broken')
+        raise RuntimeError('banco fora do ar\n')
+
+    seq.phase('jobs', lambda: calls.append('jobs'))
+
+    assert seq.run() is True
+    assert seq.run() is False
+    assert calls == ['db', 'broken', 'jobs']
+    stats = seq.stats()
+    assert stats['state'] == 'done'
+    assert [p['phase'] for p in stats['phases']] == ['db', 'broken', 'jobs']
+    assert [p['ok'] for p in stats['phases']] == [True, False, True]
+    assert stats['phases'][1]['error'] == 'RuntimeError: banco fora do ar'
+    assert all(p['ms'] >= 0 for p in stats['phases'])
+    assert stats['startup_ms'] is not None
+
+
+def test_duplicate_phase_is_rejected():
+    seq = StartupSequence()
+    seq.phase('db', lambda: None)
+    with pytest.raises(ValueError):
+        seq.phase('db', lambda: None)
+
+
+def test_shutdown_runs_once_even_if_a_step_fails():
+    seq = StartupSequence()
+    calls = []
+
+    def broken():
+        calls.append('audit')
+        raise RuntimeError('x')
+
+    seq.on_shutdown('audit', broken)
+    seq.on_shutdown('pool', lambda: calls.append('pool'))
+    seq.run()
+    assert seq.shutdown() is True
+    assert seq.shutdown() is False
+    assert calls == ['audit', 'pool']
+    # Depois do shutdown o startup não roda de novo no mesmo processo
+    assert seq.run() is False
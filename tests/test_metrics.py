@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+from backend.metrics import MetricsMiddleware, MetricsRegistry, UNMATCHED_ROUTE
+
+
+def test_counters_and_histograms_merge_thread_shards():
+    reg = MetricsRegistry(prefix='t_')
+    hits = reg.counter('hits_total', 'Acertos', ('kind',))
+    lat = reg.histogram('lat_seconds', 'Latência', buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(1000):
+            hits.inc('a')
+        lat.observe(0.05)
+        lat.observe(2.0)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    text = reg.render()
+    assert 't_hits_total{kind="a"} 4000' in text
+    assert 't_lat_seconds_bucket{le="0.1"} 4' in text
+    assert 't_lat_seconds_bucket{le="1"} 4' in text
+    assert 't_lat_seconds_bucket{le="+Inf"} 8' in text
+    assert 't_lat_seconds_count 8' in text
+    assert '# TYPE t_lat_seconds histogram' in text
+
+
+def test_collectors_render_and_failures_are_isolated():
+    reg = MetricsRegistry(prefix='t_')
+
+    def broken():
+        raise RuntimeError('x')
+
+    reg.add_collector(broken)
+    reg.add_collector(lambda: [('pool', 'gauge', 'Pool', [({'state': 'idle'}, 3), ({'state': 'x'}, None)])])
+    text = reg.render()
+    assert 't_pool{state="idle"} 3' in text
+    assert 'state="x"' not in text
+
+
+class _Route:
+    path = '/product/{barcode}'
+
+
+def test_middleware_labels_route_template_and_status():
+    from backend import metrics
+
+    async def app(scope, receive, send):
+        if scope['path'].startswith('/product/'):
+            scope['route'] = _Route()
+            await send({'type': 'http.response.start', 'status': 404})
+        else:
+            await send({'type': 'http.response.start', 'status': 200})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def send(message):
+        pass
+
+    mw = MetricsMiddleware(app)
+
+    async def run():
+        for path in ('/product/789', '/product/123', '/nada'):
+            await mw({'type': 'http', 'method': 'GET', 'path': path}, None, send)
+
+    asyncio.run(run())
+    text = metrics.registry.render()
+    assert 'precix_http_request_duration_seconds_count{method="GET",route="/product/{barcode}",status="404"} 2' in text
+    assert f'route="{UNMATCHED_ROUTE}",status="200"' in text
+    assert 'precix_http_requests_in_flight 0' in text
+
+
+def test_shards_of_finished_threads_are_folded_into_retired_totals():
+    reg = MetricsRegistry(prefix='t_')
+    hits = reg.counter('hits_total', 'Acertos')
+    lat = reg.histogram('lat_seconds', 'Latência', buckets=(0.1,))
+
+    def work():
+        hits.inc()
+        lat.observe(0.05)
+
+    # Threads curtas, como workers ociosos do threadpool que são encerrados e recriados
+    for _ in range(200):
+        t = threading.Thread(target=work)
+        t.start()
+        t.join()
+    text = reg.render()
+    assert 't_hits_total 200' in text
+    assert 't_lat_seconds_count 200' in text
+    assert len(reg._shards) <= 1
+    # Os totais aposentados continuam somando com os shards vivos
+    hits.inc()
+    assert 't_hits_total 201' in reg.render()
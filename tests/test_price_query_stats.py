@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from backend.price_query_stats import PriceQueryAggregator, summarize
+
+
+TS = datetime(2025, 1, 10, 14, 37, 12)
+
+
+def test_counts_per_hour_and_dimension():
+    flushed = []
+    agg = PriceQueryAggregator(flush_fn=flushed.extend, buckets_ms=(100, 500))
+    agg.record('pwa-1', '789', True, latency_ms=80, store_id=3, ts=TS)
+    agg.record('pwa-1', '789', False, latency_ms=700, store_id=3, ts=TS)
+    agg.record('pwa-2', '789', True, ts=TS)
+    assert agg.flush() == 4
+    rows = {(r[1], r[2]): r for r in flushed}
+    hour = datetime(2025, 1, 10, 14)
+    assert all(r[0] == hour for r in flushed)
+    # (bucket, dimension, key, queries, hits, misses, latency_count, latency_sum_ms, hist)
+    assert rows[('barcode', '789')][3:] == (3, 2, 1, 2, 780.0, [1, 0, 1])
+    assert rows[('device', 'pwa-1')][3:6] == (2, 1, 1)
+    assert rows[('device', 'pwa-2')][6] == 0
+    assert rows[('store', '3')][3] == 2
+    assert agg.flush() == 0
+
+
+def test_failed_flush_merges_back():
+    calls = []
+
+    def flaky(rows):
+        calls.append(list(rows))
+        if len(calls) == 1:
+            raise RuntimeError('db down')
+
+    agg = PriceQueryAggregator(flush_fn=flaky, buckets_ms=(100,))
+    agg.record('pwa-1', '789', True, latency_ms=10, ts=TS)
+    assert agg.flush() == 0
+    agg.record('pwa-1', '789', False, latency_ms=200, ts=TS)
+    assert agg.flush() == 2
+    row = next(r for r in calls[1] if r[1] == 'barcode')
+    assert row[3:] == (2, 1, 1, 2, 210.0, [1, 1])
+    assert agg.stats()['flush_errors'] == 1
+
+
+def test_summarize_rates_and_quantiles():
+    row = summarize({'queries': 10, 'hits': 8, 'misses': 2, 'latency_count': 10,
+                     'latency_sum_ms': 1000.0, 'latency_hist': [6, 3, 1]}, buckets_ms=(100, 500))
+    assert row['hit_ratio'] == 0.8 and row['failure_rate'] == 0.2
+    assert row['latency_avg_ms'] == 100.0
+    assert row['latency_p50_ms'] == 100 and row['latency_p95_ms'] is None
+
+
+def test_non_finite_latency_is_discarded():
+    flushed = []
+    agg = PriceQueryAggregator(flush_fn=flushed.extend, buckets_ms=(100,))
+    for value in (float('inf'), float('-inf'), float('nan'), 'Infinity'):
+        agg.record('pwa-1', '789', True, latency_ms=value, ts=TS)
+    agg.flush()
+    row = [r for r in flushed if r[1] == 'barcode'][0]
+    # Consultas contadas, latência ignorada
+    assert row[3:9] == (4, 4, 0, 0, 0.0, [0, 0])
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from backend.product_cache import ProductCache
+
+
+class Loader:
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    def __call__(self, barcode):
+        self.calls += 1
+        value = self.data.get(barcode)
+        return dict(value) if value else None
+
+
+def test_hit_after_first_load():
+    loader = Loader({'1': {'barcode': '1', 'price': 2.5}})
+    cache = ProductCache(maxsize=10, ttl=60)
+    assert cache.get_or_load('1', loader)['price'] == 2.5
+    assert cache.get_or_load('1', loader)['price'] == 2.5
+    assert loader.calls == 1
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_returns_copies():
+    loader = Loader({'1': {'barcode': '1', 'price': 2.5}})
+    cache = ProductCache(maxsize=10, ttl=60)
+    cache.get_or_load('1', loader)['price'] = 99
+    assert cache.get_or_load('1', loader)['price'] == 2.5
+
+
+def test_negative_caching_and_invalidation():
+    data = {}
+    loader = Loader(data)
+    cache = ProductCache(maxsize=10, ttl=60, negative_ttl=60)
+    assert cache.get_or_load('9', loader) is None
+    assert cache.get_or_load('9', loader) is None
+    assert loader.calls == 1
+    assert cache.stats()['negative_hits'] == 1
+    data['9'] = {'barcode': '9', 'price': 1.0}
+    cache.invalidate('9')
+    assert cache.get_or_load('9', loader)['price'] == 1.0
+
+
+def test_ttl_expiration():
+    loader = Loader({'1': {'barcode': '1'}})
+    cache = ProductCache(maxsize=10, ttl=0.01)
+    cache.get_or_load('1', loader)
+    time.sleep(0.02)
+    cache.get_or_load('1', loader)
+    assert loader.calls == 2
+    assert cache.stats()['expired'] == 1
+
+
+def test_lru_eviction():
+    loader = Loader({str(i): {'barcode': str(i)} for i in range(3)})
+    cache = ProductCache(maxsize=2, ttl=60)
+    cache.get_or_load('0', loader)
+    cache.get_or_load('1', loader)
+    cache.get_or_load('0', loader)  # '0' passa a ser o mais recente
+    cache.get_or_load('2', loader)  # expulsa '1'
+    assert cache.stats()['evictions'] == 1
+    calls = loader.calls
+    cache.get_or_load('0', loader)
+    assert loader.calls == calls
+    cache.get_or_load('1', loader)
+    assert loader.calls == calls + 1
+
+
+def test_loader_error_is_not_cached():
+    cache = ProductCache(maxsize=10, ttl=60)
+
+    def failing(barcode):
+        raise RuntimeError('db down')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load('1', failing)
+    assert cache.stats()['size'] == 0
+
+
+def test_load_racing_with_invalidation_is_discarded():
+    cache = ProductCache(maxsize=10, ttl=60)
+
+    def loader(barcode):
+        # Escrita concorrente acontece enquanto a consulta está em andamento
+        cache.invalidate(barcode)
+        return {'barcode': barcode, 'price': 1.0}
+
+    assert cache.get_or_load('1', loader)['price'] == 1.0
+    stats = cache.stats()
+    assert stats['size'] == 0
+    assert stats['stale_loads_discarded'] == 1
@@ -0,0 +1,68 @@
+import asyncio
+
+from backend.request_timing import (
+    RequestTimingMiddleware, SlowQueryLog, _is_read_only, current_request, redact_sql,
+)
+
+
+def test_redact_sql_removes_values():
+    sql = b"INSERT INTO audit_log (device_name, details) VALUES ('pwa-1', 'it''s'), ('pwa-2', '{}') RETURNING id"
+    assert redact_sql(sql) == 'INSERT INTO audit_log (device_name, details) VALUES (?, ?), ... RETURNING id'
+    assert redact_sql("SELECT * FROM products WHERE barcode = '789' AND price > 10.5 LIMIT 1") == \
+        'SELECT * FROM products WHERE barcode = ? AND price > ? LIMIT ?'
+
+
+def test_middleware_attributes_db_time_and_adds_headers():
+    seen = {}
+
+    async def app(scope, receive, send):
+        ctx = current_request()
+        ctx.add_query(0.020)
+        ctx.add_query(0.005)
+        seen['id'] = ctx.request_id
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    mw = RequestTimingMiddleware(app, route_of=lambda scope: '/product/{barcode}')
+    scope = {'type': 'http', 'method': 'GET', 'path': '/product/1', 'headers': [(b'x-request-id', b'abc')]}
+    asyncio.run(mw(scope, None, send))
+    headers = dict(sent[0]['headers'])
+    assert seen['id'] == 'abc' and headers[b'x-request-id'] == b'abc'
+    timing = headers[b'server-timing'].decode()
+    assert timing.startswith('db;dur=25.0;desc="2 queries", app;dur=')
+    assert current_request() is None
+
+
+def test_slow_query_log_explains_selects_once(wait_until):
+    plans = []
+
+    def explain(sql):
+        plans.append(sql)
+        return "Index Scan using products_pkey\n  Index Cond: (barcode = '789'::text)"
+
+    log = SlowQueryLog(threshold_ms=100, explain_ms=100, explain_interval_s=60, explain_fn=explain)
+    assert not log.is_slow(0.05) and log.is_slow(0.2)
+    sql = "SELECT * FROM products WHERE barcode = %s"
+    entry = log.record(0.2, sql, literal_sql=lambda: b"SELECT * FROM products WHERE barcode = '789'")
+    log.record(0.3, sql, literal_sql=lambda: b"SELECT * FROM products WHERE barcode = '123'")
+    log.record(0.3, "UPDATE products SET price = %s", literal_sql=lambda: "UPDATE products SET price = 1")
+    assert wait_until(lambda: entry['explain'] is not None)
+    assert plans == ["SELECT * FROM products WHERE barcode = '789'"]
+    assert "'789'" not in entry['explain']
+    recent = log.recent()
+    assert [e['duration_ms'] for e in recent] == [300.0, 300.0, 200.0]
+    assert log.stats()['slow'] == 3
+
+
+def test_selects_with_side_effects_are_never_explained():
+    assert _is_read_only("SELECT * FROM products WHERE barcode = '1'")
+    assert _is_read_only('WITH t AS (SELECT 1) SELECT * FROM t')
+    for sql in ('SELECT pg_try_advisory_lock(42)', 'select pg_advisory_lock (1)',
+                "SELECT setval('products_id_seq', 10)", "SELECT nextval('s')",
+                "SELECT pg_notify('catalog', '1')", 'UPDATE products SET price = 1'):
+        assert not _is_read_only(sql), sql